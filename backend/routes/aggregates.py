@@ -0,0 +1,506 @@
+"""
+aggregates.py - Materialized region x month x hour-of-day PW aggregates
+
+The dashboard's region cards and climatologies summarise PW, predicted PW
+and the temperature / pressure / humidity context per region and month.
+Instead of rescanning raw rows, every observation or prediction is folded
+once into a cell (region, YYYY-MM, hour of day) holding, per measure,
+
+    count, sum, sum of squares, min, max     -> mean / std / range
+    a DDSketch-style quantile sketch         -> p10 / p50 / p90 ...
+
+Both are exactly mergeable, so a card (one region-month = 24 cells) or a
+climatology (all cells of a region) is a handful of array lookups however
+many rows went in. Sketch quantiles carry a relative error of at most
+SKETCH_ACCURACY.
+
+Observations are ingested in bulk (ingest / ingest_frame). prediction.py
+appends one JSON line per prediction to a spool with a single O_APPEND
+write (as metrics.py does); the spool is folded in before each query.
+
+Regions (ZVC_REGIONS):
+    grid:<deg>   lat/lon cells of <deg> degrees, e.g. "N30E120" for grid:10 (default)
+    country      ISO country code of 9-character station IDs (SEJN00KOR -> KOR),
+                 grid cells for anything else
+
+Usage:
+    python aggregates.py ingest ../../model/dataset.csv ../../model/gnss_pw_with_predictions_enhanced.csv
+    python aggregates.py regions
+    python aggregates.py card N60E20 --month 2025-08
+    python aggregates.py climatology N60E20 --measure pw
+
+Environment:
+    ZVC_AGGREGATES_DIR     store directory (default: backend/data/aggregates)
+    ZVC_AGGREGATES=0       do not spool predictions
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from shared import file_lock
+
+ROUTES_DIR = os.path.dirname(os.path.abspath(__file__))
+AGGREGATES_DIR = os.environ.get('ZVC_AGGREGATES_DIR', os.path.join(ROUTES_DIR, '..', 'data', 'aggregates'))
+ENABLED = os.environ.get('ZVC_AGGREGATES', '1') != '0'
+REGION_SCHEME = os.environ.get('ZVC_REGIONS', 'grid:10')
+
+SPOOL_FILE = 'spool.jsonl'
+STATE_FILE = 'aggregates.npz'
+LOCK_FILE = '.lock'
+
+MEASURES = ('pw', 'pw_predicted', 'temperature', 'pressure', 'humidity')
+MOMENTS = ('count', 'sum', 'sumsq', 'min', 'max')
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Sketch buckets: |x| in (gamma^(i-1), gamma^i] -> bucket i, relative error <= SKETCH_ACCURACY
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+SKETCH_MIN = 1e-6          # |x| below this falls into the zero bucket
+SKETCH_OFFSET = 2048       # bucket i is stored as +-(i + SKETCH_OFFSET), zero as 0
+BUCKET_BITS = 16
+# Sketches store x - origin, so the relative error applies to the anomaly (1% of 1013 hPa would be 10 hPa)
+SKETCH_ORIGIN = {'pressure': 1013.25}
+
+
+def month_number(epoch):
+    """Months since 1970-01 for epoch seconds"""
+    return np.asarray(epoch, dtype='int64').astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_label(number):
+    return str(np.datetime64(int(number), 'M'))
+
+
+def region_of(station_ids, lat, lon, scheme=None):
+    """Region label per row under the given scheme (see module docstring)"""
+    scheme = scheme or REGION_SCHEME
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if scheme == 'country' or not scheme.startswith('grid:'):
+        deg = 10.0
+    else:
+        deg = float(scheme.split(':', 1)[1])
+
+    known = np.isfinite(lat) & np.isfinite(lon)
+    lat_index = np.floor(np.where(known, lat, 0) / deg).astype(np.int64)
+    lon_index = np.floor(((np.where(known, lon, 0) + 180) % 360 - 180) / deg).astype(np.int64)
+    # Format each distinct cell once
+    unknown = np.iinfo(np.int64).max
+    codes, inverse = np.unique(np.where(known, (lat_index + 50_000) * 100_000 + lon_index + 50_000, unknown),
+                               return_inverse=True)
+    names = []
+    for code in codes.tolist():
+        if code == unknown:
+            names.append('UNKNOWN')
+            continue
+        a, o = (code // 100_000 - 50_000) * deg, (code % 100_000 - 50_000) * deg
+        names.append(f"{'N' if a >= 0 else 'S'}{abs(a):g}{'E' if o >= 0 else 'W'}{abs(o):g}")
+    names = np.array(names, dtype=object)
+    labels = names[inverse.reshape(-1)]
+
+    if scheme == 'country' and station_ids is not None:
+        ids = np.asarray(station_ids, dtype=object)
+        for i, station in enumerate(ids):
+            station = str(station)
+            if len(station) == 9 and station[-3:].isalpha() and station[-3:].isupper():
+                labels[i] = station[-3:]
+    return labels
+
+
+def sketch_buckets(values):
+    """Signed sketch bucket of each value (0 for |x| < SKETCH_MIN)"""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = np.ceil(np.log(np.maximum(magnitude, SKETCH_MIN)) / math.log(SKETCH_GAMMA))
+    index = np.clip(index, -SKETCH_OFFSET + 1, SKETCH_OFFSET - 1).astype(np.int64) + SKETCH_OFFSET
+    return np.where(magnitude < SKETCH_MIN, 0, np.sign(values).astype(np.int64) * index)
+
+
+def bucket_values(buckets):
+    """Representative value of each signed bucket (midpoint in relative terms)"""
+    buckets = np.asarray(buckets, dtype=np.int64)
+    index = np.abs(buckets) - SKETCH_OFFSET
+    value = 2 * SKETCH_GAMMA ** index / (SKETCH_GAMMA + 1)
+    return np.where(buckets == 0, 0.0, np.sign(buckets) * value)
+
+
+class Aggregates:
+    """
+    Cells are rows of dense moment arrays (rows x measures); sketches are a
+    sorted array of (row, measure, bucket) keys with counts.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or AGGREGATES_DIR
+        self.load()
+
+    def load(self):
+        """(Re)load the saved state, or start empty"""
+        self.cells = []            # row -> (region, month number, hour)
+        self.index = {}            # (region, month number, hour) -> row
+        self.by_region = {}        # region -> rows
+        self.moments = {name: np.zeros((0, len(MEASURES))) for name in MOMENTS}
+        self.sketch_keys = np.zeros(0, dtype=np.int64)
+        self.sketch_counts = np.zeros(0, dtype=np.int64)
+        state = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(state):
+            return
+        with np.load(state) as data:
+            self._add_cells(zip(data['cell_region'].tolist(), data['cell_month'].tolist(), data['cell_hour'].tolist()))
+            for name in MOMENTS:
+                self.moments[name] = data[name]
+            self.sketch_keys = data['sketch_keys']
+            self.sketch_counts = data['sketch_counts']
+
+    @contextlib.contextmanager
+    def updating(self):
+        """
+        Exclusive read-modify-write: reloads the saved state under a lock
+        file and saves on exit, so concurrent collectors never drop each
+        other's updates.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(os.path.join(self.directory, LOCK_FILE)):
+            self.load()
+            yield self
+            self.save()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        cells = list(zip(*self.cells)) or [[], [], []]
+        tmp = os.path.join(self.directory, 'aggregates.tmp.npz')
+        np.savez(tmp, cell_region=np.array(cells[0], dtype=str), cell_month=np.array(cells[1], dtype=np.int64),
+                 cell_hour=np.array(cells[2], dtype=np.int64), sketch_keys=self.sketch_keys,
+                 sketch_counts=self.sketch_counts, **self.moments)
+        os.replace(tmp, os.path.join(self.directory, STATE_FILE))
+
+    def _add_cells(self, cells):
+        rows = []
+        new = 0
+        for cell in cells:
+            row = self.index.get(cell)
+            if row is None:
+                row = self.index[cell] = len(self.cells)
+                self.cells.append(cell)
+                self.by_region.setdefault(cell[0], []).append(row)
+                new += 1
+            rows.append(row)
+        if new:
+            for name in MOMENTS:
+                fill = {'min': np.inf, 'max': -np.inf}.get(name, 0.0)
+                self.moments[name] = np.vstack([self.moments[name], np.full((new, len(MEASURES)), fill)])
+        return np.array(rows, dtype=np.int64)
+
+    def add(self, regions, epochs, measures):
+        """
+        Fold a batch in: regions and epoch seconds per row, measures a dict
+        of measure name -> values (NaN = not observed). Returns rows added.
+        """
+        epochs = np.asarray(epochs, dtype=np.int64)
+        if not len(epochs):
+            return 0
+        region_names, region_codes = np.unique(np.asarray(regions, dtype=str), return_inverse=True)
+        months = month_number(epochs)
+        hours = (epochs // 3600) % 24
+        combined = (region_codes.astype(np.int64) * 100_000 + months - months.min()) * 24 + hours
+        uniques, inverse = np.unique(combined, return_inverse=True)
+
+        first = np.zeros(len(uniques), dtype=np.int64)
+        first[inverse[::-1]] = np.arange(len(epochs))[::-1]
+        rows = self._add_cells([(str(region_names[region_codes[i]]), int(months[i]), int(hours[i])) for i in first])
+        cell_rows = rows[inverse]
+
+        new_keys = []
+        for m, name in enumerate(MEASURES):
+            if name not in measures:
+                continue
+            values = np.asarray(measures[name], dtype=np.float64)
+            ok = np.isfinite(values)
+            if not ok.any():
+                continue
+            v, codes = values[ok], inverse[ok]
+            k = len(uniques)
+            self.moments['count'][rows, m] += np.bincount(codes, minlength=k)
+            self.moments['sum'][rows, m] += np.bincount(codes, weights=v, minlength=k)
+            self.moments['sumsq'][rows, m] += np.bincount(codes, weights=v * v, minlength=k)
+            lo = np.full(k, np.inf)
+            hi = np.full(k, -np.inf)
+            np.minimum.at(lo, codes, v)
+            np.maximum.at(hi, codes, v)
+            self.moments['min'][rows, m] = np.minimum(self.moments['min'][rows, m], lo)
+            self.moments['max'][rows, m] = np.maximum(self.moments['max'][rows, m], hi)
+            new_keys.append(self._sketch_key(cell_rows[ok], m, sketch_buckets(v - SKETCH_ORIGIN.get(name, 0.0))))
+
+        if new_keys:
+            keys = np.concatenate([self.sketch_keys] + new_keys)
+            counts = np.concatenate([self.sketch_counts, np.ones(len(keys) - len(self.sketch_keys), dtype=np.int64)])
+            self.sketch_keys, inverse = np.unique(keys, return_inverse=True)
+            self.sketch_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        return len(epochs)
+
+    @staticmethod
+    def _sketch_key(rows, measure, buckets):
+        return ((np.asarray(rows, dtype=np.int64) * len(MEASURES) + measure) << BUCKET_BITS) \
+            + (np.asarray(buckets, dtype=np.int64) + (1 << (BUCKET_BITS - 1)))
+
+    def merge(self, other):
+        """Add another Aggregates (e.g. built on a separate shard) into this one"""
+        rows = self._add_cells(other.cells)
+        if len(rows):
+            for name in ('count', 'sum', 'sumsq'):
+                self.moments[name][rows] += other.moments[name]
+            self.moments['min'][rows] = np.minimum(self.moments['min'][rows], other.moments['min'])
+            self.moments['max'][rows] = np.maximum(self.moments['max'][rows], other.moments['max'])
+        if len(other.sketch_keys):
+            cell_measure = other.sketch_keys >> BUCKET_BITS
+            remapped = ((rows[cell_measure // len(MEASURES)] * len(MEASURES) + cell_measure % len(MEASURES))
+                        << BUCKET_BITS) + (other.sketch_keys & ((1 << BUCKET_BITS) - 1))
+            keys = np.concatenate([self.sketch_keys, remapped])
+            counts = np.concatenate([self.sketch_counts, other.sketch_counts])
+            self.sketch_keys, inverse = np.unique(keys, return_inverse=True)
+            self.sketch_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        return self
+
+    def collect(self):
+        """
+        Fold the prediction spool in. The spool is renamed first, so
+        predictions appending meanwhile start a new spool and nothing is lost.
+        """
+        spool = os.path.join(self.directory, SPOOL_FILE)
+        if not os.path.exists(spool):
+            return 0
+        with self.updating():
+            work = f"{spool}.{os.getpid()}.work"
+            try:
+                os.replace(spool, work)
+            except FileNotFoundError:
+                return 0  # another collector got there first
+            records = []
+            with open(work) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+            records = [r for r in records if 'ts' in r and 'latitude' in r and 'longitude' in r]
+            if records:
+                regions = region_of([r.get('station_id') for r in records],
+                                    [r['latitude'] for r in records], [r['longitude'] for r in records])
+                self.add(regions, [int(r['ts']) for r in records],
+                         {m: [r.get(m, np.nan) for r in records] for m in MEASURES})
+        os.remove(work)
+        return len(records)
+
+    def _summaries(self, rows):
+        """Per-measure summary (moments + sketch quantiles) over the given cell rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = {}
+        for m, name in enumerate(MEASURES):
+            count = self.moments['count'][rows, m].sum()
+            if count == 0:
+                continue
+            total = self.moments['sum'][rows, m].sum()
+            mean = total / count
+            var = max(self.moments['sumsq'][rows, m].sum() / count - mean * mean, 0.0)
+            summary = {
+                'count': int(count),
+                'mean': round(float(mean), 4),
+                'std': round(math.sqrt(var), 4),
+                'min': round(float(self.moments['min'][rows, m].min()), 4),
+                'max': round(float(self.moments['max'][rows, m].max()), 4),
+            }
+            for q, value in zip(QUANTILES, self.quantiles(rows, m, QUANTILES)):
+                # Bucket midpoints can overshoot the exact extremes
+                value = min(max(float(value), summary['min']), summary['max'])
+                summary[f"p{int(q * 100)}"] = round(value, 4)
+            out[name] = summary
+        return out
+
+    def quantiles(self, rows, measure, qs):
+        """Quantiles of one measure over cell rows, from the merged sketches"""
+        buckets, counts = [], []
+        for row in np.atleast_1d(rows):
+            base = (int(row) * len(MEASURES) + measure) << BUCKET_BITS
+            lo, hi = np.searchsorted(self.sketch_keys, [base, base + (1 << BUCKET_BITS)])
+            buckets.append(self.sketch_keys[lo:hi] - base - (1 << (BUCKET_BITS - 1)))
+            counts.append(self.sketch_counts[lo:hi])
+        buckets, counts = np.concatenate(buckets), np.concatenate(counts)
+        if not counts.sum():
+            return [np.nan] * len(qs)
+        values = bucket_values(buckets) + SKETCH_ORIGIN.get(MEASURES[measure], 0.0)
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(counts[order])
+        ranks = np.asarray(qs) * (cumulative[-1] - 1)
+        return values[np.searchsorted(cumulative, ranks, side='right')]
+
+    def regions(self):
+        out = []
+        for region in sorted(self.by_region):
+            rows = self.by_region[region]
+            months = sorted({self.cells[r][1] for r in rows})
+            counts = self.moments['count'][rows].sum(axis=0)
+            out.append({'region': region, 'first_month': month_label(months[0]),
+                        'last_month': month_label(months[-1]),
+                        'counts': {name: int(c) for name, c in zip(MEASURES, counts) if c}})
+        return out
+
+    def card(self, region, month=None):
+        """Region card: summaries for one month (default: the region's latest month)"""
+        if region not in self.by_region:
+            raise KeyError(f"Unknown region: {region}")
+        if month is None:
+            number = max(self.cells[r][1] for r in self.by_region[region])
+        else:
+            number = int(np.datetime64(month, 'M').astype(np.int64))
+        rows = [self.index[(region, number, h)] for h in range(24) if (region, number, h) in self.index]
+        return {'region': region, 'month': month_label(number), 'measures': self._summaries(rows) if rows else {}}
+
+    def climatology(self, region, measure='pw'):
+        """Mean, std and count of a measure by calendar month x hour of day, over all years"""
+        if region not in self.by_region:
+            raise KeyError(f"Unknown region: {region}")
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure {measure!r}, expected one of {MEASURES}")
+        m = MEASURES.index(measure)
+        rows = np.asarray(self.by_region[region])
+        calendar = np.array([(self.cells[r][1] % 12) * 24 + self.cells[r][2] for r in rows])
+        count = np.bincount(calendar, weights=self.moments['count'][rows, m], minlength=288)
+        total = np.bincount(calendar, weights=self.moments['sum'][rows, m], minlength=288)
+        sumsq = np.bincount(calendar, weights=self.moments['sumsq'][rows, m], minlength=288)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(sumsq / count - mean * mean, 0.0))
+
+        def table(values, digits=4):
+            return np.where(count > 0, np.round(values, digits), None).reshape(12, 24).tolist()
+        return {'region': region, 'measure': measure, 'rows': 'month 1-12', 'columns': 'hour 0-23 UTC',
+                'mean': table(mean), 'std': table(std), 'count': table(count, 0)}
+
+
+def ingest_frame(df, aggregates, scheme=None):
+    """Fold a legacy-layout or gnss_store frame of observations into the aggregates"""
+    from gnss_store import to_storage_frame
+
+    if 'epoch' not in df.columns:
+        df = to_storage_frame(df)
+    if 'pw' not in df.columns and 'zwd' in df.columns:
+        df = df.assign(pw=df['zwd'] * np.float32(0.16))  # same ZWD -> PW conversion as training
+    regions = region_of(df['station_id'].to_numpy() if 'station_id' in df.columns else None,
+                        df['lat'].to_numpy(), df['lon'].to_numpy(), scheme)
+    return aggregates.add(regions, df['epoch'].to_numpy(), {m: df[m].to_numpy() for m in MEASURES if m in df.columns})
+
+
+def ingest(sources, directory=None, chunksize=1_000_000):
+    """Add CSV files or gnss_store directories to the aggregates, chunk by chunk"""
+    import pandas as pd
+    from gnss_store import read_dataset
+
+    aggregates = Aggregates(directory)
+    aggregates.collect()
+    total = 0
+    with aggregates.updating():
+        for source in sources:
+            chunks = [read_dataset(source, legacy_names=False)] if os.path.isdir(source) \
+                else pd.read_csv(source, chunksize=chunksize)
+            for chunk in chunks:
+                total += ingest_frame(chunk, aggregates)
+            print(f"Added {source}")
+    print(f"Aggregates {aggregates.directory}: {total} rows, {len(aggregates.cells)} cells, "
+          f"{len(aggregates.by_region)} regions")
+    return aggregates
+
+
+def _prediction_epoch(input_data):
+    """Observation time of a prediction request (year/month/day/hour fields, UTC), else now"""
+    try:
+        if 'year' in input_data:
+            stamp = np.datetime64(f"{int(input_data['year']):04d}-{int(input_data.get('month', 1)):02d}-"
+                                  f"{int(input_data.get('day', 1)):02d}T{int(input_data.get('hour', 0)):02d}", 's')
+            return int(stamp.astype(np.int64))
+        if input_data.get('timestamp') is not None:
+            return int(float(input_data['timestamp']))
+    except (TypeError, ValueError):
+        pass
+    return int(time.time())
+
+
+def record_prediction(input_data, result, directory=None):
+    """
+    Spool one prediction (prediction.py) for the next collect(); never raises.
+    The meteorology recorded is what the prediction used (result['covariates'],
+    resolved by model/covariates.py), not only what the request carried.
+    """
+    if not ENABLED or 'predicted_pw' not in result:
+        return
+    lat = input_data.get('latitude', input_data.get('stationLatitude'))
+    lon = input_data.get('longitude', input_data.get('stationLongitude'))
+    if lat is None or lon is None:
+        return
+    line = {'ts': _prediction_epoch(input_data),
+            'latitude': float(lat), 'longitude': float(lon), 'pw_predicted': float(result['predicted_pw'])}
+    station = input_data.get('stationId', input_data.get('Station ID'))
+    if station is not None:
+        line['station_id'] = str(station)
+    met = result.get('covariates') or input_data
+    for measure in ('temperature', 'pressure', 'humidity'):
+        if met.get(measure) is not None:
+            line[measure] = float(met[measure])
+    try:
+        directory = directory or AGGREGATES_DIR
+        os.makedirs(directory, exist_ok=True)
+        # Shared lock: collect() cannot take the spool between our open and write
+        with file_lock(os.path.join(directory, LOCK_FILE), shared=True):
+            fd = os.open(os.path.join(directory, SPOOL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (json.dumps(line, separators=(',', ':')) + '\n').encode())
+            finally:
+                os.close(fd)
+    except (OSError, TypeError, ValueError):
+        pass  # aggregates must never fail a prediction
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Region x month x hour PW aggregates")
+    parser.add_argument('--dir', default=None, help=f"store directory (default {AGGREGATES_DIR})")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest_cmd = sub.add_parser('ingest', help="add CSVs / gnss_store directories")
+    ingest_cmd.add_argument('sources', nargs='+')
+    ingest_cmd.add_argument('--chunksize', type=int, default=1_000_000)
+
+    sub.add_parser('regions', help="list regions as JSON")
+
+    card_cmd = sub.add_parser('card', help="region card for one month as JSON")
+    card_cmd.add_argument('region')
+    card_cmd.add_argument('--month', default=None, help="YYYY-MM (default: latest)")
+
+    clim_cmd = sub.add_parser('climatology', help="month x hour climatology as JSON")
+    clim_cmd.add_argument('region')
+    clim_cmd.add_argument('--measure', default='pw')
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        ingest(args.sources, args.dir, args.chunksize)
+        sys.exit(0)
+
+    aggregates = Aggregates(args.dir)
+    aggregates.collect()
+    try:
+        if args.command == 'regions':
+            result = {'regions': aggregates.regions()}
+        elif args.command == 'card':
+            result = aggregates.card(args.region, args.month)
+        else:
+            result = aggregates.climatology(args.region, args.measure)
+    except (KeyError, ValueError) as e:
+        print(json.dumps({'error': str(e.args[0]) if isinstance(e, KeyError) else str(e)}))
+        sys.exit(2 if isinstance(e, KeyError) else 1)
+    print(json.dumps(result))
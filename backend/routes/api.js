@@ -4,7 +4,6 @@ const dotenv = require('dotenv');
 const multer = require('multer');
 const path = require('path');
 const fs = require('fs');
-const axios = require('axios');
 const { spawn } = require('child_process');
 const authenticateToken = require('../middleware/authenticateToken');
 dotenv.config();
@@ -51,51 +50,21 @@ const upload = multer({
 // Path to the prediction script
 const PREDICTION_SCRIPT = path.join(__dirname, 'prediction.py');
 const MODEL_FILE = path.join(__dirname, 'physics_informed_xgb.pkl');
-
-// Function to generate synthetic weather data
-function generateSyntheticWeather(latitude, longitude, timestamp) {
-  const date = new Date(timestamp * 1000);
-  const month = date.getMonth();
-  
-  const baseTemp = 25 - (Math.abs(latitude) * 0.6);
-  const seasonalAdjustment = Math.sin((month - 3) * Math.PI / 6) * 10;
-  
-  const temperature = (baseTemp + seasonalAdjustment + (Math.random() * 8 - 4)).toFixed(1);
-  const pressure = (1013 + (Math.random() * 20 - 10)).toFixed(1);
-  const humidity = Math.floor(60 + (Math.random() * 30 - 15));
-  
-  return { temperature, pressure, humidity };
-}
-
-// Function to fetch meteorological data
-async function fetchMeteoData(latitude, longitude, timestamp) {
-  const date = new Date(timestamp * 1000);
-  const dateString = date.toISOString().split('T')[0];
-  
-  try {
-    const response = await axios.get(
-      `https://api.open-meteo.com/v1/forecast?latitude=${latitude}&longitude=${longitude}&hourly=temperature_2m,relative_humidity_2m,surface_pressure&start_date=${dateString}&end_date=${dateString}`,
-      { timeout: 10000 }
-    );
-    
-    const hourlyData = response.data.hourly;
-    const targetHour = date.getUTCHours();
-    
-    const index = hourlyData.time.findIndex(t => t.includes(`${dateString}T${targetHour.toString().padStart(2, '0')}:`));
-    
-    if (index !== -1) {
-      return {
-        temperature: hourlyData.temperature_2m[index],
-        pressure: hourlyData.surface_pressure[index],
-        humidity: hourlyData.relative_humidity_2m[index]
-      };
-    }
-  } catch (error) {
-    console.warn(`Weather API failed, using synthetic data: ${error.message}`);
-    return generateSyntheticWeather(latitude, longitude, timestamp);
-  }
-  
-  return generateSyntheticWeather(latitude, longitude, timestamp);
+const METRICS_SCRIPT = path.join(__dirname, 'metrics.py');
+const TIMELINE_SCRIPT = path.join(__dirname, 'timeline.py');
+const AGGREGATES_SCRIPT = path.join(__dirname, 'aggregates.py');
+const CUBE_SCRIPT = path.join(__dirname, '..', '..', 'model', 'pw_cube.py');
+const CUBE_DIR = process.env.ZVC_CUBE_DIR || path.join(__dirname, '..', 'data', 'pw_cube.zarr');
+const INGEST_SCRIPT = path.join(__dirname, 'ingest.py');
+const COVARIATES_SCRIPT = path.join(__dirname, '..', '..', 'model', 'covariates.py');
+// ?profile= is honoured only when the server runs with ZVC_PROFILING=1 (profiling.py)
+const PROFILING = process.env.ZVC_PROFILING === '1';
+
+// Surface meteorology for predictions is resolved by prediction.py (model/covariates.py):
+// batched, cached provider lookups with an ERA5 / climatology fallback, so
+// missing temperature / pressure / humidity are left out of the input.
+function optionalFloat(value) {
+  return value === undefined || value === null || value === '' ? undefined : parseFloat(value);
 }
 
 // Function to format timestamp
@@ -164,7 +133,8 @@ function parseRinexForZWD(content) {
 }
 
 // Function to run Python prediction script
-function runPythonPrediction(inputData) {
+// profile (e.g. req.query.profile) asks prediction.py to profile this one request when PROFILING is on
+function runPythonPrediction(inputData, profile) {
   return new Promise((resolve, reject) => {
     // Check if model file exists
     if (!fs.existsSync(MODEL_FILE)) {
@@ -180,10 +150,13 @@ function runPythonPrediction(inputData) {
     const tempInputPath = path.join(__dirname, '..', '..', tempInputFile);
     
     try {
-      fs.writeFileSync(tempInputPath, JSON.stringify(inputData, null, 2));
+      fs.writeFileSync(tempInputPath, JSON.stringify(PROFILING && profile ? { ...inputData, _profile: profile } : inputData, null, 2));
       
       // Spawn Python process with the prediction script
-      const pythonProcess = spawn('python3', [PREDICTION_SCRIPT, tempInputPath]);
+      // ZVC_SPAWN_TS lets metrics.py attribute process start-up time to the 'spawn' stage
+      const pythonProcess = spawn('python3', [PREDICTION_SCRIPT, tempInputPath], {
+        env: { ...process.env, ZVC_SPAWN_TS: String(Date.now() / 1000) }
+      });
       
       let stdoutData = '';
       let stderrData = '';
@@ -426,9 +399,9 @@ router.post('/features', async (req, res) => {
       zwdObservation: parseFloat(inputData.zwdObservation),
       satelliteAzimuth: parseFloat(inputData.satelliteAzimuth || 180),
       satelliteElevation: parseFloat(inputData.satelliteElevation || 45),
-      temperature: parseFloat(inputData.temperature || 25),
-      pressure: parseFloat(inputData.pressure || 1013),
-      humidity: parseFloat(inputData.humidity || 60),
+      temperature: optionalFloat(inputData.temperature),
+      pressure: optionalFloat(inputData.pressure),
+      humidity: optionalFloat(inputData.humidity),
       year: parseInt(inputData.year),
       month: parseInt(inputData.month),
       day: parseInt(inputData.day),
@@ -443,7 +416,7 @@ router.post('/features', async (req, res) => {
     let predictionResults = {};
     try {
       console.log('Running Python prediction with XGBoost model...');
-      predictionResults = await runPythonPrediction(predictionInput);
+      predictionResults = await runPythonPrediction(predictionInput, req.query.profile);
       console.log('Python prediction completed:', predictionResults);
     } catch (pythonError) {
       console.error('Python prediction failed:', pythonError.message);
@@ -554,7 +527,7 @@ router.post('/interpolation', async (req, res) => {
     let predictionResults = {};
     try {
       console.log('Running Python interpolation with XGBoost spatial model...');
-      predictionResults = await runPythonPrediction(predictionInput);
+      predictionResults = await runPythonPrediction(predictionInput, req.query.profile);
       console.log('Python interpolation completed:', predictionResults);
     } catch (pythonError) {
       console.error('Python interpolation failed:', pythonError.message);
@@ -643,7 +616,7 @@ router.post('/error', async (req, res) => {
 
     let interpolationResults = {};
     try {
-      interpolationResults = await runPythonPrediction(predictionInput);
+      interpolationResults = await runPythonPrediction(predictionInput, req.query.profile);
     } catch (error) {
       console.error('Interpolation error:', error.message);
       interpolationResults = getFallbackPrediction(predictionInput);
@@ -754,5 +727,135 @@ router.post('/history', async (req, res) => {
   }
 });
 
+// GET /metrics - prediction latency/fallback metrics in Prometheus text format
+router.get('/metrics', (req, res) => {
+  const metricsProcess = spawn('python3', [METRICS_SCRIPT]);
+  let stdoutData = '';
+  let stderrData = '';
+
+  metricsProcess.stdout.on('data', (data) => {
+    stdoutData += data.toString();
+  });
+
+  metricsProcess.stderr.on('data', (data) => {
+    stderrData += data.toString();
+  });
+
+  metricsProcess.on('close', (code) => {
+    if (code !== 0) {
+      console.error('Metrics script error:', stderrData);
+      return res.status(500).type('text/plain').send('# metrics unavailable\n');
+    }
+    res.type('text/plain; version=0.0.4').send(stdoutData);
+  });
+});
+
+// Run a JSON-printing script (timeline.py, aggregates.py) and relay its output;
+// exit code 2 means not found, any other failure a bad request
+function runJsonScript(script, args, res) {
+  const scriptProcess = spawn('python3', [script, ...args]);
+  let stdoutData = '';
+  let stderrData = '';
+
+  scriptProcess.stdout.on('data', (data) => {
+    stdoutData += data.toString();
+  });
+
+  scriptProcess.stderr.on('data', (data) => {
+    stderrData += data.toString();
+  });
+
+  scriptProcess.on('close', (code) => {
+    let result;
+    try {
+      result = JSON.parse(stdoutData);
+    } catch (parseError) {
+      console.error(`${path.basename(script)} error:`, stderrData);
+      return res.status(500).json({ success: false, message: 'Service script failed' });
+    }
+    if (code !== 0) {
+      return res.status(code === 2 ? 404 : 400).json({ success: false, message: result.error });
+    }
+    res.json({ success: true, ...result });
+  });
+}
+
+// GET /timeline - stations available in the timeline store
+router.get('/timeline', (req, res) => {
+  runJsonScript(TIMELINE_SCRIPT, ['stations'], res);
+});
+
+// GET /timeline/:stationId?start=2025-01-01&end=2025-09-01&points=500&method=lttb|minmax&series=pw,pw_predicted
+router.get('/timeline/:stationId', (req, res) => {
+  const { start, end, points, method, series } = req.query;
+  const args = ['query'];
+  if (start) args.push('--start', String(start));
+  if (end) args.push('--end', String(end));
+  if (points) args.push('--points', String(parseInt(points, 10) || 500));
+  if (method) args.push('--method', String(method));
+  if (series) args.push('--series', String(series));
+  args.push('--', req.params.stationId);
+  runJsonScript(TIMELINE_SCRIPT, args, res);
+});
+
+// GET /regions - regions with materialized aggregates
+router.get('/regions', (req, res) => {
+  runJsonScript(AGGREGATES_SCRIPT, ['regions'], res);
+});
+
+// GET /regions/:region?month=2025-08 - region card (PW, predicted PW, temperature/pressure/humidity context)
+router.get('/regions/:region', (req, res) => {
+  const args = ['card'];
+  if (req.query.month) args.push('--month', String(req.query.month));
+  args.push('--', req.params.region);
+  runJsonScript(AGGREGATES_SCRIPT, args, res);
+});
+
+// GET /regions/:region/climatology?measure=pw - calendar month x hour-of-day means
+router.get('/regions/:region/climatology', (req, res) => {
+  const args = ['climatology'];
+  if (req.query.measure) args.push('--measure', String(req.query.measure));
+  args.push('--', req.params.region);
+  runJsonScript(AGGREGATES_SCRIPT, args, res);
+});
+
+// PW time-cube (model/pw_cube.py). The Zarr store itself is served as static
+// files, so a zarr client can fetch one compressed chunk per map while scrubbing
+router.use('/cube/store', express.static(CUBE_DIR, { dotfiles: 'allow' }));
+
+// GET /cube - grid, time range and step count of the cube
+router.get('/cube', (req, res) => {
+  runJsonScript(CUBE_SCRIPT, ['info', CUBE_DIR], res);
+});
+
+// GET /cube/frame?time=2025-09-03T12:00 - PW and uncertainty maps of the closest step
+router.get('/cube/frame', (req, res) => {
+  if (!req.query.time) {
+    return res.status(400).json({ success: false, message: 'time is required' });
+  }
+  runJsonScript(CUBE_SCRIPT, ['frame', CUBE_DIR, '--time', String(req.query.time)], res);
+});
+
+// GET /cube/history?lat=28.6&lon=77.2&start=&end= - PW series of the nearest grid cell
+router.get('/cube/history', (req, res) => {
+  const { lat, lon, start, end } = req.query;
+  if (lat === undefined || lon === undefined || isNaN(parseFloat(lat)) || isNaN(parseFloat(lon))) {
+    return res.status(400).json({ success: false, message: 'lat and lon are required' });
+  }
+  const args = ['history', CUBE_DIR, '--lat', String(parseFloat(lat)), '--lon', String(parseFloat(lon))];
+  if (start) args.push('--start', String(start));
+  if (end) args.push('--end', String(end));
+  runJsonScript(CUBE_SCRIPT, args, res);
+});
+
+// GET /ingest - watch-folder ingestion ledger totals and backlog (ingest.py run does the work)
+router.get('/ingest', (req, res) => {
+  runJsonScript(INGEST_SCRIPT, ['status'], res);
+});
+
+// GET /covariates - covariate cache size, provider state and fallback counts
+router.get('/covariates', (req, res) => {
+  runJsonScript(COVARIATES_SCRIPT, ['stats'], res);
+});
 
 module.exports = router;
\ No newline at end of file
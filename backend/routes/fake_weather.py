@@ -0,0 +1,134 @@
+"""
+fake_weather.py - Local stand-in for the Open-Meteo hourly API
+
+Answers the same GET requests fetchMeteoData() and pipeline.py send
+(latitude, longitude, hourly=temperature_2m,relative_humidity_2m,surface_pressure,
+start_date, end_date) with deterministic values on any path, forecast
+(/v1/forecast) and archive (/v1/archive) alike, so the pipeline can be
+exercised without network access. Comma-separated latitude/longitude lists
+return a list of locations, as Open-Meteo does. Latency, jitter and a
+failure rate can be injected to see how a slow or flaky provider affects
+the stages downstream.
+
+Usage:
+    python fake_weather.py --port 8099 --latency 0.5 --jitter 0.2 --fail-rate 0.05
+    ZVC_WEATHER_BASE_URL=http://127.0.0.1:8099 python pipeline.py run ../data/downloads/*.Z
+
+ZVC_WEATHER_BASE_URL points both covariate endpoints here; setting only
+ZVC_WEATHER_URL would leave historical RINEX epochs (older than
+covariates.ARCHIVE_AFTER_DAYS) going to the real archive API.
+"""
+
+import argparse
+import datetime
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_DAYS = 366
+VARIABLES = ('temperature_2m', 'relative_humidity_2m', 'surface_pressure')
+
+
+def hourly(lat, lon, start, end):
+    """Deterministic hourly series for one location between two dates (inclusive)"""
+    days = (end - start).days + 1
+    if days < 1 or days > MAX_DAYS:
+        raise ValueError(f"Date range must cover 1 to {MAX_DAYS} days")
+    times, temperature, humidity, pressure = [], [], [], []
+    for h in range(days * 24):
+        t = datetime.datetime.combine(start, datetime.time()) + datetime.timedelta(hours=h)
+        local_hour = (t.hour + lon / 15) % 24
+        season = math.sin((t.month - 4) * math.pi / 6) * (1 if lat >= 0 else -1)
+        temp = 27 - abs(lat) * 0.5 + 8 * season + 4 * math.sin((local_hour - 9) * math.pi / 12)
+        times.append(t.strftime('%Y-%m-%dT%H:%M'))
+        temperature.append(round(temp, 1))
+        humidity.append(round(min(100.0, max(5.0, 70 - 15 * math.sin((local_hour - 9) * math.pi / 12))), 0))
+        pressure.append(round(1013.25 - 8 * math.cos(math.radians(2 * lat)) + 1.5 * math.sin(h * math.pi / 12), 1))
+    return {'time': times, 'temperature_2m': temperature,
+            'relative_humidity_2m': humidity, 'surface_pressure': pressure}
+
+
+def forecast(params):
+    """Open-Meteo shaped response for parsed query parameters"""
+    lats = [float(v) for v in params['latitude'].split(',')]
+    lons = [float(v) for v in params['longitude'].split(',')]
+    if len(lats) != len(lons):
+        raise ValueError("latitude and longitude must have the same number of values")
+    today = datetime.date.today()
+    start = datetime.date.fromisoformat(params.get('start_date', today.isoformat()))
+    end = datetime.date.fromisoformat(params.get('end_date', start.isoformat()))
+    wanted = [v for v in params.get('hourly', ','.join(VARIABLES)).split(',') if v]
+    unknown = [v for v in wanted if v not in VARIABLES]
+    if unknown:
+        raise ValueError(f"Unsupported hourly variables: {unknown}")
+
+    locations = []
+    for lat, lon in zip(lats, lons):
+        series = hourly(lat, lon, start, end)
+        locations.append({
+            'latitude': lat, 'longitude': lon, 'timezone': 'GMT', 'utc_offset_seconds': 0,
+            'hourly_units': {'time': 'iso8601', 'temperature_2m': '°C',
+                             'relative_humidity_2m': '%', 'surface_pressure': 'hPa'},
+            'hourly': {'time': series['time'], **{v: series[v] for v in wanted}},
+        })
+    return locations[0] if len(locations) == 1 else locations
+
+
+def serve(port, latency=0.0, jitter=0.0, fail_rate=0.0, seed=None):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    counters = {'requests': 0, 'failures': 0, 'locations': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'      # keep-alive, so pooled clients reuse connections
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                with lock:
+                    self._send(200, dict(counters))
+                return
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            with lock:
+                delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+                fail = rng.random() < fail_rate
+                counters['requests'] += 1
+                counters['failures'] += fail
+                counters['locations'] += len(params.get('latitude', '').split(','))
+            time.sleep(delay)
+            if fail:
+                self._send(503, {'error': True, 'reason': 'Injected failure'})
+                return
+            try:
+                self._send(200, forecast(params))
+            except (KeyError, ValueError) as e:
+                self._send(400, {'error': True, 'reason': f"Invalid request: {e}"})
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Fake weather API on :{port} (latency {latency:g}s ± {jitter:g}s, fail rate {fail_rate:g})")
+    ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake of the Open-Meteo hourly API")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="uniform ± seconds added to latency")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.jitter, args.fail_rate, args.seed)
@@ -0,0 +1,1126 @@
+"""
+ingest.py - Watch-folder ingestion daemon for downloaded RINEX observation files
+
+Station files (ABMF00GLP0010.20o.Z, abmf0010.20d.gz, ABMF00GLP_R_20200010000_01D_30S_MO.crx.gz)
+land in backend/data/downloads and used to wait there until someone uploaded
+them through /rinex. This daemon watches the download directories (inotify,
+or polling where inotify is unavailable) and runs every new file through
+
+    decompress -> parse -> feature -> predict
+
+on a bounded process pool, off the request path:
+
+    decompress   Unix compress (.Z), gzip, Hatanaka (crx2rnx on PATH); sniffed, not by extension
+    parse        RINEX 2/3 observation headers and epoch records
+    feature      epochs binned to --interval, station position from
+                 stations-metadata.json (or the header's APPROX POSITION XYZ),
+                 surface meteorology from the covariate resolver offline (cached
+                 provider values, ERA5 grid, climatology; model/covariates.py),
+                 each row's source kept in covariate_source
+    predict      one vectorized call of a PW model per file (zwd_xgboost_model.pkl by
+                 default; see predict_pw for the models it refuses)
+
+Results are appended to a partitioned Parquet store (gnss_store layout,
+station_id=<ID>/month=<YYYY-MM>) in batches of files.
+
+Idempotency: files are identified by the SHA-256 of their content in a
+sqlite ledger, so a file copied or downloaded twice under another name is
+counted as a duplicate and skipped. Rows are deduplicated on (station,
+epoch) when a batch is written: the same observations arriving as .rnx
+and .gz (different bytes, same records), or overlapping files, add each
+interval once, and the bin with the most epochs wins, so the partial hour
+at the edge of one file never displaces the complete hour from another
+(a fuller bin arriving later replaces the stored one). A batch is
+journaled in the ledger before its part files (part-<batch>-<i>.parquet,
+named after the batch's file hashes) are written and committed, together
+with its (station, epoch, n_epochs) keys and the stored rows it replaces,
+after; on restart the part files of an uncommitted batch are removed and
+its files processed again, and replaced rows still in their old part
+files are removed, so a crash never leaves rows in the store twice.
+
+Backlog metrics (pending, in flight, buffered, age of the oldest waiting
+file, per-file processing time) are written to status.json every few
+seconds; `status` prints them with the ledger totals as JSON and `metrics`
+in the Prometheus text format.
+
+Usage:
+    python ingest.py run                                 watch backend/data/downloads until SIGTERM
+    python ingest.py run --once                          process what is there and exit (cron)
+    python ingest.py run ~/rinex/igs ~/rinex/euref --workers 4 --timeline
+    python ingest.py status
+    python ingest.py metrics
+
+Environment:
+    ZVC_INGEST_DIR         ledger, status and default store (default: backend/data/ingest)
+    ZVC_INGEST_WATCH       os.pathsep-separated directories to watch (default: backend/data/downloads)
+    ZVC_INGEST_MODEL       model predicting PW (default: backend/routes/zwd_xgboost_model.pkl)
+"""
+
+import argparse
+import calendar
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import shared  # noqa: F401  (puts model/ on sys.path)
+
+try:
+    import unlzw3
+except ImportError:
+    unlzw3 = None
+
+ROUTES_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROUTES_DIR, '..', 'data')
+INGEST_DIR = os.environ.get('ZVC_INGEST_DIR', os.path.join(DATA_DIR, 'ingest'))
+WATCH_DIRS = os.environ.get('ZVC_INGEST_WATCH', os.path.join(DATA_DIR, 'downloads')).split(os.pathsep)
+STATIONS_METADATA = os.path.join(DATA_DIR, 'stations-metadata.json')
+PW_MODEL_FILE = os.environ.get('ZVC_INGEST_MODEL', os.path.join(ROUTES_DIR, 'zwd_xgboost_model.pkl'))
+
+LEDGER_FILE = 'ledger.sqlite'
+STATUS_FILE = 'status.json'
+STORE_DIR = 'store'
+
+INTERVAL = 3600            # s, one output row per station and interval
+BATCH_FILES = 64           # files per Parquet batch
+FLUSH_SECONDS = 30.0       # a partial batch is written once its oldest file waited this long
+POLL_SECONDS = 10.0
+SETTLE_SECONDS = 2.0       # files modified more recently than this may still be downloading
+STATUS_SECONDS = 5.0
+MAX_ATTEMPTS = 3           # pool crashes tolerated per file before it is marked failed
+UNKNOWN_EPOCHS = 1 << 30   # bin size assumed for ledger rows stored without one (never replaced)
+UNCERTAINTY = 0.08         # prediction.py's full-feature uncertainty
+PW_MAX = 100.0             # mm, above any observed column; larger predictions mean a broken model
+
+# pklgen's residual models: (T, P, RH) -> PW minus the training-set mean PW
+RESIDUAL_FEATURES = ['Temperature (°C)', 'Pressure (hPa)', 'Humidity (%)']
+
+# RINEX 2 short names (ssss[ccccc]ddd f.yyt) and RINEX 3 long names, optionally compressed
+RINEX2_NAME = re.compile(r'^(?P<station>[A-Za-z0-9]{4}(?:[A-Za-z0-9]{5})?)\d{3}[a-xA-X0-9]\.\d{2}[oOdD](?:\.(?:Z|gz))?$')
+RINEX3_NAME = re.compile(r'^(?P<station>[A-Z0-9]{9})_[A-Z]_\d{11}_\d{2}[A-Z]_(?:\d{2}[A-Z]_)?[A-Z]O\.(?:rnx|crx)(?:\.(?:Z|gz))?$')
+
+LZW_MAGIC = b'\x1f\x9d'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_EVENT = 16              # struct inotify_event without the name
+
+
+def station_from_name(name):
+    """Station ID of a RINEX observation file name, or None if the name is not one"""
+    match = RINEX2_NAME.match(name) or RINEX3_NAME.match(name)
+    return match.group('station').upper() if match else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---- Decompress ----
+
+def _align(pos, mark, n_bits):
+    # compress(1) reads codes in groups of 8; a code size change discards the rest of the group
+    group = 8 * n_bits
+    return mark + -(-(pos - mark) // group) * group
+
+
+def unlzw(data):
+    """Decompress Unix compress (.Z) data (unlzw3 when installed, else pure Python)"""
+    if len(data) < 3 or data[:2] != LZW_MAGIC:
+        raise ValueError("Not compress (.Z) data")
+    if unlzw3 is not None:
+        return unlzw3.unlzw(data)
+
+    max_bits = data[2] & 0x1f
+    block_mode = data[2] & 0x80
+    if not 9 <= max_bits <= 16:
+        raise ValueError(f"Unsupported .Z code size: {max_bits} bits")
+
+    table = [bytes([i]) for i in range(256)]
+    if block_mode:
+        table.append(b'')          # 256 is the clear code
+    out = []
+    n_bits, mask = 9, 0x1ff
+    pos = mark = 24                # bit positions; 24 skips the 3-byte header
+    end = len(data) * 8
+    prev = None
+
+    while pos + n_bits <= end:
+        if len(table) > mask and n_bits < max_bits:
+            pos = mark = _align(pos, mark, n_bits)
+            n_bits, mask = n_bits + 1, (mask << 1) | 1
+            continue
+        byte = pos >> 3
+        code = (int.from_bytes(data[byte:byte + 3], 'little') >> (pos & 7)) & mask
+        pos += n_bits
+
+        if prev is None:
+            if code > 255:
+                raise ValueError("Corrupt .Z data")
+            out.append(table[code])
+            prev = code
+            continue
+        if code == 256 and block_mode:
+            pos = mark = _align(pos, mark, n_bits)
+            n_bits, mask = 9, 0x1ff
+            del table[257:]
+            prev = None                # the next code is a literal and starts over
+            continue
+
+        if code < len(table):
+            entry = table[code]
+            new = table[prev] + entry[:1]
+        elif code == len(table):   # the code being defined (cScSc)
+            entry = new = table[prev] + table[prev][:1]
+        else:
+            raise ValueError("Corrupt .Z data")
+        out.append(entry)
+        if len(table) <= mask:
+            table.append(new)
+        prev = code
+
+    return b''.join(out)
+
+
+def decompress(data):
+    """RINEX text of a (possibly .Z / gzip / Hatanaka compressed) observation file"""
+    if data[:2] == LZW_MAGIC:
+        data = unlzw(data)
+    elif data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+
+    if b'COMPACT RINEX FORMAT' in data[:80]:
+        crx2rnx = shutil.which('crx2rnx') or shutil.which('CRX2RNX')
+        if crx2rnx is None:
+            raise ValueError("Hatanaka-compressed file and crx2rnx is not on PATH")
+        data = subprocess.run([crx2rnx, '-'], input=data, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, check=True).stdout
+    return data.decode('latin-1')
+
+
+# ---- Parse ----
+
+def parse_rinex_obs(text):
+    """
+    Header and epochs of a RINEX 2 or 3 observation file:
+    {'version', 'marker', 'approx_xyz', 'interval', 'time_system', 'epochs' (Unix s, UTC),
+    'utc_offset' (s subtracted from the file's time scale to get UTC), 'n_sats'}.
+    Observation values are skipped; only epoch records are decoded.
+    """
+    lines = text.splitlines()
+    first = lines[0] if lines else ''
+    if 'RINEX VERSION / TYPE' not in first or first[20:21].upper() != 'O':
+        raise ValueError(f"Not a RINEX observation file (starts with {first[:40].strip()!r})")
+
+    header = {'version': float(first[:9]), 'marker': None, 'approx_xyz': None,
+              'interval': None, 'time_system': 'GPS'}
+    n_types = 0
+    i = 1
+    for i in range(1, len(lines)):
+        line = lines[i]
+        label = line[60:].strip()
+        if label == 'END OF HEADER':
+            break
+        if label == 'MARKER NAME':
+            header['marker'] = line[:60].strip() or None
+        elif label == 'APPROX POSITION XYZ':
+            xyz = [float(v) for v in line[:42].split()]
+            header['approx_xyz'] = xyz if len(xyz) == 3 and any(xyz) else None
+        elif label == 'INTERVAL':
+            header['interval'] = float(line[:10])
+        elif label == 'TIME OF FIRST OBS':
+            header['time_system'] = line[48:51].strip() or 'GPS'
+        elif label == '# / TYPES OF OBSERV' and line[:6].strip():
+            n_types = int(line[:6])
+    else:
+        raise ValueError("RINEX header has no END OF HEADER")
+
+    epochs, n_sats = [], []
+    version3 = header['version'] >= 3
+    i += 1
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        if not (line.startswith('>') if version3 else line[:32].strip()):
+            i += 1
+            continue
+        try:
+            flag, count = (int(line[31:32] or 0), int(line[32:35])) if version3 else \
+                          (int(line[28:29] or 0), int(line[29:32]))
+            if flag not in (0, 1, 6):
+                i += 1 + count          # event records (date may be blank): count header lines follow
+                continue
+            if version3:
+                fields = (int(line[2:6]), int(line[7:9]), int(line[10:12]),
+                          int(line[13:15]), int(line[16:18]), float(line[18:29]))
+                record_lines = count
+            else:
+                year = int(line[1:3])
+                fields = (year + (2000 if year < 80 else 1900), int(line[4:6]), int(line[7:9]),
+                          int(line[10:12]), int(line[13:15]), float(line[15:26]))
+                # Satellite list continues 12 per line, then ceil(types / 5) lines per satellite
+                record_lines = max(count - 1, 0) // 12 + count * -(-n_types // 5)
+        except ValueError:
+            raise ValueError(f"Malformed RINEX epoch record at line {i + 1}: {line[:40]!r}")
+        i += 1 + record_lines
+        epochs.append(calendar.timegm(fields[:5] + (int(fields[5]),)))
+        n_sats.append(count)
+
+    header['utc_offset'] = 0
+    if header['time_system'] in ('GPS', 'GAL', 'QZS', 'BDT'):
+        from sat_geometry import LEAP_SECONDS
+        header['utc_offset'] = LEAP_SECONDS    # GNSS time -> UTC (BDT is 14 s behind GPS, close enough)
+    header['epochs'] = np.array(epochs, dtype=np.int64) - header['utc_offset']
+    header['n_sats'] = np.array(n_sats, dtype=np.int16)
+    return header
+
+
+# ---- Feature / predict (worker processes) ----
+
+_MODEL = None
+_RESOLVER = None
+_STATIONS = None
+
+
+def _init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent drains the pool on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # not the parent's drain handler
+
+
+def _model():
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = load_pw_model()
+    return _MODEL
+
+
+def load_pw_model(path=None):
+    """
+    The PW model (PW_MODEL_FILE by default). Raises ValueError for a residual
+    model without its baseline: its output is not PW.
+    """
+    from prediction import load_model
+
+    path = path or PW_MODEL_FILE
+    model = load_model(path)
+    if model is None:
+        raise ValueError(f"Could not load the PW model {path}")
+    if _residual_model(model) and getattr(model, 'pw_baseline_', None) is None:
+        raise ValueError(f"{os.path.basename(path)} predicts the PW residual against a training baseline it "
+                         f"does not store; retrain it with pklgen.py or set ZVC_INGEST_MODEL to a PW model")
+    return model
+
+
+def _residual_model(model):
+    names = getattr(model, 'feature_names_in_', None)
+    return hasattr(model, 'pw_baseline_') or (names is not None and list(names) == RESIDUAL_FEATURES)
+
+
+def resolve_station(station, approx_xyz=None):
+    """
+    (station ID, lat, lon, height) from stations-metadata.json, else the RINEX
+    header's position. A 4-character code (RINEX 2 short names) takes the full
+    metadata ID (ABMF -> ABMF00GLP), so both naming schemes land in one partition.
+    """
+    global _STATIONS
+    if _STATIONS is None:
+        _STATIONS = {}
+        if os.path.exists(STATIONS_METADATA):
+            with open(STATIONS_METADATA) as f:
+                for sid, meta in json.load(f).items():
+                    entry = (sid, float(meta['Latitude']), float(meta['Longitude']), float(meta['Height']))
+                    _STATIONS[sid] = entry
+                    _STATIONS.setdefault(sid[:4], entry)
+    entry = _STATIONS.get(station)
+    if entry is not None:
+        return entry
+    if approx_xyz is not None:
+        from sat_geometry import ecef_to_geodetic
+        lat, lon, height = ecef_to_geodetic(np.array(approx_xyz, dtype=np.float64))
+        return station, float(np.degrees(lat)), float(np.degrees(lon)), float(height)
+    raise ValueError(f"No position for station {station}: not in stations-metadata.json and no APPROX POSITION XYZ")
+
+
+def covariates(lat, lon, elev, epoch):
+    """
+    Surface temperature (°C), pressure (hPa), humidity (%) and source
+    ('open-meteo', 'era5' or 'climatology') per row from the covariate
+    resolver without provider calls (the daemon works offline): cached
+    provider values, else the ERA5 grid, else climatology.
+    """
+    global _RESOLVER
+    if _RESOLVER is None:
+        from covariates import CovariateResolver
+        _RESOLVER = CovariateResolver()
+    met = _RESOLVER.resolve(lat, lon, epoch, elev, online=False)
+    return met['temperature'], met['pressure'], met['humidity'], met['source']
+
+
+def model_matrix(model, columns):
+    """Feature matrix in the order the model was fitted with (prediction.MODEL_FEATURES if it does not say)"""
+    from prediction import MODEL_FEATURES
+
+    names = getattr(model, 'feature_names_in_', None)
+    names = MODEL_FEATURES if names is None else list(names)
+    missing = [name for name in names if name not in columns]
+    if missing:
+        raise ValueError(f"Model needs features the ingest pipeline does not build: {missing}")
+    return np.column_stack([columns[name] for name in names])
+
+
+def pw_from_output(model, output):
+    """
+    PW (mm) from raw model output: the stored baseline added back for residual
+    models, negatives clipped to 0 as in pklgen.enforce_physical_pw. Raises
+    ValueError when any value exceeds PW_MAX.
+    """
+    pw = np.asarray(output, dtype=np.float64)
+    if _residual_model(model):
+        pw = pw + model.pw_baseline_
+    if np.any(pw > PW_MAX):
+        raise ValueError(f"Model predicted PW up to {np.nanmax(pw):.0f} mm (> {PW_MAX:.0f} mm)")
+    return np.clip(pw, 0.0, None).astype(np.float32)
+
+
+def predict_pw(model, columns):
+    """PW (mm) for feature columns; see pw_from_output"""
+    return pw_from_output(model, model.predict(model_matrix(model, columns)))
+
+
+def apply_covariates(frame, columns, temperature, pressure, humidity, source):
+    """Set the meteorology (and its per-row source) of a feature frame and its model columns"""
+    from physics import vapor_pressure
+
+    frame['temperature'] = temperature.astype(np.float32)
+    frame['pressure'] = pressure.astype(np.float32)
+    frame['humidity'] = humidity.astype(np.float32)
+    frame['covariate_source'] = source.astype(str)
+    columns.update({
+        'temp': temperature, 'pressure': pressure, 'vapor_pressure': vapor_pressure(temperature, humidity),
+        'Temperature (°C)': temperature, 'Pressure (hPa)': pressure, 'Humidity (%)': humidity,
+    })
+
+
+def features(obs, station, interval=INTERVAL):
+    """
+    One row per interval with observations: storage-schema columns and the
+    station / time model feature columns. The meteorology is added by
+    apply_covariates.
+    """
+    import pandas as pd
+
+    if not len(obs['epochs']):
+        raise ValueError("RINEX file has no observation epochs")
+    station, lat, lon, elev = resolve_station(station, obs['approx_xyz'])
+
+    # Binned on the file's own time scale: shifted to UTC first, a daily file's first epoch
+    # would open a bin of its own at 23:00 of the day before. The bin is labelled with its
+    # start (seconds off UTC at most), so the same hour from two files is the same bin.
+    bins, index = np.unique((obs['epochs'] + obs.get('utc_offset', 0)) // interval, return_inverse=True)
+    counts = np.bincount(index)
+    epoch = bins * interval
+    n = len(epoch)
+
+    stamp = epoch.astype('datetime64[s]')
+    hour = (epoch // 3600) % 24
+    doy = (stamp.astype('datetime64[D]') - stamp.astype('datetime64[Y]')).astype(np.int64) + 1
+    # prediction.MODEL_FEATURES (and, with apply_covariates, the dataset.csv names of the (T, P, RH) models)
+    columns = {
+        'lat': np.full(n, lat), 'lon': np.full(n, lon), 'elev': np.full(n, elev),
+        'hour_sin': np.sin(2 * np.pi * hour / 24), 'hour_cos': np.cos(2 * np.pi * hour / 24),
+        'doy_sin': np.sin(2 * np.pi * doy / 365.25), 'doy_cos': np.cos(2 * np.pi * doy / 365.25),
+    }
+
+    frame = pd.DataFrame({
+        'station_id': station,
+        'epoch': epoch,
+        'lat': np.float32(lat), 'lon': np.float32(lon), 'elev': np.float32(elev),
+        'n_epochs': counts.astype(np.float32),
+        'n_sats': (np.bincount(index, weights=obs['n_sats']) / counts).astype(np.float32),
+    })
+    return frame, columns
+
+
+def process_file(path, sha256, interval=INTERVAL):
+    """
+    Worker: decompress -> parse -> feature -> predict one file.
+    Returns (sha256, frame, error, seconds); bad files come back with an error, never raise.
+    """
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != sha256:
+            return sha256, None, "content changed while queued", time.perf_counter() - start
+        obs = parse_rinex_obs(decompress(data))
+        station = station_from_name(os.path.basename(path)) or (obs['marker'] or 'UNKNOWN').upper()
+        frame, columns = features(obs, station, interval)
+        met = covariates(columns['lat'], columns['lon'], columns['elev'], frame['epoch'].to_numpy())
+        apply_covariates(frame, columns, *met)
+        model = _model()
+        frame['pw_predicted'] = predict_pw(model, columns)
+        frame['pw_uncertainty'] = np.float32(UNCERTAINTY)
+        frame['source'] = sha256[:16]
+        return sha256, frame, None, time.perf_counter() - start
+    except (OSError, ValueError, subprocess.CalledProcessError, EOFError) as e:
+        return sha256, None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+# ---- Ledger ----
+
+class Ledger:
+    """sqlite record of every path seen, every distinct file (by hash) and every batch"""
+
+    def __init__(self, path):
+        # Not tied to one thread: pipeline.py writes from its I/O threads, one at a time
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT);
+                CREATE TABLE IF NOT EXISTS files (sha256 TEXT PRIMARY KEY, path TEXT, status TEXT, batch TEXT,
+                                                  rows INTEGER, attempts INTEGER DEFAULT 0, error TEXT,
+                                                  seen REAL, finished REAL);
+                CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, status TEXT, files INTEGER, rows INTEGER,
+                                                    created REAL, committed REAL);
+                CREATE TABLE IF NOT EXISTS rows (station_id TEXT, epoch INTEGER, sha256 TEXT,
+                                                 PRIMARY KEY (station_id, epoch)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS replaced (batch TEXT, station_id TEXT, epoch INTEGER,
+                                                     PRIMARY KEY (batch, station_id, epoch)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS files_status ON files (status);
+            """)
+            columns = {row[1] for row in self.db.execute('PRAGMA table_info(rows)')}
+            if 'n_epochs' not in columns:
+                # Ledgers from before rows knew their bin size: those rows are never replaced
+                self.db.execute('ALTER TABLE rows ADD COLUMN n_epochs INTEGER')
+                self.db.execute('ALTER TABLE rows ADD COLUMN batch TEXT')
+                self.db.execute('UPDATE rows SET batch = (SELECT batch FROM files WHERE files.sha256 = rows.sha256)')
+
+    def close(self):
+        self.db.close()
+
+    def unchanged(self, path, st):
+        row = self.db.execute('SELECT size, mtime_ns FROM paths WHERE path = ?', (path,)).fetchone()
+        return row is not None and row == (st.st_size, st.st_mtime_ns)
+
+    def add(self, path, st, sha256):
+        """Record the path; True if its content is new (queued), False for a duplicate"""
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?)',
+                            (path, st.st_size, st.st_mtime_ns, sha256))
+            cursor = self.db.execute("INSERT OR IGNORE INTO files (sha256, path, status, seen) VALUES (?, ?, 'queued', ?)",
+                                     (sha256, path, time.time()))
+        return cursor.rowcount == 1
+
+    def forget_path(self, path):
+        with self.db:
+            self.db.execute('DELETE FROM paths WHERE path = ?', (path,))
+
+    def queued(self):
+        return self.db.execute("SELECT sha256, path, seen FROM files WHERE status = 'queued' ORDER BY seen").fetchall()
+
+    def crashed(self, sha256):
+        """Count a pool crash against the file; True once it has used up its attempts"""
+        with self.db:
+            self.db.execute('UPDATE files SET attempts = attempts + 1 WHERE sha256 = ?', (sha256,))
+        return self.db.execute('SELECT attempts FROM files WHERE sha256 = ?', (sha256,)).fetchone()[0] >= MAX_ATTEMPTS
+
+    def fail(self, sha256, error):
+        with self.db:
+            self.db.execute("UPDATE files SET status = 'failed', error = ?, finished = ? WHERE sha256 = ?",
+                            (error, time.time(), sha256))
+
+    def retry_failed(self):
+        with self.db:
+            return self.db.execute("UPDATE files SET status = 'queued', error = NULL, attempts = 0 "
+                                   "WHERE status = 'failed'").rowcount
+
+    def begin_batch(self, batch, shas):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO batches (id, status, files, created) VALUES (?, 'writing', ?, ?)",
+                            (batch, len(shas), time.time()))
+            self.db.executemany('UPDATE files SET batch = ? WHERE sha256 = ?', [(batch, sha) for sha in shas])
+
+    def stored_rows(self, station_ids, epochs):
+        """
+        Epoch count and batch of the committed row of each (station, epoch):
+        (n_epochs, batch) arrays, 0 / None where there is none.
+        """
+        station_ids = np.asarray(station_ids).astype(str)
+        epochs = np.asarray(epochs, dtype=np.int64)
+        n_epochs = np.zeros(len(epochs), dtype=np.int64)
+        batches = np.full(len(epochs), None, dtype=object)
+        for station in np.unique(station_ids):
+            rows = np.flatnonzero(station_ids == station)
+            stored = {epoch: (n, batch) for epoch, n, batch in self.db.execute(
+                'SELECT epoch, COALESCE(n_epochs, ?), batch FROM rows WHERE station_id = ? AND epoch BETWEEN ? AND ?',
+                (UNKNOWN_EPOCHS, station, int(epochs[rows].min()), int(epochs[rows].max())))}
+            for k in rows:
+                n_epochs[k], batches[k] = stored.get(int(epochs[k]), (0, None))
+        return n_epochs, batches
+
+    def commit_batch(self, batch, rows, keys=(), replaced=()):
+        """
+        rows: {sha256: row count}, keys: [(station, epoch, sha256, n_epochs)] written,
+        replaced: [(batch, station, epoch)] stored rows they supersede (removed by
+        drop_replaced); marks the batch and its files done in one transaction
+        """
+        now = time.time()
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO rows (station_id, epoch, sha256, n_epochs, batch) '
+                                'VALUES (?, ?, ?, ?, ?)', [(*key, batch) for key in keys])
+            self.db.executemany('INSERT OR IGNORE INTO replaced VALUES (?, ?, ?)', replaced)
+            self.db.execute("UPDATE batches SET status = 'done', rows = ?, committed = ? WHERE id = ?",
+                            (sum(rows.values()), now, batch))
+            self.db.executemany("UPDATE files SET status = 'done', rows = ?, finished = ? WHERE sha256 = ?",
+                                [(n, now, sha) for sha, n in rows.items()])
+
+    def abort(self, batch, store):
+        """Remove the part files of an uncommitted batch; its files stay queued"""
+        for dirpath, _, names in os.walk(store):
+            for name in names:
+                if name.startswith(f"part-{batch}-"):
+                    os.remove(os.path.join(dirpath, name))
+        with self.db:
+            self.db.execute("UPDATE files SET batch = NULL WHERE batch = ? AND status = 'queued'", (batch,))
+            self.db.execute('DELETE FROM batches WHERE id = ?', (batch,))
+
+    def drop_replaced(self, store):
+        """Rewrite the part files holding rows superseded by fuller bins, without those rows"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        from gnss_store import epoch_month
+
+        replaced = self.db.execute('SELECT batch, station_id, epoch FROM replaced').fetchall()
+        partitions = {}
+        for batch, station, epoch in replaced:
+            partitions.setdefault((batch, station, epoch_month([epoch])[0]), []).append(epoch)
+        for (batch, station, month), epochs in partitions.items():
+            directory = os.path.join(store, f"station_id={station}", f"month={month}")
+            for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+                if not name.startswith(f"part-{batch}-"):
+                    continue
+                path = os.path.join(directory, name)
+                table = pq.ParquetFile(path).read()
+                kept = table.filter(pc.invert(pc.is_in(table['epoch'], value_set=pa.array(epochs, pa.int64()))))
+                if kept.num_rows == table.num_rows:
+                    continue
+                if kept.num_rows:
+                    tmp = os.path.join(directory, f".{name}.tmp")      # dot files are not read as data
+                    pq.write_table(kept, tmp, compression='zstd')
+                    os.replace(tmp, path)
+                else:
+                    os.remove(path)
+        with self.db:
+            self.db.executemany('DELETE FROM replaced WHERE batch = ? AND station_id = ? AND epoch = ?', replaced)
+        return len(replaced)
+
+    def recover(self, store):
+        """
+        Remove the part files of batches that were never committed (their files
+        stay queued) and finish removing rows superseded by committed ones
+        """
+        batches = [row[0] for row in self.db.execute("SELECT id FROM batches WHERE status = 'writing'")]
+        for batch in batches:
+            self.abort(batch, store)
+        self.drop_replaced(store)
+        return len(batches)
+
+    def totals(self):
+        files = dict(self.db.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall())
+        paths = self.db.execute('SELECT COUNT(*) FROM paths').fetchone()[0]
+        rows, batches, last = self.db.execute(
+            "SELECT COALESCE(SUM(rows), 0), COUNT(*), MAX(committed) FROM batches WHERE status = 'done'").fetchone()
+        return {
+            'files': {status: files.get(status, 0) for status in ('done', 'failed', 'queued')},
+            'duplicate_paths': paths - sum(files.values()),
+            'rows': rows,
+            'batches': batches,
+            'last_batch': last,
+        }
+
+    def failures(self, limit=20):
+        return [{'path': path, 'error': error} for path, error in self.db.execute(
+            "SELECT path, error FROM files WHERE status = 'failed' ORDER BY finished DESC LIMIT ?", (limit,))]
+
+
+def write_batch(ledger, store, parts):
+    """
+    Append [(sha256, frame)] to the store as one journaled batch with one row
+    per (station, epoch) bin: the row with the most epochs wins, within the
+    batch (the first file processed on ties) and against rows committed
+    before, whose copies are then removed from their part files. Part files
+    are named after the batch's file hashes. Returns (batch, frame written,
+    {sha256: rows written}, rows dropped).
+    """
+    import pandas as pd
+    from gnss_store import write_dataset
+
+    shas = sorted(sha for sha, _ in parts)
+    batch = hashlib.sha256('\n'.join(shas).encode()).hexdigest()[:16]
+    frame = pd.concat([f for _, f in parts], ignore_index=True)
+    frame['station_id'] = frame['station_id'].astype(str)
+    row_sha = np.repeat([sha for sha, _ in parts], [len(f) for _, f in parts])
+    n_epochs = frame['n_epochs'].to_numpy(np.int64)
+
+    # A file's partial hour (the start or end of its span) never displaces a complete one
+    fullest = np.argsort(-n_epochs, kind='stable')
+    keep = np.zeros(len(frame), dtype=bool)
+    keep[fullest] = ~frame.iloc[fullest].duplicated(['station_id', 'epoch']).to_numpy()
+    stored_n, stored_batch = ledger.stored_rows(frame['station_id'], frame['epoch'])
+    keep &= n_epochs > stored_n
+    replaced = keep & (stored_n > 0)
+    replaced = list(zip(stored_batch[replaced].tolist(), frame['station_id'][replaced].tolist(),
+                        frame['epoch'][replaced].tolist()))
+    dropped = int(np.count_nonzero(~keep))
+    frame, row_sha, n_epochs = frame[keep].reset_index(drop=True), row_sha[keep], n_epochs[keep]
+    rows = {sha: int(np.count_nonzero(row_sha == sha)) for sha in shas}
+
+    ledger.begin_batch(batch, shas)
+    try:
+        if len(frame):
+            write_dataset(frame, store, legacy=False, basename=batch)
+    except BaseException:
+        ledger.abort(batch, store)
+        raise
+    ledger.commit_batch(batch, rows, zip(frame['station_id'].tolist(), frame['epoch'].tolist(),
+                                         row_sha.tolist(), n_epochs.tolist()), replaced)
+    if replaced:
+        ledger.drop_replaced(store)
+    return batch, frame, rows, dropped
+
+
+# ---- Watchers ----
+
+def listing(dirs):
+    """Every file in the watched directories"""
+    paths = []
+    for directory in dirs:
+        try:
+            with os.scandir(directory) as entries:
+                paths.extend(entry.path for entry in entries if entry.is_file())
+        except FileNotFoundError:
+            continue
+    return paths
+
+
+class PollWatcher:
+    """Rescans the directories every poll seconds (NFS mounts, non-Linux)"""
+
+    mode = 'poll'
+
+    def __init__(self, dirs, poll=POLL_SECONDS):
+        self.dirs = dirs
+        self.poll = poll
+        self.next_scan = time.monotonic() + poll
+
+    def wait(self, timeout):
+        """Candidate paths seen within timeout seconds, and whether they need settling"""
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return [], True
+        time.sleep(max(delay, 0))
+        self.next_scan = time.monotonic() + self.poll
+        return listing(self.dirs), True
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify through libc: files closed after writing or moved into a watched directory"""
+
+    mode = 'inotify'
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.dirs = dirs
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        for directory in dirs:
+            os.makedirs(directory, exist_ok=True)
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self.watches[wd] = directory
+
+    def wait(self, timeout):
+        import select
+        import struct
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return [], False
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return [], False
+        paths = []
+        offset = 0
+        while offset + IN_EVENT <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + IN_EVENT:offset + IN_EVENT + length].rstrip(b'\0')
+            offset += IN_EVENT + length
+            if mask & IN_Q_OVERFLOW:
+                return listing(self.dirs), True        # events were dropped: rescan everything
+            if wd in self.watches and name:
+                paths.append(os.path.join(self.watches[wd], os.fsdecode(name)))
+        return paths, False
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(dirs, poll=None):
+    if poll is None:
+        try:
+            return InotifyWatcher(dirs)
+        except (OSError, AttributeError) as e:     # AttributeError: libc without inotify
+            print(f"inotify unavailable ({e}), polling every {POLL_SECONDS:g}s")
+            poll = POLL_SECONDS
+    return PollWatcher(dirs, poll)
+
+
+# ---- Daemon ----
+
+class Ingestor:
+    """Watcher -> hash/dedupe -> bounded process pool -> batched, journaled Parquet writes"""
+
+    def __init__(self, watch=None, store=None, directory=None, workers=None, batch_files=BATCH_FILES,
+                 flush_seconds=FLUSH_SECONDS, interval=INTERVAL, timeline=False):
+        from metrics import Histogram
+
+        self.directory = directory or INGEST_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.watch = [os.path.abspath(d) for d in (watch or WATCH_DIRS)]
+        self.store = store or os.path.join(self.directory, STORE_DIR)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = 2 * self.workers
+        self.batch_files = batch_files
+        self.flush_seconds = flush_seconds
+        self.interval = interval
+        self.timeline = timeline
+        self.ledger = Ledger(os.path.join(self.directory, LEDGER_FILE))
+
+        self.pending = []          # [(sha256, path, seen)], oldest first
+        self.in_flight = {}        # future -> (sha256, path, seen)
+        self.buffer = []           # [(sha256, frame)] processed, not yet written
+        self.buffer_since = None
+        self.pool = None
+        self.stopping = False
+        self.watcher_mode = None
+        self.started = time.time()
+        self.counters = {'discovered': 0, 'duplicates': 0, 'processed': 0, 'failed': 0, 'rows': 0,
+                         'duplicate_rows': 0, 'batches': 0}
+        self.file_seconds = Histogram()
+        self.last_status = 0.0
+
+    # -- discovery --
+
+    def discover(self, paths, settle):
+        """Hash new or changed files among paths and queue the ones with new content"""
+        now = time.time()
+        for path in paths:
+            if station_from_name(os.path.basename(path)) is None:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if settle and now - st.st_mtime < SETTLE_SECONDS:
+                continue                       # still being written; picked up on the next scan
+            if self.ledger.unchanged(path, st):
+                continue
+            sha = file_sha256(path)
+            self.counters['discovered'] += 1
+            if self.ledger.add(path, st, sha):
+                self.pending.append((sha, path, now))
+            else:
+                self.counters['duplicates'] += 1
+
+    # -- pool --
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        return self.pool
+
+    def submit(self):
+        while self.pending and len(self.in_flight) < self.max_in_flight and not self.stopping:
+            item = self.pending.pop(0)
+            future = self._pool().submit(process_file, item[1], item[0], self.interval)
+            self.in_flight[future] = item
+
+    def reap(self, timeout=0):
+        if not self.in_flight:
+            return
+        done, _ = concurrent.futures.wait(list(self.in_flight), timeout, concurrent.futures.FIRST_COMPLETED)
+        broken = False
+        for future in done:
+            sha, path, seen = item = self.in_flight.pop(future)
+            try:
+                _, frame, error, seconds = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                broken = True
+                if self.ledger.crashed(sha):
+                    self.ledger.fail(sha, "worker process crashed")
+                    self.counters['failed'] += 1
+                else:
+                    self.pending.insert(0, item)
+                continue
+            except Exception as e:
+                _, frame, error, seconds = sha, None, f"{type(e).__name__}: {e}", 0.0
+            self.file_seconds.observe(seconds)
+            if error is not None:
+                print(f"Failed {path}: {error}")
+                self.ledger.fail(sha, error)
+                if error == "content changed while queued":
+                    self.ledger.forget_path(path)      # rehashed as a new file on the next scan
+                self.counters['failed'] += 1
+                continue
+            self.counters['processed'] += 1
+            if self.buffer_since is None:
+                self.buffer_since = time.monotonic()
+            self.buffer.append((sha, frame))
+        if broken:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    # -- output --
+
+    def flush(self, force=False):
+        if not self.buffer:
+            return 0
+        due = (len(self.buffer) >= self.batch_files or
+               time.monotonic() - self.buffer_since >= self.flush_seconds)
+        if not (force or due):
+            return 0
+
+        batch, frame, _, dropped = write_batch(self.ledger, self.store, self.buffer)
+        if self.timeline and len(frame):
+            from timeline import add_rows
+            add_rows(frame)
+
+        print(f"Batch {batch}: {len(self.buffer)} files, {len(frame)} rows -> {self.store}"
+              + (f" ({dropped} duplicate rows dropped)" if dropped else ""))
+        self.counters['rows'] += len(frame)
+        self.counters['duplicate_rows'] += dropped
+        self.counters['batches'] += 1
+        self.buffer, self.buffer_since = [], None
+        return len(frame)
+
+    # -- metrics --
+
+    def backlog(self):
+        oldest = min([seen for _, _, seen in self.pending] + [seen for _, _, seen in self.in_flight.values()],
+                     default=None)
+        return {
+            'pending': len(self.pending),
+            'in_flight': len(self.in_flight),
+            'buffered': len(self.buffer),
+            'total': len(self.pending) + len(self.in_flight) + len(self.buffer),
+            'oldest_seconds': round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        }
+
+    def write_status(self, force=False):
+        now = time.time()
+        if not force and now - self.last_status < STATUS_SECONDS:
+            return
+        self.last_status = now
+        status = {
+            'pid': os.getpid(),
+            'started': self.started,
+            'heartbeat': now,
+            'watcher': self.watcher_mode,
+            'watch': self.watch,
+            'store': os.path.abspath(self.store),
+            'workers': self.workers,
+            'backlog': self.backlog(),
+            'since_start': dict(self.counters),
+            'file_seconds': self.file_seconds.to_dict(),
+        }
+        path = os.path.join(self.directory, STATUS_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(status, f)
+        os.replace(path + '.tmp', path)
+
+    # -- main loop --
+
+    def _stop(self, *args):
+        self.stopping = True
+
+    def run(self, once=False, poll=None, retry_failed=False):
+        recovered = self.ledger.recover(self.store)
+        if recovered:
+            print(f"Removed {recovered} uncommitted batch(es); their files are processed again")
+        if retry_failed:
+            print(f"Retrying {self.ledger.retry_failed()} failed file(s)")
+        # Files queued before a restart (or crash) go first
+        self.pending = []
+        for sha, path, seen in self.ledger.queued():
+            if os.path.exists(path):
+                self.pending.append((sha, path, seen))
+            else:
+                self.ledger.fail(sha, "file disappeared before processing")
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        watcher = None if once else make_watcher(self.watch, poll)
+        self.watcher_mode = 'once' if once else watcher.mode
+        print(f"Ingesting {', '.join(self.watch)} -> {self.store} ({self.watcher_mode}, {self.workers} workers)")
+        self.discover(listing(self.watch), settle=True)
+
+        try:
+            while not self.stopping:
+                self.submit()
+                self.reap(0)
+                if once and not self.pending and not self.in_flight:
+                    break
+                if watcher is None:
+                    self.reap(1.0)
+                else:
+                    paths, settle = watcher.wait(0.2 if self.in_flight or self.buffer else 1.0)
+                    self.discover(paths, settle)
+                self.flush()
+                self.write_status()
+            # Drain: finish what is running, write everything processed; pending files stay queued
+            while self.in_flight:
+                self.reap(1.0)
+            self.flush(force=True)
+        finally:
+            if watcher is not None:
+                watcher.close()
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+            self.write_status(force=True)
+            self.ledger.close()
+        return self.counters
+
+
+# ---- Status ----
+
+def status(directory=None):
+    """Ledger totals plus the live backlog of a running daemon"""
+    directory = directory or INGEST_DIR
+    result = {'running': False}
+    path = os.path.join(directory, LEDGER_FILE)
+    if os.path.exists(path):
+        ledger = Ledger(path)
+        result.update(ledger.totals())
+        result['recent_failures'] = ledger.failures(5)
+        ledger.close()
+    path = os.path.join(directory, STATUS_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            live = json.load(f)
+        try:
+            os.kill(live['pid'], 0)
+            alive = time.time() - live['heartbeat'] < 6 * STATUS_SECONDS
+        except (ProcessLookupError, PermissionError):
+            alive = False
+        result['running'] = alive
+        result['live'] = live
+    return result
+
+
+def render(result):
+    """Prometheus text exposition format of status()"""
+    from metrics import Histogram, LATENCY_BUCKETS
+
+    lines = ["# HELP zvc_ingest_files_total Distinct files by ledger status",
+             "# TYPE zvc_ingest_files_total gauge"]
+    for state, count in sorted(result.get('files', {}).items()):
+        lines.append(f'zvc_ingest_files_total{{status="{state}"}} {count}')
+    for name, key, help_text in (('zvc_ingest_duplicate_paths', 'duplicate_paths', "Paths skipped as content duplicates"),
+                                 ('zvc_ingest_rows_total', 'rows', "Rows written to the store"),
+                                 ('zvc_ingest_batches_total', 'batches', "Committed batches")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {result.get(key, 0)}"]
+    lines += ["# HELP zvc_ingest_last_batch_timestamp_seconds Commit time of the latest batch",
+              "# TYPE zvc_ingest_last_batch_timestamp_seconds gauge",
+              f"zvc_ingest_last_batch_timestamp_seconds {result.get('last_batch') or 0:.3f}",
+              "# HELP zvc_ingest_up Whether the daemon is running",
+              "# TYPE zvc_ingest_up gauge",
+              f"zvc_ingest_up {int(result['running'])}"]
+
+    live = result.get('live')
+    if result['running'] and live:
+        lines += ["# HELP zvc_ingest_backlog_files Files waiting, by stage",
+                  "# TYPE zvc_ingest_backlog_files gauge"]
+        for stage in ('pending', 'in_flight', 'buffered'):
+            lines.append(f'zvc_ingest_backlog_files{{stage="{stage}"}} {live["backlog"][stage]}')
+        lines += ["# HELP zvc_ingest_backlog_oldest_seconds Age of the oldest file not yet processed",
+                  "# TYPE zvc_ingest_backlog_oldest_seconds gauge",
+                  f"zvc_ingest_backlog_oldest_seconds {live['backlog']['oldest_seconds']:.3f}"]
+        h = Histogram.from_dict(live['file_seconds'])
+        name = 'zvc_ingest_file_seconds'
+        lines += [f"# HELP {name} Decompress-to-predict time per file since the daemon started",
+                  f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, h.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines += [f'{name}_bucket{{le="+Inf"}} {h.count}', f'{name}_sum {h.sum:.6f}', f'{name}_count {h.count}']
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RINEX watch-folder ingestion")
+    parser.add_argument('--dir', default=None, help=f"ledger/status directory (default {INGEST_DIR})")
+    sub = parser.add_subparsers(dest='command')
+
+    run_cmd = sub.add_parser('run', help="watch directories and ingest new files")
+    run_cmd.add_argument('watch', nargs='*', help=f"directories to watch (default {os.pathsep.join(WATCH_DIRS)})")
+    run_cmd.add_argument('--store', default=None, help="Parquet store (default <dir>/store)")
+    run_cmd.add_argument('--workers', type=int, default=None)
+    run_cmd.add_argument('--batch-files', type=int, default=BATCH_FILES)
+    run_cmd.add_argument('--flush-seconds', type=float, default=FLUSH_SECONDS)
+    run_cmd.add_argument('--interval', type=int, default=INTERVAL, help="seconds per output row")
+    run_cmd.add_argument('--poll', type=float, default=None, metavar='SECONDS',
+                         help="poll instead of inotify (e.g. on network mounts)")
+    run_cmd.add_argument('--once', action='store_true', help="process the current files and exit")
+    run_cmd.add_argument('--retry-failed', action='store_true')
+    run_cmd.add_argument('--timeline', action='store_true', help="also merge rows into the timeline store")
+
+    sub.add_parser('status', help="ledger totals and backlog as JSON")
+    sub.add_parser('metrics', help="ledger totals and backlog in Prometheus text format")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        try:
+            load_pw_model()    # refuse a model whose target is not PW before any file is marked failed
+        except ValueError as e:
+            sys.exit(str(e))
+        ingestor = Ingestor(args.watch or None, args.store, args.dir, args.workers, args.batch_files,
+                            args.flush_seconds, args.interval, args.timeline)
+        counters = ingestor.run(once=args.once, poll=args.poll, retry_failed=args.retry_failed)
+        print(json.dumps(counters))
+    elif args.command == 'status':
+        print(json.dumps(status(args.dir)))
+    elif args.command == 'metrics':
+        print(render(status(args.dir)), end='')
+    else:
+        parser.print_help()
@@ -0,0 +1,318 @@
+"""
+metrics.py - Per-stage latency metrics for the prediction service
+
+prediction.py runs as a fresh process per request, so metrics cannot live in
+memory. Each request appends one JSON line (stage timings, method, fallback
+reason) to a spool file with a single O_APPEND write. The reader side folds
+the spool into cumulative histograms and renders them in the Prometheus text
+exposition format.
+
+Request side (prediction.py):
+    timer = StageTimer()
+    with timer.stage('model_load'):
+        ...
+    timer.record(method, fallback_reason)
+
+Reader side:
+    python metrics.py                       print /metrics text once
+    python metrics.py --serve 9464          serve GET /metrics over HTTP
+    python metrics.py --dump-every 60 --out /var/lib/zvc/metrics.prom
+
+Environment:
+    ZVC_METRICS=0          disable recording (the timers become no-ops)
+    ZVC_METRICS_DIR        spool/aggregate directory (default: <tmp>/zvc-metrics)
+    ZVC_SPAWN_TS           Unix time the parent spawned this process; turns the
+                           spawn-to-start gap into the 'spawn' stage
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from shared import file_lock
+
+ENABLED = os.environ.get('ZVC_METRICS', '1') != '0'
+METRICS_DIR = os.environ.get('ZVC_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'zvc-metrics'))
+SPOOL_FILE = 'requests.jsonl'
+LOCK_FILE = '.lock'
+AGGREGATE_FILE = 'aggregate.json'
+
+# Histogram upper bounds in seconds (Prometheus 'le' labels); +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Wall clock and monotonic clock at import, i.e. close to interpreter start
+_IMPORT_WALL = time.time()
+_IMPORT_PERF = time.perf_counter()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.timer.stages[self.name] = self.timer.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class StageTimer:
+    """Accumulates wall time per named stage for one request"""
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.stages = {}
+        self.fallback_reason = None
+        self.start = _IMPORT_PERF
+        spawn_ts = os.environ.get('ZVC_SPAWN_TS')
+        if enabled and spawn_ts:
+            try:
+                self.stages['spawn'] = max(_IMPORT_WALL - float(spawn_ts), 0.0)
+            except ValueError:
+                pass
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def add(self, name, seconds):
+        if self.enabled:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record(self, method, fallback_reason=None, directory=None):
+        """Append this request to the spool; total runs from import (plus spawn) to now"""
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.start + self.stages.get('spawn', 0.0)
+        line = json.dumps({
+            'ts': round(time.time(), 3),
+            'method': method,
+            'fallback': fallback_reason,
+            'total': round(total, 6),
+            'stages': {k: round(v, 6) for k, v in self.stages.items()},
+        }, separators=(',', ':')) + '\n'
+        try:
+            directory = directory or METRICS_DIR
+            os.makedirs(directory, exist_ok=True)
+            # Shared lock: Aggregate.collect cannot take the spool between our open and write
+            with file_lock(os.path.join(directory, LOCK_FILE), shared=True):
+                fd = os.open(os.path.join(directory, SPOOL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode())  # one write per line keeps concurrent appends whole
+                finally:
+                    os.close(fd)
+        except OSError:
+            pass  # metrics must never fail a prediction
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram (counts per upper bound, sum, count)"""
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = counts or [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(list(d['counts']), d['sum'], d['count'])
+
+
+class Aggregate:
+    """Cumulative metrics folded from the spool and persisted in aggregate.json"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or METRICS_DIR
+        self.path = os.path.join(self.directory, AGGREGATE_FILE)
+        self.requests = {}      # method -> count
+        self.fallbacks = {}     # reason -> count
+        self.latency = {}       # method -> Histogram
+        self.stages = {}        # stage -> Histogram
+        self.last_request = 0.0
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            self.requests = state['requests']
+            self.fallbacks = state['fallbacks']
+            self.latency = {k: Histogram.from_dict(v) for k, v in state['latency'].items()}
+            self.stages = {k: Histogram.from_dict(v) for k, v in state['stages'].items()}
+            self.last_request = state.get('last_request', 0.0)
+
+    def add(self, entry):
+        method = entry.get('method') or 'unknown'
+        self.requests[method] = self.requests.get(method, 0) + 1
+        if entry.get('fallback'):
+            self.fallbacks[entry['fallback']] = self.fallbacks.get(entry['fallback'], 0) + 1
+        self.latency.setdefault(method, Histogram()).observe(entry['total'])
+        for stage, seconds in entry.get('stages', {}).items():
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+        self.last_request = max(self.last_request, entry.get('ts', 0.0))
+
+    def collect(self):
+        """
+        Fold the spool into the aggregate. The spool is renamed first, so
+        requests appending meanwhile start a new spool and nothing is lost;
+        the aggregate is reloaded, updated and saved under a lock file (as
+        aggregates.Aggregates.updating), so concurrent collectors never drop
+        each other's updates.
+        """
+        spool = os.path.join(self.directory, SPOOL_FILE)
+        if not os.path.exists(spool):
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(os.path.join(self.directory, LOCK_FILE)):
+            if not os.path.exists(spool):
+                return 0    # another collector took it while we waited
+            self.load()
+            work = f"{spool}.{os.getpid()}.work"
+            os.replace(spool, work)
+            n = 0
+            with open(work) as f:
+                for line in f:
+                    try:
+                        self.add(json.loads(line))
+                        n += 1
+                    except (ValueError, KeyError):
+                        continue
+            self.save()
+            os.remove(work)
+        return n
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'requests': self.requests,
+                'fallbacks': self.fallbacks,
+                'latency': {k: v.to_dict() for k, v in self.latency.items()},
+                'stages': {k: v.to_dict() for k, v in self.stages.items()},
+                'last_request': self.last_request,
+            }, f)
+        os.replace(tmp, self.path)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def histogram(name, help_text, label, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, h in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{key}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {h.count}')
+
+        lines.append("# HELP zvc_prediction_requests_total Prediction requests by method")
+        lines.append("# TYPE zvc_prediction_requests_total counter")
+        for method, count in sorted(self.requests.items()):
+            lines.append(f'zvc_prediction_requests_total{{method="{method}"}} {count}')
+
+        lines.append("# HELP zvc_prediction_fallbacks_total Fallback activations by reason")
+        lines.append("# TYPE zvc_prediction_fallbacks_total counter")
+        for reason, count in sorted(self.fallbacks.items()):
+            lines.append(f'zvc_prediction_fallbacks_total{{reason="{reason}"}} {count}')
+
+        histogram('zvc_prediction_latency_seconds', "End-to-end latency (spawn to output) by method",
+                  'method', self.latency)
+        histogram('zvc_prediction_stage_seconds', "Time per stage (spawn, imports, model_load, covariates, "
+                  "engineer_features, predict, output)", 'stage', self.stages)
+        if 'model_load' in self.stages:
+            histogram('zvc_model_load_seconds', "Model deserialisation time", 'model',
+                      {'xgboost': self.stages['model_load']})
+
+        lines.append("# HELP zvc_prediction_last_request_timestamp_seconds Time of the latest request")
+        lines.append("# TYPE zvc_prediction_last_request_timestamp_seconds gauge")
+        lines.append(f"zvc_prediction_last_request_timestamp_seconds {self.last_request:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def scrape(directory=None):
+    """Collect the spool and return the /metrics text"""
+    aggregate = Aggregate(directory)
+    aggregate.collect()
+    return aggregate.render()
+
+
+def serve(port, directory=None):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = scrape(directory).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Serving metrics from {directory or METRICS_DIR} on :{port}/metrics")
+    HTTPServer(('', port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prediction service metrics")
+    parser.add_argument('--dir', default=None, help=f"spool directory (default {METRICS_DIR})")
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT')
+    parser.add_argument('--dump-every', type=float, default=None, metavar='SECONDS')
+    parser.add_argument('--out', default=None, help="file for --dump-every (default stdout)")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.dir)
+    elif args.dump_every:
+        while True:
+            text = scrape(args.dir)
+            if args.out:
+                with open(args.out + '.tmp', 'w') as f:
+                    f.write(text)
+                os.replace(args.out + '.tmp', args.out)
+            else:
+                print(text, flush=True)
+            time.sleep(args.dump_every)
+    else:
+        print(scrape(args.dir), end='')
@@ -0,0 +1,559 @@
+"""
+pipeline.py - Staged asyncio pipeline for uploaded RINEX files
+
+/rinex handled an upload strictly in sequence (read, parse, fetch weather
+over HTTP, spawn prediction.py, clean up), so one slow weather call held up
+everything behind it. Here each step is a stage with its own bounded inbox
+and its own number of workers:
+
+    decompress -> parse -> covariates -> predict -> persist
+
+    decompress   process pool (ingest.decompress)
+    parse        process pool (ingest.parse_rinex_obs + ingest.features: binning only,
+                 the covariates stage adds the meteorology)
+    covariates   files batched into one CovariateResolver call (model/covariates.py:
+                 cached, multi-location provider calls, ERA5 / climatology fallback)
+    predict      files batched into one call of the ingest.py PW model (ZVC_INGEST_MODEL)
+    persist      batches appended to a Parquet store (gnss_store layout) through an
+                 ingest.py ledger: one row per (station, hour), the fullest bin wins,
+                 so re-uploads add nothing (ingest.write_batch)
+
+Backpressure: every inbox is bounded and a worker only takes its next item
+once the previous one fits into the next inbox, so a slow stage fills its
+inbox and then stalls the stages in front of it. Files are admitted only
+while the pipeline has room for them (max_admitted); the server does not
+read a request body before its file is admitted, so a burst of uploads
+waits in TCP buffers rather than in memory.
+
+Per-stage queue depth, active workers, processed/failed counts, mean time
+and throughput over the last minute are served at GET /stats and printed
+by `run --stats-every`.
+
+Usage:
+    python pipeline.py --serve 8097            POST /rinex (file as body, X-Filename header), GET /stats
+    python pipeline.py run ../data/downloads/*.Z --stats-every 2
+    python pipeline.py run files... --concurrency covariates=32,predict=1 --batch 64
+
+Environment:
+    ZVC_WEATHER_BASE_URL   weather server for both the forecast and the archive endpoint
+                           (historical epochs use the archive); ZVC_WEATHER_URL,
+                           ZVC_WEATHER_ARCHIVE_URL, ZVC_COVARIATE_CACHE etc. as in
+                           model/covariates.py. Point it at fake_weather.py for local testing
+    ZVC_PIPELINE_DIR       ledger and default store (default: backend/data/pipeline); set it to
+                           the ingest.py directory to share its store and ledger
+    ZVC_PIPELINE_STORE     Parquet store (default: <ZVC_PIPELINE_DIR>/store)
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from ingest import (DATA_DIR, INTERVAL, LEDGER_FILE, STORE_DIR, UNCERTAINTY, Ledger, apply_covariates, decompress,
+                    features, load_pw_model, model_matrix, parse_rinex_obs, pw_from_output, station_from_name,
+                    write_batch)
+
+PIPELINE_DIR = os.environ.get('ZVC_PIPELINE_DIR', os.path.join(DATA_DIR, 'pipeline'))
+PIPELINE_STORE = os.environ.get('ZVC_PIPELINE_STORE', os.path.join(PIPELINE_DIR, STORE_DIR))
+
+STAGES = ('decompress', 'parse', 'covariates', 'predict', 'persist')
+DEFAULT_CONCURRENCY = {
+    'decompress': os.cpu_count() or 1,
+    'parse': os.cpu_count() or 1,
+    'covariates': 4,            # I/O bound: concurrent resolver batches
+    'predict': 1,
+    'persist': 1,
+}
+QUEUE_SIZE = 8                  # items per stage inbox
+BATCH = {'covariates': 16, 'predict': 32, 'persist': 64}
+BATCH_WAIT = {'covariates': 0.05, 'predict': 0.05, 'persist': 0.2}   # s a worker waits to fill a batch
+MAX_UPLOAD = 50 * 1024 * 1024   # bytes, the /rinex multer limit
+THROUGHPUT_WINDOW = 60.0        # s
+
+
+class StageError(Exception):
+    """A file failed in a stage; str() is the reason"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{type(error).__name__}: {error}" if isinstance(error, Exception) else str(error))
+        self.stage = stage
+
+
+class Upload:
+    """One file moving through the stages"""
+
+    def __init__(self, name, data):
+        self.name = os.path.basename(name)
+        self.data = data
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.text = None
+        self.frame = None
+        self.columns = None
+        self.n_epochs = 0
+        self.covariate_source = None
+        self.timings = {}
+        self.started = time.perf_counter()
+        self.done = asyncio.get_running_loop().create_future()
+
+    def fail(self, stage, error):
+        if not self.done.done():
+            self.done.set_exception(StageError(stage, error))
+
+    def finish(self):
+        if not self.done.done():
+            self.done.set_result(self.summary())
+
+    def summary(self):
+        """Result for the caller; the field names follow the /rinex response"""
+        frame = self.frame
+        last = frame.iloc[-1]
+        return {
+            'file': self.name,
+            'sha256': self.sha256,
+            'stationId': str(last['station_id']),
+            'stationLatitude': round(float(last['lat']), 6),
+            'stationLongitude': round(float(last['lon']), 6),
+            'stationElevation': round(float(last['elev']), 2),
+            'totalObservations': self.n_epochs,
+            'timestamp': int(last['epoch']),
+            'temperature': round(float(last['temperature']), 2),
+            'pressure': round(float(last['pressure']), 2),
+            'humidity': round(float(last['humidity']), 2),
+            'covariateSource': self.covariate_source,
+            'prediction': {
+                'predicted_pw': round(float(last['pw_predicted']), 4),
+                'mean_pw': round(float(frame['pw_predicted'].mean()), 4),
+                'uncertainty': UNCERTAINTY,
+                'method': 'xgboost_pipeline',
+            },
+            'series': [{'timestamp': int(e), 'predicted_pw': round(float(pw), 4)}
+                       for e, pw in zip(frame['epoch'], frame['pw_predicted'])],
+            'timings': {k: round(v, 4) for k, v in self.timings.items()},
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+        }
+
+
+class Stage:
+    """Workers taking (batches of) items from a bounded inbox and handing them to the next stage"""
+
+    def __init__(self, name, func, concurrency=1, queue_size=QUEUE_SIZE, batch=1, batch_wait=0.0):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.batch = batch
+        self.batch_wait = batch_wait
+        self.inbox = asyncio.Queue(queue_size)
+        self.next = None
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.started = time.monotonic()
+        self.recent = collections.deque()       # (monotonic time, items) of finished batches
+        self.tasks = []
+
+    def start(self):
+        self.started = time.monotonic()
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def _take(self):
+        items = [await self.inbox.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(items) < self.batch:
+            timeout = deadline - time.monotonic()
+            try:
+                items.append(self.inbox.get_nowait() if timeout <= 0 else
+                             await asyncio.wait_for(self.inbox.get(), timeout))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+        return items
+
+    async def _work(self):
+        while True:
+            items = await self._take()
+            self.active += 1
+            start = time.perf_counter()
+            try:
+                await self.func(items)
+            except Exception as e:
+                for item in items:
+                    item.fail(self.name, e)
+            # Items the stage failed on their own (the others go on), or the whole batch
+            failed = [item for item in items if item.done.done()]
+            seconds = time.perf_counter() - start
+            self.active -= 1
+            self.busy += seconds
+            self.batches += 1
+            self.processed += len(items) - len(failed)
+            self.failed += len(failed)
+            self.recent.append((time.monotonic(), len(items)))
+            for _ in items:
+                self.inbox.task_done()
+            for item in items:
+                if item.done.done():
+                    continue
+                item.timings[self.name] = seconds
+                if self.next is not None:
+                    await self.next.inbox.put(item)     # waits while the next stage is full
+                else:
+                    item.finish()
+
+    def stats(self):
+        now = time.monotonic()
+        while self.recent and now - self.recent[0][0] > THROUGHPUT_WINDOW:
+            self.recent.popleft()
+        window = min(THROUGHPUT_WINDOW, max(now - self.started, 1e-9))
+        return {
+            'stage': self.name,
+            'concurrency': self.concurrency,
+            'batch': self.batch,
+            'queue': self.inbox.qsize(),
+            'queue_max': self.inbox.maxsize,
+            'active': self.active,
+            'processed': self.processed,
+            'failed': self.failed,
+            'mean_seconds': round(self.busy / self.batches, 4) if self.batches else 0.0,
+            'throughput_per_s': round(sum(n for _, n in self.recent) / window, 3),
+            'utilization': round(self.busy / (max(now - self.started, 1e-9) * self.concurrency), 3),
+        }
+
+
+# ---- Stage work ----
+
+def _parse(text, name, interval):
+    obs = parse_rinex_obs(text)
+    station = station_from_name(name) or (obs['marker'] or 'UNKNOWN').upper()
+    frame, columns = features(obs, station, interval)
+    return frame, columns, len(obs['epochs'])
+
+
+class Pipeline:
+    """The five stages, their executors and admission control"""
+
+    def __init__(self, concurrency=None, queue_size=QUEUE_SIZE, batch=None, processes=None,
+                 weather_base=None, store=None, interval=INTERVAL, persist=True, max_admitted=None):
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.batch = {**BATCH, **(batch or {})}
+        self.queue_size = queue_size
+        self.processes = processes or os.cpu_count() or 1
+        self.weather_base = weather_base
+        self.store = store or PIPELINE_STORE
+        self.interval = interval
+        self.persist = persist
+        # Everything the stages can hold at once: inboxes plus the batches being worked on
+        self.max_admitted = max_admitted or sum(
+            queue_size + self.concurrency[s] * self.batch.get(s, 1) for s in STAGES)
+        self.admitted_count = 0
+        self.completed = 0
+        self.errors = 0
+        self.model = None
+        self.ledger = None
+        self.ledger_lock = threading.Lock()     # persist workers share one sqlite connection
+        self.stages = []
+
+    async def start(self):
+        from covariates import ARCHIVE_URL, WEATHER_URL, CovariateResolver, provider_urls
+
+        loop = asyncio.get_running_loop()
+        url, archive_url = provider_urls(self.weather_base) if self.weather_base else (WEATHER_URL, ARCHIVE_URL)
+        self.resolver = CovariateResolver(url=url, archive_url=archive_url,
+                                          pool_size=self.concurrency['covariates'])
+        self.cpu_pool = concurrent.futures.ProcessPoolExecutor(self.processes)
+        self.http_pool = concurrent.futures.ThreadPoolExecutor(self.concurrency['covariates'])
+        self.io_pool = concurrent.futures.ThreadPoolExecutor(self.concurrency['predict'] + self.concurrency['persist'])
+        self.model = await loop.run_in_executor(self.io_pool, load_pw_model)
+        if self.persist:
+            os.makedirs(PIPELINE_DIR, exist_ok=True)
+            self.ledger = Ledger(os.path.join(PIPELINE_DIR, LEDGER_FILE))
+            self.ledger.recover(self.store)     # batches a crash left uncommitted
+        self.admission = asyncio.Semaphore(self.max_admitted)
+        self.started = time.monotonic()
+
+        funcs = {'decompress': self._decompress, 'parse': self._parse, 'covariates': self._covariates,
+                 'predict': self._predict, 'persist': self._persist}
+        self.stages = [Stage(name, funcs[name], self.concurrency[name], self.queue_size,
+                             self.batch.get(name, 1), BATCH_WAIT.get(name, 0.0)) for name in STAGES]
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.next = following
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    async def close(self):
+        for stage in self.stages:
+            for task in stage.tasks:
+                task.cancel()
+        for stage in self.stages:
+            await asyncio.gather(*stage.tasks, return_exceptions=True)
+        for pool in (self.cpu_pool, self.http_pool, self.io_pool):
+            pool.shutdown(cancel_futures=True)
+        self.resolver.close()
+        if self.ledger is not None:
+            self.ledger.close()
+
+    @contextlib.asynccontextmanager
+    async def admitted(self):
+        """Hold a pipeline slot; acquire before reading an upload into memory"""
+        async with self.admission:
+            self.admitted_count += 1
+            try:
+                yield
+            finally:
+                self.admitted_count -= 1
+
+    async def process(self, name, data):
+        """Run one file through the stages (call inside admitted()); raises StageError"""
+        item = Upload(name, data)
+        await self.stages[0].inbox.put(item)
+        try:
+            result = await item.done
+        except StageError:
+            self.errors += 1
+            raise
+        self.completed += 1
+        return result
+
+    def stats(self):
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started, 3),
+            'admitted': self.admitted_count,
+            'max_admitted': self.max_admitted,
+            'completed': self.completed,
+            'failed': self.errors,
+            'stages': [stage.stats() for stage in self.stages],
+            'covariates': dict(self.resolver.counters),
+        }
+
+    # -- stages --
+
+    async def _isolated(self, stage, func, items):
+        """func(items); if that fails, func([item]) per item, so one bad file fails alone"""
+        try:
+            await func(items)
+        except Exception:
+            if len(items) == 1:
+                raise
+            for item in items:
+                try:
+                    await func([item])
+                except Exception as e:
+                    item.fail(stage, e)
+
+    async def _decompress(self, items):
+        loop = asyncio.get_running_loop()
+        for item in items:
+            try:
+                item.text = await loop.run_in_executor(self.cpu_pool, decompress, item.data)
+            except Exception as e:
+                item.fail('decompress', e)
+            item.data = None
+
+    async def _parse(self, items):
+        loop = asyncio.get_running_loop()
+        for item in items:
+            try:
+                item.frame, item.columns, item.n_epochs = await loop.run_in_executor(
+                    self.cpu_pool, _parse, item.text, item.name, self.interval)
+            except Exception as e:
+                item.fail('parse', e)
+            item.text = None
+
+    async def _covariates(self, items):
+        await self._isolated('covariates', self._resolve_covariates, items)
+
+    async def _resolve_covariates(self, items):
+        frames = [item.frame for item in items]
+        lat, lon, elev, epoch = (np.concatenate([f[c].to_numpy() for f in frames]) for c in ('lat', 'lon', 'elev', 'epoch'))
+        out = await asyncio.get_running_loop().run_in_executor(
+            self.http_pool, self.resolver.resolve, lat, lon, epoch, elev)
+        offsets = np.cumsum([len(f) for f in frames])[:-1]
+        split = {name: np.split(values, offsets) for name, values in out.items()}
+        for k, item in enumerate(items):
+            apply_covariates(item.frame, item.columns, split['temperature'][k], split['pressure'][k],
+                             split['humidity'][k], split['source'][k])
+            item.covariate_source = '+'.join(np.unique(split['source'][k].astype(str)))
+
+    async def _predict(self, items):
+        await self._isolated('predict', self._predict_batch, items)
+
+    async def _predict_batch(self, items):
+        loop = asyncio.get_running_loop()
+        X = np.vstack([model_matrix(self.model, item.columns) for item in items])
+        pw = await loop.run_in_executor(self.io_pool, self.model.predict, X)
+        offsets = np.cumsum([len(item.frame) for item in items])[:-1]
+        # Check every file's PW before writing any, so a retry starts from unchanged frames
+        pw = [pw_from_output(self.model, values) for values in np.split(np.asarray(pw), offsets)]
+        for item, values in zip(items, pw):
+            item.frame['pw_predicted'] = values
+            item.frame['pw_uncertainty'] = np.float32(UNCERTAINTY)
+            item.frame['source'] = item.sha256[:16]
+            item.columns = None
+
+    async def _persist(self, items):
+        if not self.persist:
+            return
+        await self._isolated('persist', self._write_batch, items)
+
+    async def _write_batch(self, items):
+        def write():
+            with self.ledger_lock:
+                write_batch(self.ledger, self.store, [(item.sha256, item.frame) for item in items])
+
+        await asyncio.get_running_loop().run_in_executor(self.io_pool, write)
+
+
+# ---- Service / CLI ----
+
+async def _respond(writer, status, payload):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 411: 'Length Required',
+               413: 'Payload Too Large', 422: 'Unprocessable Entity'}
+    body = json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+async def serve(port, pipeline):
+    """POST /rinex runs an upload through the pipeline; GET /stats shows the stages"""
+
+    async def handle(reader, writer):
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            path = urlparse(target).path
+
+            if method == 'GET' and path == '/stats':
+                await _respond(writer, 200, pipeline.stats())
+            elif method == 'POST' and path == '/rinex':
+                if 'content-length' not in headers:
+                    return await _respond(writer, 411, {'success': False, 'message': 'Content-Length required'})
+                length = int(headers['content-length'])
+                if length > MAX_UPLOAD:
+                    return await _respond(writer, 413, {'success': False, 'message': 'File too large'})
+                async with pipeline.admitted():
+                    if headers.get('expect', '').lower() == '100-continue':
+                        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                        await writer.drain()
+                    data = await reader.readexactly(length)     # only read once admitted
+                    try:
+                        result = await pipeline.process(headers.get('x-filename', 'upload'), data)
+                        await _respond(writer, 200, {'success': True, **result})
+                    except StageError as e:
+                        await _respond(writer, 422, {'success': False, 'stage': e.stage, 'message': str(e)})
+            else:
+                await _respond(writer, 404, {'success': False, 'message': 'not found'})
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            with contextlib.suppress(ConnectionError):
+                await _respond(writer, 400, {'success': False, 'message': f"Bad request: {e}"})
+        finally:
+            writer.close()
+
+    await pipeline.start()
+    server = await asyncio.start_server(handle, '', port)
+    print(f"RINEX pipeline on :{port} (POST /rinex, GET /stats), max {pipeline.max_admitted} files admitted")
+    async with server:
+        await server.serve_forever()
+
+
+async def run_files(paths, pipeline, stats_every=None):
+    """Push files through the pipeline as one burst; returns (results, failures)"""
+    await pipeline.start()
+    loop = asyncio.get_running_loop()
+    results, failures = [], []
+
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def one(path):
+        async with pipeline.admitted():
+            data = await loop.run_in_executor(None, read, path)
+            try:
+                results.append(await pipeline.process(path, data))
+            except StageError as e:
+                failures.append({'file': os.path.basename(path), 'stage': e.stage, 'error': str(e)})
+
+    async def report():
+        while True:
+            await asyncio.sleep(stats_every)
+            print(json.dumps(pipeline.stats()), flush=True)
+
+    reporter = asyncio.create_task(report()) if stats_every else None
+    try:
+        await asyncio.gather(*(one(path) for path in paths))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        stats = pipeline.stats()
+        await pipeline.close()
+    return results, failures, stats
+
+
+def _pairs(text, cast=int):
+    """'covariates=16,predict=1' -> {'covariates': 16, 'predict': 1}"""
+    out = {}
+    for pair in filter(None, (text or '').split(',')):
+        name, _, value = pair.partition('=')
+        if name not in STAGES:
+            raise SystemExit(f"Unknown stage {name!r}; stages are {', '.join(STAGES)}")
+        out[name] = cast(value)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Staged asyncio RINEX pipeline")
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT')
+    parser.add_argument('--concurrency', default=None, help="per-stage workers, e.g. covariates=32,parse=2")
+    parser.add_argument('--batch', default=None, help="files per batch, e.g. predict=64,persist=128")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--max-admitted', type=int, default=None,
+                        help="files in the pipeline at once (default: what the inboxes and batches hold)")
+    parser.add_argument('--processes', type=int, default=None, help="decompress/parse process pool size")
+    parser.add_argument('--store', default=None, help=f"Parquet store (default {PIPELINE_STORE})")
+    parser.add_argument('--no-persist', action='store_true')
+    parser.add_argument('--weather-base', default=None,
+                        help="weather server for the forecast and archive endpoints (default: see model/covariates.py)")
+    sub = parser.add_subparsers(dest='command')
+    run_cmd = sub.add_parser('run', help="process files as one burst and print the results")
+    run_cmd.add_argument('files', nargs='+')
+    run_cmd.add_argument('--stats-every', type=float, default=None, metavar='SECONDS')
+    args = parser.parse_args()
+
+    try:
+        load_pw_model()    # refuse a model whose target is not PW before admitting uploads
+    except ValueError as e:
+        sys.exit(str(e))
+
+    pipeline = Pipeline(_pairs(args.concurrency), args.queue_size, _pairs(args.batch), args.processes,
+                        args.weather_base, args.store, persist=not args.no_persist,
+                        max_admitted=args.max_admitted)
+    if args.serve:
+        asyncio.run(serve(args.serve, pipeline))
+    elif args.command == 'run':
+        results, failures, stats = asyncio.run(run_files(args.files, pipeline, args.stats_every))
+        for result in results:
+            print(f"{result['file']}: {result['stationId']} {len(result['series'])} rows, "
+                  f"PW {result['prediction']['mean_pw']:.3f} ({result['covariateSource']}), "
+                  f"{result['total_seconds']:.2f}s")
+        for failure in failures:
+            print(f"{failure['file']}: failed in {failure['stage']}: {failure['error']}")
+        print(json.dumps(stats, indent=2))
+    else:
+        parser.print_help()
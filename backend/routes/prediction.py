@@ -10,21 +10,41 @@ Usage:
 Input format (from stdin or file):
     - For coordinate interpolation: {"latitude": lat, "longitude": lon}
     - For full features: {... all feature fields ...}
+    - Either may add "_profile": true | "sampling" | {...}, honoured with
+      ZVC_PROFILING=1 (see profiling.py)
+    - Missing temperature / pressure / humidity are resolved for the station
+      and time (model/covariates.py). Full-feature requests ask the weather
+      provider unless "_covariates": "offline"; coordinate-only requests stay
+      local (cache, ERA5 grid, climatology) unless "_covariates": "online"
     
 Output:
-    JSON response with predicted_pw, uncertainty, method
+    JSON response with predicted_pw, uncertainty, method and the covariates used
 """
 
-import joblib
-import numpy as np
-from datetime import datetime
-import json
-import sys
-import os
+from metrics import StageTimer  # first, so the import stage covers numpy/joblib/xgboost
+
+TIMER = StageTimer()
+
+with TIMER.stage('imports'):
+    import joblib
+    import numpy as np
+    from datetime import datetime, timezone
+    import calendar
+    import json
+    import sys
+    import os
 
 # Model path - use zwd_xgboost_model.pkl from the same directory
 MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_FILE = os.path.join(MODEL_DIR, "physics_informed_xgb.pkl")
+MODEL_FILE = os.environ.get('ZVC_MODEL_FILE', os.path.join(MODEL_DIR, "physics_informed_xgb.pkl"))
+
+with TIMER.stage('imports'):
+    import shared  # noqa: F401  (puts model/ on sys.path)
+    from physics import vapor_pressure, weighted_mean_temperature, pw_from_zwd
+    from profiling import profilable
+    from aggregates import record_prediction
+    # Tm climatology grid (tm_grid.py build) used for ZWD -> PW conversion
+    from tm_grid import TM_GRID_FILE
 
 # Exact feature names expected by the XGBoost model
 MODEL_FEATURES = [
@@ -32,8 +52,9 @@ MODEL_FEATURES = [
     'hour_sin', 'hour_cos', 'doy_sin', 'doy_cos'
 ]
 
-def load_model(model_path=MODEL_FILE):
-    """Load the XGBoost model"""
+def load_model(model_path=None):
+    """Load the XGBoost model (MODEL_FILE by default)"""
+    model_path = model_path or MODEL_FILE
     try:
         model = joblib.load(model_path)
         return model
@@ -42,6 +63,53 @@ def load_model(model_path=MODEL_FILE):
     except Exception as e:
         raise Exception(f"Error loading model: {e}")
 
+def request_time(input_data):
+    """UTC datetime (naive) of the request's year/month/day/hour fields (now when missing or invalid)"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        return datetime(int(input_data.get('year', now.year)), int(input_data.get('month', now.month)),
+                        int(input_data.get('day', now.day)), int(input_data.get('hour', now.hour)), 0, 0)
+    except (TypeError, ValueError):
+        return now
+
+_RESOLVER = None
+
+def covariate_resolver():
+    """The process's CovariateResolver, opened on first use"""
+    global _RESOLVER
+    if _RESOLVER is None:
+        from covariates import CovariateResolver
+        _RESOLVER = CovariateResolver()
+    return _RESOLVER
+
+def resolve_covariates(input_data, default_elev=100, online=True):
+    """
+    Temperature (°C), pressure (hPa) and humidity (%) for a request: the values
+    it carries, the missing ones from the covariate resolver for its station
+    and hour. online says whether the weather provider may be asked; the
+    request's "_covariates" ("online" / "offline") overrides it.
+    Returns {'temperature', 'pressure', 'humidity', 'source'}.
+    """
+    given = {
+        'temperature': input_data.get('temperature', input_data.get('Temperature (°C)')),
+        'pressure': input_data.get('pressure', input_data.get('Pressure (hPa)')),
+        'humidity': input_data.get('humidity', input_data.get('Humidity (%)')),
+    }
+    given = {k: float(v) for k, v in given.items() if v is not None}
+    if len(given) == 3:
+        return {**given, 'source': 'input'}
+
+    lat = float(input_data.get('stationLatitude', input_data.get('latitude', 0)))
+    lon = float(input_data.get('stationLongitude', input_data.get('longitude', 0)))
+    elev = float(input_data.get('stationElevation', input_data.get('Elevation', default_elev)))
+    epoch = calendar.timegm(request_time(input_data).timetuple())
+    mode = input_data.get('_covariates')
+    if mode in ('online', 'offline'):
+        online = mode == 'online'
+    met = covariate_resolver().resolve_one(lat, lon, epoch, elev, online=online)
+    source = f"input+{met['source']}" if given else met['source']
+    return {**met, **given, 'source': source}
+
 def engineer_features(input_data):
     """
     Engineer features from raw input data to match model expectations.
@@ -67,33 +135,24 @@ def engineer_features(input_data):
     features['lon'] = float(lon)
     features['elev'] = float(elev)
     
-    # Extract meteorological data
-    temp = input_data.get('temperature', input_data.get('Temperature (°C)', 25))
-    pressure = input_data.get('pressure', input_data.get('Pressure (hPa)', 1013))
-    humidity = input_data.get('humidity', input_data.get('Humidity (%)', 60))
+    # Extract meteorological data (resolved for the station and hour when missing)
+    temp = input_data.get('temperature', input_data.get('Temperature (°C)'))
+    pressure = input_data.get('pressure', input_data.get('Pressure (hPa)'))
+    humidity = input_data.get('humidity', input_data.get('Humidity (%)'))
+    if temp is None or pressure is None or humidity is None:
+        met = resolve_covariates(input_data)
+        temp, pressure, humidity = met['temperature'], met['pressure'], met['humidity']
     
     features['temp'] = float(temp)
     features['pressure'] = float(pressure)
     
     # Calculate vapor pressure from temperature and relative humidity
     # Using Tetens formula approximation
-    saturation_vapor = 6.1078 * 10 ** ((7.5 * float(temp)) / (float(temp) + 237.3))
-    vapor_pressure = saturation_vapor * (float(humidity) / 100)
-    features['vapor_pressure'] = float(vapor_pressure)
+    features['vapor_pressure'] = float(vapor_pressure(float(temp), float(humidity)))
     
     # Extract time fields
-    year = input_data.get('year', datetime.now().year)
-    month = input_data.get('month', datetime.now().month)
-    day = input_data.get('day', datetime.now().day)
-    hour = input_data.get('hour', datetime.now().hour)
-    
-    # Create datetime for day of year calculation
-    try:
-        dt = datetime(int(year), int(month), int(day), int(hour), 0, 0)
-    except:
-        dt = datetime.now()
-        hour = dt.hour
-    
+    dt = request_time(input_data)
+    hour = dt.hour
     day_of_year = dt.timetuple().tm_yday
     
     # Cyclical encoding for hour
@@ -124,13 +183,14 @@ def predict_from_features(features, model):
     
     return float(predicted_pw)
 
-def interpolate_coordinates(lat, lon, model):
+def interpolate_coordinates(lat, lon, model, covariates=None):
     """
     Interpolate PW at specific coordinates using the XGBoost model.
-    Uses reasonable default values for other features.
+    covariates (resolve_covariates) supplies the meteorology; without it
+    reasonable default values are used for the other features.
     """
     # Create minimal features for coordinate-only prediction
-    dt = datetime.now()
+    dt = request_time({})
     hour = dt.hour
     day_of_year = dt.timetuple().tm_yday
     
@@ -146,6 +206,10 @@ def interpolate_coordinates(lat, lon, model):
         'doy_sin': np.sin(2 * np.pi * day_of_year / 365.25),
         'doy_cos': np.cos(2 * np.pi * day_of_year / 365.25)
     }
+    if covariates is not None:
+        features['temp'] = covariates['temperature']
+        features['pressure'] = covariates['pressure']
+        features['vapor_pressure'] = float(vapor_pressure(covariates['temperature'], covariates['humidity']))
     
     # Make prediction
     predicted_pw = predict_from_features(features, model)
@@ -157,14 +221,18 @@ def interpolate_coordinates(lat, lon, model):
     
     return predicted_pw, uncertainty
 
+@profilable
 def predict(input_data):
     """
     Main prediction function that handles both coordinate interpolation
-    and full feature-based prediction.
+    and full feature-based prediction. With ZVC_PROFILING=1, an input with
+    "_profile" set is run under the profiler and the report returned under
+    "profile" (profiling.py).
     """
     try:
         # Load model
-        model = load_model()
+        with TIMER.stage('model_load'):
+            model = load_model()
         
         # Check if this is a coordinate-only interpolation request
         has_coordinates = 'latitude' in input_data and 'longitude' in input_data
@@ -177,20 +245,29 @@ def predict(input_data):
             lat = float(input_data['latitude'])
             lon = float(input_data['longitude'])
             
-            predicted_pw, uncertainty = interpolate_coordinates(lat, lon, model)
+            # Stays local (no provider round trip) unless the request opts in
+            with TIMER.stage('covariates'):
+                covariates = resolve_covariates(input_data, online=False)
+            with TIMER.stage('predict'):
+                predicted_pw, uncertainty = interpolate_coordinates(lat, lon, model, covariates)
             
             return {
                 "predicted_pw": round(predicted_pw, 4),
                 "uncertainty": round(uncertainty, 4),
                 "method": "xgboost_spatial_interpolation",
                 "latitude": lat,
-                "longitude": lon
+                "longitude": lon,
+                "covariates": covariates
             }
         
         else:
             # Full feature-based prediction
-            features = engineer_features(input_data)
-            predicted_pw = predict_from_features(features, model)
+            with TIMER.stage('covariates'):
+                covariates = resolve_covariates(input_data)
+            with TIMER.stage('engineer_features'):
+                features = engineer_features({**input_data, **covariates})
+            with TIMER.stage('predict'):
+                predicted_pw = predict_from_features(features, model)
             
             # Estimate uncertainty based on feature completeness
             uncertainty = 0.08  # Base uncertainty
@@ -202,19 +279,44 @@ def predict(input_data):
             return {
                 "predicted_pw": round(predicted_pw, 4),
                 "uncertainty": round(uncertainty, 4),
-                "method": "xgboost_full_prediction"
+                "method": "xgboost_full_prediction",
+                "covariates": covariates
             }
     
     except FileNotFoundError as e:
-        print(f"Model file error: {e}")
+        print(f"Model file error: {e}", file=sys.stderr)
+        TIMER.fallback_reason = 'model_missing'
         return fallback_prediction(input_data)
     
     except Exception as e:
-        print(f"Prediction error: {e}")
+        print(f"Prediction error: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
+        TIMER.fallback_reason = type(e).__name__
         return fallback_prediction(input_data)
 
+def zwd_to_pw(zwd, input_data):
+    """
+    Convert ZWD to PW with Π(Tm), taking Tm from the climatology grid when
+    available, else from surface temperature (Bevis), else Π = 0.16.
+    Returns (pw, description of the conversion).
+    """
+    lat = input_data.get('stationLatitude', input_data.get('latitude'))
+    lon = input_data.get('stationLongitude', input_data.get('longitude'))
+
+    if lat is not None and lon is not None and os.path.exists(TM_GRID_FILE):
+        from tm_grid import TmGrid
+        timestamp = np.datetime64(request_time(input_data))
+        tm = float(TmGrid(TM_GRID_FILE).lookup(float(lat), float(lon), timestamp))
+        return float(pw_from_zwd(zwd, tm)), f"Π(Tm) with Tm = {tm:.1f} K from the climatology grid"
+
+    temp = input_data.get('temperature', input_data.get('Temperature (°C)'))
+    if temp is not None:
+        tm = float(weighted_mean_temperature(float(temp)))
+        return float(pw_from_zwd(zwd, tm)), f"Π(Tm) with Bevis Tm = {tm:.1f} K"
+
+    return zwd * 0.16, "ZWD * 0.16 conversion"
+
 def fallback_prediction(input_data):
     """
     Fallback prediction using simple formula if XGBoost model fails.
@@ -236,38 +338,46 @@ def fallback_prediction(input_data):
     
     # Full prediction fallback
     zwd = float(input_data.get('zwdObservation', input_data.get('ZWD Observation', 15)))
-    predicted_pw = zwd * 0.16  # Standard ZWD to PW conversion
+    predicted_pw, conversion = zwd_to_pw(zwd, input_data)
     
     return {
         "predicted_pw": round(predicted_pw, 4),
         "uncertainty": 0.15,
         "method": "fallback_conversion",
-        "note": "XGBoost model not available, using ZWD * 0.16 conversion"
+        "note": f"XGBoost model not available, using {conversion}"
     }
 
 if __name__ == "__main__":
     # Read input from command line argument or stdin
-    if len(sys.argv) > 1:
-        # Read from file path
-        input_file = sys.argv[1]
-        if os.path.exists(input_file):
-            with open(input_file, 'r') as f:
-                input_data = json.load(f)
+    with TIMER.stage('read_input'):
+        if len(sys.argv) > 1:
+            # Read from file path
+            input_file = sys.argv[1]
+            if os.path.exists(input_file):
+                with open(input_file, 'r') as f:
+                    input_data = json.load(f)
+            else:
+                # Treat as JSON string
+                input_data = json.loads(input_file)
         else:
-            # Treat as JSON string
-            input_data = json.loads(input_file)
-    else:
-        # Read from stdin
-        input_json = sys.stdin.read()
-        if input_json.strip():
-            input_data = json.loads(input_json)
-        else:
-            print(json.dumps({"error": "No input data provided"}))
-            sys.exit(1)
+            # Read from stdin
+            input_json = sys.stdin.read()
+            if input_json.strip():
+                input_data = json.loads(input_json)
+            else:
+                print(json.dumps({"error": "No input data provided"}))
+                sys.exit(1)
     
     # Run prediction
     result = predict(input_data)
     
     # Output result as JSON
-    print(json.dumps(result, indent=2))
+    with TIMER.stage('output'):
+        print(json.dumps(result, indent=2), flush=True)
+
+    # Per-stage timings for metrics.py (one appended line; ZVC_METRICS=0 disables)
+    TIMER.record(result.get('method'), TIMER.fallback_reason)
+
+    # Spool the prediction for the region/month aggregates (aggregates.py; ZVC_AGGREGATES=0 disables)
+    record_prediction(input_data, result)
 
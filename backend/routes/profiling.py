@@ -0,0 +1,225 @@
+"""
+profiling.py - On-demand profiling of individual prediction requests
+
+A request carrying "_profile" in its input runs under a profiler plus
+tracemalloc, and the report is returned with the result under "profile"
+(and optionally spooled to disk). Requests without the flag pay a single
+dict lookup; cProfile/tracemalloc are only imported when asked for.
+
+    "_profile": true                        cProfile + tracemalloc, report inline
+    "_profile": "sampling"                  stack sampling instead of cProfile
+    "_profile": {"mode": "cprofile", "top": 30, "memory": false, "spool": true}
+
+Falsy flags (false, 0, "0", "false", "no", "off") leave profiling off, and
+an unknown mode does too, with a warning on stderr: a bad flag never fails
+the request.
+
+Profiling only runs when the process has ZVC_PROFILING=1; otherwise the
+flag is dropped and the call goes straight through, whoever set it. The
+Express routes likewise only forward ?profile=1 (or ?profile=sampling)
+when the server runs with ZVC_PROFILING=1.
+
+Spooled reports land in ZVC_PROFILE_DIR (default <tmp>/zvc-profiles) as
+<time>-<pid>.json, plus a .pstats file for cProfile runs that snakeviz or
+`python -m pstats` can open. Setting ZVC_PROFILE_DIR spools every profiled
+request; {"spool": true} does it for one.
+"""
+
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROFILE_KEY = '_profile'
+PROFILE_MODES = ('cprofile', 'sampling', 'memory')
+OFF_FLAGS = ('', '0', 'false', 'no', 'off')
+PROFILING = os.environ.get('ZVC_PROFILING') == '1'
+PROFILE_DIR = os.environ.get('ZVC_PROFILE_DIR')
+DEFAULT_TOP = 20
+SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+
+
+def profile_options(flag):
+    """
+    Normalise the request flag (true / mode string / dict) to an options
+    dict; None when profiling is disabled (ZVC_PROFILING), the flag turns it
+    off or names an unknown mode.
+    """
+    if not PROFILING:
+        return None
+    options = {'mode': 'cprofile', 'top': DEFAULT_TOP, 'memory': True, 'spool': bool(PROFILE_DIR)}
+    if isinstance(flag, str):
+        flag = flag.strip().lower()
+        if flag in OFF_FLAGS:
+            return None
+        if flag not in ('1', 'true', 'yes'):
+            options['mode'] = flag
+    elif isinstance(flag, dict):
+        options.update(flag)
+    elif not flag:
+        return None
+    if options['mode'] not in PROFILE_MODES:
+        print(f"Unknown profile mode {options['mode']!r}, profiling off", file=sys.stderr)
+        return None
+    return options
+
+
+def _short_path(filename):
+    for root in sorted(sys.path, key=len, reverse=True):
+        if root and filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+class Sampler:
+    """
+    Statistical profiler: a background thread records the target thread's
+    stack every SAMPLE_INTERVAL. Overhead stays flat however many Python
+    calls the request makes, unlike cProfile.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.own = {}        # (file, line, function) -> samples at the top of the stack
+        self.total = {}      # (file, line, function) -> samples anywhere on the stack
+        self.samples = 0
+        self._stop = threading.Event()
+
+    def _run(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.own[key] = self.own.get(key, 0) + 1
+                    top = False
+                if key not in seen:
+                    self.total[key] = self.total.get(key, 0) + 1
+                    seen.add(key)
+                frame = frame.f_back
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, args=(threading.get_ident(),), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def report(self, top):
+        # Hottest first by samples spent in the function itself, then by inclusive samples
+        keys = sorted(self.total, key=lambda k: (self.own.get(k, 0), self.total[k]), reverse=True)
+        keys = [k for k in keys if k[0] != __file__][:top]
+        return [{
+            'function': f"{_short_path(f)}:{line}({name})",
+            'own_samples': self.own.get((f, line, name), 0),
+            'total_samples': self.total[(f, line, name)],
+            'own_fraction': round(self.own.get((f, line, name), 0) / self.samples, 4) if self.samples else 0.0,
+        } for f, line, name in keys]
+
+
+def _cprofile_report(stats, top):
+    rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top]
+    return [{
+        'function': f"{_short_path(f)}:{line}({name})",
+        'calls': primitive if primitive == calls else f"{calls}/{primitive}",
+        'tottime_s': round(tottime, 6),
+        'cumtime_s': round(cumtime, 6),
+    } for (f, line, name), (primitive, calls, tottime, cumtime, _) in rows]
+
+
+def _memory_report(snapshot, peak, current, top):
+    stats = snapshot.statistics('lineno')[:top]
+    return {
+        'peak_bytes': peak,
+        'retained_bytes': current,
+        'top_allocations': [{
+            'site': f"{_short_path(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+            'size_bytes': s.size,
+            'count': s.count,
+        } for s in stats],
+    }
+
+
+def profile_call(fn, args, kwargs, options):
+    """Run fn(*args, **kwargs) under the requested profilers; returns (result, report)"""
+    import tracemalloc
+
+    report = {'mode': options['mode']}
+    profiler = stats = None
+    trace_memory = options['memory'] and not tracemalloc.is_tracing()
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if options['mode'] == 'cprofile':
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            result = profiler.runcall(fn, *args, **kwargs)
+            stats = pstats.Stats(profiler)
+            report['functions'] = _cprofile_report(stats, options['top'])
+        elif options['mode'] == 'sampling':
+            with Sampler() as sampler:
+                result = fn(*args, **kwargs)
+            report['samples'] = sampler.samples
+            report['functions'] = sampler.report(options['top'])
+        else:
+            result = fn(*args, **kwargs)
+        report['wall_s'] = round(time.perf_counter() - start, 6)
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            report['memory'] = _memory_report(tracemalloc.take_snapshot(), peak, current, options['top'])
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    if options['spool']:
+        report['spool'] = spool(report, stats)
+    return result, report
+
+
+def spool(report, stats=None, directory=None):
+    """Write the report (and .pstats for cProfile runs); returns the JSON path"""
+    directory = directory or PROFILE_DIR or os.path.join(tempfile.gettempdir(), 'zvc-profiles')
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{threading.get_ident() % 10000}")
+    if stats is not None:
+        stats.dump_stats(stem + '.pstats')
+    with open(stem + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return stem + '.json'
+
+
+def profilable(fn):
+    """
+    Decorator for request handlers whose first argument is the input dict:
+    profiles the call when the input carries PROFILE_KEY, otherwise calls
+    straight through.
+    """
+    @functools.wraps(fn)
+    def wrapper(input_data, *args, **kwargs):
+        if not isinstance(input_data, dict) or PROFILE_KEY not in input_data:
+            return fn(input_data, *args, **kwargs)
+
+        options = profile_options(input_data[PROFILE_KEY])
+        input_data = {k: v for k, v in input_data.items() if k != PROFILE_KEY}
+        if options is None:
+            return fn(input_data, *args, **kwargs)
+        result, report = profile_call(fn, (input_data, *args), kwargs, options)
+        if isinstance(result, dict):
+            return {**result, 'profile': report}
+        return {'results': result, 'profile': report}
+    return wrapper
@@ -48,51 +48,16 @@ const upload = multer({
 // Path to the prediction script
 const PREDICTION_SCRIPT = path.join(__dirname, 'prediction.py');
 const MODEL_FILE = path.join(__dirname, 'physics_informed_xgb.pkl');
-
-// Function to generate synthetic weather data
-function generateSyntheticWeather(latitude, longitude, timestamp) {
-  const date = new Date(timestamp * 1000);
-  const month = date.getMonth();
-  
-  const baseTemp = 25 - (Math.abs(latitude) * 0.6);
-  const seasonalAdjustment = Math.sin((month - 3) * Math.PI / 6) * 10;
-  
-  const temperature = (baseTemp + seasonalAdjustment + (Math.random() * 8 - 4)).toFixed(1);
-  const pressure = (1013 + (Math.random() * 20 - 10)).toFixed(1);
-  const humidity = Math.floor(60 + (Math.random() * 30 - 15));
-  
-  return { temperature, pressure, humidity };
-}
-
-// Function to fetch meteorological data
-async function fetchMeteoData(latitude, longitude, timestamp) {
-  const date = new Date(timestamp * 1000);
-  const dateString = date.toISOString().split('T')[0];
-  
-  try {
-    const response = await axios.get(
-      `https://api.open-meteo.com/v1/forecast?latitude=${latitude}&longitude=${longitude}&hourly=temperature_2m,relative_humidity_2m,surface_pressure&start_date=${dateString}&end_date=${dateString}`,
-      { timeout: 10000 }
-    );
-    
-    const hourlyData = response.data.hourly;
-    const targetHour = date.getUTCHours();
-    
-    const index = hourlyData.time.findIndex(t => t.includes(`${dateString}T${targetHour.toString().padStart(2, '0')}:`));
-    
-    if (index !== -1) {
-      return {
-        temperature: hourlyData.temperature_2m[index],
-        pressure: hourlyData.surface_pressure[index],
-        humidity: hourlyData.relative_humidity_2m[index]
-      };
-    }
-  } catch (error) {
-    console.warn(`Weather API failed, using synthetic data: ${error.message}`);
-    return generateSyntheticWeather(latitude, longitude, timestamp);
-  }
-  
-  return generateSyntheticWeather(latitude, longitude, timestamp);
+// Optional staged pipeline service (pipeline.py --serve PORT), e.g. http://127.0.0.1:8097
+const PIPELINE_URL = process.env.ZVC_PIPELINE_URL;
+// ?profile= is honoured only when the server runs with ZVC_PROFILING=1 (profiling.py)
+const PROFILING = process.env.ZVC_PROFILING === '1';
+
+// Surface meteorology for predictions is resolved by prediction.py (model/covariates.py):
+// batched, cached provider lookups with an ERA5 / climatology fallback, so
+// missing temperature / pressure / humidity are left out of the input.
+function optionalFloat(value) {
+  return value === undefined || value === null || value === '' ? undefined : parseFloat(value);
 }
 
 // Function to format timestamp
@@ -161,7 +126,8 @@ function parseRinexForZWD(content) {
 }
 
 // Function to run Python prediction script
-function runPythonPrediction(inputData) {
+// profile (e.g. req.query.profile) asks prediction.py to profile this one request when PROFILING is on
+function runPythonPrediction(inputData, profile) {
   return new Promise((resolve, reject) => {
     // Check if model file exists
     if (!fs.existsSync(MODEL_FILE)) {
@@ -177,10 +143,13 @@ function runPythonPrediction(inputData) {
     const tempInputPath = path.join(__dirname, '..', '..', tempInputFile);
     
     try {
-      fs.writeFileSync(tempInputPath, JSON.stringify(inputData, null, 2));
+      fs.writeFileSync(tempInputPath, JSON.stringify(PROFILING && profile ? { ...inputData, _profile: profile } : inputData, null, 2));
       
       // Spawn Python process with the prediction script
-      const pythonProcess = spawn('python3', [PREDICTION_SCRIPT, tempInputPath]);
+      // ZVC_SPAWN_TS lets metrics.py attribute process start-up time to the 'spawn' stage
+      const pythonProcess = spawn('python3', [PREDICTION_SCRIPT, tempInputPath], {
+        env: { ...process.env, ZVC_SPAWN_TS: String(Date.now() / 1000) }
+      });
       
       let stdoutData = '';
       let stderrData = '';
@@ -296,6 +265,64 @@ function cleanupFiles(filePaths) {
   }
 }
 
+// Send an upload through pipeline.py and shape its answer like the /rinex response.
+// Resolves to null when the service cannot be reached, so the caller can fall back.
+async function forwardToPipeline(file) {
+  let response;
+  try {
+    response = await axios.post(`${PIPELINE_URL}/rinex`, fs.createReadStream(file.path), {
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'Content-Length': file.size,
+        'X-Filename': file.originalname
+      },
+      maxBodyLength: Infinity,
+      validateStatus: status => status === 200 || status === 422
+    });
+  } catch (error) {
+    console.error('Pipeline service unavailable, processing in-process:', error.message);
+    return null;
+  }
+
+  const result = response.data;
+  if (!result.success) {
+    return { status: 422, body: { success: false, message: `RINEX ${result.stage} failed: ${result.message}` } };
+  }
+  const formattedTimestamp = formatTimestamp(result.timestamp);
+  return {
+    status: 200,
+    body: {
+      success: true,
+      message: 'RINEX file processed successfully',
+      extractedData: {
+        stationId: result.stationId,
+        stationLatitude: result.stationLatitude,
+        stationLongitude: result.stationLongitude,
+        stationElevation: result.stationElevation,
+        timestamp: result.timestamp,
+        totalObservations: result.totalObservations,
+        temperature: result.temperature,
+        pressure: result.pressure,
+        humidity: result.humidity,
+        covariateSource: result.covariateSource,
+        year: formattedTimestamp.year,
+        month: formattedTimestamp.month,
+        day: formattedTimestamp.day,
+        hour: formattedTimestamp.hour,
+        minute: formattedTimestamp.minute,
+        second: formattedTimestamp.second,
+        dateString: formattedTimestamp.dateString
+      },
+      prediction: { ...result.prediction, series: result.series, timings: result.timings },
+      fileInfo: {
+        originalName: file.originalname,
+        stationId: result.stationId,
+        processedAt: new Date().toISOString()
+      }
+    }
+  };
+}
+
 // POST endpoint for RINEX file processing
 router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req, res) => {
   try {
@@ -308,6 +335,14 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
       });
     }
 
+    if (PIPELINE_URL) {
+      const forwarded = await forwardToPipeline(req.file);
+      if (forwarded) {
+        cleanupFiles([req.file.path]);
+        return res.status(forwarded.status).json(forwarded.body);
+      }
+    }
+
     const { includeMeteoData, processAllSatellites } = req.body;
     
     // For now, skip decompression and try to read the file as-is
@@ -363,22 +398,6 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
       ...gnssData
     };
     
-    // Get weather data if requested
-    let weatherData = {};
-    if (includeMeteoData === 'true') {
-      weatherData = await fetchMeteoData(
-        completeGnssData.stationLatitude,
-        completeGnssData.stationLongitude,
-        completeGnssData.timestamp
-      );
-    } else {
-      weatherData = generateSyntheticWeather(
-        completeGnssData.stationLatitude,
-        completeGnssData.stationLongitude,
-        completeGnssData.timestamp
-      );
-    }
-    
     // Format timestamp
     const formattedTimestamp = formatTimestamp(completeGnssData.timestamp);
     
@@ -391,9 +410,8 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
       zwdObservation: parseFloat(completeGnssData.zwdObservation),
       satelliteAzimuth: completeGnssData.satelliteAzimuth,
       satelliteElevation: completeGnssData.satelliteElevation,
-      temperature: parseFloat(weatherData.temperature || 25),
-      pressure: parseFloat(weatherData.pressure || 1013),
-      humidity: parseFloat(weatherData.humidity || 60),
+      // prediction.py resolves the weather; without includeMeteoData no provider call is made
+      _covariates: includeMeteoData === 'true' ? 'online' : 'offline',
       year: formattedTimestamp.year,
       month: formattedTimestamp.month,
       day: formattedTimestamp.day,
@@ -408,7 +426,7 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
     let predictionResults = {};
     try {
       console.log('Running Python prediction with XGBoost model...');
-      predictionResults = await runPythonPrediction(predictionInput);
+      predictionResults = await runPythonPrediction(predictionInput, req.query.profile);
       console.log('Python prediction completed:', predictionResults);
     } catch (pythonError) {
       console.error('Python prediction failed:', pythonError.message);
@@ -417,6 +435,7 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
     
     // Clean up temporary files
     cleanupFiles([req.file.path]);
+    const covariates = predictionResults.covariates || {};
     
     // Combine extracted data with prediction results
     const finalResult = {
@@ -432,9 +451,10 @@ router.post('/rinex', authenticateToken, upload.single('rinexFile'), async (req,
         satelliteAzimuth: completeGnssData.satelliteAzimuth,
         satelliteElevation: completeGnssData.satelliteElevation,
         totalObservations: completeGnssData.totalObservations,
-        temperature: parseFloat(weatherData.temperature || 0),
-        pressure: parseFloat(weatherData.pressure || 0),
-        humidity: parseFloat(weatherData.humidity || 0),
+        temperature: covariates.temperature ?? null,
+        pressure: covariates.pressure ?? null,
+        humidity: covariates.humidity ?? null,
+        covariateSource: covariates.source || null,
         year: formattedTimestamp.year,
         month: formattedTimestamp.month,
         day: formattedTimestamp.day,
@@ -498,9 +518,9 @@ router.post('/features', authenticateToken, async (req, res) => {
       zwdObservation: parseFloat(inputData.zwdObservation),
       satelliteAzimuth: parseFloat(inputData.satelliteAzimuth || 180),
       satelliteElevation: parseFloat(inputData.satelliteElevation || 45),
-      temperature: parseFloat(inputData.temperature || 25),
-      pressure: parseFloat(inputData.pressure || 1013),
-      humidity: parseFloat(inputData.humidity || 60),
+      temperature: optionalFloat(inputData.temperature),
+      pressure: optionalFloat(inputData.pressure),
+      humidity: optionalFloat(inputData.humidity),
       year: parseInt(inputData.year),
       month: parseInt(inputData.month),
       day: parseInt(inputData.day),
@@ -515,7 +535,7 @@ router.post('/features', authenticateToken, async (req, res) => {
     let predictionResults = {};
     try {
       console.log('Running Python prediction with XGBoost model...');
-      predictionResults = await runPythonPrediction(predictionInput);
+      predictionResults = await runPythonPrediction(predictionInput, req.query.profile);
       console.log('Python prediction completed:', predictionResults);
     } catch (pythonError) {
       console.error('Python prediction failed:', pythonError.message);
@@ -588,7 +608,7 @@ router.post('/interpolation', async (req, res) => {
     let predictionResults = {};
     try {
       console.log('Running Python interpolation with XGBoost spatial model...');
-      predictionResults = await runPythonPrediction(predictionInput);
+      predictionResults = await runPythonPrediction(predictionInput, req.query.profile);
       console.log('Python interpolation completed:', predictionResults);
     } catch (pythonError) {
       console.error('Python interpolation failed:', pythonError.message);
@@ -639,7 +659,7 @@ router.post('/error', authenticateToken, async (req, res) => {
 
     let interpolationResults = {};
     try {
-      interpolationResults = await runPythonPrediction(predictionInput);
+      interpolationResults = await runPythonPrediction(predictionInput, req.query.profile);
     } catch (error) {
       console.error('Interpolation error:', error.message);
       interpolationResults = getFallbackPrediction(predictionInput);
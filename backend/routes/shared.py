@@ -0,0 +1,30 @@
+"""
+shared.py - Helpers shared by the Python route scripts
+
+Importing this module puts the repo's model/ directory (physics, storage,
+covariate and imputation code) on sys.path, so the scripts Express spawns
+from backend/routes can import it. file_lock serialises processes through
+an advisory lock file.
+"""
+
+import contextlib
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # no advisory locks on this platform
+
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model'))
+if MODEL_DIR not in sys.path:
+    sys.path.insert(0, MODEL_DIR)
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Hold an exclusive (shared=True: shared) flock on path for the block"""
+    with open(path, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
@@ -0,0 +1,539 @@
+"""
+timeline.py - Per-station PW timelines with server-side downsampling
+
+The dashboard timelines used to read whole CSVs. This keeps a columnar
+store with one directory per station, made of time-ordered segments:
+
+    <root>/<station>/meta.json            location, row count, time range, segment list
+    <root>/<station>/<segment>/epoch.npy  int64 epoch seconds, sorted, unique
+    <root>/<station>/<segment>/pw.npy     float32 PW (plus any other stored series)
+
+Segments never change once written and cover disjoint, increasing time
+ranges. Rows later than everything stored become a new segment; rows
+overlapping stored ones are merged with the segments they overlap (and
+those after them) into one. Trailing segments are merged while the one
+before holds less than SEGMENT_GROWTH times their rows, so a station
+keeps O(log rows) segments and appends cost O(batch) amortised. meta.json
+is the only pointer to the segments and is swapped atomically, so readers
+see either the old or the new station and a crash leaves at most
+unreferenced segments, removed by the next write.
+
+Arrays are opened memory-mapped, so a query touches only the slices found
+by binary search on each segment's epoch.npy, and those are reduced to a
+point budget before they leave the process (pandas is only imported for
+building):
+
+    lttb     Largest-Triangle-Three-Buckets: keeps the points that carry the
+             visual shape (peaks, troughs, steps) of the series
+    minmax   per bucket the minimum and maximum, in time order: never loses
+             an extreme, at two points per bucket
+
+A year of 30-second PW (~1M rows) comes back as a few hundred points in a
+few milliseconds once the interpreter is up.
+
+Usage:
+    python timeline.py build ../../model/dataset.csv ../../model/gnss_pw_with_predictions_enhanced.csv
+    python timeline.py stations
+    python timeline.py query MET300FIN --start 2025-01-01 --end 2025-09-01 --points 400 --method minmax
+    python timeline.py --serve 8091            GET /timeline, /timeline/<station>?start=&end=&points=&method=
+
+Environment:
+    ZVC_TIMELINE_DIR       store root (default: backend/data/timeline)
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from shared import file_lock
+
+ROUTES_DIR = os.path.dirname(os.path.abspath(__file__))
+TIMELINE_DIR = os.environ.get('ZVC_TIMELINE_DIR', os.path.join(ROUTES_DIR, '..', 'data', 'timeline'))
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 20_000
+METHODS = ('lttb', 'minmax')
+SEGMENT_GROWTH = 2      # a trailing segment is merged into the one before until that holds this many times its rows
+UTC_OFFSET = re.compile(r'[+-]\d\d:?\d\d$')
+
+# Storage columns (gnss_store names) kept as series next to pw
+SERIES = ('pw', 'zwd', 'pw_predicted', 'pw_uncertainty', 'temperature', 'pressure', 'humidity')
+
+
+def _safe_name(station):
+    station = str(station)
+    if not station or station.startswith('.') or os.sep in station or (os.altsep and os.altsep in station):
+        raise ValueError(f"Invalid station ID: {station!r}")
+    return station
+
+
+def _to_epoch(value):
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    if isinstance(value, str) and value.lstrip('-').isdigit():
+        return int(value)
+    if isinstance(value, str) and not UTC_OFFSET.search(value):
+        # Naive ISO strings / 'Z' suffix without the pandas import
+        try:
+            return int(np.datetime64(value.rstrip('Z'), 's').astype(np.int64))
+        except ValueError:
+            pass
+    import pandas as pd
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.timestamp())
+
+
+def _storage_frame(df):
+    """Legacy CSV frame or gnss_store frame -> epoch / station_id / series columns"""
+    from gnss_store import to_storage_frame
+
+    if 'epoch' not in df.columns:
+        df = to_storage_frame(df)
+    if 'pw' not in df.columns and 'zwd' in df.columns:
+        df = df.assign(pw=df['zwd'] * np.float32(0.16))  # same ZWD -> PW conversion as training
+    return df
+
+
+def _write_json(path, payload):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def _segment_name(path):
+    """Next unused segment name in a station directory"""
+    numbers = [int(name.split('.')[0]) for name in os.listdir(path) if name.split('.')[0].isdigit()]
+    return f"{max(numbers, default=-1) + 1:06d}"
+
+
+def _write_segment(path, epoch, series):
+    """Write a new segment (complete or not at all); returns its meta.json entry"""
+    name = _segment_name(path)
+    tmp = os.path.join(path, name + '.tmp')
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'epoch.npy'), epoch)
+    for s, values in series.items():
+        np.save(os.path.join(tmp, s + '.npy'), values)
+    os.replace(tmp, os.path.join(path, name))
+    return {'name': name, 'rows': int(len(epoch)), 'start': int(epoch[0]), 'end': int(epoch[-1]),
+            'series': sorted(series)}
+
+
+def _load_segments(path, segments, names):
+    """Epochs and series (NaN where a segment lacks one) of segments, concatenated"""
+    epoch, series = [], {s: [] for s in names}
+    for segment in segments:
+        directory = os.path.join(path, segment['name'])
+        t = np.load(os.path.join(directory, 'epoch.npy'))
+        epoch.append(t)
+        for s in names:
+            series[s].append(np.load(os.path.join(directory, s + '.npy')) if s in segment['series']
+                             else np.full(len(t), np.nan, np.float32))
+    return (np.concatenate(epoch) if epoch else np.empty(0, np.int64),
+            {s: np.concatenate(v) if v else np.empty(0, np.float32) for s, v in series.items()})
+
+
+def _merge(epoch, series):
+    """Sort by time; of rows with the same timestamp the last one wins"""
+    order = np.argsort(epoch, kind='stable')
+    epoch = epoch[order]
+    keep = np.append(epoch[1:] != epoch[:-1], True)
+    return epoch[keep], {s: v[order][keep] for s, v in series.items()}
+
+
+def _recover(root, station):
+    """
+    Repair what an interrupted write left behind and return the station's
+    meta.json (None for a new station): a station directory the single-
+    directory layout swapped out (<station>.tmp, <station>.old), temporary
+    files, and segments meta.json does not reference. Call with the
+    station's lock held.
+    """
+    path = os.path.join(root, _safe_name(station))
+    meta_file = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_file):
+        # The old layout replaced <station> by <station>.tmp via <station>.old; take the newest complete one
+        for candidate in (path + '.tmp', path + '.old'):
+            if os.path.exists(os.path.join(candidate, 'meta.json')):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                os.replace(candidate, path)
+                break
+    for stale in (path + '.tmp', path + '.old'):
+        if os.path.isdir(stale):
+            shutil.rmtree(stale)
+    if not os.path.exists(meta_file):
+        if os.path.isdir(path):
+            shutil.rmtree(path)     # a first write that never got to meta.json
+        return None
+
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if 'segments' in meta:
+        referenced = {segment['name'] for segment in meta['segments']}
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            if os.path.isdir(full) and name not in referenced:
+                shutil.rmtree(full)
+            elif name.endswith(('.tmp', '.npy')):
+                os.remove(full)     # an unfinished meta.json, or arrays of the single-directory layout
+    return meta
+
+
+def _write_station(root, station, epoch, series, meta):
+    """
+    Add sorted, unique rows to a station (call with its lock held): a new
+    segment after the stored ones, or one merged with the segments they
+    overlap; then the trailing segments are merged by size and meta.json is
+    swapped to the new list. Returns the new meta.json.
+    """
+    path = os.path.join(root, _safe_name(station))
+    stored = _recover(root, station)
+    os.makedirs(path, exist_ok=True)
+    if stored is None:
+        segments = []
+    elif 'segments' in stored:
+        segments = list(stored['segments'])
+    else:
+        # Single-directory layout: the whole station becomes the first segment
+        segments = [{'name': '', 'rows': stored['rows'], 'start': stored['start'], 'end': stored['end'],
+                     'series': stored.get('series', [])}]
+
+    if stored is not None:
+        meta = {**{k: stored[k] for k in ('latitude', 'longitude', 'elevation') if k in stored}, **meta}
+
+    # Segments from the first one reaching into the new rows onwards are rewritten with them
+    first = next((k for k, segment in enumerate(segments) if segment['end'] >= epoch[0]), len(segments))
+    if segments and segments[0]['name'] == '':
+        first = 0
+    merged = segments[first:]
+    segments = segments[:first]
+    names = sorted(set(series).union(*(segment['series'] for segment in merged)))
+    if merged:
+        old_epoch, old_series = _load_segments(path, merged, names)
+        epoch, series = _merge(np.concatenate([old_epoch, epoch]), {
+            s: np.concatenate([old_series[s], series[s] if s in series else np.full(len(epoch), np.nan, np.float32)])
+            for s in names})
+    segments.append(_write_segment(path, epoch, series))
+
+    # Keep segment sizes growing geometrically towards the past
+    while len(segments) >= 2 and segments[-2]['rows'] < SEGMENT_GROWTH * segments[-1]['rows']:
+        tail = segments[-2:]
+        names = sorted(set(tail[0]['series']) | set(tail[1]['series']))
+        epoch, series = _load_segments(path, tail, names)
+        segments[-2:] = [_write_segment(path, epoch, series)]
+
+    meta = {**meta, 'rows': sum(segment['rows'] for segment in segments),
+            'start': segments[0]['start'], 'end': segments[-1]['end'],
+            'series': sorted(set().union(*(segment['series'] for segment in segments))),
+            'segments': segments}
+    _write_json(os.path.join(path, 'meta.json'), meta)
+    _recover(root, station)     # drop the segments that were merged
+    return meta
+
+
+def add_rows(df, root=None):
+    """
+    Merge a frame of observations into the store. Rows are sorted by time
+    per station; on duplicate timestamps the newest write wins.
+    Returns the number of rows per station after the merge.
+    """
+    root = root or TIMELINE_DIR
+    os.makedirs(root, exist_ok=True)
+    df = _storage_frame(df)
+    series_names = [s for s in SERIES if s in df.columns]
+    counts = {}
+
+    for station, group in df.groupby('station_id', observed=True, sort=False):
+        epoch, series = _merge(group['epoch'].to_numpy(np.int64),
+                               {s: group[s].to_numpy(np.float32) for s in series_names})
+        meta = {'station': str(station)}
+        for col, key in (('lat', 'latitude'), ('lon', 'longitude'), ('elev', 'elevation')):
+            if col in group.columns and group[col].notna().any():
+                meta[key] = round(float(group[col].dropna().iloc[-1]), 6)
+
+        with file_lock(os.path.join(root, f".{_safe_name(station)}.lock")):
+            cached = _OPEN.pop(os.path.join(root, _safe_name(station)), None)
+            if cached is not None:
+                cached.close()
+            meta = _write_station(root, station, epoch, series, meta)
+        counts[str(station)] = meta['rows']
+    return counts
+
+
+def build(sources, root=None, chunksize=1_000_000):
+    """Add CSV files or gnss_store directories to the store, chunk by chunk"""
+    import pandas as pd
+    from gnss_store import read_dataset
+
+    root = root or TIMELINE_DIR
+    os.makedirs(root, exist_ok=True)
+    counts = {}
+    for source in sources:
+        chunks = [read_dataset(source, legacy_names=False)] if os.path.isdir(source) \
+            else pd.read_csv(source, chunksize=chunksize)
+        for chunk in chunks:
+            counts.update(add_rows(chunk, root))
+        print(f"Added {source}")
+    print(f"Timeline store {root}: {len(counts)} stations, {sum(counts.values())} rows")
+    return counts
+
+
+class StationTimeline:
+    """Memory-mapped segments of one station"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.mtime = os.path.getmtime(os.path.join(path, 'meta.json'))
+        # Stores written before segments keep their arrays in the station directory
+        segments = self.meta.get('segments') or [{'name': '', 'series': self.meta.get('series', [])}]
+        self.segments = []
+        for segment in segments:
+            directory = os.path.join(path, segment['name'])
+            self.segments.append((np.load(os.path.join(directory, 'epoch.npy'), mmap_mode='r'),
+                                  {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+                                   for name in segment['series']}))
+
+    def close(self):
+        # Drop the memmaps so the segments can be removed (Windows keeps mapped files locked)
+        self.segments = None
+
+    def read(self, start=None, end=None, names=()):
+        """Epochs and named series of the rows with start <= epoch < end (NaN where a segment lacks a series)"""
+        epoch, series = [], {name: [] for name in names}
+        for t, values in self.segments:
+            lo = 0 if start is None else int(np.searchsorted(t, start, side='left'))
+            hi = len(t) if end is None else int(np.searchsorted(t, end, side='left'))
+            if hi <= lo:
+                continue
+            epoch.append(np.asarray(t[lo:hi]))
+            for name in names:
+                series[name].append(np.asarray(values[name][lo:hi]) if name in values
+                                    else np.full(hi - lo, np.nan, np.float32))
+        return (np.concatenate(epoch) if epoch else np.empty(0, np.int64),
+                {name: np.concatenate(v) if v else np.empty(0, np.float32) for name, v in series.items()})
+
+
+_OPEN = {}
+
+
+def open_station(station, root=None, missing_ok=False):
+    """Cached StationTimeline, reopened when the station has been rewritten"""
+    path = os.path.join(root or TIMELINE_DIR, _safe_name(station))
+    meta_file = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_file):
+        if missing_ok:
+            return None
+        raise KeyError(f"Unknown station: {station}")
+    cached = _OPEN.get(path)
+    if cached is not None and cached.segments is not None and cached.mtime == os.path.getmtime(meta_file):
+        return cached
+    try:
+        _OPEN[path] = StationTimeline(path)
+    except FileNotFoundError:
+        # A write swapped meta.json and removed merged segments while they were being opened
+        _OPEN[path] = StationTimeline(path)
+    return _OPEN[path]
+
+
+def stations(root=None):
+    """meta.json of every station in the store"""
+    root = root or TIMELINE_DIR
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for name in sorted(os.listdir(root)):
+        meta_file = os.path.join(root, name, 'meta.json')
+        if not name.endswith(('.tmp', '.old')) and os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            meta.pop('segments', None)
+            out.append(meta)
+    return out
+
+
+def _edges(n, n_buckets):
+    """Boundaries splitting 0..n into n_buckets contiguous, non-empty buckets (n >= n_buckets)"""
+    return (np.arange(n_buckets + 1) * (n / n_buckets)).astype(np.int64)
+
+
+def minmax(x, y, points):
+    """Indices of the min and max of each bucket, in time order"""
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    edges = _edges(n, max(points // 2, 1))
+    keep = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        bucket = y[lo:hi]
+        keep += [lo + int(bucket.argmin()), lo + int(bucket.argmax())]
+    return np.unique(keep)
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson 2013): first and last point
+    plus, per bucket, the point forming the largest triangle with the point
+    chosen in the previous bucket and the mean of the next bucket.
+    """
+    n = len(y)
+    if n <= points or points < 3:
+        return np.arange(n) if n <= points else np.array([0, n - 1])
+    # Relative times keep the triangle areas exact in float64
+    x = np.asarray(x, dtype=np.float64) - float(x[0])
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = _edges(n - 2, points - 2) + 1
+    counts = np.diff(edges)
+    # Mean of each following bucket; the last bucket looks at the final point
+    mean_x = np.append((np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts)[1:], x[-1])
+    mean_y = np.append((np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts)[1:], y[-1])
+
+    chosen = np.empty(points, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, n - 1
+    ax, ay = x[0], y[0]
+    for b in range(points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs((ax - mean_x[b]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (mean_y[b] - ay))
+        k = lo + int(area.argmax())
+        chosen[b + 1] = k
+        ax, ay = x[k], y[k]
+    return chosen
+
+
+def query(station, start=None, end=None, points=DEFAULT_POINTS, method='lttb', series=('pw',), root=None):
+    """
+    Series of one station between start and end (end exclusive; timestamps,
+    ISO strings or epoch seconds) reduced to about `points` points.
+    The first requested series drives the downsampling; the others are
+    sampled at the same timestamps.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+    points = int(min(max(int(points), 3), MAX_POINTS))
+    timeline = open_station(station, root)
+    stored = timeline.meta.get('series', [])
+    series = [s for s in series if s in stored] or ['pw']
+    if series[0] not in stored:
+        raise KeyError(f"Station {station} has no {series[0]} series")
+
+    t, values = timeline.read(_to_epoch(start), _to_epoch(end), series)
+    n_rows = len(t)
+    y = values[series[0]]
+    finite = np.isfinite(y)
+    if not finite.all():
+        t, y = t[finite], y[finite]
+        offsets = np.flatnonzero(finite)
+    else:
+        offsets = None
+
+    if len(y) <= points:
+        keep = np.arange(len(y))
+    elif method == 'minmax':
+        keep = minmax(t, y, points)
+    else:
+        keep = lttb(t, y, points)
+
+    rows = keep if offsets is None else offsets[keep]
+    out = {
+        'station': timeline.meta['station'],
+        'start': int(t[0]) if len(t) else None,
+        'end': int(t[-1]) if len(t) else None,
+        'rows': n_rows,
+        'method': method if len(keep) < len(y) else 'raw',
+        'epoch': t[keep].tolist(),
+    }
+    for name in series:
+        sampled = values[name][rows].astype(np.float64)
+        out[name] = np.where(np.isfinite(sampled), np.round(sampled, 4), None).tolist()
+    return out
+
+
+def serve(port, root=None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs, unquote
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [unquote(p) for p in url.path.strip('/').split('/')]
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if parts == ['timeline']:
+                    self._send(200, {'stations': stations(root)})
+                elif len(parts) == 2 and parts[0] == 'timeline':
+                    start = time.perf_counter()
+                    result = query(parts[1], params.get('start'), params.get('end'),
+                                   params.get('points', DEFAULT_POINTS), params.get('method', 'lttb'),
+                                   params.get('series', 'pw').split(','), root)
+                    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+                    self._send(200, result)
+                else:
+                    self._send(404, {'error': 'not found'})
+            except KeyError as e:
+                self._send(404, {'error': str(e.args[0])})
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+
+        def log_message(self, *args):
+            pass
+
+    print(f"Serving timelines from {root or TIMELINE_DIR} on :{port}/timeline")
+    ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-station PW timelines")
+    parser.add_argument('--dir', default=None, help=f"store root (default {TIMELINE_DIR})")
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT')
+    sub = parser.add_subparsers(dest='command')
+
+    build_cmd = sub.add_parser('build', help="add CSVs / gnss_store directories to the store")
+    build_cmd.add_argument('sources', nargs='+')
+    build_cmd.add_argument('--chunksize', type=int, default=1_000_000)
+
+    sub.add_parser('stations', help="list stations as JSON")
+
+    query_cmd = sub.add_parser('query', help="downsampled series of one station as JSON")
+    query_cmd.add_argument('station')
+    query_cmd.add_argument('--start', default=None)
+    query_cmd.add_argument('--end', default=None)
+    query_cmd.add_argument('--points', type=int, default=DEFAULT_POINTS)
+    query_cmd.add_argument('--method', default='lttb', help=' / '.join(METHODS))
+    query_cmd.add_argument('--series', default='pw', help="comma-separated, e.g. pw,pw_predicted")
+
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.dir)
+    elif args.command == 'build':
+        build(args.sources, args.dir, args.chunksize)
+    elif args.command == 'stations':
+        print(json.dumps({'stations': stations(args.dir)}))
+    elif args.command == 'query':
+        try:
+            print(json.dumps(query(args.station, args.start, args.end, args.points, args.method,
+                                   args.series.split(','), args.dir)))
+        except (KeyError, ValueError) as e:
+            print(json.dumps({'error': str(e.args[0]) if isinstance(e, KeyError) else str(e)}))
+            sys.exit(2 if isinstance(e, KeyError) else 1)
+    else:
+        parser.print_help()
@@ -1,81 +1,331 @@
+"""
+unified_predictor.py - Predictions from the enhanced GNSS PW model package
+
+The package (enhanced_gnss_pw_model_fixed.pkl, written by
+EnhancedGNSSPWModel.save_model) holds the regressor, scaler, station encoder,
+feature_columns, station_locations and the spatial GP. `Predictor` loads it
+once and predicts whole batches column-wise: features are built with
+vectorized pandas/numpy, then one scaler.transform and one model.predict.
+
+    predictor = get_predictor()                  # cached per model file
+    out = predictor.predict(df)                  # DataFrame / records / dict / Arrow table
+    grid = predictor.interpolate(lats, lons)     # spatial GP, one call
+
+Usage:
+    python unified_predictor.py <input.json | input.csv | input.parquet> [--out results.parquet]
+"""
+
+import argparse
+import os
+import sys
 import joblib
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import json
-import sys
-def unified_predictor(input_data, model_file="enhanced_gnss_pw_model_fixed.pkl"):
+from profiling import profilable
+
+from shared import MODEL_DIR
+from imputation import fill_group_means, impute
+MODEL_FILE = os.environ.get('ZVC_UNIFIED_MODEL_FILE', os.path.join(MODEL_DIR, "enhanced_gnss_pw_model_fixed.pkl"))
+
+# Request (camelCase) field names -> dataset.csv column names the model was trained on
+COLUMN_ALIASES = {
+    'stationId': 'Station ID',
+    'zwdObservation': 'ZWD Observation',
+    'temperature': 'Temperature (°C)',
+    'pressure': 'Pressure (hPa)',
+    'humidity': 'Humidity (%)',
+    'satelliteAzimuth': 'Satellite Azimuth',
+    'satelliteElevation': 'Satellite Elevation',
+    'stationLatitude': 'Latitude',
+    'stationLongitude': 'Longitude',
+    'latitude': 'Latitude',
+    'longitude': 'Longitude',
+}
+
+# Last-resort fill values for measurements with no value in a batch, for model
+# packages saved without training means (the routes' defaults)
+DEFAULTS = {
+    'Temperature (°C)': 25.0,
+    'Pressure (hPa)': 1013.0,
+    'Humidity (%)': 60.0,
+    'Satellite Azimuth': 180.0,
+    'Satellite Elevation': 45.0,
+}
+
+DEFAULT_PW = 2.5
+MODEL_UNCERTAINTY = 0.05  # placeholder, the regressor has no variance estimate
+
+
+def fallback_pw(latitude, longitude):
+    return np.round(np.abs(latitude) * 0.1 + np.abs(longitude) * 0.01, 4)
+
+
+def to_frame(data):
+    """DataFrame, list of records, dict (one record or dict of columns) or Arrow table -> DataFrame"""
+    if isinstance(data, pd.DataFrame):
+        return data
+    if hasattr(data, 'to_pandas'):  # pyarrow Table / RecordBatch
+        return data.to_pandas()
+    if isinstance(data, dict):
+        if any(isinstance(v, (list, tuple, np.ndarray)) for v in data.values()):
+            return pd.DataFrame(data)
+        return pd.DataFrame([data])
+    return pd.DataFrame.from_records(data)
+
+
+class Predictor:
+    """The enhanced model package, loaded once, with batch prediction"""
+
+    def __init__(self, saved_model):
+        self.model = saved_model['model']
+        self.scaler = saved_model['scaler']
+        self.station_encoder = saved_model.get('station_encoder')
+        self.feature_columns = list(saved_model['feature_columns'])
+        self.spatial_model = saved_model.get('spatial_model')
+
+        self.station_ids = None
+        locations = saved_model.get('station_locations')
+        if locations is not None and len(locations):
+            locations = locations.drop_duplicates('Station ID').sort_values('Station ID')
+            self.station_ids = locations['Station ID'].astype(str).to_numpy()
+            self.station_lat = locations['Latitude'].to_numpy(np.float64)
+            self.station_lon = locations['Longitude'].to_numpy(np.float64)
+            # Training normalised coordinates by the extent of the station network
+            self.lat_range = (np.nanmin(self.station_lat), np.nanmax(self.station_lat))
+            self.lon_range = (np.nanmin(self.station_lon), np.nanmax(self.station_lon))
+
+        # Training-set column means, the fill for columns a batch has no value for at all
+        self.fill_values = {**DEFAULTS, 'PW': DEFAULT_PW, **(saved_model.get('imputation_means') or {})}
+
+        classes = getattr(self.station_encoder, 'classes_', None)
+        self.encoder_classes = np.asarray(classes).astype(str) if classes is not None else None
+
+    @classmethod
+    def load(cls, model_file=None):
+        return cls(joblib.load(model_file or MODEL_FILE))
+
+    def _encode_stations(self, station_ids):
+        """LabelEncoder codes by binary search; unseen stations get -1 instead of raising"""
+        if self.encoder_classes is None or not len(self.encoder_classes):
+            return np.full(len(station_ids), -1, dtype=np.int64)
+        idx = np.searchsorted(self.encoder_classes, station_ids)
+        idx = np.minimum(idx, len(self.encoder_classes) - 1)
+        return np.where(self.encoder_classes[idx] == station_ids, idx, -1)
+
+    def _station_coordinates(self, station_ids):
+        if self.station_ids is None:
+            nan = np.full(len(station_ids), np.nan)
+            return nan, nan.copy()
+        idx = np.minimum(np.searchsorted(self.station_ids, station_ids), len(self.station_ids) - 1)
+        known = self.station_ids[idx] == station_ids
+        return np.where(known, self.station_lat[idx], np.nan), np.where(known, self.station_lon[idx], np.nan)
+
+    @staticmethod
+    def _timestamps(df):
+        if 'datetime' in df.columns:
+            return pd.to_datetime(df['datetime'])
+        for col in ('dateString', 'Date (ISO Format)'):
+            if col in df.columns:
+                return pd.to_datetime(df[col], utc=True, format='mixed').dt.tz_localize(None)
+        if 'timestamp' in df.columns:
+            return pd.to_datetime(df['timestamp'], unit='s')
+        if {'year', 'month', 'day'} <= set(df.columns):
+            parts = df[['year', 'month', 'day']].copy()
+            parts['hour'] = df['hour'] if 'hour' in df.columns else 0
+            return pd.to_datetime(parts)
+        return pd.Series(pd.Timestamp(datetime.now()), index=df.index)
+
+    def features(self, data):
+        """
+        Model feature matrix (DataFrame in feature_columns order) plus the
+        station IDs and timestamps, for a whole batch.
+
+        Missing measurements are imputed as in training (imputation.py):
+        interpolated within each station's time-ordered series, then the
+        station mean, then the batch mean, then the training mean. Lag/rolling
+        features are computed per station over the batch's time order, so a
+        batch should hold whole station series.
+        """
+        df = to_frame(data).rename(columns=COLUMN_ALIASES)
+        df = df.loc[:, ~df.columns.duplicated(keep='last')]
+        n = len(df)
+        out = {}
+
+        station_ids = (df['Station ID'].astype(str).to_numpy() if 'Station ID' in df.columns
+                       else np.full(n, 'unknown'))
+        # Per-station work runs on the distinct IDs and is broadcast back through the codes
+        codes, uniques = pd.factorize(station_ids)
+        uniques = np.asarray(uniques).astype(str)
+        times = self._timestamps(df)
+        out['station_encoded'] = self._encode_stations(uniques)[codes]
+
+        # Station-major, time-ordered view of the batch (training order), scattered back at the end
+        order = np.lexsort((times.to_numpy(), codes))
+        sorted_codes = codes[order]
+        numeric = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64) if col in df.columns
+                   else np.full(n, np.nan) for col in [*DEFAULTS, 'ZWD Observation']}
+        numeric['PW'] = numeric['ZWD Observation'] * 0.16
+        imputed = impute(pd.DataFrame(numeric).iloc[order].reset_index(drop=True), sorted_codes,
+                         self.fill_values)
+        for col in DEFAULTS:
+            out[col] = self._scatter(imputed[col].to_numpy(), order)
+
+        hour = times.dt.hour.to_numpy()
+        doy = times.dt.dayofyear.to_numpy()
+        month = times.dt.month.to_numpy()
+        out['is_weekend'] = (times.dt.dayofweek.to_numpy() >= 5).astype(np.int64)
+        out['hour_sin'] = np.sin(2 * np.pi * hour / 24)
+        out['hour_cos'] = np.cos(2 * np.pi * hour / 24)
+        out['doy_sin'] = np.sin(2 * np.pi * doy / 365.25)
+        out['doy_cos'] = np.cos(2 * np.pi * doy / 365.25)
+        out['month_sin'] = np.sin(2 * np.pi * month / 12)
+        out['month_cos'] = np.cos(2 * np.pi * month / 12)
+
+        if any(col in self.feature_columns for col in ('norm_lat', 'norm_lon')):
+            lat, lon = self._station_coordinates(uniques)
+            lat, lon = lat[codes], lon[codes]
+            if 'Latitude' in df.columns:
+                lat = np.where(np.isnan(lat), pd.to_numeric(df['Latitude'], errors='coerce'), lat)
+            if 'Longitude' in df.columns:
+                lon = np.where(np.isnan(lon), pd.to_numeric(df['Longitude'], errors='coerce'), lon)
+            for name, values, (lo, hi) in (('lat', lat, self.lat_range), ('lon', lon, self.lon_range)):
+                norm = (values - lo) / (hi - lo) if hi > lo else np.full(n, 0.5)
+                norm = np.nan_to_num(norm, nan=0.5)
+                out[f'norm_{name}'] = norm
+                out[f'{name}_sin'] = np.sin(2 * np.pi * norm)
+                out[f'{name}_cos'] = np.cos(2 * np.pi * norm)
+
+        lag_columns = [col for col in self.feature_columns if 'lag_' in col or 'rolling_' in col]
+        if lag_columns:
+            lags = self._lag_features(imputed['PW'], sorted_codes, lag_columns)
+            for col, values in lags.items():
+                out[col] = self._scatter(values.to_numpy(), order)
+
+        X = pd.DataFrame({col: out.get(col, 0.0) for col in self.feature_columns}, index=df.index)
+        return X, station_ids, times
+
+    @staticmethod
+    def _scatter(values, order):
+        """Values in station-major order back to the batch's row order"""
+        result = np.empty(len(values))
+        result[order] = values
+        return result
+
+    def _lag_features(self, pw, sorted_codes, lag_columns):
+        """Lag/rolling PW features over the station-major, time-ordered batch"""
+        groups = pw.groupby(sorted_codes, sort=False)
+        result = {}
+        for col in lag_columns:
+            name = col.split('_')
+            if col.startswith('PW_lag_'):
+                result[col] = groups.shift(int(name[-1]))
+            elif col.startswith('PW_rolling_'):
+                rolling = groups.rolling(window=int(name[-1]), min_periods=1)
+                stat = rolling.mean() if name[-2] == 'mean' else rolling.std()
+                result[col] = stat.droplevel(0).sort_index()
+            else:
+                result[col] = pw * np.nan
+        # Gaps (a station's first epochs) take the station mean, then the batch mean, as in training
+        lags = fill_group_means(pd.DataFrame(result), sorted_codes, self.fill_values)
+        return lags.fillna(DEFAULT_PW)
+
+    def predict_arrays(self, data):
+        """(predicted_pw, station_ids, timestamps) as arrays"""
+        X, station_ids, times = self.features(data)
+        predicted = np.asarray(self.model.predict(self.scaler.transform(X)), dtype=np.float64)
+        return predicted, station_ids, times
+
+    def predict(self, data):
+        """Columnar results: station_id, timestamp, predicted_pw, uncertainty"""
+        predicted, station_ids, times = self.predict_arrays(data)
+        return pd.DataFrame({
+            'station_id': station_ids,
+            'timestamp': times.to_numpy(),
+            'predicted_pw': predicted,
+            'uncertainty': np.full(len(predicted), MODEL_UNCERTAINTY),
+        })
+
+    def interpolate(self, latitude, longitude):
+        """
+        Spatial GP at arrays of coordinates in one predict call; returns
+        (predicted_pw, uncertainty, method).
+        """
+        lat = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        if self.spatial_model is None:
+            return fallback_pw(lat, lon), np.full(len(lat), 0.15), 'approximate_interpolation'
+        X = np.column_stack([lon, lat])
+        try:
+            predicted, std = self.spatial_model.predict(X, return_std=True)
+        except TypeError:
+            # Spatial models without uncertainty estimation
+            predicted, std = self.spatial_model.predict(X), np.full(len(lat), 0.1)
+        return np.asarray(predicted, dtype=np.float64), np.asarray(std, dtype=np.float64), 'spatial_interpolation'
+
+
+_PREDICTORS = {}
+
+
+def get_predictor(model_file=None):
+    """Predictor for model_file, loaded on first use and kept for the life of the process"""
+    path = os.path.abspath(model_file or MODEL_FILE)
+    if path not in _PREDICTORS:
+        _PREDICTORS[path] = Predictor.load(path)
+    return _PREDICTORS[path]
+
+
+@profilable
+def unified_predictor(input_data, model_file=MODEL_FILE):
     """
-    Universal predictor that handles both coordinate interpolation and data prediction
+    Universal predictor that handles both coordinate interpolation and data prediction.
+    Inputs with "_profile" set are profiled when ZVC_PROFILING=1 (see profiling.py).
     """
     try:
         # Check if this is a coordinate interpolation request
-        if 'latitude' in input_data and 'longitude' in input_data:
+        if isinstance(input_data, dict) and 'latitude' in input_data and 'longitude' in input_data:
             return interpolate_coordinates(input_data['latitude'], input_data['longitude'], model_file)
-        
+
         # Otherwise, it's a data prediction request
         return predict_from_raw_data(input_data, model_file)
-        
+
     except Exception as e:
         # Fallback to simple calculation if anything fails
-        if 'latitude' in input_data and 'longitude' in input_data:
+        if isinstance(input_data, dict) and 'latitude' in input_data and 'longitude' in input_data:
             return {
-                "predicted_pw": (abs(input_data['latitude']) * 0.1 + abs(input_data['longitude']) * 0.01).round(4),
+                "predicted_pw": float(fallback_pw(input_data['latitude'], input_data['longitude'])),
                 "uncertainty": 0.2,
                 "method": "fallback_coordinate_calculation",
                 "error": str(e)
             }
         else:
+            zwd = input_data.get('zwdObservation', 15) if isinstance(input_data, dict) else 15
             return {
-                "predicted_pw": float(input_data.get('zwdObservation', 15)) * 0.16,
+                "predicted_pw": float(zwd) * 0.16,
                 "uncertainty": 0.1,
                 "method": "fallback_calculation",
                 "error": str(e)
             }
 
-def interpolate_coordinates(latitude, longitude, model_file):
+def interpolate_coordinates(latitude, longitude, model_file=MODEL_FILE):
     """Interpolate PW at specific coordinates using spatial model"""
     try:
-        # Try to load the model package
-        saved_model = joblib.load(model_file)
-        
-        # Check if spatial model is available
-        if 'spatial_model' in saved_model:
-            spatial_model = saved_model['spatial_model']
-            X_pred = np.array([[longitude, latitude]])
-            
-            # Some spatial models support uncertainty estimation
-            try:
-                pw_pred, uncertainty = spatial_model.predict(X_pred, return_std=True)
-                predicted_pw = float(pw_pred[0])
-                uncertainty = float(uncertainty[0])
-            except:
-                # Fallback if uncertainty estimation is not supported
-                pw_pred = spatial_model.predict(X_pred)
-                predicted_pw = float(pw_pred[0])
-                uncertainty = 0.1
-            
-            return {
-                "predicted_pw": predicted_pw,
-                "uncertainty": uncertainty,
-                "method": "spatial_interpolation",
-                "latitude": latitude,
-                "longitude": longitude
-            }
-        else:
-            # Fallback if no spatial model is available
-            return {
-                "predicted_pw": (abs(latitude) * 0.1 + abs(longitude) * 0.01).round(4),
-                "uncertainty": 0.15,
-                "method": "approximate_interpolation",
-                "note": "No spatial model available, using approximate calculation",
-                "latitude": latitude,
-                "longitude": longitude
-            }
-            
+        predicted, uncertainty, method = get_predictor(model_file).interpolate(latitude, longitude)
+        result = {
+            "predicted_pw": float(predicted[0]),
+            "uncertainty": float(uncertainty[0]),
+            "method": method,
+            "latitude": latitude,
+            "longitude": longitude
+        }
+        if method == 'approximate_interpolation':
+            result["note"] = "No spatial model available, using approximate calculation"
+        return result
+
     except FileNotFoundError:
         return {
-            "predicted_pw": (abs(latitude) * 0.1 + abs(longitude) * 0.01).round(4),
+            "predicted_pw": float(fallback_pw(latitude, longitude)),
             "uncertainty": 0.2,
             "method": "fallback_interpolation",
             "note": f"Model file {model_file} not found",
@@ -84,7 +334,7 @@ def interpolate_coordinates(latitude, longitude, model_file):
         }
     except Exception as e:
         return {
-            "predicted_pw": (abs(latitude) * 0.1 + abs(longitude) * 0.01).round(4),
+            "predicted_pw": float(fallback_pw(latitude, longitude)),
             "uncertainty": 0.2,
             "method": "error_fallback",
             "error": str(e),
@@ -92,77 +342,60 @@ def interpolate_coordinates(latitude, longitude, model_file):
             "longitude": longitude
         }
 
-def predict_from_raw_data(df, saved_model):
-    """Predict from raw data by engineering features first"""
-    df_processed = df.copy()
-    
-    # Convert to datetime if needed
-    if 'dateString' in df.columns:
-        df_processed['datetime'] = pd.to_datetime(df_processed['dateString'])
-    else:
-        df_processed['datetime'] = datetime.now()
-    
-    # Create PW from ZWD if available
-    if 'zwdObservation' in df.columns:
-        df_processed['PW'] = df_processed['zwdObservation'] * 0.16
-    
-    # Add basic temporal features
-    df_processed['hour'] = df_processed['datetime'].dt.hour
-    df_processed['day_of_year'] = df_processed['datetime'].dt.dayofyear
-    df_processed['month'] = df_processed['datetime'].dt.month
-    
-    # Cyclical encoding
-    df_processed['hour_sin'] = np.sin(2 * np.pi * df_processed['hour'] / 24)
-    df_processed['hour_cos'] = np.cos(2 * np.pi * df_processed['hour'] / 24)
-    df_processed['doy_sin'] = np.sin(2 * np.pi * df_processed['day_of_year'] / 365.25)
-    df_processed['doy_cos'] = np.cos(2 * np.pi * df_processed['day_of_year'] / 365.25)
-    df_processed['month_sin'] = np.sin(2 * np.pi * df_processed['month'] / 12)
-    df_processed['month_cos'] = np.cos(2 * np.pi * df_processed['month'] / 12)
-    
-    # Use the main model
-    model = saved_model['model']
-    scaler = saved_model['scaler']
-    feature_columns = saved_model['feature_columns']
-    
-    # Ensure all required features are present
-    for feat in feature_columns:
-        if feat not in df_processed.columns:
-            if 'lag' in feat or 'rolling' in feat:
-                df_processed[feat] = df_processed.get('PW', 2.5)
-            elif 'sin' in feat or 'cos' in feat:
-                df_processed[feat] = 0.0
-            else:
-                df_processed[feat] = 0.0
-    
-    X = df_processed[feature_columns]
-    X_scaled = scaler.transform(X)
-    predictions = model.predict(X_scaled)
-    
-    # Prepare results
-    results = []
-    for i, prediction in enumerate(predictions):
-        result = {
-            'predicted_pw': float(prediction),
-            'uncertainty': 0.05,  # Placeholder uncertainty
+def predict_from_raw_data(data, model_file=MODEL_FILE):
+    """
+    Predict from raw rows (DataFrame, records, dict or Arrow table). One row
+    returns a result dict, several return the columnar form: a dict of lists.
+    """
+    results = get_predictor(model_file).predict(data)
+    if len(results) == 1:
+        row = results.iloc[0]
+        return {
+            'predicted_pw': float(row['predicted_pw']),
+            'uncertainty': float(row['uncertainty']),
             'method': 'ml_prediction',
-            'station_id': df_processed.get('stationId', 'unknown').iloc[i] if 'stationId' in df_processed.columns else 'unknown',
-            'timestamp': df_processed['datetime'].iloc[i].isoformat() if 'datetime' in df_processed.columns else datetime.now().isoformat()
+            'station_id': row['station_id'],
+            'timestamp': row['timestamp'].isoformat(),
         }
-        results.append(result)
-    
-    return results[0] if len(results) == 1 else results
+    return {
+        'method': 'ml_prediction',
+        'station_id': results['station_id'].tolist(),
+        'timestamp': results['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+        'predicted_pw': results['predicted_pw'].round(4).tolist(),
+        'uncertainty': results['uncertainty'].tolist(),
+    }
+
+def read_input(path):
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    with open(path, 'r') as f:
+        return json.load(f)
 
 if __name__ == "__main__":
-    # Read JSON input from command line argument
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
-        with open(input_file, 'r') as f:
-            input_data = json.load(f)
-        
+    parser = argparse.ArgumentParser(description="Enhanced model predictions")
+    parser.add_argument('input', nargs='?', help="JSON (record, records or coordinates), CSV or Parquet")
+    parser.add_argument('--model', default=MODEL_FILE)
+    parser.add_argument('--out', help="write the columnar results here (.parquet or .csv) instead of JSON")
+    args = parser.parse_args()
+
+    if not args.input:
+        print(json.dumps({"error": "No input file provided"}, indent=2))
+        sys.exit(1)
+
+    input_data = read_input(args.input)
+    if args.out:
+        results = get_predictor(args.model).predict(input_data)
+        if args.out.endswith('.parquet'):
+            results.to_parquet(args.out, index=False)
+        else:
+            results.to_csv(args.out, index=False)
+        print(f"Wrote {len(results)} predictions to {args.out}")
+    else:
         # Run prediction
-        result = unified_predictor(input_data)
-        
+        result = unified_predictor(input_data, args.model)
+
         # Output result as JSON
         print(json.dumps(result, indent=2))
-    else:
-        print(json.dumps({"error": "No input file provided"}, indent=2))
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The training code lives in model/pickle-model-generator-1.py, which cannot be
+imported by name, so it is loaded from its file path here.
+"""
+
+import importlib.util
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIR = os.path.join(REPO_ROOT, "model")
+ROUTES_DIR = os.path.join(REPO_ROOT, "backend", "routes")
+BUILDER_DIR = os.path.join(REPO_ROOT, "gnss-data-coll", "zenith_dataset")
+DATASET_CSV = os.path.join(MODEL_DIR, "dataset.csv")
+
+for path in (BUILDER_DIR, ROUTES_DIR, MODEL_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_training_module():
+    """Import model/pickle-model-generator-1.py as a module"""
+    path = os.path.join(MODEL_DIR, "pickle-model-generator-1.py")
+    spec = importlib.util.spec_from_file_location("enhanced_gnss_pw_model", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(fn, *args, **kwargs):
+    """Run fn once and return (result, wall seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,110 @@
+"""
+Microbenchmark the shared physics kernels in model/physics.py.
+
+For each array size and precision, times the numpy path, the numba JIT path
+(when numba is installed; compile time excluded) and, up to --loop-max
+elements, the original per-element Python loop the builder used. Reports the
+best of --repeat runs in ns/element.
+
+Usage:
+    python benchmarks/bench_physics.py
+    python benchmarks/bench_physics.py --sizes 1000 1000000 100000000 --dtypes float32
+    python benchmarks/bench_physics.py --kernels zwd_from_ztd rh_from_dewpoint --repeat 5
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+from _common import timed
+import physics
+
+RANDOM_STATE = 42
+
+
+def scalar_zwd(ztd, p, lat, elev):
+    phi = math.radians(lat)
+    return ztd - 0.0022768 * p / (1 - 0.00266 * math.cos(2 * phi) - 0.00028 * elev / 1000.0)
+
+
+def scalar_rh(t, td):
+    td = min(td, t)
+    return 100 * math.exp(17.27 * td / (237.7 + td) - 17.27 * t / (237.7 + t))
+
+
+def scalar_vapor_pressure(t, rh):
+    return 6.1078 * 10 ** ((7.5 * t) / (t + 237.3)) * (rh / 100)
+
+
+def scalar_pw(zwd, t):
+    return (0.15 + 0.0005 * t) * zwd
+
+
+# kernel name -> (argument generators, scalar reference)
+KERNELS = {
+    'zwd_from_ztd': ((lambda rng, n: rng.normal(2300, 50, n),
+                      lambda rng, n: rng.normal(1000, 20, n),
+                      lambda rng, n: rng.uniform(-90, 90, n),
+                      lambda rng, n: rng.uniform(0, 3000, n)), scalar_zwd),
+    'rh_from_dewpoint': ((lambda rng, n: rng.normal(15, 10, n),
+                          lambda rng, n: rng.normal(8, 10, n)), scalar_rh),
+    'vapor_pressure': ((lambda rng, n: rng.normal(15, 10, n),
+                        lambda rng, n: rng.uniform(5, 100, n)), scalar_vapor_pressure),
+    'pw_from_zwd_linear': ((lambda rng, n: rng.normal(150, 40, n),
+                            lambda rng, n: rng.normal(15, 10, n)), scalar_pw),
+}
+
+
+def best_of(repeat, fn, *args, **kwargs):
+    return min(timed(fn, *args, **kwargs)[1] for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[10 ** k for k in range(3, 9)])
+    parser.add_argument('--dtypes', nargs='+', default=['float64', 'float32'], choices=['float64', 'float32'])
+    parser.add_argument('--kernels', nargs='+', default=list(KERNELS), choices=list(KERNELS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--loop-max', type=int, default=100_000,
+                        help="time the scalar Python loop up to this many elements")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(RANDOM_STATE)
+    print(f"numba JIT: {'available' if physics.JIT_AVAILABLE else 'not installed'}")
+    header = f"{'kernel':>20} {'dtype':>8} {'elements':>10} {'loop ns':>9} {'numpy ns':>9} {'jit ns':>9} {'max rel err':>11}"
+    print(header)
+    print("-" * len(header))
+
+    for name in args.kernels:
+        generators, scalar = KERNELS[name]
+        kernel = getattr(physics, name)
+        for dtype in args.dtypes:
+            for size in args.sizes:
+                inputs = [gen(rng, size).astype(dtype) for gen in generators]
+                repeat = args.repeat if size < 10 ** 7 else 1
+
+                result = kernel(*inputs)
+                numpy_s = best_of(repeat, kernel, *inputs)
+
+                jit_ns = f"{'-':>9}"
+                if physics.JIT_AVAILABLE:
+                    kernel(*[a[:1] for a in inputs], jit=True)  # compile outside the timing
+                    jit_ns = f"{best_of(repeat, kernel, *inputs, jit=True) / size * 1e9:>9.2f}"
+
+                loop_ns, diff = f"{'-':>9}", f"{'-':>11}"
+                if size <= args.loop_max:
+                    columns = [a.tolist() for a in inputs]
+                    expected = [scalar(*v) for v in zip(*columns)]
+                    loop_s = best_of(repeat, lambda: [scalar(*v) for v in zip(*columns)])
+                    loop_ns = f"{loop_s / size * 1e9:>9.1f}"
+                    rel = np.abs(result - np.asarray(expected)) / np.maximum(np.abs(expected), 1.0)
+                    diff = f"{float(rel.max()):>11.2e}"
+
+                print(f"{name:>20} {dtype:>8} {size:>10} {loop_ns} {numpy_s / size * 1e9:>9.2f} {jit_ns} {diff}")
+                del inputs, result
+
+
+if __name__ == "__main__":
+    main()
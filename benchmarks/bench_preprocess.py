@@ -0,0 +1,100 @@
+"""
+Benchmark EnhancedGNSSPWModel.preprocess_data on synthetic frames of growing size.
+
+Reports wall time and rows/second per size so the scaling can be read off
+directly, and (for sizes up to --check-max) verifies that the interpolated and
+lag/rolling features match the original per-station implementation.
+With --memory-lean the model runs in its memory-lean mode (float32 features,
+categorical Station ID) and the process peak RSS is reported per size.
+
+Usage:
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --sizes 10000 100000 1000000 10000000
+    python benchmarks/bench_preprocess.py --memory-lean --sizes 10000000
+"""
+
+import argparse
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+from _common import load_training_module, timed
+from fixtures import synthetic_gnss_frame
+
+NUMERIC_COLS = ['ZWD Observation', 'Temperature (°C)', 'Pressure (hPa)', 'Humidity (%)',
+                'Satellite Azimuth', 'Satellite Elevation', 'PW']
+
+
+def reference_features(data):
+    """The original per-station interpolation and lag loops, used as ground truth"""
+    df = data.copy()
+    df['datetime'] = pd.to_datetime(df['Date (ISO Format)'])
+    df = df.sort_values(['Station ID', 'datetime'])
+    df['PW'] = df['ZWD Observation'] * 0.16
+
+    for col in NUMERIC_COLS:
+        df[col] = df.groupby('Station ID')[col].transform(
+            lambda x: x.interpolate(method='linear', limit_direction='both'))
+        station_means = df.groupby('Station ID')[col].transform('mean')
+        df[col] = df[col].fillna(station_means).fillna(df[col].mean())
+
+    for station_id, group in df.groupby('Station ID'):
+        station_idx = df.index[df['Station ID'] == station_id]
+        for lag in [1, 2, 3]:
+            df.loc[station_idx, f'PW_lag_{lag}'] = group['PW'].shift(lag)
+        for window in [3, 6]:
+            df.loc[station_idx, f'PW_rolling_mean_{window}'] = group['PW'].rolling(
+                window=window, min_periods=1).mean()
+            df.loc[station_idx, f'PW_rolling_std_{window}'] = group['PW'].rolling(
+                window=window, min_periods=1).std()
+
+    lag_cols = [col for col in df.columns if 'lag_' in col or 'rolling_' in col]
+    for col in lag_cols:
+        station_means = df.groupby('Station ID')[col].transform('mean')
+        df[col] = df[col].fillna(station_means).fillna(df[col].mean())
+    return df[NUMERIC_COLS + lag_cols]
+
+
+def check_equivalence(processed, data):
+    """Compare preprocess_data output with the reference implementation"""
+    expected = reference_features(data)
+    actual = processed[expected.columns].set_index(processed.index)
+    expected = expected.loc[actual.index]
+    max_diff = float(np.nanmax(np.abs(actual.to_numpy() - expected.to_numpy())))
+    return max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--stations', type=int, default=400)
+    parser.add_argument('--check-max', type=int, default=100_000,
+                        help="verify against the reference implementation up to this size")
+    parser.add_argument('--memory-lean', action='store_true',
+                        help="run the memory-lean preprocessing mode")
+    args = parser.parse_args()
+
+    module = load_training_module()
+
+    print(f"{'rows':>10} {'seconds':>9} {'rows/s':>12} {'ns/row':>8} {'max |diff|':>11} "
+          f"{'frame MB':>9} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        data = synthetic_gnss_frame(size, n_stations=args.stations, compact=args.memory_lean)
+        reference_input = data.copy() if size <= args.check_max else None
+        pw_model = module.EnhancedGNSSPWModel(memory_lean=args.memory_lean)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, seconds = timed(pw_model.preprocess_data, data)
+
+        diff = f"{'-':>11}"
+        if reference_input is not None:
+            diff = f"{check_equivalence(processed, reference_input):>11.2e}"
+        frame_mb = processed.memory_usage(deep=True).sum() / 1e6
+        print(f"{size:>10} {seconds:>9.2f} {size / seconds:>12,.0f} {seconds / size * 1e9:>8.0f} {diff} "
+              f"{frame_mb:>9.1f} {module.peak_rss_mb():>12.1f}")
+        del data, processed
+
+
+if __name__ == "__main__":
+    main()
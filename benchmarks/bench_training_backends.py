@@ -0,0 +1,110 @@
+"""
+Benchmark the EnhancedGNSSPWModel training backends.
+
+Compares wall time and holdout accuracy of the original exact GBR against the
+histogram backends on model/dataset.csv and on scaled-up synthetic copies of
+its feature matrix.
+
+Usage:
+    python benchmarks/bench_training_backends.py
+    python benchmarks/bench_training_backends.py --sizes 0 100000 1000000 --backends gbr hist xgboost
+    python benchmarks/bench_training_backends.py --n-jobs 4 --early-stopping 20
+
+A size of 0 means "the real dataset as is".
+"""
+
+import argparse
+import contextlib
+import io
+
+import numpy as np
+from sklearn.metrics import mean_squared_error, mean_absolute_error
+from sklearn.preprocessing import StandardScaler
+
+from _common import DATASET_CSV, load_training_module, timed
+from training_backends import BACKENDS, make_regressor, fit_regressor, as_float32
+
+RANDOM_STATE = 42
+
+
+def load_real_features():
+    """Run the model's own preprocessing over dataset.csv and return X, y"""
+    module = load_training_module()
+    pw_model = module.EnhancedGNSSPWModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = pw_model.load_data([DATASET_CSV])
+        processed = pw_model.preprocess_data(data)
+        X, y = pw_model.create_features(processed)
+    return X.to_numpy(dtype=np.float64), y.to_numpy(dtype=np.float64)
+
+
+def scale_up(X, y, n_rows, rng):
+    """Resample rows with replacement and jitter them to reach n_rows"""
+    idx = rng.integers(0, len(X), size=n_rows)
+    X_big = X[idx] + rng.normal(0, 0.05, size=(n_rows, X.shape[1])) * X.std(axis=0)
+    y_big = y[idx] + rng.normal(0, 0.05 * y.std(), size=n_rows)
+    return X_big, y_big
+
+
+def run_backend(backend, X, y, n_jobs, early_stopping_rounds, test_size=0.2, validation_size=0.1):
+    """Train one backend with the same split as train_model and score it"""
+    split_idx = int(len(X) * (1 - test_size))
+    scaler = StandardScaler()
+    X_train = as_float32(scaler.fit_transform(X[:split_idx]))
+    X_test = as_float32(scaler.transform(X[split_idx:]))
+    y_train, y_test = y[:split_idx], y[split_idx:]
+
+    X_val = y_val = None
+    if early_stopping_rounds:
+        val_idx = int(len(X_train) * (1 - validation_size))
+        X_train, X_val = X_train[:val_idx], X_train[val_idx:]
+        y_train, y_val = y_train[:val_idx], y_train[val_idx:]
+
+    model = make_regressor(backend, random_state=RANDOM_STATE, n_jobs=n_jobs)
+    n_rounds, fit_seconds = timed(fit_regressor, model, backend, X_train, y_train, X_val, y_val,
+                                  early_stopping_rounds=early_stopping_rounds, n_jobs=n_jobs)
+    y_pred, predict_seconds = timed(model.predict, X_test)
+
+    return {
+        'fit_s': fit_seconds,
+        'predict_s': predict_seconds,
+        'rounds': n_rounds,
+        'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))),
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[0, 100_000, 1_000_000])
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--early-stopping', type=int, default=None)
+    parser.add_argument('--skip-gbr-above', type=int, default=1_000_000,
+                        help="skip the exact GBR backend above this many rows")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(RANDOM_STATE)
+    X_real, y_real = load_real_features()
+    print(f"dataset.csv: {X_real.shape[0]} rows x {X_real.shape[1]} features")
+
+    header = f"{'rows':>10} {'backend':>9} {'fit_s':>9} {'pred_s':>8} {'rounds':>6} {'rmse':>8} {'mae':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for size in args.sizes:
+        X, y = (X_real, y_real) if size == 0 else scale_up(X_real, y_real, size, rng)
+        for backend in args.backends:
+            if backend == 'gbr' and len(X) > args.skip_gbr_above:
+                continue
+            try:
+                r = run_backend(backend, X, y, args.n_jobs, args.early_stopping)
+            except ImportError as e:
+                print(f"{len(X):>10} {backend:>9} skipped ({e})")
+                continue
+            print(f"{len(X):>10} {backend:>9} {r['fit_s']:>9.2f} {r['predict_s']:>8.3f} "
+                  f"{r['rounds']:>6} {r['rmse']:>8.4f} {r['mae']:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Fixed synthetic datasets for the benchmarks.
+
+Everything is generated from RANDOM_STATE, so the same commit always sees
+the same inputs and no downloads, real model files or ERA5 archives are needed.
+"""
+
+import numpy as np
+import pandas as pd
+
+RANDOM_STATE = 42
+
+
+def synthetic_gnss_frame(n_rows, n_stations=400, nan_fraction=0.02, seed=RANDOM_STATE, compact=False):
+    """
+    Raw GNSS rows in dataset.csv layout, shuffled, with scattered missing values.
+
+    compact=True returns the dtypes memory-lean loading produces
+    (categorical Station ID, float32 measurements).
+    """
+    rng = np.random.default_rng(seed)
+    station_idx = rng.integers(0, n_stations, size=n_rows)
+    epoch = (np.datetime64('2023-01-01T00:00:00')
+             + rng.integers(0, 365 * 86400, size=n_rows).astype('timedelta64[s]'))
+
+    df = pd.DataFrame({
+        'Station ID': np.char.add('ST', station_idx.astype(str).astype('U4')).astype(object),
+        'Date (ISO Format)': epoch,
+        'ZWD Observation': rng.normal(15, 4, n_rows),
+        'Temperature (°C)': rng.normal(15, 10, n_rows),
+        'Pressure (hPa)': rng.normal(1010, 8, n_rows),
+        'Humidity (%)': rng.uniform(10, 100, n_rows),
+        'Satellite Azimuth': rng.uniform(0, 360, n_rows),
+        'Satellite Elevation': rng.uniform(10, 90, n_rows),
+    })
+    for col in ['ZWD Observation', 'Temperature (°C)', 'Pressure (hPa)', 'Humidity (%)']:
+        df.loc[rng.random(n_rows) < nan_fraction, col] = np.nan
+    if compact:
+        df = df.astype({col: np.float32 for col in df.columns[2:]})
+        df['Station ID'] = df['Station ID'].astype('category')
+    return df
+
+
+def station_locations(n_stations, seed=RANDOM_STATE, bounds=(-10.0, 10.0, 70.0, 90.0)):
+    """Station ID / Latitude / Longitude table with stations scattered over bounds"""
+    rng = np.random.default_rng(seed)
+    min_lat, max_lat, min_lon, max_lon = bounds
+    return pd.DataFrame({
+        'Station ID': [f"ST{i}" for i in range(n_stations)],
+        'Latitude': rng.uniform(min_lat, max_lat, n_stations),
+        'Longitude': rng.uniform(min_lon, max_lon, n_stations),
+    })
+
+
+def prediction_model(path, n_rows=5000, seed=RANDOM_STATE):
+    """Train a small XGBoost regressor on prediction.MODEL_FEATURES and save it with joblib"""
+    import joblib
+    from xgboost import XGBRegressor
+    from prediction import MODEL_FEATURES
+
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.uniform(-60, 60, n_rows), rng.uniform(-180, 180, n_rows), rng.uniform(0, 2000, n_rows),
+        rng.normal(20, 8, n_rows), rng.normal(1010, 10, n_rows), rng.uniform(2, 35, n_rows),
+        *[np.sin(rng.uniform(0, 2 * np.pi, n_rows)) for _ in range(4)],
+    ])
+    y = 0.8 * X[:, 5] + 0.1 * X[:, 3] + rng.normal(0, 1, n_rows)
+    model = XGBRegressor(n_estimators=200, max_depth=6, random_state=seed)
+    model.fit(pd.DataFrame(X, columns=MODEL_FEATURES), y)
+    joblib.dump(model, path)
+    return path
+
+
+def enhanced_model_package(path, n_rows=20_000, n_stations=40, seed=RANDOM_STATE):
+    """
+    Train EnhancedGNSSPWModel ('hist' backend, no CV) on synthetic rows and
+    save_model it, i.e. the enhanced_gnss_pw_model_fixed.pkl layout
+    unified_predictor.Predictor loads.
+    """
+    from _common import load_training_module
+
+    module = load_training_module()
+    pw_model = module.EnhancedGNSSPWModel(backend='hist', cv_folds=0)
+    pw_model.station_locations = station_locations(n_stations, seed)
+    df = pw_model.preprocess_data(synthetic_gnss_frame(n_rows, n_stations=n_stations, seed=seed))
+    X, y = pw_model.create_features(df)
+    pw_model.train_model(X, y)
+    pw_model.train_spatial_model(df[['Station ID', 'datetime', 'PW']])
+    pw_model.save_model(path)
+    return path
+
+
+def prediction_inputs(n, seed=RANDOM_STATE):
+    """Full-feature request payloads as the Express routes send them"""
+    rng = np.random.default_rng(seed)
+    return [{
+        'stationId': f"ST{i % 50}",
+        'stationLatitude': float(rng.uniform(-60, 60)),
+        'stationLongitude': float(rng.uniform(-180, 180)),
+        'stationElevation': float(rng.uniform(0, 2000)),
+        'zwdObservation': float(rng.normal(150, 40)),
+        'satelliteAzimuth': float(rng.uniform(0, 360)),
+        'satelliteElevation': float(rng.uniform(10, 90)),
+        'temperature': float(rng.normal(20, 8)),
+        'pressure': float(rng.normal(1010, 10)),
+        'humidity': float(rng.uniform(10, 100)),
+        'year': 2023, 'month': int(rng.integers(1, 13)), 'day': int(rng.integers(1, 29)),
+        'hour': int(rng.integers(0, 24)),
+    } for i in range(n)]
+
+
+def coordinates(n, seed=RANDOM_STATE):
+    """(lat, lon) query points"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(-60, 60, n), rng.uniform(-180, 180, n)])
+
+
+def spatial_frame(locations, n_epochs=24, seed=RANDOM_STATE):
+    """Hourly PW per station (Station ID, datetime, PW), for train_spatial_model"""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2023-06-01', periods=n_epochs, freq='h')
+    ids = np.repeat(locations['Station ID'].to_numpy(), n_epochs)
+    lat = np.repeat(locations['Latitude'].to_numpy(), n_epochs)
+    return pd.DataFrame({
+        'Station ID': ids,
+        'datetime': np.tile(times, len(locations)),
+        'PW': 20 + 10 * np.cos(np.radians(lat)) + rng.normal(0, 1, len(ids)),
+    })
+
+
+def era5_dataset(days=10, step_deg=2.0, seed=RANDOM_STATE):
+    """Hourly global single-level ERA5 fields (t2m, d2m, sp, tcwv) on a step_deg grid"""
+    import xarray as xr
+
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2023-01-01', periods=days * 24, freq='h')
+    lats = np.arange(90, -90 - step_deg / 2, -step_deg)
+    lons = np.arange(0, 360, step_deg)
+    shape = (len(times), len(lats), len(lons))
+    base = np.cos(np.radians(lats))[None, :, None]
+    t2m = (250 + 45 * base + rng.normal(0, 2, shape)).astype(np.float32)
+    return xr.Dataset({
+        't2m': (('valid_time', 'latitude', 'longitude'), t2m),
+        'd2m': (('valid_time', 'latitude', 'longitude'), t2m - rng.uniform(1, 10, shape).astype(np.float32)),
+        'sp': (('valid_time', 'latitude', 'longitude'),
+               (101325 - 2000 * (1 - base) + rng.normal(0, 300, shape)).astype(np.float32)),
+        'tcwv': (('valid_time', 'latitude', 'longitude'),
+                 (5 + 45 * base ** 2 + rng.normal(0, 2, shape)).astype(np.float32)),
+    }, coords={'valid_time': times, 'latitude': lats, 'longitude': lons})
+
+
+def loso_frame(n_stations=30, rows_per_station=100, seed=RANDOM_STATE):
+    """Cleaned pklgen input (dataset.csv columns plus Hour/doy), before add_physics_pw"""
+    rng = np.random.default_rng(seed)
+    n = n_stations * rows_per_station
+    locations = station_locations(n_stations, seed)
+    idx = np.repeat(np.arange(n_stations), rows_per_station)
+    dates = pd.to_datetime('2023-01-01') + pd.to_timedelta(rng.integers(0, 365 * 86400, n), unit='s')
+    return pd.DataFrame({
+        'Station ID': locations['Station ID'].to_numpy()[idx],
+        'Date (ISO Format)': dates,
+        'Station Latitude': locations['Latitude'].to_numpy()[idx],
+        'Station Longitude': locations['Longitude'].to_numpy()[idx],
+        'ZWD Observation': rng.uniform(0.05, 0.3, n),
+        'Temperature (°C)': rng.normal(20, 8, n),
+        'Pressure (hPa)': rng.normal(1010, 8, n),
+        'Humidity (%)': rng.uniform(10, 100, n),
+        'Hour': dates.hour,
+        'doy': dates.dayofyear,
+    })
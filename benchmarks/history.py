@@ -0,0 +1,144 @@
+"""
+Benchmark history: one JSON line per suite run, keyed by git commit.
+
+Each record carries the commit, whether the tree was dirty, the host and
+the versions of the numeric dependencies, so a slowdown can be traced to
+either a code change or a dependency upgrade.
+
+Usage:
+    python benchmarks/history.py                  # runs per commit, latest last
+    python benchmarks/history.py --case predict_single
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from _common import REPO_ROOT
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+TRACKED_PACKAGES = ['numpy', 'pandas', 'scipy', 'sklearn', 'xgboost', 'xarray', 'pyarrow', 'numba']
+
+# A case counts as regressed when its median is this much slower than the baseline run
+REGRESSION_THRESHOLD = 1.25
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Commit, host and dependency versions for a history record"""
+    packages = {}
+    for name in TRACKED_PACKAGES:
+        try:
+            packages[name] = importlib.import_module(name).__version__
+        except ImportError:
+            packages[name] = None
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'subject': _git('log', '-1', '--format=%s'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'packages': packages,
+    }
+
+
+def append(record, path=HISTORY_FILE):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline_for(record, history, ref=None):
+    """
+    The run to compare against: the latest run of commit `ref` (prefix match)
+    if given, else the latest run on the same host from a different commit.
+    """
+    for past in reversed(history):
+        if ref is not None:
+            if (past.get('commit') or '').startswith(ref):
+                return past
+        elif past.get('host') == record['host'] and past.get('commit') != record['commit']:
+            return past
+    return None
+
+
+def compare(record, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Per-case median ratios against the baseline run.
+
+    Returns a list of (case, baseline median, current median, ratio, flag)
+    where flag is 'REGRESSION', 'improved' or ''. Dependency version changes
+    between the runs are returned separately so they can be reported.
+    """
+    rows = []
+    for case, result in record['results'].items():
+        before = baseline['results'].get(case)
+        if not before or not before.get('median_s') or not result.get('median_s'):
+            continue
+        ratio = result['median_s'] / before['median_s']
+        flag = 'REGRESSION' if ratio > threshold else 'improved' if ratio < 1 / threshold else ''
+        rows.append((case, before['median_s'], result['median_s'], ratio, flag))
+
+    changed = {name: (baseline['packages'].get(name), version)
+               for name, version in record['packages'].items()
+               if baseline['packages'].get(name) != version}
+    return rows, changed
+
+
+def print_comparison(record, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print the comparison table; returns the number of regressed cases"""
+    rows, changed = compare(record, baseline, threshold)
+    print(f"\nAgainst {baseline['commit'][:10]} ({baseline['timestamp']}): {baseline.get('subject') or ''}")
+    for name, (before, after) in changed.items():
+        print(f"  dependency changed: {name} {before} -> {after}")
+    print(f"{'case':>26} {'before ms':>10} {'now ms':>10} {'ratio':>7}")
+    for case, before, now, ratio, flag in rows:
+        print(f"{case:>26} {before * 1e3:>10.2f} {now * 1e3:>10.2f} {ratio:>7.2f} {flag}")
+    return sum(flag == 'REGRESSION' for *_, flag in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--case', help="show one case's median across runs")
+    parser.add_argument('--file', default=HISTORY_FILE)
+    args = parser.parse_args()
+
+    history = load(args.file)
+    if not history:
+        print(f"No benchmark history in {args.file}")
+        sys.exit(0)
+
+    for record in history:
+        commit = (record.get('commit') or 'unknown')[:10] + ('+' if record.get('dirty') else ' ')
+        if args.case:
+            result = record['results'].get(args.case)
+            median = f"{result['median_s'] * 1e3:10.2f} ms" if result else f"{'-':>13}"
+            print(f"{commit} {record['timestamp']} {record['host']:>12} {median}")
+        else:
+            print(f"{commit} {record['timestamp']} {record['host']:>12} "
+                  f"{len(record['results'])} cases  {record.get('subject') or ''}")
+
+
+if __name__ == "__main__":
+    main()
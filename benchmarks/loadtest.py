@@ -0,0 +1,211 @@
+"""
+Replay a request trace (workload.py trace) against the prediction service.
+
+Open-loop driver: request i is issued at its trace time rescaled to the
+target QPS, whether or not earlier requests have finished, so latency
+includes queueing (no coordinated omission). Targets:
+
+    spawn      python prediction.py '<json>' per request, as the Express routes do
+    inprocess  prediction.predict() in worker threads of this process
+    http       POST the payload as JSON to --url (e.g. a running backend route)
+
+Reports p50/p90/p99/max latency (from scheduled start), service time,
+achieved throughput, errors and fallback answers per request kind.
+
+Usage:
+    python benchmarks/loadtest.py /tmp/zvc/trace.jsonl --target spawn --qps 20 --duration 30
+    python benchmarks/loadtest.py /tmp/zvc/trace.jsonl --target inprocess --qps 500 --concurrency 8
+    python benchmarks/loadtest.py trace.jsonl --target http --url http://localhost:5000/api/interpolation \\
+        --kind interpolation --extra '{"apiKey": "..."}'
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from _common import ROUTES_DIR
+
+PREDICTION_SCRIPT = os.path.join(ROUTES_DIR, "prediction.py")
+REQUEST_TIMEOUT = 30.0  # seconds, the routes' spawn timeout
+
+
+def read_trace(path, kind=None, limit=None):
+    with open(path) as f:
+        records = (json.loads(line) for line in f if line.strip())
+        if kind:
+            records = (r for r in records if r['kind'] == kind)
+        return list(itertools.islice(records, limit))
+
+
+def spawn_target(python, model_path=None):
+    env = dict(os.environ, ZVC_MODEL_FILE=model_path) if model_path else None
+
+    def call(payload):
+        proc = subprocess.run([python, PREDICTION_SCRIPT, json.dumps(payload)], capture_output=True,
+                              text=True, timeout=REQUEST_TIMEOUT, env=env)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "exit code")
+        # prediction.py may print diagnostics before the (indented) JSON answer
+        out = proc.stdout.strip()
+        return json.loads(out if out.startswith('{') else out[out.rfind('\n{') + 1:])
+    return call
+
+
+def inprocess_target(model_path=None):
+    import prediction
+    if model_path:
+        prediction.MODEL_FILE = model_path
+    return prediction.predict
+
+
+def http_target(url, extra, headers):
+    def call(payload):
+        body = json.dumps({**payload, **extra}).encode()
+        request = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json', **headers})
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            result = json.loads(response.read())
+        return result.get('prediction', result)
+    return call
+
+
+def run(records, call, qps, concurrency):
+    """
+    Issue every record at trace time t * (trace QPS / target QPS).
+
+    Returns per-request arrays: kind, scheduled offset, latency from the
+    scheduled time, service time, ok flag and fallback flag.
+    """
+    n = len(records)
+    trace_t = np.array([r['t'] for r in records])
+    trace_qps = n / trace_t[-1] if n and trace_t[-1] > 0 else qps
+    scheduled = (trace_t - trace_t[0]) * (trace_qps / qps) if qps else np.zeros(n)
+
+    latency = np.full(n, np.nan)
+    service = np.full(n, np.nan)
+    ok = np.zeros(n, dtype=bool)
+    fallback = np.zeros(n, dtype=bool)
+    errors = {}
+
+    def issue(i, due):
+        start = time.perf_counter()
+        try:
+            result = call(records[i]['payload'])
+            ok[i] = True
+            fallback[i] = str(result.get('method', '')).startswith('fallback')
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        end = time.perf_counter()
+        service[i] = end - start
+        latency[i] = end - due
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(n):
+            due = t0 + scheduled[i]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(issue, i, due)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'kind': np.array([r['kind'] for r in records]),
+        'latency': latency, 'service': service, 'ok': ok, 'fallback': fallback,
+        'elapsed': elapsed, 'errors': errors,
+    }
+
+
+def summarize(result, label, mask):
+    lat = result['latency'][mask & result['ok']] * 1e3
+    svc = result['service'][mask & result['ok']] * 1e3
+    count = int(mask.sum())
+    if not len(lat):
+        return f"{label:>14} {count:>7} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {count:>6} {0:>6}"
+    p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+    return (f"{label:>14} {count:>7} {p50:>8.1f} {p90:>8.1f} {p99:>8.1f} {lat.max():>8.1f} "
+            f"{np.median(svc):>8.1f} {count - len(lat):>6} {int(result['fallback'][mask].sum()):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', help="JSONL trace from workload.py trace")
+    parser.add_argument('--target', choices=['spawn', 'inprocess', 'http'], default='spawn')
+    parser.add_argument('--qps', type=float, default=10.0, help="target request rate (0 = as fast as possible)")
+    parser.add_argument('--duration', type=float, default=None, help="replay only this many seconds")
+    parser.add_argument('--requests', type=int, default=None, help="replay only this many requests")
+    parser.add_argument('--concurrency', type=int, default=32, help="maximum requests in flight")
+    parser.add_argument('--kind', choices=['full', 'interpolation'], default=None)
+    parser.add_argument('--python', default=sys.executable, help="interpreter for --target spawn")
+    parser.add_argument('--model', help="model file for spawn/inprocess (default: prediction.MODEL_FILE)")
+    parser.add_argument('--synthetic-model', action='store_true',
+                        help="train the benchmark fixture model and serve that")
+    parser.add_argument('--url', help="endpoint for --target http")
+    parser.add_argument('--extra', default='{}', help="JSON merged into every http payload (e.g. apiKey)")
+    parser.add_argument('--header', action='append', default=[], help="'Name: value' for http requests")
+    parser.add_argument('--json', dest='json_out', help="also write the summary as JSON here")
+    args = parser.parse_args()
+
+    limit = args.requests
+    if args.duration and args.qps:
+        limit = min(limit or sys.maxsize, int(args.duration * args.qps))
+    records = read_trace(args.trace, args.kind, limit)
+    if not records:
+        sys.exit(f"No requests in {args.trace}")
+
+    model_path = args.model
+    if args.synthetic_model:
+        import fixtures
+        model_path = fixtures.prediction_model(os.path.join(tempfile.mkdtemp(), "loadtest_xgb.pkl"))
+
+    if args.target == 'spawn':
+        call = spawn_target(args.python, model_path)
+    elif args.target == 'inprocess':
+        call = inprocess_target(model_path)
+    else:
+        if not args.url:
+            sys.exit("--target http needs --url")
+        headers = dict(h.split(':', 1) for h in args.header)
+        call = http_target(args.url, json.loads(args.extra), {k.strip(): v.strip() for k, v in headers.items()})
+
+    print(f"Replaying {len(records)} requests against {args.target} at "
+          f"{args.qps or 'max'} QPS, concurrency {args.concurrency}")
+    result = run(records, call, args.qps, args.concurrency)
+
+    completed = int(result['ok'].sum())
+    print(f"\n{'kind':>14} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'svc p50':>8} {'errors':>6} {'fallbk':>6}")
+    everything = np.ones(len(records), dtype=bool)
+    for kind in sorted(set(result['kind'])):
+        print(summarize(result, kind, result['kind'] == kind))
+    print(summarize(result, 'all', everything))
+    print(f"\nThroughput: {completed / result['elapsed']:.1f} req/s completed "
+          f"(target {args.qps or 'max'} QPS) over {result['elapsed']:.1f} s")
+    for name, count in result['errors'].items():
+        print(f"  {count} x {name}")
+
+    if args.json_out:
+        ok = result['ok']
+        lat = result['latency'][ok]
+        summary = {
+            'target': args.target, 'qps': args.qps, 'requests': len(records), 'completed': completed,
+            'elapsed_s': result['elapsed'], 'throughput_rps': completed / result['elapsed'],
+            'p50_ms': float(np.percentile(lat, 50) * 1e3) if len(lat) else None,
+            'p99_ms': float(np.percentile(lat, 99) * 1e3) if len(lat) else None,
+            'fallbacks': int(result['fallback'].sum()), 'errors': result['errors'],
+        }
+        with open(args.json_out, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark suite for the Python hot paths, with per-commit regression history.
+
+Cases (fixed synthetic inputs from fixtures.py, fully offline):
+    predict_single           prediction.predict on one full-feature payload (model load included)
+    predict_batched          prediction.predict over 200 payloads, as the routes call it
+    interpolate_coordinates  prediction.interpolate_coordinates at 1000 points, model loaded once
+    dashboard_grid           EnhancedGNSSPWModel.create_dashboard_data, GP over 40 stations, 41x41 grid
+    preprocess_10k           EnhancedGNSSPWModel.preprocess_data on 10k rows
+    preprocess_1m            ... on 1M rows (skipped with --quick)
+    build_colocate           build_dataset.make_rows (ERA5 co-location) for 100k station epochs
+    pklgen_loso              pklgen.loso_validation over 30 stations x 100 rows
+    unified_batch            unified_predictor.Predictor.predict on 100k raw rows, package loaded once
+
+Each case is timed --repeat times after a warm-up run; the median and best
+wall times are appended to history.jsonl with the git commit and dependency
+versions, and compared with the previous run of another commit on this host.
+
+Usage:
+    python benchmarks/suite.py
+    python benchmarks/suite.py --quick --cases predict_single preprocess_10k
+    python benchmarks/suite.py --baseline 3fc61c9 --fail-on-regression
+    python benchmarks/suite.py --no-save
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+
+import numpy as np
+
+from _common import load_training_module, timed
+import fixtures
+import history
+
+CASES = {}
+
+
+def case(name, quick=True, repeat=None):
+    """Register a benchmark: setup(workdir) returns (callable, items processed per call)"""
+    def register(setup):
+        CASES[name] = {'setup': setup, 'quick': quick, 'repeat': repeat}
+        return setup
+    return register
+
+
+def _prediction_module(workdir):
+    import prediction
+    path = os.path.join(workdir, "bench_xgb.pkl")
+    if not os.path.exists(path):
+        fixtures.prediction_model(path)
+    prediction.MODEL_FILE = path
+    return prediction
+
+
+@case('predict_single')
+def predict_single(workdir):
+    prediction = _prediction_module(workdir)
+    payload = fixtures.prediction_inputs(1)[0]
+    return (lambda: prediction.predict(payload)), 1
+
+
+@case('predict_batched')
+def predict_batched(workdir):
+    prediction = _prediction_module(workdir)
+    payloads = fixtures.prediction_inputs(200)
+    return (lambda: [prediction.predict(p) for p in payloads]), len(payloads)
+
+
+@case('interpolate_coordinates')
+def interpolate_coordinates(workdir):
+    prediction = _prediction_module(workdir)
+    model = prediction.load_model()
+    points = fixtures.coordinates(1000)
+    return (lambda: [prediction.interpolate_coordinates(lat, lon, model) for lat, lon in points]), len(points)
+
+
+@case('dashboard_grid', repeat=3)
+def dashboard_grid(workdir):
+    module = load_training_module()
+    pw_model = module.EnhancedGNSSPWModel()
+    pw_model.station_locations = fixtures.station_locations(40)
+    pw_model.train_spatial_model(fixtures.spatial_frame(pw_model.station_locations))
+    bounds = {'min_lat': -10.0, 'max_lat': 10.0, 'min_lon': 70.0, 'max_lon': 90.0}
+    return (lambda: pw_model.create_dashboard_data(bounds, resolution=0.5)), 41 * 41
+
+
+def _preprocess(n_rows):
+    module = load_training_module()
+    data = fixtures.synthetic_gnss_frame(n_rows)
+    return (lambda: module.EnhancedGNSSPWModel().preprocess_data(data)), n_rows
+
+
+@case('preprocess_10k')
+def preprocess_10k(workdir):
+    return _preprocess(10_000)
+
+
+@case('preprocess_1m', quick=False, repeat=3)
+def preprocess_1m(workdir):
+    return _preprocess(1_000_000)
+
+
+@case('build_colocate', repeat=3)
+def build_colocate(workdir):
+    import build_dataset
+    from era5_colocate import ERA5Grid
+
+    grid = ERA5Grid(fixtures.era5_dataset())
+    rng = np.random.default_rng(fixtures.RANDOM_STATE)
+    n_rows = 100_000
+    ids = rng.choice(list(build_dataset.GNSS_STATIONS), n_rows)
+    epochs = rng.integers(int(grid.times[0]), int(grid.times[-1]) + 1, n_rows)
+
+    def run():
+        np.random.seed(fixtures.RANDOM_STATE)
+        return build_dataset.make_rows(grid, ids, epochs)
+    return run, n_rows
+
+
+@case('pklgen_loso', repeat=1)
+def pklgen_loso(workdir):
+    import pklgen
+    df = pklgen.add_physics_pw(fixtures.loso_frame(), tm_grid_path=None)
+    return (lambda: pklgen.loso_validation(df, model_path=None)), df['Station ID'].nunique()
+
+
+@case('unified_batch', repeat=3)
+def unified_batch(workdir):
+    import unified_predictor
+    path = os.path.join(workdir, "bench_enhanced.pkl")
+    if not os.path.exists(path):
+        fixtures.enhanced_model_package(path)
+    predictor = unified_predictor.Predictor.load(path)
+    n_rows = 100_000
+    data = fixtures.synthetic_gnss_frame(n_rows, n_stations=40, seed=fixtures.RANDOM_STATE + 1)
+    return (lambda: predictor.predict(data)), n_rows
+
+
+def run_case(name, workdir, repeat):
+    """Warm up once, then time `repeat` calls; returns the history result entry"""
+    spec = CASES[name]
+    repeat = spec['repeat'] or repeat
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn, items = spec['setup'](workdir)
+        fn()
+        times = [timed(fn)[1] for _ in range(repeat)]
+    median = statistics.median(times)
+    return {
+        'median_s': median,
+        'best_s': min(times),
+        'runs': len(times),
+        'items': items,
+        'per_item_s': median / items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None)
+    parser.add_argument('--quick', action='store_true', help="skip the large-input cases")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--no-save', action='store_true', help="do not append to the history")
+    parser.add_argument('--baseline', help="commit to compare against (default: previous commit run here)")
+    parser.add_argument('--threshold', type=float, default=history.REGRESSION_THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    names = args.cases or [n for n, spec in CASES.items() if spec['quick'] or not args.quick]
+    record = history.environment()
+    record['results'] = {}
+
+    print(f"commit {(record['commit'] or 'unknown')[:10]}{' (dirty)' if record['dirty'] else ''}, "
+          f"python {record['python']}, numpy {record['packages']['numpy']}, pandas {record['packages']['pandas']}")
+    print(f"{'case':>26} {'median ms':>10} {'best ms':>10} {'runs':>5} {'items':>8} {'us/item':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            result = run_case(name, workdir, args.repeat)
+            record['results'][name] = result
+            print(f"{name:>26} {result['median_s'] * 1e3:>10.2f} {result['best_s'] * 1e3:>10.2f} "
+                  f"{result['runs']:>5} {result['items']:>8} {result['per_item_s'] * 1e6:>10.2f}")
+
+    past = history.load()
+    baseline = history.baseline_for(record, past, args.baseline)
+    regressions = 0
+    if baseline:
+        regressions = history.print_comparison(record, baseline, args.threshold)
+    elif args.baseline:
+        print(f"\nNo history for commit {args.baseline}")
+
+    if not args.no_save:
+        history.append(record)
+        print(f"\nAppended to {history.HISTORY_FILE}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
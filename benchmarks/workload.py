@@ -0,0 +1,345 @@
+"""
+Synthetic large-scale workloads: ERA5-like cubes, station networks and request traces.
+
+Extends the synthetic sketches in build_dataset.py (create_synthetic_era5,
+generate_gnss_observations) to production sizes. Everything is seeded and
+generated in bounded chunks, so volumes far larger than memory can be
+written:
+
+    station_network(n)                 stations spread evenly over the globe, with
+                                       metadata-style IDs, heights and ECEF X/Y/Z
+    era5_cube(times, step_deg)         t2m / d2m / sp / tcwv with seasonal and diurnal
+                                       cycles and spatially smooth weather noise (in memory)
+    write_era5_cubes(out_dir, ...)     one netCDF per month, readable by build_dataset.py,
+                                       written ERA5_TIME_CHUNK steps at a time
+    gnss_observations(network, ...)    batches of ZTD observations (the builder's model)
+    request_trace(network, n, qps)     Poisson request arrivals for the prediction service
+
+Usage:
+    python benchmarks/workload.py network --stations 5000 --out /tmp/zvc/stations.csv
+    python benchmarks/workload.py era5 --start 2023-01-01 --end 2023-03-31 --step 0.5 --out /tmp/zvc/raw_era5
+    python benchmarks/workload.py observations --stations 2000 --days 30 --out /tmp/zvc/obs.parquet
+    python benchmarks/workload.py trace --requests 100000 --qps 200 --out /tmp/zvc/trace.jsonl
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import _common  # noqa: F401  (puts model/ on sys.path)
+
+RANDOM_STATE = 42
+OBS_BATCH_ROWS = 1_000_000
+ERA5_TIME_CHUNK = 24 * 7    # ERA5 time steps generated and written per pass
+ERA5_VARIABLES = ('t2m', 'd2m', 'sp', 'tcwv')
+
+# Request mix of the Express routes: full-feature /get and /rinex payloads vs
+# coordinate-only /interpolation payloads
+REQUEST_MIX = {'full': 0.7, 'interpolation': 0.3}
+
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+
+def _station_code(i):
+    """Four-character base-36 site code (up to 36^4 stations)"""
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    code = ""
+    for _ in range(4):
+        i, r = divmod(i, 36)
+        code = digits[r] + code
+    return code
+
+
+def station_network(n_stations, seed=RANDOM_STATE):
+    """
+    Stations uniform on the sphere (uniform in sin(latitude)), with heights
+    from a log-normal distribution and ECEF coordinates like stations-metadata.json.
+    """
+    rng = np.random.default_rng(seed)
+    lat = np.degrees(np.arcsin(rng.uniform(-0.95, 0.95, n_stations)))
+    lon = rng.uniform(-180, 180, n_stations)
+    height = np.round(rng.lognormal(5.0, 1.2, n_stations).clip(0, 5000), 1)
+
+    phi, lam = np.radians(lat), np.radians(lon)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(phi) ** 2)
+    return pd.DataFrame({
+        'Station ID': [_station_code(i) + "00SYN" for i in range(n_stations)],
+        'Latitude': np.round(lat, 6),
+        'Longitude': np.round(lon, 6),
+        'Height': height,
+        'X': (n + height) * np.cos(phi) * np.cos(lam),
+        'Y': (n + height) * np.cos(phi) * np.sin(lam),
+        'Z': (n * (1 - WGS84_E2) + height) * np.sin(phi),
+    })
+
+
+def _smooth_noise(rng, n_times, n_lat, n_lon, scale, coarse=8):
+    """Spatially smooth noise: a coarse random field upsampled bilinearly to the grid"""
+    field = rng.normal(0, scale, (n_times, coarse + 1, coarse + 1)).astype(np.float32)
+    yi = np.linspace(0, coarse, n_lat)
+    xi = np.linspace(0, coarse, n_lon)
+    y0 = np.minimum(yi.astype(int), coarse - 1)
+    x0 = np.minimum(xi.astype(int), coarse - 1)
+    wy = (yi - y0).astype(np.float32)[None, :, None]
+    wx = (xi - x0).astype(np.float32)[None, None, :]
+    f00 = field[:, y0][:, :, x0]
+    f01 = field[:, y0][:, :, x0 + 1]
+    f10 = field[:, y0 + 1][:, :, x0]
+    f11 = field[:, y0 + 1][:, :, x0 + 1]
+    return (1 - wy) * ((1 - wx) * f00 + wx * f01) + wy * ((1 - wx) * f10 + wx * f11)
+
+
+def _era5_axes(step_deg):
+    return np.arange(90, -90 - step_deg / 2, -step_deg), np.arange(0, 360, step_deg)
+
+
+def synthetic_orography(n_lat, n_lon, seed=RANDOM_STATE):
+    """Smooth synthetic surface heights (m), shared by every time step and month of a cube"""
+    return np.clip(_smooth_noise(np.random.default_rng(seed), 1, n_lat, n_lon, 800.0)[0], 0, None)
+
+
+def _era5_fields(times, lats, lons, rng, orography):
+    """float32 [time, lat, lon] arrays of t2m, d2m, sp and tcwv"""
+    n_t, n_lat, n_lon = len(times), len(lats), len(lons)
+
+    lat = np.radians(lats)[None, :, None].astype(np.float32)
+    doy = np.asarray(times.dayofyear, dtype=np.float32)[:, None, None]
+    utc_hour = (np.asarray(times.hour) + np.asarray(times.minute) / 60).astype(np.float32)[:, None, None]
+    solar_hour = (utc_hour + lons.astype(np.float32)[None, None, :] / 15) % 24
+
+    season = np.cos(2 * np.pi * (doy - 200) / 365.25) * np.sign(lat)
+    t2m = (245 + 55 * np.cos(lat) + 10 * season * np.abs(np.sin(lat))
+           + 5 * np.cos(2 * np.pi * (solar_hour - 15) / 24)
+           + _smooth_noise(rng, n_t, n_lat, n_lon, 3.0))
+    depression = np.clip(6 + _smooth_noise(rng, n_t, n_lat, n_lon, 3.0), 0.5, None)
+    d2m = t2m - depression
+
+    sp = (101325 * np.exp(-orography / 8000)[None] + _smooth_noise(rng, n_t, n_lat, n_lon, 600.0))
+    # Clausius-Clapeyron-like growth of column water vapour with dewpoint
+    tcwv = np.clip(25 * np.exp(0.065 * (d2m - 283)) + _smooth_noise(rng, n_t, n_lat, n_lon, 2.0), 0.5, 80)
+    return {name: values.astype(np.float32) for name, values in
+            (('t2m', t2m), ('d2m', d2m), ('sp', sp), ('tcwv', tcwv))}
+
+
+def era5_cube(times, step_deg=1.0, seed=RANDOM_STATE):
+    """
+    ERA5-like single-level fields over the globe at the given times, in memory.
+
+    Temperature follows latitude, season (opposite in each hemisphere) and
+    local solar time; dewpoint depression, surface pressure (with a smooth
+    synthetic orography) and total column water vapour follow temperature.
+    """
+    import xarray as xr
+
+    times = pd.DatetimeIndex(times)
+    lats, lons = _era5_axes(step_deg)
+    fields = _era5_fields(times, lats, lons, np.random.default_rng(seed),
+                          synthetic_orography(len(lats), len(lons), seed))
+    dims = ('valid_time', 'latitude', 'longitude')
+    return xr.Dataset({name: (dims, values) for name, values in fields.items()},
+                      coords={'valid_time': times, 'latitude': lats, 'longitude': lons})
+
+
+def write_era5_cubes(out_dir, start, end, step_deg=1.0, freq='h', seed=RANDOM_STATE, time_chunk=ERA5_TIME_CHUNK):
+    """
+    Write one netCDF per calendar month between start and end; returns the paths.
+
+    Each month is generated and appended time_chunk steps at a time along an
+    unlimited valid_time dimension, so memory holds one chunk, not a month.
+    """
+    import netCDF4
+
+    os.makedirs(out_dir, exist_ok=True)
+    times = pd.date_range(start, end, freq=freq)
+    lats, lons = _era5_axes(step_deg)
+    orography = synthetic_orography(len(lats), len(lons), seed)
+    paths = []
+    for month, month_times in pd.Series(times, index=times).groupby(times.to_period('M')):
+        month_times = month_times.index
+        path = os.path.join(out_dir, f"synthetic_era5_{month}.nc")
+        with netCDF4.Dataset(path, 'w') as nc:
+            nc.createDimension('valid_time', None)
+            nc.createDimension('latitude', len(lats))
+            nc.createDimension('longitude', len(lons))
+            valid_time = nc.createVariable('valid_time', 'i8', ('valid_time',))
+            valid_time.units = 'seconds since 1970-01-01'
+            valid_time.calendar = 'proleptic_gregorian'
+            nc.createVariable('latitude', 'f8', ('latitude',))[:] = lats
+            nc.createVariable('longitude', 'f8', ('longitude',))[:] = lons
+            for name in ERA5_VARIABLES:
+                nc.createVariable(name, 'f4', ('valid_time', 'latitude', 'longitude'))
+
+            for first in range(0, len(month_times), time_chunk):
+                chunk = month_times[first:first + time_chunk]
+                chunk_seed = np.random.SeedSequence([seed, month.year, month.month, first])
+                fields = _era5_fields(chunk, lats, lons, np.random.default_rng(chunk_seed), orography)
+                stop = first + len(chunk)
+                valid_time[first:stop] = chunk.asi8 // 10 ** 9
+                for name, values in fields.items():
+                    nc[name][first:stop] = values
+        paths.append(path)
+        print(f"  {path}: {len(month_times)} steps")
+    return paths
+
+
+def gnss_observations(network, start, end, interval_s=3600, seed=RANDOM_STATE, batch_rows=OBS_BATCH_ROWS):
+    """
+    Yield DataFrame batches of station observations every interval_s (with
+    jitter) between start and end, using the builder's ZTD model.
+    """
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp(start).timestamp()
+    epochs = np.arange(t0, pd.Timestamp(end).timestamp(), interval_s)
+    n_stations = len(network)
+    epochs_per_batch = max(1, batch_rows // n_stations)
+
+    lat = network['Latitude'].to_numpy()
+    for i in range(0, len(epochs), epochs_per_batch):
+        e = epochs[i:i + epochs_per_batch]
+        idx = np.tile(np.arange(n_stations), len(e))
+        t = np.repeat(e, n_stations) + rng.integers(0, min(interval_s, 3600), len(idx))
+        doy = pd.DatetimeIndex(pd.to_datetime(t, unit='s')).dayofyear.to_numpy()
+
+        lat_factor = 0.5 + 0.3 * np.cos(np.radians(lat[idx]))
+        ztd = (2000 + lat_factor * 100 + 10 * np.sin(2 * np.pi * doy / 365)
+               + rng.normal(0, 5, len(idx)))
+        yield pd.DataFrame({
+            'station_id': network['Station ID'].to_numpy()[idx],
+            'timestamp': t.astype(np.int64),
+            'lat': lat[idx],
+            'lon': network['Longitude'].to_numpy()[idx],
+            'elevation': network['Height'].to_numpy()[idx],
+            'ztd': ztd,
+            'azimuth': rng.uniform(0, 360, len(idx)),
+            'elevation_angle': rng.uniform(10, 90, len(idx)),
+        })
+
+
+def _full_payload(rng, station, t):
+    ts = pd.Timestamp(t, unit='s')
+    temp = 30 * np.cos(np.radians(station['Latitude'])) - 5 + rng.normal(0, 5)
+    return {
+        'stationId': station['Station ID'],
+        'stationLatitude': float(station['Latitude']),
+        'stationLongitude': float(station['Longitude']),
+        'stationElevation': float(station['Height']),
+        'zwdObservation': round(float(rng.gamma(6, 25)), 2),
+        'satelliteAzimuth': round(float(rng.uniform(0, 360)), 1),
+        'satelliteElevation': round(float(rng.uniform(10, 90)), 1),
+        'temperature': round(float(temp), 2),
+        'pressure': round(float(1013.25 * np.exp(-station['Height'] / 8000) + rng.normal(0, 6)), 2),
+        'humidity': round(float(rng.uniform(15, 100)), 2),
+        'year': ts.year, 'month': ts.month, 'day': ts.day,
+        'hour': ts.hour, 'minute': ts.minute, 'second': ts.second,
+        'timestamp': int(t),
+    }
+
+
+def request_trace(network, n_requests, qps, start='2023-06-01', mix=REQUEST_MIX, seed=RANDOM_STATE,
+                  hot_fraction=0.1):
+    """
+    Yield trace records {"t": seconds from trace start, "kind", "payload"}.
+
+    Arrivals are Poisson at qps. Full-feature requests come from stations
+    with a skewed popularity (hot_fraction of stations receive half the
+    traffic); interpolation requests are uniform over the globe.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = list(mix)
+    probs = np.array([mix[k] for k in kinds], dtype=float)
+    probs /= probs.sum()
+
+    n_hot = max(1, int(len(network) * hot_fraction))
+    weights = np.where(np.arange(len(network)) < n_hot, 0.5 / n_hot, 0.5 / max(len(network) - n_hot, 1))
+    weights /= weights.sum()
+    stations = network.to_dict('records')
+    t0 = pd.Timestamp(start).timestamp()
+
+    t = 0.0
+    for _ in range(n_requests):
+        t += rng.exponential(1.0 / qps)
+        kind = kinds[rng.choice(len(kinds), p=probs)]
+        if kind == 'interpolation':
+            payload = {'latitude': round(float(np.degrees(np.arcsin(rng.uniform(-1, 1)))), 4),
+                       'longitude': round(float(rng.uniform(-180, 180)), 4)}
+        else:
+            payload = _full_payload(rng, stations[rng.choice(len(stations), p=weights)], t0 + t)
+        yield {'t': round(t, 6), 'kind': kind, 'payload': payload}
+
+
+def write_trace(path, records):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    n = 0
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('network', help="station network CSV")
+    p.add_argument('--stations', type=int, default=1000)
+    p.add_argument('--out', required=True)
+
+    p = sub.add_parser('era5', help="monthly ERA5-like netCDF cubes")
+    p.add_argument('--start', default='2023-01-01')
+    p.add_argument('--end', default='2023-01-31 23:00')
+    p.add_argument('--step', type=float, default=1.0, help="grid spacing (deg)")
+    p.add_argument('--freq', default='h')
+    p.add_argument('--out', required=True)
+
+    p = sub.add_parser('observations', help="GNSS ZTD observations (Parquet, streamed)")
+    p.add_argument('--stations', type=int, default=1000)
+    p.add_argument('--start', default='2023-01-01')
+    p.add_argument('--days', type=float, default=7)
+    p.add_argument('--interval', type=int, default=3600, help="seconds between epochs")
+    p.add_argument('--out', required=True)
+
+    p = sub.add_parser('trace', help="prediction request trace (JSONL)")
+    p.add_argument('--stations', type=int, default=1000)
+    p.add_argument('--requests', type=int, default=10000)
+    p.add_argument('--qps', type=float, default=50)
+    p.add_argument('--interpolation-share', type=float, default=REQUEST_MIX['interpolation'])
+    p.add_argument('--out', required=True)
+
+    for p in sub.choices.values():
+        p.add_argument('--seed', type=int, default=RANDOM_STATE)
+    args = parser.parse_args()
+
+    if args.command == 'network':
+        network = station_network(args.stations, args.seed)
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        network.to_csv(args.out, index=False)
+        print(f"{len(network)} stations written to {args.out}")
+
+    elif args.command == 'era5':
+        paths = write_era5_cubes(args.out, args.start, args.end, args.step, args.freq, args.seed)
+        print(f"{len(paths)} files written to {args.out}")
+
+    elif args.command == 'observations':
+        from gnss_store import StreamingWriter
+
+        network = station_network(args.stations, args.seed)
+        end = pd.Timestamp(args.start) + pd.Timedelta(days=args.days)
+        with StreamingWriter(args.out) as writer:
+            for batch in gnss_observations(network, args.start, end, args.interval, args.seed):
+                writer.write(batch)
+        print(f"{writer.rows_written} observations written to {args.out}")
+
+    elif args.command == 'trace':
+        network = station_network(args.stations, args.seed)
+        mix = {'full': 1 - args.interpolation_share, 'interpolation': args.interpolation_share}
+        n = write_trace(args.out, request_trace(network, args.requests, args.qps, mix=mix, seed=args.seed))
+        print(f"{n} requests at {args.qps} QPS written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -449,17 +449,56 @@ ZenithVapourCast Dataset Builder - Using REAL ERA5 Data Only
 
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 import xarray as xr
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import json
+import multiprocessing
 import os
+import sys
+import zlib
+
+# Shared Python modules (dataset store, physics) live in the repo's model/ directory
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+sys.path.insert(0, os.path.abspath(MODEL_DIR))
+
+from gnss_store import write_dataset, StreamingWriter
+from physics import zwd_from_ztd, rh_from_dewpoint
+from tm_grid import TM_GRID_FILE, build_tm_grid
+from met_grid import MET_GRID_FILE, build_met_grid
+from era5_colocate import ERA5Grid
+from sat_geometry import NavEphemeris, annotate, station_xyz
 
 PROJECT_ROOT = "/Users/salchad27/Desktop/extras/extra-codes/gnss-data-coll/zenith_dataset"
 RAW_ERA5_DIR = os.path.join(PROJECT_ROOT, "raw_era5")
+RAW_NAV_DIR = os.path.join(PROJECT_ROOT, "raw_nav")  # RINEX broadcast navigation files
 PROCESSED_DIR = os.path.join(PROJECT_ROOT, "processed")
 
+# Optional ERA5 surface geopotential on the same grid, for reducing T/P to station elevation
+ERA5_GEOPOTENTIAL = os.path.join(RAW_ERA5_DIR, "geopotential.nc")
+
 TARGET_ROWS = 8000
 RANDOM_STATE = 42
 
+# Rows are generated in fixed-size batches: every candidate row is streamed to
+# STREAM_FILE and a reservoir sample of TARGET_ROWS becomes data.csv / the store
+BATCH_ROWS = 100_000
+OVERSAMPLE = 2
+STREAM_FILE = "rows.parquet"  # "rows.csv" streams chunked CSV instead
+
+# Sharded builder: shards are (group of STATIONS_PER_SHARD stations, calendar month)
+STATIONS_PER_SHARD = 5
+SHARD_DIR = os.path.join(PROCESSED_DIR, "shards")
+
+# Satellite geometry from broadcast ephemerides: elevation mask (deg), and the
+# largest offset (m) between stations-metadata.json and GNSS_STATIONS before
+# the metadata entry is taken to be a different site
+ELEVATION_MASK = 10.0
+MAX_STATION_OFFSET = 50_000.0
+
 # Real global GNSS station locations (from IGS network)
 GNSS_STATIONS = {
     'USNO': {'lat': 38.921, 'lon': -77.066, 'elev': 85, 'name': 'Washington DC'},
@@ -485,20 +524,15 @@ GNSS_STATIONS = {
 }
 
 def compute_zwd(ztd, pressure_hpa, lat, elev):
-    """Saastamoinen model for ZWD"""
-    phi = np.radians(lat)
-    h_km = elev / 1000.0
-    zhd = 0.0022768 * pressure_hpa / (1 - 0.00266 * np.cos(2 * phi) - 0.00028 * h_km)
-    return ztd - zhd
+    """Saastamoinen model for ZWD (scalars or arrays)"""
+    return zwd_from_ztd(ztd, pressure_hpa, lat, elev)
 
 def compute_rh_from_dewpoint(t_c, td_c):
-    """Calculate relative humidity from temperature and dewpoint"""
-    if td_c > t_c:
-        td_c = t_c
-    return 100 * np.exp(17.27 * td_c / (237.7 + td_c) - 17.27 * t_c / (237.7 + t_c))
+    """Calculate relative humidity from temperature and dewpoint (scalars or arrays)"""
+    return rh_from_dewpoint(t_c, td_c)
 
 def generate_satellite_angles(timestamp, station_lat, station_lon):
-    """Generate realistic satellite azimuth/elevation based on time and location"""
+    """Generate realistic satellite azimuth/elevation based on time and location (scalars or arrays)"""
     # GPS satellites orbit at ~20200 km altitude, ~55° inclination
     # Simulate typical satellite pass patterns
     hour = timestamp.hour + timestamp.minute / 60.0
@@ -508,15 +542,184 @@ def generate_satellite_angles(timestamp, station_lat, station_lon):
     base_elevation = 45 + 25 * np.sin((hour - 6) * np.pi / 12)  # Higher elev during day
     
     # Add some variation
-    azimuth = (base_azimuth + np.random.uniform(-30, 30)) % 360
-    elevation = max(10, min(90, base_elevation + np.random.uniform(-15, 15)))
+    azimuth = (base_azimuth + np.random.uniform(-30, 30, np.shape(base_azimuth))) % 360
+    elevation = np.clip(base_elevation + np.random.uniform(-15, 15, np.shape(base_elevation)), 10, 90)
     
     return azimuth, elevation
 
-def build():
+def satellite_angles(nav, station_ids, epochs, lat, lon):
+    """
+    Azimuth/elevation of a random satellite above ELEVATION_MASK for each row,
+    from broadcast ephemerides. Rows with no ephemeris coverage (or no nav
+    files at all) fall back to generate_satellite_angles.
+    """
+    if nav is None:
+        return generate_satellite_angles(pd.DatetimeIndex(pd.to_datetime(epochs, unit='s')), lat, lon)
+
+    fallback = {sid: (s['lat'], s['lon'], s['elev']) for sid, s in GNSS_STATIONS.items()}
+    rx = station_xyz(station_ids, fallback=fallback, max_offset=MAX_STATION_OFFSET)
+    _, az, el = annotate(nav, rx, epochs, elevation_mask=ELEVATION_MASK, rng=np.random)
+
+    missing = np.isnan(el)
+    if missing.any():
+        ts = pd.DatetimeIndex(pd.to_datetime(np.asarray(epochs)[missing], unit='s'))
+        az[missing], el[missing] = generate_satellite_angles(ts, lat[missing], lon[missing])
+    return az, el
+
+def make_rows(grid, station_ids, epochs, nav=None):
+    """
+    Build dataset rows for arrays of station IDs and epoch seconds.
+
+    ERA5 is co-located at the exact station position and epoch (bilinear in
+    space, linear in time) and reduced to the station elevation. With nav
+    (a NavEphemeris), satellite angles come from the broadcast orbits.
+    """
+    stations = pd.DataFrame.from_dict(GNSS_STATIONS, orient='index')
+    idx = stations.index.get_indexer(station_ids)
+    lat = stations['lat'].to_numpy(dtype=np.float64)[idx]
+    lon = stations['lon'].to_numpy(dtype=np.float64)[idx]
+    elev = stations['elev'].to_numpy(dtype=np.float64)[idx]
+    timestamps = pd.DatetimeIndex(pd.to_datetime(epochs, unit='s'))
+    n = len(epochs)
+
+    era5 = grid.colocate(lat, lon, epochs, elev=elev)
+
+    # Convert units
+    temp_c = era5['t2m'] - 273.15
+    dew_c = era5['d2m'] - 273.15
+    pres_hpa = era5['sp'] / 100
+    pw = era5['tcwv']  # kg/m² (same as mm)
+
+    # Compute RH
+    rh = np.clip(compute_rh_from_dewpoint(temp_c, dew_c), 0, 100)  # Clamp to 0-100%
+
+    # Compute ZWD using Saastamoinen
+    # Estimate ZTD from surface pressure (typical ZTD ~2.3m)
+    ztd_estimate = 2300 + (pres_hpa - 1013.25) * 3  # Rough estimate
+    ztd = ztd_estimate + np.random.normal(0, 10, n)  # Add some noise
+    zwd = compute_zwd(ztd, pres_hpa, lat, elev)
+
+    # Satellite angles
+    az, el = satellite_angles(nav, station_ids, epochs, lat, lon)
+
+    return pd.DataFrame({
+        'Station ID': np.asarray(station_ids),
+        'Year': timestamps.year,
+        'Month': timestamps.month,
+        'Day': timestamps.day,
+        'Hour': timestamps.hour,
+        'Minute': timestamps.minute,
+        'Second': timestamps.second,
+        'Date (ISO Format)': np.datetime_as_string(np.asarray(epochs).astype('datetime64[s]')),
+        'Station Latitude': lat,
+        'Station Longitude': lon,
+        'Station Elevation': elev.astype(int),
+        'Timestamp (Epoch)': np.asarray(epochs, dtype=np.int64),
+        'ZWD Observation': np.round(zwd, 3),
+        'Satellite Azimuth': np.round(az, 1),
+        'Satellite Elevation': np.round(el, 1),
+        'Temperature (°C)': np.round(temp_c, 2),
+        'Pressure (hPa)': np.round(pres_hpa, 2),
+        'Humidity (%)': np.round(rh, 2),
+        'Actual Measured PW': np.round(pw, 2)
+    })
+
+class ReservoirSampler:
+    """
+    Uniform sample of k rows from a stream of DataFrame batches (Algorithm R,
+    vectorized per batch). Memory is O(k) however many rows pass through.
+    """
+
+    def __init__(self, k, seed=RANDOM_STATE):
+        self.k = k
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+        self.columns = None
+
+    def add(self, batch):
+        n = len(batch)
+        values = {col: batch[col].to_numpy() for col in batch.columns}
+        if self.columns is None:
+            self.columns = {col: np.empty(self.k, dtype=v.dtype) for col, v in values.items()}
+
+        # Fill the reservoir first
+        fill = min(max(self.k - self.seen, 0), n)
+        for col, v in values.items():
+            self.columns[col][self.seen:self.seen + fill] = v[:fill]
+
+        # Row number i (0-based) then replaces slot j ~ U[0, i] when j < k
+        rest = np.arange(fill, n)
+        slots = self.rng.integers(0, self.seen + rest + 1)
+        take = slots < self.k
+        src, dst = rest[take], slots[take]
+        # When a slot is hit twice in one batch the later row wins, as in the sequential algorithm
+        dst, last = np.unique(dst[::-1], return_index=True)
+        src = src[::-1][last]
+        for col, v in values.items():
+            self.columns[col][dst] = v[src]
+
+        self.seen += n
+
+    def sample(self):
+        size = min(self.k, self.seen)
+        return pd.DataFrame({col: v[:size] for col, v in (self.columns or {}).items()})
+
+def generate_batches(grid, n_rows, station_ids, t_start, t_end, batch_rows=BATCH_ROWS, nav=None):
+    """Yield make_rows batches of random stations at exact epochs in [t_start, t_end]"""
+    for start in range(0, n_rows, batch_rows):
+        n = min(batch_rows, n_rows - start)
+        ids = np.random.choice(station_ids, n)
+        epochs = np.random.randint(int(t_start), int(t_end) + 1, n)
+        yield make_rows(grid, ids, epochs, nav)
+
+def stream_rows(batches, target_rows, stream_path):
+    """
+    Write every batch through a StreamingWriter and reservoir-sample target_rows.
+
+    Returns the shuffled sample and the number of rows streamed.
+    """
+    sampler = ReservoirSampler(target_rows, RANDOM_STATE)
+    with StreamingWriter(stream_path) as writer:
+        for batch in batches:
+            writer.write(batch)
+            sampler.add(batch)
+    sample = sampler.sample().sample(frac=1, random_state=RANDOM_STATE)
+    return sample, writer.rows_written
+
+def save_sample(df):
+    """Save the sample: CSV for existing consumers, partitioned Parquet store for training"""
+    out_path = os.path.join(PROCESSED_DIR, "data.csv")
+    df.to_csv(out_path, index=False)
+    store_path = os.path.join(PROCESSED_DIR, "dataset")
+    write_dataset(df, store_path, overwrite=True)
+    return out_path, store_path
+
+def load_orography():
+    """ERA5 geopotential for station-elevation reduction, if downloaded"""
+    if os.path.exists(ERA5_GEOPOTENTIAL):
+        print(f"  Orography: {ERA5_GEOPOTENTIAL}")
+        return xr.open_dataset(ERA5_GEOPOTENTIAL)
+    return None
+
+def nav_files(raw_dir=None):
+    """RINEX navigation files in raw_dir (RINEX 3 *.rnx / RINEX 2 *.yyn, optionally gzipped)"""
+    patterns = ("*.rnx", "*.rnx.gz", "*.[0-9][0-9][np]", "*.[0-9][0-9][np].gz")
+    return sorted(p for pattern in patterns
+                  for p in glob.glob(os.path.join(raw_dir or RAW_NAV_DIR, pattern)))
+
+def load_nav(paths):
+    """Broadcast ephemerides from RINEX nav files, or None (synthetic angles) when there are none"""
+    if not paths:
+        print(f"  No RINEX nav files in {RAW_NAV_DIR}, using synthetic satellite angles")
+        return None
+    nav = NavEphemeris.from_rinex(paths)
+    print(f"  Nav: {len(paths)} files, {len(nav.table)} ephemerides, {len(nav.sats)} satellites")
+    return nav
+
+def build(target_rows=TARGET_ROWS):
     print("="*60)
     print("ZenithVapourCast Dataset Builder")
-    print("Using REAL ERA5 data + realistic satellite angles")
+    print("Using REAL ERA5 data + broadcast-ephemeris satellite angles")
     print("="*60)
     
     os.makedirs(PROCESSED_DIR, exist_ok=True)
@@ -529,97 +732,254 @@ def build():
     print(f"  Variables: {list(era5.data_vars)}")
     print(f"  Time: {era5.valid_time.min().values} to {era5.valid_time.max().values}")
     print(f"  Grid: {len(era5.latitude)} x {len(era5.longitude)}")
+
+    # Offline Tm climatology for serve-time ZWD -> PW conversion (ZVC_TM_GRID), and the
+    # T/P/RH grid the covariate resolver falls back to without the weather provider (ZVC_MET_GRID)
+    tm_grid_path = TM_GRID_FILE
+    build_tm_grid([era5_path], tm_grid_path)
+    build_met_grid([era5_path], MET_GRID_FILE, geopotential_path=ERA5_GEOPOTENTIAL)
     
-    # Get time values
-    times = era5.valid_time.values
-    lats = era5.latitude.values
-    lons = era5.longitude.values
-    
-    rows = []
+    grid = ERA5Grid(era5, orography=load_orography())
+    nav = load_nav(nav_files())
     np.random.seed(RANDOM_STATE)
     
-    print(f"\nGenerating {TARGET_ROWS} rows...")
-    
-    # Generate random samples
-    for _ in range(TARGET_ROWS * 2):  # Oversample then sample down
-        if len(rows) >= TARGET_ROWS:
-            break
-            
-        # Random station
-        station_id = np.random.choice(list(GNSS_STATIONS.keys()))
-        station = GNSS_STATIONS[station_id]
-        lat, lon, elev = station['lat'], station['lon'], station['elev']
-        
-        # Random time from ERA5
-        time_idx = np.random.randint(0, len(times))
-        timestamp = pd.Timestamp(times[time_idx])
-        
-        # Get ERA5 values at nearest grid point
-        lat_idx = np.argmin(np.abs(lats - lat))
-        lon_idx = np.argmin(np.abs(lons - lon))
-        
-        t2m = era5.isel(latitude=lat_idx, longitude=lon_idx, valid_time=time_idx)['t2m'].values
-        d2m = era5.isel(latitude=lat_idx, longitude=lon_idx, valid_time=time_idx)['d2m'].values
-        sp = era5.isel(latitude=lat_idx, longitude=lon_idx, valid_time=time_idx)['sp'].values
-        tcwv = era5.isel(latitude=lat_idx, longitude=lon_idx, valid_time=time_idx)['tcwv'].values
-        
-        # Convert units
-        temp_c = float(t2m) - 273.15
-        dew_c = float(d2m) - 273.15
-        pres_hpa = float(sp) / 100
-        pw = float(tcwv)  # kg/m² (same as mm)
-        
-        # Compute RH
-        rh = compute_rh_from_dewpoint(temp_c, dew_c)
-        rh = max(0, min(100, rh))  # Clamp to 0-100%
-        
-        # Compute ZWD using Saastamoinen
-        # Estimate ZTD from surface pressure (typical ZTD ~2.3m)
-        ztd_estimate = 2300 + (pres_hpa - 1013.25) * 3  # Rough estimate
-        ztd = ztd_estimate + np.random.normal(0, 10)  # Add some noise
-        zwd = compute_zwd(ztd, pres_hpa, lat, elev)
-        
-        # Generate satellite angles
-        az, el = generate_satellite_angles(timestamp, lat, lon)
-        
-        rows.append({
-            'Year': timestamp.year,
-            'Month': timestamp.month,
-            'Day': timestamp.day,
-            'Hour': timestamp.hour,
-            'Minute': timestamp.minute,
-            'Second': timestamp.second,
-            'Date (ISO Format)': timestamp.isoformat(),
-            'Station Latitude': lat,
-            'Station Longitude': lon,
-            'Station Elevation': elev,
-            'Timestamp (Epoch)': int(timestamp.timestamp()),
-            'ZWD Observation': round(zwd, 3),
-            'Satellite Azimuth': round(az, 1),
-            'Satellite Elevation': round(el, 1),
-            'Temperature (°C)': round(temp_c, 2),
-            'Pressure (hPa)': round(pres_hpa, 2),
-            'Humidity (%)': round(rh, 2),
-            'Actual Measured PW': round(pw, 2)
-        })
-    
-    df = pd.DataFrame(rows)
-    
-    # Sample to target
-    df = df.sample(n=min(TARGET_ROWS, len(df)), random_state=RANDOM_STATE)
-    
-    # Save
-    out_path = os.path.join(PROCESSED_DIR, "data.csv")
-    df.to_csv(out_path, index=False)
+    n_candidates = target_rows * OVERSAMPLE
+    print(f"\nGenerating {n_candidates} rows in batches of {BATCH_ROWS}, sampling {target_rows}...")
+    
+    # Random stations at exact epochs anywhere in the ERA5 period
+    batches = generate_batches(grid, n_candidates, list(GNSS_STATIONS.keys()),
+                               grid.times[0], grid.times[-1], nav=nav)
+    stream_path = os.path.join(PROCESSED_DIR, STREAM_FILE)
+    df, streamed = stream_rows(batches, target_rows, stream_path)
+    out_path, store_path = save_sample(df)
     
     print(f"\n{'='*60}")
     print("DONE!")
     print(f"{'='*60}")
+    print(f"Streamed: {streamed} rows to {stream_path}")
     print(f"Saved: {out_path}")
+    print(f"Store: {store_path}")
+    print(f"Tm grid: {tm_grid_path}")
+    print(f"Met grid: {MET_GRID_FILE}")
     print(f"Rows: {len(df)}")
     print(f"Columns: {list(df.columns)}")
     print(f"\nSample:")
     print(df.head(3).to_string())
 
+def era5_files(raw_dir=None):
+    """All ERA5 single-level files in raw_dir (the geopotential file excluded)"""
+    return sorted(p for p in glob.glob(os.path.join(raw_dir or RAW_ERA5_DIR, "*.nc"))
+                  if os.path.basename(p) != os.path.basename(ERA5_GEOPOTENTIAL))
+
+def shard_seed(key):
+    """Per-shard seed derived from RANDOM_STATE and the shard key only"""
+    return int(np.random.SeedSequence([RANDOM_STATE, zlib.crc32(key.encode())]).generate_state(1)[0])
+
+def plan_shards(files, target_rows=TARGET_ROWS, stations_per_shard=STATIONS_PER_SHARD, nav=()):
+    """
+    Split the build into (station group x month) shards.
+
+    Stations are grouped by latitude so each shard reads a narrow band of
+    the ERA5 grid. Rows are allocated in proportion to stations x hours
+    covered, with largest-remainder rounding so the total is target_rows.
+    """
+    coverage = []
+    for path in files:
+        with xr.open_dataset(path) as ds:
+            times = ds['valid_time' if 'valid_time' in ds.dims else 'time'].values
+        coverage.append((path, pd.Timestamp(times.min()), pd.Timestamp(times.max())))
+    start = min(c[1] for c in coverage)
+    end = max(c[2] for c in coverage)
+
+    by_lat = sorted(GNSS_STATIONS, key=lambda sid: GNSS_STATIONS[sid]['lat'])
+    groups = [by_lat[i:i + stations_per_shard] for i in range(0, len(by_lat), stations_per_shard)]
+
+    shards = []
+    for month in pd.period_range(start, end, freq='M'):
+        m0 = max(month.start_time, start)
+        m1 = min(month.end_time.floor('s'), end)
+        if m1 <= m0:
+            continue
+        # One day of margin so epochs near the month edges can interpolate in time
+        month_files = [p for p, t0, t1 in coverage
+                       if t0 <= m1 + pd.Timedelta(days=1) and t1 >= m0 - pd.Timedelta(days=1)]
+        if not month_files:
+            continue
+        for g, group in enumerate(groups):
+            shards.append({
+                'key': f"{month}_g{g:03d}",
+                'stations': group,
+                'files': month_files,
+                'nav': list(nav),
+                'start': int(m0.timestamp()),
+                'end': int(m1.timestamp()),
+                'weight': len(group) * (m1 - m0).total_seconds(),
+            })
+
+    weights = np.array([s['weight'] for s in shards])
+    exact = target_rows * weights / weights.sum()
+    rows = np.floor(exact).astype(int)
+    rows[np.argsort(rows - exact)[:target_rows - rows.sum()]] += 1
+    for shard, n in zip(shards, rows):
+        shard['rows'] = int(n)
+    return shards
+
+def _open_shard_era5(shard, geopotential_path):
+    """Load only the shard's latitude band and month (plus margins) from its ERA5 files"""
+    lats = [GNSS_STATIONS[sid]['lat'] for sid in shard['stations']]
+    t0 = np.datetime64(shard['start'], 's') - np.timedelta64(1, 'D')
+    t1 = np.datetime64(shard['end'], 's') + np.timedelta64(1, 'D')
+
+    if not shard['files']:
+        raise FileNotFoundError(f"No ERA5 files cover shard {shard['key']}")
+    parts = []
+    for path in shard['files']:
+        with xr.open_dataset(path) as ds:
+            ds = ds.sortby('latitude')
+            step = float(abs(ds['latitude'][1] - ds['latitude'][0])) if ds.sizes['latitude'] > 1 else 1.0
+            band = slice(min(lats) - 2 * step, max(lats) + 2 * step)
+            time_dim = 'valid_time' if 'valid_time' in ds.dims else 'time'
+            parts.append(ds.sel({'latitude': band, time_dim: slice(t0, t1)}).load())
+    era5 = xr.concat(parts, dim=time_dim).sortby(time_dim)
+    era5 = era5.isel({time_dim: np.unique(era5[time_dim].values, return_index=True)[1]})
+
+    orography = None
+    if geopotential_path and os.path.exists(geopotential_path):
+        with xr.open_dataset(geopotential_path) as geo:
+            orography = geo.sortby('latitude').sel(latitude=band).load()
+    return era5, orography
+
+def shard_plan(shard, geopotential_path=ERA5_GEOPOTENTIAL):
+    """What a shard's output depends on: rows, seed, stations, period and input files"""
+    def stamp(path):
+        st = os.stat(path)
+        return [os.path.basename(path), st.st_size, st.st_mtime_ns]
+
+    return {
+        'rows': shard['rows'],
+        'seed': shard_seed(shard['key']),
+        'stations': list(shard['stations']),
+        'start': shard['start'],
+        'end': shard['end'],
+        'files': [stamp(p) for p in shard['files']],
+        'nav': [stamp(p) for p in shard.get('nav', ())],
+        'geopotential': stamp(geopotential_path) if geopotential_path and os.path.exists(geopotential_path) else None,
+    }
+
+def build_shard(shard, shard_dir, geopotential_path=ERA5_GEOPOTENTIAL):
+    """
+    Build one shard to <shard_dir>/<key>.parquet.
+
+    A <key>.done marker holding the shard's plan (shard_plan) is written after
+    the Parquet file is in place, so an interrupted build resumes by skipping
+    every shard whose marker matches the current plan; a shard planned with
+    other rows, stations or input files is rebuilt.
+    """
+    out_path = os.path.join(shard_dir, f"{shard['key']}.parquet")
+    marker = os.path.join(shard_dir, f"{shard['key']}.done")
+    plan = shard_plan(shard, geopotential_path)
+    if os.path.exists(marker):
+        try:
+            with open(marker) as f:
+                if json.load(f) == plan:
+                    return shard['key'], 0, True
+        except ValueError:
+            pass
+        os.remove(marker)
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    np.random.seed(shard_seed(shard['key']))
+    if shard['rows']:
+        era5, orography = _open_shard_era5(shard, geopotential_path)
+        grid = ERA5Grid(era5, t_start=shard['start'], t_end=shard['end'], orography=orography)
+        nav = NavEphemeris.from_rinex(shard['nav']) if shard.get('nav') else None
+
+        with StreamingWriter(out_path) as writer:
+            for batch in generate_batches(grid, shard['rows'], shard['stations'],
+                                          shard['start'], shard['end'], nav=nav):
+                writer.write(batch)
+
+    with open(marker, 'w') as f:
+        json.dump(plan, f)
+    return shard['key'], shard['rows'], False
+
+def iter_shard_batches(shards, shard_dir, batch_rows=BATCH_ROWS):
+    """Stream shard outputs back in shard order, one record batch at a time"""
+    for shard in shards:
+        if not shard['rows']:
+            continue
+        parquet = pq.ParquetFile(os.path.join(shard_dir, f"{shard['key']}.parquet"))
+        for batch in parquet.iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+
+def build_sharded(workers=None, target_rows=TARGET_ROWS, stations_per_shard=STATIONS_PER_SHARD,
+                  fresh=False):
+    """
+    Multi-core build: (station group x month) shards in a process pool, then merged.
+
+    Re-running resumes from the per-shard markers unless fresh=True.
+    """
+    print("="*60)
+    print("ZenithVapourCast Dataset Builder (sharded)")
+    print("="*60)
+
+    files = era5_files()
+    if not files:
+        raise FileNotFoundError(f"No ERA5 files in {RAW_ERA5_DIR}")
+    navs = nav_files()
+    shards = plan_shards(files, target_rows * OVERSAMPLE, stations_per_shard, navs)
+    print(f"\n{len(files)} ERA5 files, {len(navs)} nav files, {len(shards)} shards, {target_rows * OVERSAMPLE} rows "
+          f"sampled to {target_rows}, "
+          f"{workers or os.cpu_count()} workers")
+
+    if fresh and os.path.isdir(SHARD_DIR):
+        for path in glob.glob(os.path.join(SHARD_DIR, "*")):
+            os.remove(path)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+    # Offline Tm climatology for serve-time ZWD -> PW conversion (ZVC_TM_GRID), and the
+    # T/P/RH grid the covariate resolver falls back to without the weather provider (ZVC_MET_GRID)
+    tm_grid_path = TM_GRID_FILE
+    build_tm_grid(files, tm_grid_path)
+    build_met_grid(files, MET_GRID_FILE, geopotential_path=ERA5_GEOPOTENTIAL)
+
+    done = skipped = 0
+    # spawn, not fork: HDF5/netCDF and Arrow thread pools are not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(build_shard, shard, SHARD_DIR, ERA5_GEOPOTENTIAL) for shard in shards]
+        for future in as_completed(futures):
+            key, rows, was_done = future.result()
+            done += 1
+            skipped += was_done
+            print(f"  [{done}/{len(shards)}] {key}: {'already built' if was_done else f'{rows} rows'}")
+
+    stream_path = os.path.join(PROCESSED_DIR, STREAM_FILE)
+    df, streamed = stream_rows(iter_shard_batches(shards, SHARD_DIR), target_rows, stream_path)
+    out_path, store_path = save_sample(df)
+
+    print(f"\n{'='*60}")
+    print("DONE!")
+    print(f"{'='*60}")
+    print(f"Shards: {len(shards)} ({skipped} resumed)")
+    print(f"Streamed: {streamed} rows to {stream_path}")
+    print(f"Saved: {out_path}")
+    print(f"Store: {store_path}")
+    print(f"Tm grid: {tm_grid_path}")
+    print(f"Met grid: {MET_GRID_FILE}")
+    print(f"Rows: {len(df)}")
+
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description="ZenithVapourCast dataset builder")
+    parser.add_argument('--sharded', action='store_true',
+                        help="build (station group x month) shards in a process pool")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rows', type=int, default=TARGET_ROWS)
+    parser.add_argument('--stations-per-shard', type=int, default=STATIONS_PER_SHARD)
+    parser.add_argument('--fresh', action='store_true', help="discard completed shards")
+    args = parser.parse_args()
+
+    if args.sharded:
+        build_sharded(args.workers, args.rows, args.stations_per_shard, args.fresh)
+    else:
+        build(args.rows)
@@ -0,0 +1,178 @@
+"""
+era5_colocate.py - Co-locate ERA5 single-level fields with GNSS stations and epochs
+
+colocate() samples ERA5 at arbitrary (lat, lon, epoch) arrays:
+    - bilinear interpolation in latitude/longitude (global grids wrap in longitude),
+    - linear interpolation between the bracketing valid_time steps,
+    - optional reduction from the grid-cell orography to the station elevation:
+      2 m temperature and dewpoint follow the standard lapse rate (dewpoint
+      depression preserved) and surface pressure is moved hypsometrically.
+
+Grid heights come from the ERA5 geopotential 'z' (m^2/s^2) when the file has
+it, or from an explicit orography array. All work is done with numpy gathers
+over the whole batch, in chunks of CHUNK_SIZE points to bound temporaries,
+so millions of epochs are co-located in one call.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+if os.path.abspath(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, os.path.abspath(MODEL_DIR))
+
+from physics import G, lapse_rate_temperature, hypsometric_pressure
+
+ERA5_VARIABLES = ('t2m', 'd2m', 'sp', 'tcwv')
+CHUNK_SIZE = 2_000_000
+
+
+def _time_dim(era5):
+    return 'valid_time' if 'valid_time' in era5.dims else 'time'
+
+
+def _bracket(coords, x):
+    """Lower/upper indices and upper weight of x within ascending coords (clamped at the ends)"""
+    if len(coords) == 1:
+        zeros = np.zeros(len(x), dtype=np.intp)
+        return zeros, zeros, np.zeros(len(x))
+    i0 = np.clip(np.searchsorted(coords, x, side='right') - 1, 0, len(coords) - 2)
+    w = np.clip((x - coords[i0]) / (coords[i0 + 1] - coords[i0]), 0.0, 1.0)
+    return i0, i0 + 1, w
+
+
+def _seconds(t):
+    if isinstance(t, (int, float, np.integer, np.floating)):
+        return float(t)
+    return float(np.datetime64(t, 's').astype(np.int64))
+
+
+def _grid_heights(z, time_dim):
+    """Grid orography (m) from an ERA5 geopotential DataArray"""
+    z = z.sortby('latitude').sortby('longitude')
+    if time_dim in z.dims:
+        z = z.isel({time_dim: 0})
+    return z.transpose('latitude', 'longitude').values.astype(np.float64) / G
+
+
+class ERA5Grid:
+    """
+    ERA5 fields held as numpy arrays [time, lat, lon] with ascending axes.
+
+    Only the time steps between t_start and t_end (datetime64 or epoch
+    seconds) are loaded, plus one step either side for interpolation.
+    orography is either grid heights in metres (ascending lat/lon order) or
+    an ERA5 geopotential dataset/array on the same grid.
+    """
+
+    def __init__(self, era5, variables=ERA5_VARIABLES, t_start=None, t_end=None, orography=None):
+        time_dim = _time_dim(era5)
+        era5 = era5.sortby('latitude').sortby('longitude').sortby(time_dim)
+
+        times = era5[time_dim].values.astype('datetime64[s]').astype(np.int64)
+        lo = 0 if t_start is None else max(np.searchsorted(times, _seconds(t_start), side='right') - 1, 0)
+        hi = len(times) if t_end is None else min(np.searchsorted(times, _seconds(t_end), side='left') + 1, len(times))
+        era5 = era5.isel({time_dim: slice(lo, hi)})
+
+        self.times = times[lo:hi].astype(np.float64)
+        self.lats = era5['latitude'].values.astype(np.float64)
+        self.lons = era5['longitude'].values.astype(np.float64)
+        dlon = self.lons[1] - self.lons[0] if len(self.lons) > 1 else 360.0
+        self.lon_cyclic = bool(abs(dlon * len(self.lons) - 360.0) < 1e-6)
+
+        self.fields = {var: era5[var].transpose(time_dim, 'latitude', 'longitude').values
+                       for var in variables}
+
+        self.orography = None
+        if orography is not None and hasattr(orography, 'sortby'):
+            z = orography['z'] if 'z' in getattr(orography, 'data_vars', ()) else orography
+            self.orography = _grid_heights(z, _time_dim(z))
+        elif orography is not None:
+            self.orography = np.asarray(orography, dtype=np.float64)
+        elif 'z' in era5:
+            self.orography = _grid_heights(era5['z'], time_dim)
+
+    def _lon_weights(self, lon):
+        lon0 = self.lons[0]
+        if self.lon_cyclic:
+            x = np.mod(lon - lon0, 360.0) + lon0
+            coords = np.append(self.lons, lon0 + 360.0)
+            i0 = np.clip(np.searchsorted(coords, x, side='right') - 1, 0, len(self.lons) - 1)
+            w = (x - coords[i0]) / (coords[i0 + 1] - coords[i0])
+            return i0, (i0 + 1) % len(self.lons), w
+        # Regional grid: use the longitude representation closest to the grid
+        x = np.mod(lon - lon0 + 180.0, 360.0) - 180.0 + lon0
+        return _bracket(self.lons, x)
+
+    def colocate(self, lat, lon, epoch, elev=None, chunk_size=CHUNK_SIZE):
+        """
+        Sample every field at (lat, lon, epoch seconds), reduced to elev (m) if given.
+
+        Returns a dict of float64 arrays in ERA5 units (K, Pa, kg/m^2).
+        """
+        lat, lon, epoch = (np.asarray(a, dtype=np.float64).ravel() for a in (lat, lon, epoch))
+        n = len(lat)
+        elev = None if elev is None else np.broadcast_to(np.asarray(elev, dtype=np.float64), (n,))
+
+        outside = (epoch < self.times[0]) | (epoch > self.times[-1])
+        if outside.any():
+            print(f"  Warning: {int(outside.sum())} epochs outside the ERA5 period, clamped")
+
+        out = {var: np.empty(n) for var in self.fields}
+        if elev is not None and self.orography is not None:
+            out['grid_height'] = np.empty(n)
+
+        for start in range(0, n, chunk_size):
+            sl = slice(start, start + chunk_size)
+            self._colocate_chunk(lat[sl], lon[sl], epoch[sl],
+                                 None if elev is None else elev[sl], out, sl)
+
+        if elev is not None and self.orography is None:
+            print("  Warning: no ERA5 orography ('z'), values not reduced to station elevation")
+        return out
+
+    def _colocate_chunk(self, lat, lon, epoch, elev, out, sl):
+        y0, y1, wy = _bracket(self.lats, lat)
+        x0, x1, wx = self._lon_weights(lon)
+        t0, t1, wt = _bracket(self.times, epoch)
+
+        n_lat, n_lon = len(self.lats), len(self.lons)
+        space = [(y0 * n_lon + x0, (1 - wy) * (1 - wx)), (y0 * n_lon + x1, (1 - wy) * wx),
+                 (y1 * n_lon + x0, wy * (1 - wx)), (y1 * n_lon + x1, wy * wx)]
+        layer = n_lat * n_lon
+
+        for var, field in self.fields.items():
+            flat = field.reshape(-1)
+            value = np.zeros(len(lat))
+            for offset, w_space in space:
+                value += w_space * ((1 - wt) * np.take(flat, t0 * layer + offset)
+                                    + wt * np.take(flat, t1 * layer + offset))
+            out[var][sl] = value
+
+        if elev is None or self.orography is None:
+            return
+
+        flat = self.orography.reshape(-1)
+        grid_height = sum(w * np.take(flat, offset) for offset, w in space)
+        out['grid_height'][sl] = grid_height
+        dh = elev - grid_height
+
+        if 'sp' in out and 't2m' in self.fields:
+            out['sp'][sl] = hypsometric_pressure(out['sp'][sl], out['t2m'][sl], dh)
+        for var in ('t2m', 'd2m'):
+            if var in out:
+                out[var][sl] = lapse_rate_temperature(out[var][sl], dh)
+
+
+def colocate(era5, lat, lon, epoch, elev=None, variables=ERA5_VARIABLES, orography=None,
+             chunk_size=CHUNK_SIZE):
+    """
+    One-shot co-location of an xarray ERA5 dataset at (lat, lon, epoch seconds).
+
+    Only the time steps spanned by the epochs are loaded into memory.
+    """
+    epoch = np.asarray(epoch, dtype=np.float64)
+    grid = ERA5Grid(era5, variables, t_start=epoch.min(), t_end=epoch.max(), orography=orography)
+    return grid.colocate(lat, lon, epoch, elev=elev, chunk_size=chunk_size)
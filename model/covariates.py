@@ -0,0 +1,413 @@
+"""
+covariates.py - Surface meteorology for prediction inputs, batched and cached
+
+fetchMeteoData() made one Open-Meteo call per request and fell back to
+random values; prediction.py then silently used 25 °C / 1013 hPa / 60 %.
+CovariateResolver answers whole batches of (lat, lon, epoch[, elev]):
+
+    cache     sqlite, keyed by (grid cell, hour); fresh rows are used as is.
+              Hours older than ARCHIVE_AFTER_DAYS keep for ARCHIVE_TTL, recent
+              and forecast hours for TTL, since the provider still revises them.
+    provider  the missing (cell, hour)s grouped into a few multi-location
+              Open-Meteo calls (up to BATCH_LOCATIONS cell centres per call,
+              whole days each) over one pooled HTTP session; every hour
+              returned is cached, so neighbouring queries hit the cache.
+    era5      the nearest cell of the local ERA5 climatology (met_grid.py)
+              when the provider fails or is skipped (online=False).
+    climatology  deterministic zonal climatology (latitude, hemisphere-aware
+              season, local time), only where neither the provider nor
+              the ERA5 grid has a value.
+
+After a provider failure it is not asked again for PROVIDER_BACKOFF seconds
+(recorded in the cache, so it holds across the per-request prediction
+processes). Provider and ERA5 values refer to the cell's height and are
+carried to the station elevation (lapse rate, hypsometric); humidity is kept.
+
+Usage:
+    python covariates.py resolve --lat 16.26 --lon -61.53 --time 2025-09-08T12:00 --elev 25
+    python covariates.py resolve --points points.csv          (columns lat, lon, time[, elev])
+    python covariates.py stats
+
+Hours older than ARCHIVE_AFTER_DAYS (historical RINEX epochs, typically) go
+to the archive endpoint, the rest to the forecast endpoint, so a stand-in
+provider must replace both: ZVC_WEATHER_BASE_URL does, e.g.
+ZVC_WEATHER_BASE_URL=http://127.0.0.1:8099 for fake_weather.py.
+
+Environment:
+    ZVC_WEATHER_BASE_URL     one server for both endpoints (<base>/v1/forecast, <base>/v1/archive)
+    ZVC_WEATHER_URL          forecast endpoint (default: Open-Meteo, or from ZVC_WEATHER_BASE_URL)
+    ZVC_WEATHER_ARCHIVE_URL  endpoint for hours older than ARCHIVE_AFTER_DAYS
+                             (default: Open-Meteo archive, or from ZVC_WEATHER_BASE_URL)
+    ZVC_COVARIATE_CACHE      sqlite cache (default: backend/data/covariates.sqlite)
+    ZVC_MET_GRID             ERA5 grid (default: model/met_grid.npy)
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+from met_grid import MET_GRID_FILE
+from physics import KELVIN, hypsometric_pressure, lapse_rate_temperature
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def provider_urls(base):
+    """(forecast, archive) endpoints of one server, Open-Meteo paths"""
+    base = base.rstrip('/')
+    return f"{base}/v1/forecast", f"{base}/v1/archive"
+
+
+WEATHER_BASE_URL = os.environ.get('ZVC_WEATHER_BASE_URL')
+_BASE_URLS = provider_urls(WEATHER_BASE_URL) if WEATHER_BASE_URL else (None, None)
+WEATHER_URL = os.environ.get('ZVC_WEATHER_URL') or _BASE_URLS[0] or 'https://api.open-meteo.com/v1/forecast'
+ARCHIVE_URL = (os.environ.get('ZVC_WEATHER_ARCHIVE_URL') or _BASE_URLS[1]
+               or 'https://archive-api.open-meteo.com/v1/archive')
+CACHE_FILE = os.environ.get('ZVC_COVARIATE_CACHE',
+                            os.path.join(MODEL_DIR, '..', 'backend', 'data', 'covariates.sqlite'))
+
+CELL_DEG = 0.25             # cache / provider grid, as ERA5
+TTL = 3 * 3600              # s, recent and forecast hours
+ARCHIVE_TTL = 30 * 86400    # s, hours older than ARCHIVE_AFTER_DAYS
+ARCHIVE_AFTER_DAYS = 60     # older days go to the archive endpoint (the forecast API keeps ~92)
+BATCH_LOCATIONS = 100       # cell centres per provider call
+TIMEOUT = 10.0              # s per provider call, as fetchMeteoData
+RETRIES = 2                 # per call, on connection errors and 429/5xx (needs requests)
+PROVIDER_BACKOFF = 300      # s without provider calls after a failure
+HOURLY = 'temperature_2m,relative_humidity_2m,surface_pressure'
+
+
+def climatology(lat, lon, elev, epoch):
+    """
+    Surface temperature (°C), pressure (hPa) and humidity (%) arrays from a
+    zonal-mean climatology: annual mean and seasonal amplitude by latitude
+    (coldest in mid-January in the north, mid-July in the south), a diurnal
+    cycle in local solar time, and subtropical-dry / tropical-moist humidity.
+    Temperature and pressure are carried to the station height.
+    """
+    lat, lon, elev, epoch = np.broadcast_arrays(np.asarray(lat, dtype=np.float64),
+                                                np.asarray(lon, dtype=np.float64),
+                                                np.asarray(elev, dtype=np.float64),
+                                                np.asarray(epoch, dtype=np.int64))
+    day = epoch / 86400.0
+    doy = np.mod(day, 365.2425)                                     # days since 1 Jan, to within a day
+    solar_hour = np.mod((day % 1.0) * 24.0 + lon / 15.0, 24.0)
+
+    # ~27 °C at the equator, ~13 °C at 45°, ~-17 °C at 80°; the annual cycle grows
+    # from ~0.5 °C in the tropics to 20 °C near the poles, opposite in the south
+    mean = 27.0 - 0.0068 * lat ** 2
+    amplitude = np.minimum(0.5 + 0.004 * lat ** 2, 20.0) * np.where(lat < 0, -1.0, 1.0)
+    seasonal = -amplitude * np.cos(2 * np.pi * (doy - 15.0) / 365.2425)
+    diurnal = np.cos(2 * np.pi * (solar_hour - 15.0) / 24.0)          # +1 at 15:00, -1 at 03:00
+    sea_level = mean + seasonal + 1.5 * diurnal
+
+    temperature = lapse_rate_temperature(sea_level, elev)
+    pressure = hypsometric_pressure(1013.25, sea_level + KELVIN, elev)
+    humidity = 77.0 - 12.0 * np.exp(-((np.abs(lat) - 25.0) / 10.0) ** 2) - 5.0 * diurnal
+    return temperature, pressure, np.clip(humidity, 0.0, 100.0)
+
+
+def cell_index(lat, lon, cell=CELL_DEG):
+    """Integer (row, column) of the cell centred nearest to each point; longitudes wrap"""
+    i = np.rint(np.asarray(lat, dtype=np.float64) / cell).astype(np.int64)
+    n = int(round(360 / cell))
+    j = np.mod(np.rint(np.asarray(lon, dtype=np.float64) / cell).astype(np.int64) + n // 2, n) - n // 2
+    return i, j
+
+
+def parse_hourly(location):
+    """(epoch, temperature, pressure, humidity, elevation) from one Open-Meteo location object"""
+    hourly = location['hourly']
+
+    def values(key):
+        return np.array([np.nan if v is None else v for v in hourly[key]], dtype=np.float64)
+
+    epoch = np.array(hourly['time'], dtype='datetime64[m]').astype('datetime64[s]').astype(np.int64)
+    elevation = location.get('elevation')
+    return (epoch, values('temperature_2m'), values('surface_pressure'), values('relative_humidity_2m'),
+            np.nan if elevation is None else float(elevation))
+
+
+class CovariateResolver:
+    """Batched, cached surface meteorology; safe to share between threads"""
+
+    def __init__(self, cache_path=None, url=WEATHER_URL, archive_url=ARCHIVE_URL, grid_path=None,
+                 cell=CELL_DEG, ttl=TTL, archive_ttl=ARCHIVE_TTL, batch_locations=BATCH_LOCATIONS,
+                 timeout=TIMEOUT, backoff=PROVIDER_BACKOFF, pool_size=8):
+        self.cache_path = cache_path or CACHE_FILE
+        self.url = url
+        self.archive_url = archive_url
+        self.grid_path = grid_path or MET_GRID_FILE
+        self.cell = cell
+        self.ttl = ttl
+        self.archive_ttl = archive_ttl
+        self.batch_locations = batch_locations
+        self.timeout = timeout
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.counters = {'queries': 0, 'cache_hits': 0, 'provider_calls': 0, 'provider_failures': 0,
+                         'provider': 0, 'era5': 0, 'climatology': 0}
+        self._session = None
+        self._grid = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self.db = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS covariates (
+                cell TEXT NOT NULL, hour INTEGER NOT NULL,
+                temperature REAL, pressure REAL, humidity REAL, elevation REAL,
+                fetched REAL NOT NULL, PRIMARY KEY (cell, hour)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value REAL);
+        """)
+
+    def close(self):
+        self.db.close()
+        if self._session is not None:
+            self._session.close()
+
+    # -- provider --
+
+    @property
+    def session(self):
+        """One pooled keep-alive session for all provider calls (urllib when requests is missing)"""
+        if self._session is None and requests is not None:
+            self._session = requests.Session()
+            retry = Retry(total=RETRIES, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504),
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=retry)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
+
+    def _get(self, url, params):
+        if self.session is not None:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        with urllib.request.urlopen(f"{url}?{urllib.parse.urlencode(params)}", timeout=self.timeout) as response:
+            return json.load(response)
+
+    def provider_down(self):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM state WHERE key = 'provider_down_until'").fetchone()
+        return row is not None and row[0] > time.time()
+
+    def _mark_down(self):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('provider_down_until', ?)",
+                            (time.time() + self.backoff,))
+
+    def fetch(self, cells):
+        """
+        Fetch {(i, j): (first_day, last_day)} from the provider in multi-location
+        calls and cache every hour returned. Returns False if any call failed.
+        """
+        archive_before = np.datetime64(int(time.time()) // 86400 - ARCHIVE_AFTER_DAYS, 'D')
+        groups = {}
+        for (i, j), (first, last) in cells.items():
+            url = self.archive_url if last < archive_before else self.url
+            groups.setdefault((url, str(first), str(last)), []).append((i, j))
+
+        ok = True
+        for (url, first, last), members in groups.items():
+            for start in range(0, len(members), self.batch_locations):
+                chunk = members[start:start + self.batch_locations]
+                params = {
+                    'latitude': ','.join(f"{i * self.cell:.4f}" for i, _ in chunk),
+                    'longitude': ','.join(f"{j * self.cell:.4f}" for _, j in chunk),
+                    'hourly': HOURLY, 'start_date': first, 'end_date': last, 'timezone': 'GMT',
+                }
+                self.counters['provider_calls'] += 1
+                try:
+                    data = self._get(url, params)
+                    locations = data if isinstance(data, list) else [data]
+                    if len(locations) != len(chunk):
+                        raise ValueError(f"{len(locations)} locations returned for {len(chunk)} requested")
+                    rows = []
+                    now = time.time()
+                    for (i, j), location in zip(chunk, locations):
+                        epoch, t, p, rh, elevation = parse_hourly(location)
+                        rows.extend((f"{i}:{j}", int(e), *(None if np.isnan(v) else float(v) for v in (a, b, c)),
+                                     None if np.isnan(elevation) else elevation, now)
+                                    for e, a, b, c in zip(epoch, t, p, rh))
+                except (OSError, ValueError, KeyError, TypeError) as e:   # requests' errors are OSErrors
+                    print(f"  Weather provider failed for {len(chunk)} cells: {type(e).__name__}: {e}",
+                          file=sys.stderr)
+                    self.counters['provider_failures'] += 1
+                    self._mark_down()
+                    ok = False
+                    break
+                with self.lock, self.db:
+                    self.db.executemany("INSERT OR REPLACE INTO covariates VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            if not ok:
+                break
+        return ok
+
+    # -- cache --
+
+    def cached(self, keys):
+        """{(cell, hour): (temperature, pressure, humidity, elevation)} of the fresh cache rows for keys"""
+        if not keys:
+            return {}
+        now = time.time()
+        archive_hour = (int(now) // 86400 - ARCHIVE_AFTER_DAYS) * 86400
+        wanted = set(keys)
+        cells = sorted({cell for cell, _ in wanted})
+        hours = [hour for _, hour in wanted]
+        out = {}
+        with self.lock:
+            for start in range(0, len(cells), 500):
+                part = cells[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT cell, hour, temperature, pressure, humidity, elevation, fetched FROM covariates "
+                    f"WHERE cell IN ({','.join('?' * len(part))}) AND hour BETWEEN ? AND ?",
+                    (*part, min(hours), max(hours))).fetchall()
+                for cell, hour, t, p, rh, elevation, fetched in rows:
+                    ttl = self.archive_ttl if hour < archive_hour else self.ttl
+                    if (cell, hour) in wanted and now - fetched <= ttl and None not in (t, p, rh):
+                        out[(cell, hour)] = (t, p, rh, np.nan if elevation is None else elevation)
+        return out
+
+    # -- fallback --
+
+    @property
+    def grid(self):
+        if self._grid is None and os.path.exists(self.grid_path):
+            from met_grid import MetGrid
+            self._grid = MetGrid(self.grid_path)
+        return self._grid
+
+    # -- entry points --
+
+    def resolve(self, lat, lon, epoch, elev=None, online=True):
+        """
+        Covariates for arrays of lat, lon, epoch seconds (and elev, m; broadcast together).
+        Returns a dict of float64 arrays 'temperature' (°C), 'pressure' (hPa),
+        'humidity' (%) and a 'source' array ('open-meteo', 'era5' or 'climatology').
+        """
+        lat, lon, epoch = (a.ravel() for a in np.broadcast_arrays(
+            np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), np.asarray(epoch, dtype=np.int64)))
+        n = len(lat)
+        elev = None if elev is None else np.broadcast_to(np.asarray(elev, dtype=np.float64), (n,))
+        self.counters['queries'] += n
+
+        i, j = cell_index(lat, lon, self.cell)
+        hour = epoch // 3600 * 3600
+        cells = np.char.add(np.char.add(i.astype(str), ':'), j.astype(str))
+        keys, inverse = np.unique(np.stack([cells, hour.astype(str)], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        keys = [(cell, int(h)) for cell, h in keys]
+
+        found = self.cached(keys)
+        self.counters['cache_hits'] += len(found)
+        missing = [k for k in keys if k not in found]
+        if missing and online and not self.provider_down():
+            spans = {}
+            for cell, h in missing:
+                ci, cj = (int(v) for v in cell.split(':'))
+                day = np.datetime64(h, 's').astype('datetime64[D]')
+                first, last = spans.get((ci, cj), (day, day))
+                spans[(ci, cj)] = (min(first, day), max(last, day))
+            self.fetch(spans)
+            found.update(self.cached(missing))
+
+        values = np.array([found.get(k, (np.nan,) * 4) for k in keys], dtype=np.float64)[inverse]
+        temperature, pressure, humidity, height = values.T.copy()
+        source = np.where(np.isnan(temperature), 'climatology', 'open-meteo').astype(object)
+
+        if elev is not None:
+            dh = np.where(np.isnan(height), 0.0, elev - height)
+            pressure = hypsometric_pressure(pressure, temperature + KELVIN, dh)
+            temperature = lapse_rate_temperature(temperature, dh)
+
+        gap = np.isnan(temperature)
+        if gap.any() and self.grid is not None:
+            inside = gap & self.grid.covers(lat, lon)
+            if inside.any():
+                t, p, rh = self.grid.lookup(lat[inside], lon[inside], epoch[inside],
+                                            None if elev is None else elev[inside])
+                temperature[inside], pressure[inside], humidity[inside] = t, p, rh
+                source[inside] = 'era5'
+            gap = np.isnan(temperature)
+        if gap.any():
+            t, p, rh = climatology(lat[gap], lon[gap], 0.0 if elev is None else elev[gap], epoch[gap])
+            temperature[gap], pressure[gap], humidity[gap] = t, p, rh
+
+        for name in ('open-meteo', 'era5', 'climatology'):
+            self.counters['provider' if name == 'open-meteo' else name] += int((source == name).sum())
+        return {'temperature': temperature, 'pressure': pressure, 'humidity': humidity, 'source': source}
+
+    def resolve_one(self, lat, lon, epoch, elev=None, online=True):
+        """Scalar form of resolve(): {'temperature', 'pressure', 'humidity', 'source'}"""
+        out = self.resolve(lat, lon, epoch, elev, online)
+        return {'temperature': round(float(out['temperature'][0]), 2), 'pressure': round(float(out['pressure'][0]), 2),
+                'humidity': round(float(out['humidity'][0]), 2), 'source': str(out['source'][0])}
+
+    def stats(self):
+        with self.lock:
+            rows, cells, oldest = self.db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT cell), MIN(fetched) FROM covariates").fetchone()
+        return {
+            'cache_file': os.path.abspath(self.cache_path),
+            'cached_hours': rows, 'cached_cells': cells,
+            'oldest_fetch_age_s': None if oldest is None else round(time.time() - oldest),
+            'provider_down': self.provider_down(),
+            'met_grid': os.path.abspath(self.grid_path) if self.grid is not None else None,
+            **self.counters,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched, cached surface meteorology for prediction inputs")
+    parser.add_argument('--cache', default=None, help=f"sqlite cache (default {CACHE_FILE})")
+    parser.add_argument('--grid', default=None, help=f"ERA5 met grid (default {MET_GRID_FILE})")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    resolve = sub.add_parser('resolve', help="covariates for one point or a CSV of points")
+    resolve.add_argument('--lat', type=float)
+    resolve.add_argument('--lon', type=float)
+    resolve.add_argument('--time', help="ISO time (UTC)")
+    resolve.add_argument('--elev', type=float, default=None)
+    resolve.add_argument('--points', help="CSV with lat, lon, time[, elev] columns")
+    resolve.add_argument('--offline', action='store_true', help="cache and ERA5 only, no provider calls")
+    sub.add_parser('stats', help="cache size, provider state and counters")
+
+    args = parser.parse_args()
+    resolver = CovariateResolver(args.cache, grid_path=args.grid)
+    if args.command == 'stats':
+        print(json.dumps(resolver.stats(), indent=2))
+    elif args.points:
+        import pandas as pd
+        points = pd.read_csv(args.points)
+        epoch = pd.to_datetime(points['time'], utc=True).dt.tz_convert(None).to_numpy().astype('datetime64[s]').astype(np.int64)
+        start = time.perf_counter()
+        out = resolver.resolve(points['lat'], points['lon'], epoch,
+                               points['elev'] if 'elev' in points else None, online=not args.offline)
+        elapsed = time.perf_counter() - start
+        sources, counts = np.unique(out['source'].astype(str), return_counts=True)
+        print(f"{len(points)} points in {elapsed:.3f}s: {dict(zip(sources, counts.tolist()))}")
+        print(json.dumps(resolver.stats(), indent=2))
+    else:
+        if args.lat is None or args.lon is None or args.time is None:
+            parser.error("resolve needs --lat, --lon and --time (or --points)")
+        epoch = np.datetime64(args.time, 's').astype(np.int64)
+        print(json.dumps(resolver.resolve_one(args.lat, args.lon, epoch, args.elev, online=not args.offline)))
+    resolver.close()
@@ -0,0 +1,413 @@
+"""
+gnss_store.py - Partitioned Parquet storage for GNSS / PW datasets
+
+Replaces the wide CSVs (dataset.csv, processed/data.csv, gnss_data.csv,
+gnss_pw_with_predictions_enhanced.csv) with a Parquet dataset laid out as
+
+    <root>/station_id=<ID>/month=<YYYY-MM>/part-*.parquet
+
+using compact column names and dtypes (dictionary-encoded station IDs,
+float32 measurements, int64 epoch seconds). The calendar columns
+(Year ... Second, Date (ISO Format)) are not stored; they are rebuilt from
+the epoch on read.
+
+Readers support column projection and predicate pushdown: station and
+time filters prune partitions and Parquet row groups before any data is
+decoded.
+
+Usage:
+    python gnss_store.py convert dataset.csv --out dataset_store
+    python gnss_store.py convert ../backend/data/gnss_data.csv --out gnss_store --station-id UNKNOWN
+    python gnss_store.py info dataset_store
+"""
+
+import argparse
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Legacy CSV header -> storage column
+COLUMN_NAMES = {
+    'Station ID': 'station_id',
+    'Timestamp (Epoch)': 'epoch',
+    'Station Latitude': 'lat',
+    'Station Longitude': 'lon',
+    'Station Elevation': 'elev',
+    'ZWD Observation': 'zwd',
+    'Satellite Azimuth': 'sat_azimuth',
+    'Satellite Elevation': 'sat_elevation',
+    'Temperature (°C)': 'temperature',
+    'Pressure (hPa)': 'pressure',
+    'Humidity (%)': 'humidity',
+    'Actual Measured PW': 'pw_measured',
+    'PW': 'pw',
+    'Predicted_PW': 'pw_predicted',
+    'Uncertainty': 'pw_uncertainty',
+    'Confidence': 'confidence',
+}
+LEGACY_NAMES = {v: k for k, v in COLUMN_NAMES.items()}
+
+# Rebuilt from 'epoch' on read, never stored
+CALENDAR_COLUMNS = ['Year', 'Month', 'Day', 'Hour', 'Minute', 'Second', 'Date (ISO Format)']
+
+# Columns of the legacy CSVs that are derived features and are dropped on conversion
+DERIVED_COLUMNS = ['datetime', 'hour', 'day_of_year', 'day_of_week', 'month', 'is_weekend',
+                   'hour_sin', 'hour_cos', 'doy_sin', 'doy_cos', 'month_sin', 'month_cos',
+                   'station_encoded']
+
+# Compact dtypes for reading the legacy CSVs directly
+LEGACY_DTYPES = {
+    'Station ID': 'category',
+    'Timestamp (Epoch)': 'int64',
+    'Year': 'int16', 'Month': 'int8', 'Day': 'int8',
+    'Hour': 'int8', 'Minute': 'int8', 'Second': 'int8',
+    **{legacy: 'float32' for legacy, name in COLUMN_NAMES.items()
+       if name not in ('station_id', 'epoch')},
+}
+
+PARTITION_SCHEMA = pa.schema([('station_id', pa.string()), ('month', pa.string())])
+WRITE_PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+# Reading infers dictionaries so station_id comes back as a categorical
+READ_PARTITIONING = ds.partitioning(
+    pa.schema([('station_id', pa.dictionary(pa.int32(), pa.string())), ('month', pa.string())]),
+    flavor='hive',
+    dictionaries='infer'
+)
+
+ROW_GROUP_SIZE = 128 * 1024
+
+
+def station_key_from_coords(lat, lon):
+    """Stable station key for files without a Station ID column, e.g. '40.713_-74.006'"""
+    return pd.Series(lat).round(3).astype(str) + '_' + pd.Series(lon).round(3).astype(str)
+
+
+def epoch_month(epoch):
+    """'YYYY-MM' partition values for an array of epoch seconds"""
+    return np.asarray(epoch, dtype='int64').astype('datetime64[s]').astype('datetime64[M]').astype(str)
+
+
+def to_storage_frame(df, station_id=None):
+    """Map a legacy-layout frame onto the compact storage schema"""
+    out = pd.DataFrame(index=df.index)
+
+    if 'Timestamp (Epoch)' in df.columns:
+        out['epoch'] = pd.to_numeric(df['Timestamp (Epoch)'], errors='coerce').astype('int64')
+    elif 'Date (ISO Format)' in df.columns:
+        dt = pd.to_datetime(df['Date (ISO Format)'], utc=True, format='ISO8601')
+        out['epoch'] = ((dt - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).astype('int64')
+    else:
+        raise ValueError("Need 'Timestamp (Epoch)' or 'Date (ISO Format)' to store a GNSS frame")
+
+    if 'Station ID' in df.columns:
+        out['station_id'] = df['Station ID'].astype(str)
+    elif station_id is not None:
+        out['station_id'] = station_id
+    else:
+        out['station_id'] = station_key_from_coords(
+            df['Station Latitude'].to_numpy(), df['Station Longitude'].to_numpy()).to_numpy()
+
+    for legacy, name in COLUMN_NAMES.items():
+        if name in ('epoch', 'station_id') or legacy not in df.columns:
+            continue
+        out[name] = pd.to_numeric(df[legacy], errors='coerce').astype(np.float32)
+
+    # Keep any other numeric measurements under their own names
+    skip = set(COLUMN_NAMES) | set(CALENDAR_COLUMNS) | set(DERIVED_COLUMNS)
+    for col in df.columns:
+        if col not in skip and pd.api.types.is_numeric_dtype(df[col]):
+            out[col] = df[col].astype(np.float32)
+
+    out['month'] = epoch_month(out['epoch'].to_numpy())
+    return out
+
+
+def write_dataset(df, root, station_id=None, legacy=True, overwrite=False, basename=None):
+    """
+    Append a frame to the partitioned store at root.
+
+    legacy=True means df uses the CSV headers and is converted first;
+    otherwise it must already follow the storage schema. overwrite=True
+    removes any existing store at root first. basename fixes the part file
+    names (part-<basename>-<i>.parquet) so rewriting the same batch replaces
+    its files instead of adding new ones; the default is a random name.
+    """
+    if overwrite and os.path.isdir(root):
+        shutil.rmtree(root)
+
+    frame = to_storage_frame(df, station_id) if legacy else df
+    if 'month' not in frame.columns:
+        frame = frame.assign(month=epoch_month(frame['epoch'].to_numpy()))
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    ds.write_dataset(
+        table, root,
+        format='parquet',
+        partitioning=WRITE_PARTITIONING,
+        basename_template=f"part-{basename or uuid.uuid4().hex[:12]}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        max_rows_per_group=ROW_GROUP_SIZE,
+        min_rows_per_group=min(ROW_GROUP_SIZE, len(table)) if len(table) else 0,
+    )
+    return len(table)
+
+
+class StreamingWriter:
+    """
+    Append DataFrame batches to a single Parquet file (fixed-size row groups)
+    or CSV file (chunks), keeping at most one row group in memory.
+
+    Output goes to <path>.tmp and is moved into place on close, so a crashed
+    writer never leaves a truncated file under the final name.
+
+        with StreamingWriter("rows.parquet") as writer:
+            for batch in batches:
+                writer.write(batch)
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE, format=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.format = format or ('csv' if path.endswith('.csv') else 'parquet')
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._schema = None
+        self._writer = None
+
+    def write(self, df):
+        """Buffer a batch and flush every complete row group"""
+        if self._schema is None:
+            self._schema = pa.Table.from_pandas(df, preserve_index=False).schema
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._buffer.append(table)
+        self._buffered += len(table)
+        while self._buffered >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def _flush(self, n_rows):
+        table = pa.concat_tables(self._buffer)
+        chunk, rest = table.slice(0, n_rows), table.slice(n_rows)
+        self._buffer = [rest] if len(rest) else []
+        self._buffered = len(rest)
+
+        if self.format == 'parquet':
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression='zstd')
+            self._writer.write_table(chunk, row_group_size=n_rows)
+        else:
+            chunk.to_pandas().to_csv(self.tmp_path, mode='a', index=False,
+                                     header=self.rows_written == 0)
+        self.rows_written += len(chunk)
+
+    def close(self):
+        if self._buffered:
+            self._flush(self._buffered)
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+        return self.rows_written
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def open_dataset(root):
+    """Open the store as a pyarrow dataset"""
+    return ds.dataset(root, format='parquet', partitioning=READ_PARTITIONING)
+
+
+def build_filter(stations=None, start=None, end=None, extra=None):
+    """
+    Combine station / time-range predicates into one dataset expression.
+
+    start and end are anything pd.Timestamp accepts (or epoch seconds);
+    end is exclusive. The month predicate prunes partitions, the epoch
+    predicate prunes row groups.
+    """
+    expr = None
+
+    def _and(e):
+        return e if expr is None else expr & e
+
+    if stations is not None:
+        expr = _and(ds.field('station_id').isin([str(s) for s in np.atleast_1d(stations)]))
+    if start is not None:
+        start_s = _to_epoch(start)
+        expr = _and((ds.field('month') >= str(epoch_month([start_s])[0])) & (ds.field('epoch') >= start_s))
+    if end is not None:
+        end_s = _to_epoch(end)
+        expr = _and((ds.field('month') <= str(epoch_month([end_s])[0])) & (ds.field('epoch') < end_s))
+    if extra is not None:
+        expr = _and(extra)
+    return expr
+
+
+def _to_epoch(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.timestamp())
+
+
+def read_dataset(root, columns=None, stations=None, start=None, end=None, filter=None, legacy_names=True):
+    """
+    Read (a projection of) the store into a DataFrame.
+
+    columns may use legacy CSV headers or storage names; calendar columns
+    are derived from the epoch when requested (or when columns is None).
+    With legacy_names=True the result uses the legacy CSV headers, with
+    'Station ID' as a categorical and 'Date (ISO Format)' as UTC datetimes.
+    """
+    dataset = open_dataset(root)
+    available = set(dataset.schema.names)
+
+    want_calendar = []
+    if columns is None:
+        scan_columns = [c for c in dataset.schema.names if c != 'month']
+        want_calendar = list(CALENDAR_COLUMNS)
+    else:
+        scan_columns = []
+        for col in columns:
+            if col in CALENDAR_COLUMNS:
+                want_calendar.append(col)
+                col = 'epoch'
+            name = COLUMN_NAMES.get(col, col)
+            if name not in available:
+                raise KeyError(f"Column '{col}' not in store {root}")
+            if name not in scan_columns:
+                scan_columns.append(name)
+
+    table = dataset.to_table(columns=scan_columns, filter=build_filter(stations, start, end, filter))
+    df = table.to_pandas()
+
+    if want_calendar:
+        dt = pd.to_datetime(df['epoch'], unit='s', utc=True)
+        calendar = {
+            'Year': dt.dt.year, 'Month': dt.dt.month, 'Day': dt.dt.day,
+            'Hour': dt.dt.hour, 'Minute': dt.dt.minute, 'Second': dt.dt.second,
+            'Date (ISO Format)': dt,
+        }
+        for col in want_calendar:
+            df[col if legacy_names else col.lower()] = calendar[col]
+        if columns is not None and 'epoch' not in [COLUMN_NAMES.get(c, c) for c in columns]:
+            df = df.drop(columns='epoch')
+
+    # Station first, then the requested (or legacy CSV) column order
+    if columns is None:
+        order = ['station_id'] + CALENDAR_COLUMNS + [c for c in scan_columns if c != 'station_id']
+    else:
+        order = [c if c in CALENDAR_COLUMNS else COLUMN_NAMES.get(c, c) for c in columns]
+    if not legacy_names:
+        order = [c.lower() if c in CALENDAR_COLUMNS else c for c in order]
+    df = df[[c for c in dict.fromkeys(order) if c in df.columns]]
+
+    if legacy_names:
+        df = df.rename(columns=LEGACY_NAMES)
+    return df
+
+
+def load_frame(path, columns=None, stations=None, start=None, end=None, dtypes=None):
+    """
+    Load a GNSS frame from either a partitioned store directory or a legacy CSV.
+
+    CSVs are read with usecols for projection (columns missing from a file
+    are skipped), parsed with the given dtypes (e.g. LEGACY_DTYPES) and
+    filtered after parsing; stores are already compact and push the filters
+    down into the scan.
+    """
+    if os.path.isdir(path):
+        return read_dataset(path, columns=columns, stations=stations, start=start, end=end)
+
+    # Filter columns are read even when not projected, and dropped after filtering
+    filter_cols = (['Station ID'] if stations is not None else []) + \
+        (['Timestamp (Epoch)'] if start is not None or end is not None else [])
+    usecols = None if columns is None else (lambda col: col in columns or col in filter_cols)
+    df = pd.read_csv(path, usecols=usecols, dtype=dtypes)
+    if stations is not None and 'Station ID' in df.columns:
+        df = df[df['Station ID'].astype(str).isin([str(s) for s in np.atleast_1d(stations)])]
+    if start is not None or end is not None:
+        if 'Timestamp (Epoch)' not in df.columns:
+            raise ValueError(f"{path} has no 'Timestamp (Epoch)' column to filter start/end on")
+        epoch = df['Timestamp (Epoch)']
+        keep = np.ones(len(df), dtype=bool)
+        if start is not None:
+            keep &= (epoch >= _to_epoch(start)).to_numpy()
+        if end is not None:
+            keep &= (epoch < _to_epoch(end)).to_numpy()
+        df = df[keep]
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    return df
+
+
+def convert_csv(csv_path, root, station_id=None, chunksize=1_000_000):
+    """Convert a legacy CSV into the partitioned store, chunk by chunk"""
+    total = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        total += write_dataset(chunk, root, station_id=station_id)
+    print(f"Converted {csv_path}: {total} rows -> {root}")
+    return total
+
+
+def describe(root):
+    """Print a short summary of a store"""
+    dataset = open_dataset(root)
+    files = dataset.files
+    size = sum(os.path.getsize(f) for f in files)
+    stations = dataset.to_table(columns=['station_id']).column('station_id').unique()
+    print(f"Store: {root}")
+    print(f"  Files: {len(files)}, size: {size / 1e6:.2f} MB")
+    print(f"  Rows: {dataset.count_rows()}, stations: {len(stations)}")
+    print("  Schema:")
+    for field in dataset.schema:
+        print(f"    {field.name}: {field.type}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitioned Parquet storage for GNSS datasets")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    convert = sub.add_parser('convert', help="convert legacy CSVs into a store")
+    convert.add_argument('csv', nargs='+')
+    convert.add_argument('--out', required=True)
+    convert.add_argument('--station-id', default=None,
+                         help="station ID for CSVs without a 'Station ID' column "
+                              "(default: derived from coordinates)")
+    convert.add_argument('--chunksize', type=int, default=1_000_000)
+
+    info = sub.add_parser('info', help="summarise a store")
+    info.add_argument('root')
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        for path in args.csv:
+            convert_csv(path, args.out, station_id=args.station_id, chunksize=args.chunksize)
+    else:
+        describe(args.root)
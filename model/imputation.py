@@ -0,0 +1,70 @@
+"""
+imputation.py - Missing-value imputation shared by training and serving
+
+The enhanced GNSS PW model (pickle-model-generator-1.py) fills gaps in its
+numeric inputs in three steps, and unified_predictor.py repeats them at
+serve time so a request with missing values gets the features the model
+was trained on:
+
+    1. linear interpolation within each station's time-ordered series
+    2. the station mean
+    3. the mean over all rows (at serve time: the batch, then the training
+       means stored in the model package)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def interpolate_within_groups(values, groups):
+    """
+    Linearly interpolate NaNs within each group, extending the first/last valid
+    value to the group edges. Rows are taken as time-ordered within each group.
+
+    Equivalent to groupby(groups).transform(lambda x: x.interpolate(method='linear',
+    limit_direction='both')), but done with grouped forward/backward fills
+    instead of a Python call per group. The arithmetic uses row positions, so
+    each group has to be one contiguous block (station-major order); rows of
+    interleaved groups are stably sorted by group first and put back after.
+    """
+    keys = np.asarray(groups)
+    codes = pd.factorize(keys, use_na_sentinel=False)[0]
+    if len(codes) and np.count_nonzero(np.diff(codes)) != codes.max():
+        order = np.argsort(codes, kind='stable')
+        result = interpolate_within_groups(values.iloc[order], keys[order])
+        return result.iloc[np.argsort(order)]
+
+    positions = np.arange(len(values), dtype=np.float64)
+    valid_pos = pd.DataFrame(np.where(values.notna(), positions[:, None], np.nan),
+                             index=values.index, columns=values.columns)
+
+    prev_val = values.groupby(groups).ffill()
+    next_val = values.groupby(groups).bfill()
+    prev_pos = valid_pos.groupby(groups).ffill()
+    next_pos = valid_pos.groupby(groups).bfill()
+
+    # Same arithmetic as np.interp: slope * (x - x0) + y0
+    span = next_pos - prev_pos
+    slope = (next_val - prev_val) / span.where(span > 0)
+    interior = slope.mul(prev_pos.rsub(positions, axis=0)) + prev_val
+
+    # Between two valid points -> interior; at a valid point or past the last one -> prev;
+    # before the first valid point -> next
+    return interior.where(span > 0, prev_val).fillna(next_val)
+
+
+def fill_group_means(values, groups, fallback=None):
+    """Steps 2 and 3: NaNs take the group mean, then the column mean, then fallback[column]"""
+    values = values.fillna(values.groupby(groups, observed=True).transform('mean'))
+    values = values.fillna(values.mean())
+    if fallback:
+        values = values.fillna({col: fallback[col] for col in values.columns if col in fallback})
+    return values
+
+
+def impute(values, groups, fallback=None):
+    """
+    All three steps for numeric columns (DataFrame in time order within each
+    group); fallback maps columns to values for columns with no value at all.
+    """
+    return fill_group_means(interpolate_within_groups(values, groups), groups, fallback)
@@ -0,0 +1,240 @@
+"""
+mapping_functions.py - Tropospheric mapping functions and slant -> zenith conversion
+
+A slant delay along a ray at elevation e relates to the zenith delay through
+the mapping function m(e):  slant = m_h(e) * ZHD + m_w(e) * ZWD.
+Both mapping functions use the Marini continued fraction in sin(e) with
+coefficients (a, b, c):
+
+    niell_hydrostatic / niell_wet   Niell (1996) NMF: coefficients tabulated
+                                    by latitude, with an annual term and a
+                                    height correction (hydrostatic only)
+    vmf1_hydrostatic / vmf1_wet     VMF1 (Boehm et al. 2006): a coefficients
+                                    from the VMF1 grids or site files, b and c
+                                    from the closed-form expressions
+
+Everything broadcasts over numpy arrays of (elevation, latitude, height, day
+of year), so a whole RINEX epoch batch is converted at once:
+
+    slant_to_zwd(swd, elev, lat, h, doy)       slant wet delays -> ZWD per observation
+    slant_total_to_zwd(std, elev, lat, h, doy, pressure_hpa)
+                                               slant total delays -> ZWD, removing
+                                               the Saastamoinen ZHD mapped by m_h
+    epoch_zwd(station_ids, epochs, zwd, elev)  one ZWD per (station, epoch),
+                                               elevation-weighted, by group reductions
+
+Elevations are in degrees, heights in metres, delays in any consistent unit.
+
+Usage:
+    python mapping_functions.py slant.parquet epoch_zwd.csv --model niell
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from physics import zhd_saastamoinen
+
+# Niell (1996) hydrostatic coefficients at |lat| = 15, 30, 45, 60, 75 deg
+NIELL_LATITUDES = np.array([15.0, 30.0, 45.0, 60.0, 75.0])
+NIELL_HYDRO_AVG = np.array([
+    [1.2769934e-3, 2.9153695e-3, 62.610505e-3],
+    [1.2683230e-3, 2.9152299e-3, 62.837393e-3],
+    [1.2465397e-3, 2.9288445e-3, 63.721774e-3],
+    [1.2196049e-3, 2.9022565e-3, 63.824265e-3],
+    [1.2045996e-3, 2.9024912e-3, 64.258455e-3],
+])
+NIELL_HYDRO_AMP = np.array([
+    [0.0, 0.0, 0.0],
+    [1.2709626e-5, 2.1414979e-5, 9.0128400e-5],
+    [2.6523662e-5, 3.0160779e-5, 4.3497037e-5],
+    [3.4000452e-5, 7.2562722e-5, 84.795348e-5],
+    [4.1202191e-5, 11.723375e-5, 170.37206e-5],
+])
+NIELL_WET = np.array([
+    [5.8021897e-4, 1.4275268e-3, 4.3472961e-2],
+    [5.6794847e-4, 1.5138625e-3, 4.6729510e-2],
+    [5.8118019e-4, 1.4572752e-3, 4.3908931e-2],
+    [5.9727542e-4, 1.5007428e-3, 4.4626982e-2],
+    [6.1641693e-4, 1.7599082e-3, 5.4736038e-2],
+])
+# Height correction coefficients (per km), shared by NMF and VMF1
+HEIGHT_COEFFS = (2.53e-5, 5.49e-3, 1.14e-3)
+
+# Annual term: phase reference day and half-year shift for the southern hemisphere
+DOY_PHASE = 28.0
+YEAR_DAYS = 365.25
+
+# VMF1 closed-form b and c coefficients
+VMF1_B_H = 0.0029
+VMF1_C0_H = 0.062
+VMF1_C10_H = (0.001, 0.002)     # northern, southern hemisphere
+VMF1_C11_H = (0.005, 0.007)
+VMF1_B_W = 0.00146
+VMF1_C_W = 0.04391
+
+ELEVATION_MASK = 5.0
+
+
+def marini(elev_deg, a, b, c):
+    """Marini continued fraction normalised to 1 at zenith"""
+    sin_e = np.sin(np.radians(elev_deg))
+    top = 1 + a / (1 + b / (1 + c))
+    return top / (sin_e + a / (sin_e + b / (sin_e + c)))
+
+
+def _height_correction(elev_deg, height_m):
+    sin_e = np.sin(np.radians(elev_deg))
+    return (1 / sin_e - marini(elev_deg, *HEIGHT_COEFFS)) * np.asarray(height_m) / 1000.0
+
+
+def _annual(lat_deg, doy):
+    """cos of the annual term, shifted half a year in the southern hemisphere"""
+    doy = np.asarray(doy, dtype=np.float64) + np.where(np.asarray(lat_deg) < 0, YEAR_DAYS / 2, 0.0)
+    return np.cos(2 * np.pi * (doy - DOY_PHASE) / YEAR_DAYS)
+
+
+def _interp_table(table, lat_deg):
+    """Coefficients (a, b, c) linearly interpolated in |latitude|, held constant beyond 15/75 deg"""
+    lat = np.abs(np.asarray(lat_deg, dtype=np.float64))
+    return [np.interp(lat, NIELL_LATITUDES, table[:, k]) for k in range(3)]
+
+
+def niell_hydrostatic(elev_deg, lat_deg, height_m, doy):
+    avg = _interp_table(NIELL_HYDRO_AVG, lat_deg)
+    amp = _interp_table(NIELL_HYDRO_AMP, lat_deg)
+    annual = _annual(lat_deg, doy)
+    a, b, c = (m - s * annual for m, s in zip(avg, amp))
+    return marini(elev_deg, a, b, c) + _height_correction(elev_deg, height_m)
+
+
+def niell_wet(elev_deg, lat_deg):
+    return marini(elev_deg, *_interp_table(NIELL_WET, lat_deg))
+
+
+def vmf1_hydrostatic(elev_deg, ah, lat_deg, height_m, doy):
+    """VMF1 hydrostatic mapping with a_h from the VMF1 grid/site product"""
+    south = np.asarray(lat_deg) < 0
+    psi = np.where(south, np.pi, 0.0)
+    c10 = np.where(south, VMF1_C10_H[1], VMF1_C10_H[0])
+    c11 = np.where(south, VMF1_C11_H[1], VMF1_C11_H[0])
+    annual = np.cos(2 * np.pi * (np.asarray(doy, dtype=np.float64) - DOY_PHASE) / YEAR_DAYS + psi)
+    c = VMF1_C0_H + ((annual + 1) * c11 / 2 + c10) * (1 - np.cos(np.radians(lat_deg)))
+    return marini(elev_deg, ah, VMF1_B_H, c) + _height_correction(elev_deg, height_m)
+
+
+def vmf1_wet(elev_deg, aw):
+    """VMF1 wet mapping with a_w from the VMF1 grid/site product"""
+    return marini(elev_deg, aw, VMF1_B_W, VMF1_C_W)
+
+
+def wet_mapping(elev_deg, lat_deg, model='niell', aw=None):
+    if model == 'vmf1':
+        if aw is None:
+            raise ValueError("VMF1 wet mapping needs the a_w coefficients")
+        return vmf1_wet(elev_deg, aw)
+    return niell_wet(elev_deg, lat_deg)
+
+
+def hydrostatic_mapping(elev_deg, lat_deg, height_m, doy, model='niell', ah=None):
+    if model == 'vmf1':
+        if ah is None:
+            raise ValueError("VMF1 hydrostatic mapping needs the a_h coefficients")
+        return vmf1_hydrostatic(elev_deg, ah, lat_deg, height_m, doy)
+    return niell_hydrostatic(elev_deg, lat_deg, height_m, doy)
+
+
+def slant_to_zwd(swd, elev_deg, lat_deg, height_m=0.0, doy=None, model='niell', aw=None):
+    """ZWD from slant wet delays (doy and height are unused by the wet functions, kept for symmetry)"""
+    return np.asarray(swd, dtype=np.float64) / wet_mapping(elev_deg, lat_deg, model, aw)
+
+
+def slant_total_to_zwd(std, elev_deg, lat_deg, height_m, doy, pressure_hpa, model='niell', ah=None, aw=None):
+    """ZWD from slant total delays (m): remove m_h * Saastamoinen ZHD, then divide by m_w"""
+    zhd = zhd_saastamoinen(pressure_hpa, lat_deg, height_m)
+    m_h = hydrostatic_mapping(elev_deg, lat_deg, height_m, doy, model, ah)
+    return (np.asarray(std, dtype=np.float64) - m_h * zhd) / wet_mapping(elev_deg, lat_deg, model, aw)
+
+
+def day_of_year(epochs):
+    """Fractional day of year (1-based) from Unix epoch seconds"""
+    t = pd.DatetimeIndex(pd.to_datetime(np.asarray(epochs), unit='s'))
+    return np.asarray(t.dayofyear) + (np.asarray(t.hour) * 3600 + np.asarray(t.minute) * 60
+                                      + np.asarray(t.second)) / 86400.0
+
+
+def epoch_zwd(station_ids, epochs, zwd, elev_deg, elevation_mask=ELEVATION_MASK):
+    """
+    Combine per-observation ZWD into one value per (station, epoch).
+
+    Observations below elevation_mask are dropped; the rest are averaged
+    with sin^2(elevation) weights, which down-weights the low rays whose
+    mapping errors dominate. Returns a DataFrame sorted by station and epoch
+    with the weighted mean ZWD, its weighted standard deviation and the
+    number of observations used.
+    """
+    station_ids = np.asarray(station_ids)
+    epochs = np.asarray(epochs)
+    zwd = np.asarray(zwd, dtype=np.float64)
+    elev_deg = np.asarray(elev_deg, dtype=np.float64)
+
+    keep = (elev_deg >= elevation_mask) & np.isfinite(zwd)
+    station_ids, epochs, zwd, elev_deg = station_ids[keep], epochs[keep], zwd[keep], elev_deg[keep]
+
+    station_code, stations = pd.factorize(station_ids, sort=True)
+    epoch_code, epoch_values = pd.factorize(epochs, sort=True)
+    group_code, group = np.unique(station_code.astype(np.int64) * len(epoch_values) + epoch_code,
+                                  return_inverse=True)
+
+    w = np.sin(np.radians(elev_deg)) ** 2
+    n_groups = len(group_code)
+    sum_w = np.bincount(group, w, n_groups)
+    mean = np.bincount(group, w * zwd, n_groups) / sum_w
+    var = np.bincount(group, w * (zwd - mean[group]) ** 2, n_groups) / sum_w
+
+    return pd.DataFrame({
+        'Station ID': np.asarray(stations)[group_code // len(epoch_values)],
+        'Timestamp (Epoch)': np.asarray(epoch_values)[group_code % len(epoch_values)],
+        'ZWD': mean,
+        'ZWD Std': np.sqrt(var),
+        'Observations': np.bincount(group, minlength=n_groups),
+    })
+
+
+def _read_table(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slant delays -> per-epoch ZWD")
+    parser.add_argument('input', help="CSV/Parquet with Station ID, Timestamp (Epoch), Satellite Elevation, "
+                                      "Station Latitude, Station Elevation and Slant Wet Delay "
+                                      "(or Slant Total Delay + Pressure (hPa))")
+    parser.add_argument('output')
+    parser.add_argument('--model', choices=['niell', 'vmf1'], default='niell')
+    parser.add_argument('--mask', type=float, default=ELEVATION_MASK, help="elevation mask (deg)")
+    args = parser.parse_args()
+
+    obs = _read_table(args.input)
+    elev = obs['Satellite Elevation'].to_numpy(dtype=np.float64)
+    lat = obs['Station Latitude'].to_numpy(dtype=np.float64)
+    ah = obs['VMF1 ah'].to_numpy() if 'VMF1 ah' in obs else None
+    aw = obs['VMF1 aw'].to_numpy() if 'VMF1 aw' in obs else None
+
+    if 'Slant Wet Delay' in obs:
+        zwd = slant_to_zwd(obs['Slant Wet Delay'].to_numpy(), elev, lat, model=args.model, aw=aw)
+    else:
+        height = obs['Station Elevation'].to_numpy(dtype=np.float64)
+        doy = day_of_year(obs['Timestamp (Epoch)'].to_numpy())
+        zwd = slant_total_to_zwd(obs['Slant Total Delay'].to_numpy(), elev, lat, height, doy,
+                                 obs['Pressure (hPa)'].to_numpy(), args.model, ah, aw)
+
+    result = epoch_zwd(obs['Station ID'].to_numpy(), obs['Timestamp (Epoch)'].to_numpy(), zwd, elev, args.mask)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if args.output.endswith('.parquet'):
+        result.to_parquet(args.output, index=False)
+    else:
+        result.to_csv(args.output, index=False)
+    print(f"{len(obs)} observations -> {len(result)} station epochs written to {args.output}")
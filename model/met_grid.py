@@ -0,0 +1,243 @@
+"""
+met_grid.py - Surface meteorology (T, P, RH) climatology grid from ERA5
+
+The offline fallback of the covariate resolver (covariates.py): when the
+weather provider cannot be reached, surface temperature, pressure and
+relative humidity come from locally stored ERA5 values of the nearest grid
+cell instead of random numbers.
+
+build_met_grid reduces ERA5 single-level files (t2m, d2m, sp; z if present)
+to means per grid cell, day-of-year bin and hour bin, on the same bins as
+tm_grid.py, stored as a float32 .npy (memory-mapped on load) with a JSON
+sidecar:
+
+    met_grid.npy            float32 [n_lat, n_lon, n_doy, n_hour, 3]: °C, hPa, %
+    met_grid.json           axis origins/steps, bin counts, source files
+    met_grid_orography.npy  float32 [n_lat, n_lon] grid heights (m), when the files have 'z'
+
+MetGrid.lookup takes the nearest cell and time bin for whole batches and,
+given station elevations and orography, carries temperature and pressure
+from the grid height to the station (lapse rate, hypsometric). The
+orography comes from 'z' in the input files or a separate geopotential
+file (--geopotential).
+
+The dataset builder (build_dataset.py) writes the grid to MET_GRID_FILE
+(ZVC_MET_GRID, default model/met_grid.npy) from the same ERA5 files it
+reduces for the Tm grid.
+
+Usage:
+    python met_grid.py build ../gnss-data-coll/zenith_dataset/raw_era5/*.nc --out met_grid.npy \\
+        --geopotential ../gnss-data-coll/zenith_dataset/raw_era5/geopotential.nc
+    python met_grid.py lookup met_grid.npy --lat 16.26 --lon -61.53 --time 2025-09-08T12:00:00 --elev 25
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from physics import G, KELVIN, hypsometric_pressure, lapse_rate_temperature, rh_from_dewpoint
+from tm_grid import (DOY_STEP, HOUR_STEP, TIME_CHUNK, YEAR_DAYS, _doy_hour, _fill_cyclic, _time_dim,
+                     grid_shape_str, meta_path)
+
+# The one default location shared by build_dataset.py and covariates.py
+MET_GRID_FILE = os.environ.get('ZVC_MET_GRID', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'met_grid.npy'))
+
+VARIABLES = ('temperature', 'pressure', 'humidity')
+
+
+def orography_path(path):
+    return os.path.splitext(path)[0] + '_orography.npy'
+
+
+def _chunk_met(chunk):
+    """Temperature (°C), surface pressure (hPa) and RH (%) for one ERA5 time chunk, [time, lat, lon, 3]"""
+    t = chunk['t2m'].values.astype(np.float64) - KELVIN
+    rh = rh_from_dewpoint(t, chunk['d2m'].values.astype(np.float64) - KELVIN)
+    return np.stack([t, chunk['sp'].values.astype(np.float64) / 100.0, rh], axis=-1)
+
+
+def _orography(ds, time_dim):
+    """Grid heights (m) from a dataset's geopotential, [lat, lon]"""
+    z = ds['z'].isel({time_dim: 0}) if time_dim in ds['z'].dims else ds['z']
+    return z.transpose('latitude', 'longitude').values.astype(np.float64) / G
+
+
+def build_met_grid(era5_paths, out_path, doy_step=DOY_STEP, hour_step=HOUR_STEP, stride=1,
+                   geopotential_path=None):
+    """
+    Reduce ERA5 files to a T/P/RH climatology grid at out_path (.npy + .json).
+
+    stride keeps every stride-th grid point in latitude and longitude. Bins
+    not covered by the input period are filled as in build_tm_grid.
+    Orography is taken from geopotential_path when it exists, else from
+    'z' in the input files.
+    """
+    import xarray as xr
+
+    n_doy = int(np.ceil(366 / doy_step))
+    n_hour = int(np.ceil(24 / hour_step))
+    sums = counts = orography = None
+    lats = lons = None
+
+    for path in era5_paths:
+        print(f"Reducing {path}")
+        ds = xr.open_dataset(path)
+        ds = ds.isel(latitude=slice(None, None, stride), longitude=slice(None, None, stride))
+        ds = ds.sortby('latitude').sortby('longitude')
+        time_dim = _time_dim(ds)
+
+        if sums is None:
+            lats, lons = ds['latitude'].values, ds['longitude'].values
+            sums = np.zeros((n_doy * n_hour, len(lats), len(lons), len(VARIABLES)))
+            counts = np.zeros((n_doy * n_hour, len(lats), len(lons), len(VARIABLES)))
+        elif len(ds['latitude']) != len(lats) or len(ds['longitude']) != len(lons):
+            raise ValueError(f"{path} is on a different grid than {era5_paths[0]}")
+
+        if orography is None and 'z' in ds:
+            orography = _orography(ds, time_dim)
+
+        for start in range(0, ds.sizes[time_dim], TIME_CHUNK):
+            chunk = ds.isel({time_dim: slice(start, start + TIME_CHUNK)}).transpose(time_dim, ...)
+            met = _chunk_met(chunk)
+            doy, hour = _doy_hour(chunk[time_dim].values)
+            doy_bin = np.minimum((doy / YEAR_DAYS * n_doy).astype(int), n_doy - 1)
+            hour_bin = np.minimum((hour / 24.0 * n_hour).astype(int), n_hour - 1)
+            bins = doy_bin * n_hour + hour_bin
+
+            order = np.argsort(bins, kind='stable')
+            uniq, starts = np.unique(bins[order], return_index=True)
+            finite = np.isfinite(met[order])
+            sums[uniq] += np.add.reduceat(np.where(finite, met[order], 0.0), starts, axis=0)
+            counts[uniq] += np.add.reduceat(finite, starts, axis=0)
+        ds.close()
+
+    if sums is None:
+        raise ValueError("No ERA5 files given")
+
+    if geopotential_path and os.path.exists(geopotential_path):
+        with xr.open_dataset(geopotential_path) as geo:
+            geo = geo.isel(latitude=slice(None, None, stride), longitude=slice(None, None, stride))
+            geo = geo.sortby('latitude').sortby('longitude')
+            if len(geo['latitude']) != len(lats) or len(geo['longitude']) != len(lons):
+                raise ValueError(f"{geopotential_path} is on a different grid than {era5_paths[0]}")
+            orography = _orography(geo, _time_dim(geo))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        met = sums / counts
+        cell_mean = sums.sum(axis=0) / counts.sum(axis=0)
+    covered = counts[..., 0].sum(axis=(1, 2)) > 0
+    if not covered.any():
+        raise ValueError("ERA5 input contains no finite values")
+    met = np.where(np.isnan(met) & covered[:, None, None, None], cell_mean, met)
+
+    met = met.reshape(n_doy, n_hour, len(lats), len(lons), len(VARIABLES))
+    covered = covered.reshape(n_doy, n_hour)
+    doy_has_data = covered.any(axis=1)
+    for d in np.flatnonzero(doy_has_data):
+        _fill_cyclic(met[d], covered[d], axis=0)
+    _fill_cyclic(met, doy_has_data, axis=0)
+
+    grid = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                     shape=(len(lats), len(lons), n_doy, n_hour, len(VARIABLES)))
+    grid[:] = met.transpose(2, 3, 0, 1, 4)
+    grid.flush()
+    del grid
+    if orography is not None:
+        np.save(orography_path(out_path), orography.astype(np.float32))
+
+    dlat = float(lats[1] - lats[0]) if len(lats) > 1 else 1.0
+    dlon = float(lons[1] - lons[0]) if len(lons) > 1 else 1.0
+    meta = {
+        'lat0': float(lats[0]), 'dlat': dlat, 'n_lat': int(len(lats)),
+        'lon0': float(lons[0]), 'dlon': dlon, 'n_lon': int(len(lons)),
+        'lon_cyclic': bool(abs(dlon * len(lons) - 360.0) < 1e-6),
+        'n_doy': n_doy, 'n_hour': n_hour,
+        'variables': list(VARIABLES),
+        'orography': orography is not None,
+        'covered_bins': int(covered.sum()),
+        'sources': [os.path.basename(p) for p in era5_paths],
+    }
+    with open(meta_path(out_path), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Met grid {grid_shape_str(meta)} written to {out_path} "
+          f"({covered.sum()}/{n_doy * n_hour} time bins from data)")
+    return out_path
+
+
+class MetGrid:
+    def __init__(self, path):
+        with open(meta_path(path)) as f:
+            self.meta = json.load(f)
+        self.grid = np.load(path, mmap_mode='r')
+        self.orography = np.load(orography_path(path), mmap_mode='r') if self.meta.get('orography') else None
+
+    def covers(self, lat, lon):
+        """True where (lat, lon) falls inside the grid (always, for global grids)"""
+        m = self.meta
+        lat = np.asarray(lat, dtype=np.float64)
+        inside = (lat >= m['lat0'] - m['dlat'] / 2) & (lat <= m['lat0'] + (m['n_lat'] - 0.5) * m['dlat'])
+        if not m['lon_cyclic']:
+            x = np.mod(np.asarray(lon, dtype=np.float64) - m['lon0'] + 180.0, 360.0) - 180.0
+            inside &= (x >= -m['dlon'] / 2) & (x <= (m['n_lon'] - 0.5) * m['dlon'])
+        return inside
+
+    def lookup(self, lat, lon, epoch, elev=None):
+        """
+        (temperature °C, pressure hPa, humidity %) arrays of the nearest cell and
+        time bin for epoch seconds; reduced to elev (m) when the grid has orography.
+        """
+        m = self.meta
+        lat, lon, epoch = np.broadcast_arrays(np.asarray(lat, dtype=np.float64),
+                                              np.asarray(lon, dtype=np.float64),
+                                              np.asarray(epoch, dtype=np.int64))
+        lat, lon, epoch = lat.ravel(), lon.ravel(), epoch.ravel()
+        doy, hour = _doy_hour(epoch.astype('datetime64[s]'))
+
+        i = np.clip(np.rint((lat - m['lat0']) / m['dlat']).astype(np.intp), 0, m['n_lat'] - 1)
+        if m['lon_cyclic']:
+            j = np.rint(np.mod(lon - m['lon0'], 360.0) / m['dlon']).astype(np.intp) % m['n_lon']
+        else:
+            j = np.clip(np.rint((np.mod(lon - m['lon0'] + 180.0, 360.0) - 180.0) / m['dlon']).astype(np.intp),
+                        0, m['n_lon'] - 1)
+        d = np.minimum((doy / YEAR_DAYS * m['n_doy']).astype(np.intp), m['n_doy'] - 1)
+        h = np.minimum((hour / 24.0 * m['n_hour']).astype(np.intp), m['n_hour'] - 1)
+
+        values = np.asarray(self.grid[i, j, d, h], dtype=np.float64)
+        temperature, pressure, humidity = values[:, 0], values[:, 1], values[:, 2]
+        if elev is not None and self.orography is not None:
+            dh = np.broadcast_to(np.asarray(elev, dtype=np.float64), lat.shape) - self.orography[i, j]
+            pressure = hypsometric_pressure(pressure, temperature + KELVIN, dh)
+            temperature = lapse_rate_temperature(temperature, dh)
+        return temperature, pressure, humidity
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ERA5 surface meteorology climatology grid")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="reduce ERA5 files to a T/P/RH grid")
+    build.add_argument('era5', nargs='+')
+    build.add_argument('--out', required=True)
+    build.add_argument('--doy-step', type=int, default=DOY_STEP)
+    build.add_argument('--hour-step', type=int, default=HOUR_STEP)
+    build.add_argument('--stride', type=int, default=1)
+    build.add_argument('--geopotential', default=None, help="ERA5 geopotential file for the orography")
+
+    lookup = sub.add_parser('lookup', help="look up T, P and RH at a point")
+    lookup.add_argument('grid')
+    lookup.add_argument('--lat', type=float, required=True)
+    lookup.add_argument('--lon', type=float, required=True)
+    lookup.add_argument('--time', required=True)
+    lookup.add_argument('--elev', type=float, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_met_grid(args.era5, args.out, doy_step=args.doy_step, hour_step=args.hour_step,
+                       stride=args.stride, geopotential_path=args.geopotential)
+    else:
+        epoch = np.datetime64(args.time, 's').astype(np.int64)
+        t, p, rh = MetGrid(args.grid).lookup(args.lat, args.lon, epoch, args.elev)
+        print(f"T = {t[0]:.1f} °C, P = {p[0]:.1f} hPa, RH = {rh[0]:.0f} %")
@@ -0,0 +1,171 @@
+"""
+physics.py - Vectorized atmospheric physics kernels shared by the builder,
+the trainers and the prediction server
+
+Every kernel broadcasts over numpy arrays (or scalars) and keeps the input
+precision: float32 inputs are computed in float32, anything else in float64.
+Pass dtype=np.float32 to force single precision.
+
+Kernels:
+    zhd_saastamoinen           zenith hydrostatic delay (m) from surface pressure
+    zwd_from_ztd               zenith wet delay = ZTD - Saastamoinen ZHD
+    saturation_vapor_pressure  Tetens saturation vapor pressure (hPa)
+    vapor_pressure             partial vapor pressure (hPa) from T and RH
+    rh_from_dewpoint           Magnus relative humidity (%) from T and dewpoint
+    dewpoint_from_rh           inverse Magnus dewpoint (°C) from T and RH
+    weighted_mean_temperature  Bevis Tm (K) from surface temperature
+    pi_factor                  dimensionless ZWD -> PW factor for a given Tm
+    pw_from_zwd                PW = Π(Tm) * ZWD
+    pw_from_zwd_linear         PW = (0.15 + 0.0005 * T) * ZWD, the linearized Π
+    lapse_rate_temperature     temperature moved up by dh metres along the standard lapse rate
+    hypsometric_pressure       pressure moved up by dh metres through a layer of mean temperature
+
+Optional JIT: when numba is installed, kernels can run as compiled ufuncs.
+Compilation is lazy (first call per kernel) and cached on disk, so importing
+this module stays cheap for the per-request prediction processes. Enable it
+per call with jit=True or globally with ZVC_PHYSICS_JIT=1.
+"""
+
+import functools
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+JIT_AVAILABLE = numba is not None
+USE_JIT = JIT_AVAILABLE and os.environ.get('ZVC_PHYSICS_JIT', '0') == '1'
+
+# Refractivity constants (Bevis et al. 1994), in SI units (Pa)
+K2_PRIME = 0.221        # K/Pa   (22.1 K/hPa)
+K3 = 3739.0             # K^2/Pa (3.739e5 K^2/hPa)
+R_V = 461.5             # J/(kg K), specific gas constant of water vapor
+RHO_W = 1000.0          # kg/m^3, density of liquid water
+
+# Tetens saturation vapor pressure
+TETENS_A = 7.5
+TETENS_B = 237.3
+
+# Magnus relative humidity / dewpoint
+MAGNUS_A = 17.27
+MAGNUS_B = 237.7
+
+KELVIN = 273.15
+
+# Hypsometric reduction
+G = 9.80665             # m/s^2
+R_D = 287.05            # J/(kg K), specific gas constant of dry air
+LAPSE_RATE = 0.0065     # K/m, standard atmosphere
+
+_compiled = {}
+
+
+def _compile(func, nargs):
+    """Lazily build a numba ufunc for a kernel (float32 and float64 loops)"""
+    if func.__name__ not in _compiled:
+        signatures = [f"{t}({', '.join([t] * nargs)})" for t in ('float32', 'float64')]
+        _compiled[func.__name__] = numba.vectorize(signatures, cache=True)(func)
+    return _compiled[func.__name__]
+
+
+def _kernel(func):
+    """
+    Wrap an element-wise formula as a broadcasting kernel.
+
+    The formula is written once with numpy functions so the same code runs
+    on arrays (numpy path) and on scalars inside a numba ufunc (JIT path).
+    """
+    nargs = func.__code__.co_argcount
+
+    @functools.wraps(func)
+    def wrapper(*args, dtype=None, jit=None):
+        if dtype is None:
+            # Python scalars do not upcast float32 arrays; all-scalar calls use float64
+            arrays = [a for a in args if not isinstance(a, (int, float))]
+            single = arrays and np.result_type(*arrays, np.float32) == np.float32
+            dtype = np.float32 if single else np.float64
+        args = [np.asarray(a, dtype=dtype) for a in args]
+
+        if (USE_JIT if jit is None else jit) and JIT_AVAILABLE:
+            result = _compile(func, nargs)(*args)
+        else:
+            result = func(*args)
+        # 0-d results come back as numpy scalars
+        return result[()] if np.ndim(result) == 0 else result
+
+    wrapper.py_func = func
+    return wrapper
+
+
+@_kernel
+def zhd_saastamoinen(pressure_hpa, lat_deg, elev_m):
+    return 0.0022768 * pressure_hpa / (
+        1 - 0.00266 * np.cos(2 * np.radians(lat_deg)) - 0.00028 * (elev_m / 1000.0))
+
+
+@_kernel
+def zwd_from_ztd(ztd, pressure_hpa, lat_deg, elev_m):
+    return ztd - 0.0022768 * pressure_hpa / (
+        1 - 0.00266 * np.cos(2 * np.radians(lat_deg)) - 0.00028 * (elev_m / 1000.0))
+
+
+@_kernel
+def saturation_vapor_pressure(t_c):
+    return 6.1078 * 10 ** (TETENS_A * t_c / (t_c + TETENS_B))
+
+
+@_kernel
+def vapor_pressure(t_c, rh):
+    return 6.1078 * 10 ** (TETENS_A * t_c / (t_c + TETENS_B)) * (rh / 100)
+
+
+@_kernel
+def rh_from_dewpoint(t_c, td_c):
+    # A dewpoint above the air temperature is treated as saturation
+    td_c = np.minimum(td_c, t_c)
+    return 100 * np.exp(MAGNUS_A * td_c / (MAGNUS_B + td_c) - MAGNUS_A * t_c / (MAGNUS_B + t_c))
+
+
+@_kernel
+def dewpoint_from_rh(t_c, rh):
+    gamma = np.log(rh / 100) + MAGNUS_A * t_c / (MAGNUS_B + t_c)
+    return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+@_kernel
+def weighted_mean_temperature(t_c):
+    return 70.2 + 0.72 * (t_c + KELVIN)
+
+
+@_kernel
+def pi_factor(tm_k):
+    return 1e6 / (RHO_W * R_V * (K3 / tm_k + K2_PRIME))
+
+
+@_kernel
+def pw_from_zwd(zwd, tm_k):
+    return zwd * 1e6 / (RHO_W * R_V * (K3 / tm_k + K2_PRIME))
+
+
+@_kernel
+def pw_from_zwd_linear(zwd, t_c):
+    return (0.15 + 0.0005 * t_c) * zwd
+
+
+def pw_from_surface_temperature(zwd, t_c, dtype=None, jit=None):
+    """PW from ZWD using the Bevis Tm derived from surface temperature"""
+    return pw_from_zwd(zwd, weighted_mean_temperature(t_c, dtype=dtype, jit=jit), dtype=dtype, jit=jit)
+
+
+@_kernel
+def lapse_rate_temperature(t, dh_m):
+    return t - LAPSE_RATE * dh_m
+
+
+@_kernel
+def hypsometric_pressure(p, t_k, dh_m):
+    # t_k is the temperature at the lower level; the layer mean is taken halfway up
+    return p * np.exp(-G * dh_m / (R_D * (t_k - 0.5 * LAPSE_RATE * dh_m)))
@@ -2,7 +2,7 @@
 
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split, TimeSeriesSplit, cross_val_score
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import mean_squared_error, mean_absolute_error
@@ -18,24 +18,80 @@ from folium.plugins import HeatMap
 from scipy.interpolate import griddata, Rbf
 import warnings
 import os
+import sys
+
+from threadpoolctl import threadpool_limits
+
+from training_backends import make_regressor, fit_regressor, as_float32
+from gnss_store import load_frame, LEGACY_DTYPES
+from spacetime_kriging import SpaceTimeKriging, epoch_seconds
+from imputation import fill_group_means, impute
 
 warnings.filterwarnings('ignore')
 
+# Raw columns needed by preprocess_data/create_features; memory-lean loading reads only these
+TRAINING_COLUMNS = [
+    'Station ID', 'Date (ISO Format)', 'ZWD Observation', 'Temperature (°C)',
+    'Pressure (hPa)', 'Humidity (%)', 'Satellite Azimuth', 'Satellite Elevation'
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (NaN where unsupported)"""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
 class EnhancedGNSSPWModel:
-    def __init__(self):
+    def __init__(self, backend='gbr', n_jobs=None, early_stopping_rounds=None, cv_folds=3,
+                 memory_lean=False):
+        # backend: one of training_backends.BACKENDS ('gbr', 'hist', 'xgboost', 'lightgbm')
+        # n_jobs: thread cap for training and parallel cross-validation (None = all cores)
+        # early_stopping_rounds: stop boosting when the time-based holdout stops improving
+        # cv_folds: cross-validation folds run before the final fit (0 disables)
+        # memory_lean: load only TRAINING_COLUMNS with compact dtypes, categorical Station ID,
+        #   float32 features, and preprocess the loaded frame in place
+        self.backend = backend
+        self.n_jobs = n_jobs
+        self.early_stopping_rounds = early_stopping_rounds
+        self.cv_folds = cv_folds
+        self.memory_lean = memory_lean
+        self.float_dtype = np.float32 if memory_lean else np.float64
         self.model = None
         self.spatial_model = None
         self.scaler = StandardScaler()
         self.station_encoder = LabelEncoder()
         self.feature_columns = None
         self.station_locations = None
-        
-    def load_data(self, file_paths, station_locations_file=None):
-        """Load and combine multiple GNSS datasets with station locations"""
+        self.imputation_means = None
+        
+    def load_data(self, file_paths, station_locations_file=None, columns=None,
+                  stations=None, start=None, end=None):
+        """
+        Load and combine multiple GNSS datasets with station locations.
+
+        Each path may be a legacy CSV or a partitioned store directory written by
+        gnss_store; for stores, the column projection and station/time filters
+        are pushed down into the Parquet scan.
+        """
+        dtypes = None
+        if self.memory_lean:
+            columns = columns or TRAINING_COLUMNS
+            dtypes = LEGACY_DTYPES
+
         dfs = []
         for f in file_paths:
             try:
-                df = pd.read_csv(f)
+                df = load_frame(f, columns=columns, stations=stations, start=start, end=end,
+                                dtypes=dtypes)
+                if self.memory_lean:
+                    # Parse timestamps per file so the ISO strings are dropped early
+                    df['Date (ISO Format)'] = pd.to_datetime(df['Date (ISO Format)'], format='ISO8601')
                 dfs.append(df)
                 print(f"Loaded {f} with {len(df)} rows")
             except FileNotFoundError:
@@ -44,8 +100,19 @@ class EnhancedGNSSPWModel:
         if not dfs:
             raise FileNotFoundError("No datasets found!")
 
+        if self.memory_lean:
+            # Share one sorted category set so concat keeps Station ID categorical
+            categories = pd.api.types.union_categoricals(
+                [df['Station ID'].astype('category') for df in dfs], sort_categories=True).categories
+            for df in dfs:
+                df['Station ID'] = df['Station ID'].astype(pd.CategoricalDtype(categories))
+
         data = pd.concat(dfs, ignore_index=True)
+        del dfs
         print(f"Combined dataset shape: {data.shape}")
+        if self.memory_lean:
+            print(f"Loaded frame memory: {data.memory_usage(deep=True).sum() / 1e6:.1f} MB, "
+                  f"peak RSS: {peak_rss_mb():.1f} MB")
         
         # Load station locations if provided
         if station_locations_file and os.path.exists(station_locations_file):
@@ -60,18 +127,29 @@ class EnhancedGNSSPWModel:
         return data
 
     def preprocess_data(self, data):
-        """Preprocess the GNSS data and create enhanced features"""
-        df = data.copy()
+        """
+        Preprocess the GNSS data and create enhanced features.
+
+        In memory-lean mode the input frame is modified in place (no defensive
+        copy), derived features are float32 and station_encoded reuses the
+        Station ID category codes.
+        """
+        lean = self.memory_lean
+        fdt = self.float_dtype
+        df = data if lean else data.copy()
         print(f"Original data shape: {df.shape}")
 
         # Convert to datetime
         df['datetime'] = pd.to_datetime(df['Date (ISO Format)'])
 
         # Sort by station and time
-        df = df.sort_values(['Station ID', 'datetime'])
+        if lean:
+            df.sort_values(['Station ID', 'datetime'], inplace=True)
+        else:
+            df = df.sort_values(['Station ID', 'datetime'])
 
         # Create PW from ZWD
-        df['PW'] = df['ZWD Observation'] * 0.16
+        df['PW'] = (df['ZWD Observation'] * 0.16).astype(fdt, copy=False)
 
         # Handle missing values
         numeric_cols = ['ZWD Observation', 'Temperature (°C)', 'Pressure (hPa)', 'Humidity (%)',
@@ -82,36 +160,33 @@ class EnhancedGNSSPWModel:
             # Convert column to numeric dtype explicitly to avoid type issues
             df[col] = pd.to_numeric(df[col], errors='coerce')
 
-            # First interpolate within each station group
-            df[col] = df.groupby('Station ID')[col].transform(
-                lambda x: x.interpolate(method='linear', limit_direction='both')
-            )
-            
-            # Then fill any remaining NaNs with station mean, and if that fails, global mean
-            station_means = df.groupby('Station ID')[col].transform(np.mean)
-            global_mean = df[col].mean()
-
-            df[col] = df[col].fillna(station_means).fillna(global_mean)
+        # Interpolate within each station group, then fill with the station mean, then the
+        # global mean (imputation.py; unified_predictor.py repeats this at serve time)
+        df[numeric_cols] = impute(df[numeric_cols], df['Station ID']).astype(fdt, copy=False)
 
         # Enhanced temporal features
         df['hour'] = df['datetime'].dt.hour
         df['day_of_year'] = df['datetime'].dt.dayofyear
         df['day_of_week'] = df['datetime'].dt.dayofweek
         df['month'] = df['datetime'].dt.month
-        df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
+        df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(np.int8 if lean else int)
         
         # Cyclical encoding for time features
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-        df['doy_sin'] = np.sin(2 * np.pi * df['day_of_year'] / 365.25)
-        df['doy_cos'] = np.cos(2 * np.pi * df['day_of_year'] / 365.25)
-        df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
-        df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
+        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24).astype(fdt, copy=False)
+        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24).astype(fdt, copy=False)
+        df['doy_sin'] = np.sin(2 * np.pi * df['day_of_year'] / 365.25).astype(fdt, copy=False)
+        df['doy_cos'] = np.cos(2 * np.pi * df['day_of_year'] / 365.25).astype(fdt, copy=False)
+        df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12).astype(fdt, copy=False)
+        df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12).astype(fdt, copy=False)
 
         # Add spatial features if station locations are available
         if self.station_locations is not None:
-            # Merge with station locations
-            df = df.merge(self.station_locations, on='Station ID', how='left')
+            if lean:
+                # Look station columns up by category code instead of a copying merge
+                self._add_station_columns(df)
+            else:
+                # Merge with station locations
+                df = df.merge(self.station_locations, on='Station ID', how='left')
 
             # Add spatial features
             if 'Latitude' in df.columns and 'Longitude' in df.columns:
@@ -120,59 +195,78 @@ class EnhancedGNSSPWModel:
                 lon_min, lon_max = df['Longitude'].min(), df['Longitude'].max()
                 
                 if lat_max > lat_min:
-                    df['norm_lat'] = (df['Latitude'] - lat_min) / (lat_max - lat_min)
+                    df['norm_lat'] = ((df['Latitude'] - lat_min) / (lat_max - lat_min)).astype(fdt, copy=False)
                 else:
-                    df['norm_lat'] = 0.5
+                    df['norm_lat'] = fdt(0.5)
                     
                 if lon_max > lon_min:
-                    df['norm_lon'] = (df['Longitude'] - lon_min) / (lon_max - lon_min)
+                    df['norm_lon'] = ((df['Longitude'] - lon_min) / (lon_max - lon_min)).astype(fdt, copy=False)
                 else:
-                    df['norm_lon'] = 0.5
+                    df['norm_lon'] = fdt(0.5)
                 
                 # Add spatial cyclical features
-                df['lon_sin'] = np.sin(2 * np.pi * df['norm_lon'])
-                df['lon_cos'] = np.cos(2 * np.pi * df['norm_lon'])
-                df['lat_sin'] = np.sin(2 * np.pi * df['norm_lat'])
-                df['lat_cos'] = np.cos(2 * np.pi * df['norm_lat'])
+                df['lon_sin'] = np.sin(2 * np.pi * df['norm_lon']).astype(fdt, copy=False)
+                df['lon_cos'] = np.cos(2 * np.pi * df['norm_lon']).astype(fdt, copy=False)
+                df['lat_sin'] = np.sin(2 * np.pi * df['norm_lat']).astype(fdt, copy=False)
+                df['lat_cos'] = np.cos(2 * np.pi * df['norm_lat']).astype(fdt, copy=False)
 
         # Encode station IDs
-        df['station_encoded'] = self.station_encoder.fit_transform(df['Station ID'])
+        if lean:
+            # Sorted categories give the same codes LabelEncoder would assign
+            stations = df['Station ID'].astype('category').cat.remove_unused_categories()
+            if not stations.cat.categories.is_monotonic_increasing:
+                stations = stations.cat.reorder_categories(stations.cat.categories.sort_values())
+            df['Station ID'] = stations
+            self.station_encoder.classes_ = stations.cat.categories.to_numpy()
+            df['station_encoded'] = stations.cat.codes
+        else:
+            df['station_encoded'] = self.station_encoder.fit_transform(df['Station ID'])
 
         # Enhanced lag features with more sophisticated approach
-        station_groups = df.groupby('Station ID')
-        
-        for station_id, group in station_groups:
-            station_mask = df['Station ID'] == station_id
-            station_idx = df.index[station_mask]
-            
-            # Add lag features with varying windows
-            for lag in [1, 2, 3]:
-                df.loc[station_idx, f'PW_lag_{lag}'] = group['PW'].shift(lag)
-                
-            # Add rolling statistics with different windows
-            for window in [3, 6]:
-                df.loc[station_idx, f'PW_rolling_mean_{window}'] = group['PW'].rolling(
-                    window=window, min_periods=1).mean()
-                df.loc[station_idx, f'PW_rolling_std_{window}'] = group['PW'].rolling(
-                    window=window, min_periods=1).std()
-
-        # Fill NaN values in lag features
+        # (rows are already sorted by station and time, so grouped shift/rolling
+        # see each station's series in order)
+        station_pw = df.groupby('Station ID', sort=False, observed=True)['PW']
+
+        # Add lag features with varying windows
+        for lag in [1, 2, 3]:
+            df[f'PW_lag_{lag}'] = station_pw.shift(lag)
+
+        # Add rolling statistics with different windows
+        for window in [3, 6]:
+            rolling = station_pw.rolling(window=window, min_periods=1)
+            df[f'PW_rolling_mean_{window}'] = rolling.mean().droplevel(0).astype(fdt, copy=False)
+            df[f'PW_rolling_std_{window}'] = rolling.std().droplevel(0).astype(fdt, copy=False)
+
+        # Fill NaN values in lag features with station-specific mean if available,
+        # otherwise global mean
         lag_cols = [col for col in df.columns if 'lag_' in col or 'rolling_' in col]
-        for col in lag_cols:
-            if col in df.columns:
-                # Convert to numeric explicitly
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-                # Fill with station-specific mean if available, otherwise global mean
-                # station_means = df.groupby('Station ID')[col].transform(np.mean) #type: ignore
-                station_means = df.groupby('Station ID')[col].transform(np.mean).astype(float) #type: ignore
-                global_mean = df[col].mean()
-                
-                df[col] = df[col].fillna(station_means).fillna(global_mean)
+        df[lag_cols] = fill_group_means(df[lag_cols], df['Station ID'])
+
+        # Global means, the serve-time fill for columns a request has no value for at all
+        self.imputation_means = df[numeric_cols + lag_cols].mean().astype(float).to_dict()
 
         print(f"Final processed data shape: {df.shape}")
+        if lean:
+            print(f"Processed frame memory: {df.memory_usage(deep=True).sum() / 1e6:.1f} MB, "
+                  f"peak RSS: {peak_rss_mb():.1f} MB")
         return df
 
+    def _add_station_columns(self, df):
+        """Add station_locations columns to df in place, indexed by Station ID category code"""
+        locations = self.station_locations.drop_duplicates('Station ID').set_index('Station ID')
+        stations = df['Station ID'].astype('category')
+        codes = stations.cat.codes.to_numpy()
+        for col in locations.columns:
+            values = locations[col].reindex(stations.cat.categories).to_numpy()
+            if values.dtype.kind in 'iuf':
+                values = values.astype(self.float_dtype)
+                missing = values.dtype.type(np.nan)
+            else:
+                values = values.astype(object)
+                missing = None
+            # Code -1 (missing Station ID) picks the trailing missing value
+            df[col] = np.append(values, missing)[codes]
+
 
     def create_features(self, df):
         """Create feature matrix and target vector with enhanced features"""
@@ -204,7 +298,7 @@ class EnhancedGNSSPWModel:
         
         return X, y
 
-    def train_model(self, X, y, test_size=0.2, random_state=42):
+    def train_model(self, X, y, test_size=0.2, random_state=42, validation_size=0.1):
         """Train an enhanced model with better hyperparameters"""
         if len(X) == 0:
             raise ValueError("No data available for training. Check preprocessing steps.")
@@ -216,32 +310,40 @@ class EnhancedGNSSPWModel:
         X_train, X_test = X.iloc[:split_idx], X.iloc[split_idx:]
         y_train, y_test = y.iloc[:split_idx], y.iloc[split_idx:]
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Use Gradient Boosting for potentially better performance
-        self.model = GradientBoostingRegressor(
-            n_estimators=100,
-            learning_rate=0.05,
-            max_depth=6,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=random_state,
-            subsample=0.8
-        )
-        
-        # Cross-validation
-        try:
-            cv_scores = cross_val_score(self.model, X_train_scaled, y_train, 
-                                       cv=min(3, len(X_train)//2), 
-                                       scoring='neg_mean_squared_error')
-            print(f"Cross-validation MSE: {-cv_scores.mean():.4f} (±{cv_scores.std() * 2:.4f})")
-        except:
-            print("Cross-validation skipped due to small dataset")
+        # Scale features, then hand float32 matrices to the tree backends
+        X_train_scaled = as_float32(self.scaler.fit_transform(X_train))
+        X_test_scaled = as_float32(self.scaler.transform(X_test))
+        y_train = y_train.to_numpy(dtype=np.float64)
+        
+        self.model = make_regressor(self.backend, random_state=random_state, n_jobs=self.n_jobs)
+        print(f"Training backend: {self.backend}")
+        
+        # Cross-validation: folds in parallel (None = all cores, as make_regressor), under the
+        # same native thread cap as the final fit
+        if self.cv_folds:
+            try:
+                with threadpool_limits(limits=self.n_jobs):
+                    cv_scores = cross_val_score(self.model, X_train_scaled, y_train,
+                                               cv=min(self.cv_folds, len(X_train)//2),
+                                               scoring='neg_mean_squared_error',
+                                               n_jobs=self.n_jobs if self.n_jobs is not None else -1)
+                print(f"Cross-validation MSE: {-cv_scores.mean():.4f} (±{cv_scores.std() * 2:.4f})")
+            except:
+                print("Cross-validation skipped due to small dataset")
+        
+        # Early stopping uses the most recent slice of the training period as holdout,
+        # so the test period stays unseen
+        X_fit, y_fit, X_val, y_val = X_train_scaled, y_train, None, None
+        if self.early_stopping_rounds:
+            val_idx = int(len(X_train_scaled) * (1 - validation_size))
+            X_fit, X_val = X_train_scaled[:val_idx], X_train_scaled[val_idx:]
+            y_fit, y_val = y_train[:val_idx], y_train[val_idx:]
         
         # Train final model
-        self.model.fit(X_train_scaled, y_train)
+        n_rounds = fit_regressor(self.model, self.backend, X_fit, y_fit, X_val, y_val,
+                                 early_stopping_rounds=self.early_stopping_rounds,
+                                 n_jobs=self.n_jobs)
+        print(f"Boosting rounds: {n_rounds}")
         
         # Evaluate
         y_pred = self.model.predict(X_test_scaled)
@@ -253,11 +355,20 @@ class EnhancedGNSSPWModel:
         
         return self.model
 
-    def train_spatial_model(self, df):
-        """Train a spatial interpolation model using Gaussian Process"""
+    def train_spatial_model(self, df, spacetime=False, window_hours=24, time_scale_hours=6):
+        """
+        Train a spatial interpolation model using Gaussian Process.
+
+        With spacetime=True the model is an online SpaceTimeKriging over every
+        observation in the last window_hours (not just each station's latest
+        value); new epochs can then be absorbed with update_spatial_model.
+        """
         if self.station_locations is None:
             print("No station locations available for spatial model")
             return None
+
+        if spacetime:
+            return self._train_spacetime_model(df, window_hours, time_scale_hours)
             
         # Prepare spatial data - use the latest PW values for each station
         spatial_data = df.sort_values('datetime').groupby('Station ID').last().reset_index()
@@ -296,6 +407,48 @@ class EnhancedGNSSPWModel:
             print(f"Error training spatial model: {e}")
             return None
 
+    def _station_coordinates(self, station_ids):
+        """(Longitude, Latitude) rows for station IDs, NaN where the station is unknown"""
+        coords = (self.station_locations.drop_duplicates('Station ID')
+                  .assign(**{'Station ID': lambda d: d['Station ID'].astype(str)})
+                  .set_index('Station ID')[['Longitude', 'Latitude']])
+        return coords.reindex(pd.Index(station_ids).astype(str)).to_numpy(dtype=np.float64)
+
+    def _train_spacetime_model(self, df, window_hours, time_scale_hours):
+        """Fit SpaceTimeKriging on the trailing window of observations"""
+        latest = df['datetime'].max()
+        recent = df[df['datetime'] >= latest - pd.Timedelta(hours=window_hours)]
+
+        X = self._station_coordinates(recent['Station ID'])
+        y = recent['PW'].to_numpy(dtype=np.float64)
+        t = epoch_seconds(recent['datetime'])
+        valid = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+
+        if valid.sum() < 3:
+            print("Not enough observations with valid data for space-time model")
+            return None
+
+        self.spatial_model = SpaceTimeKriging(
+            length_scale=1.0,
+            time_scale=time_scale_hours * 3600.0,
+            noise_level=0.1,
+            window=window_hours * 3600.0
+        ).fit(X[valid], y[valid], t[valid])
+
+        print(f"Space-time interpolation model trained with {self.spatial_model.n} observations "
+              f"from {recent.loc[valid, 'Station ID'].nunique()} stations")
+        return self.spatial_model
+
+    def update_spatial_model(self, station_id, pw, datetime_val):
+        """Absorb one new station observation into the space-time model in O(n^2)"""
+        if not isinstance(self.spatial_model, SpaceTimeKriging):
+            raise ValueError("Incremental updates need train_spatial_model(..., spacetime=True)")
+
+        x = self._station_coordinates([station_id])[0]
+        if np.isnan(x).any():
+            raise ValueError(f"No location known for station {station_id}")
+        self.spatial_model.add(x, float(pw), epoch_seconds(datetime_val))
+
     def interpolate_pw(self, latitude, longitude, datetime_val=None):
         """Interpolate PW at any location using spatial model"""
         if self.spatial_model is None:
@@ -303,10 +456,15 @@ class EnhancedGNSSPWModel:
             
         # Prepare input for prediction
         X_pred = np.array([[longitude, latitude]], dtype=np.float64)
+
+        # The space-time model can also be queried at a specific time
+        predict_kwargs = {}
+        if datetime_val is not None and isinstance(self.spatial_model, SpaceTimeKriging):
+            predict_kwargs['t'] = epoch_seconds(datetime_val)
         
         try:
             # Predict with Gaussian Process
-            result = self.spatial_model.predict(X_pred, return_std=True)
+            result = self.spatial_model.predict(X_pred, return_std=True, **predict_kwargs)
             
             # Handle different return formats with explicit type conversion
             if isinstance(result, tuple):
@@ -367,84 +525,125 @@ class EnhancedGNSSPWModel:
             # Fallback to a default value with high uncertainty
             return 2.5, 1.0  # Default PW value with high uncertainty
 
-    def validate_with_third_party(self, third_party_data):
-        """Validate model predictions with third-party observations"""
-        errors = []
-        
-        for _, row in third_party_data.iterrows():
-            lat, lon, obs_pw, obs_time = row['Latitude'], row['Longitude'], row['PW'], row['datetime']
-            
-            # Predict PW at this location and time
-            if self.spatial_model:
-                pred_pw, uncertainty = self.interpolate_pw(lat, lon, obs_time)
-            else:
-                # Fallback if no spatial model
-                pred_pw, uncertainty = self.extrapolate_pw(lat, lon, obs_time)
-                
-            # Calculate error
-            error = abs(pred_pw - obs_pw)
-            errors.append({
-                'Latitude': lat,
-                'Longitude': lon,
-                'Observed_PW': obs_pw,
+    def interpolate_many(self, latitudes, longitudes, datetimes=None):
+        """Vectorized interpolate_pw: one spatial-model call for all points, returns (pw, std) arrays"""
+        if self.spatial_model is None:
+            raise ValueError("Spatial model not trained. Call train_spatial_model first.")
+
+        X_pred = np.column_stack([np.asarray(longitudes, dtype=np.float64),
+                                  np.asarray(latitudes, dtype=np.float64)])
+        predict_kwargs = {}
+        if datetimes is not None and isinstance(self.spatial_model, SpaceTimeKriging):
+            predict_kwargs['t'] = epoch_seconds(datetimes)
+
+        try:
+            result = self.spatial_model.predict(X_pred, return_std=True, **predict_kwargs)
+            if isinstance(result, tuple) and len(result) == 2:
+                pred, std = result
+                return np.asarray(pred, dtype=np.float64), np.asarray(std, dtype=np.float64)
+            pred = result[0] if isinstance(result, tuple) else result
+            return np.asarray(pred, dtype=np.float64), np.full(len(X_pred), 1.0 if isinstance(result, tuple) else 0.5)
+        except Exception as e:
+            print(f"Warning: Spatial interpolation failed: {e}")
+            fallback = 2.5
+            if getattr(self.spatial_model, 'y_train_', None) is not None:
+                fallback = float(np.mean(self.spatial_model.y_train_))
+            return np.full(len(X_pred), fallback), np.ones(len(X_pred))
+
+    def extrapolate_many(self, latitudes, longitudes, datetimes=None):
+        """Vectorized extrapolate_pw (regional average far from the network when uncertain)"""
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        try:
+            pred, std = self.interpolate_many(latitudes, longitudes, datetimes)
+        except Exception as e:
+            print(f"Extrapolation error: {e}")
+            return np.full(len(latitudes), 2.5), np.ones(len(latitudes))
+
+        uncertain = std > 1.0
+        if uncertain.any() and self.station_locations is not None and 'Latitude' in self.station_locations.columns:
+            station_lats = self.station_locations['Latitude'].to_numpy(np.float64)
+            station_lons = self.station_locations['Longitude'].to_numpy(np.float64)
+            idx = np.flatnonzero(uncertain)
+            min_distance = np.sqrt((latitudes[idx, None] - station_lats) ** 2 +
+                                   (longitudes[idx, None] - station_lons) ** 2).min(axis=1)
+            far = idx[min_distance > 5.0]  # degrees, approx 500 km
+            if len(far):
+                regional_avg = float(self.station_locations['PW'].mean()) if 'PW' in self.station_locations.columns else 2.5
+                pred, std = pred.copy(), std.copy()
+                pred[far] = regional_avg
+                std[far] *= 2
+        return pred, std
+
+    def validate_with_third_party(self, third_party_data, chunk_size=50_000):
+        """Validate model predictions with third-party observations (vectorized, chunk_size rows per call)"""
+        predict = self.interpolate_many if self.spatial_model else self.extrapolate_many
+        parts = []
+
+        for start in range(0, len(third_party_data), chunk_size):
+            chunk = third_party_data.iloc[start:start + chunk_size]
+            pred_pw, uncertainty = predict(chunk['Latitude'].to_numpy(), chunk['Longitude'].to_numpy(),
+                                           chunk['datetime'])
+            parts.append(pd.DataFrame({
+                'Latitude': chunk['Latitude'].to_numpy(),
+                'Longitude': chunk['Longitude'].to_numpy(),
+                'Observed_PW': chunk['PW'].to_numpy(),
                 'Predicted_PW': pred_pw,
                 'Uncertainty': uncertainty,
-                'Error': error,
-                'Datetime': obs_time
-            })
-            
-        errors_df = pd.DataFrame(errors)
+                'Error': np.abs(pred_pw - chunk['PW'].to_numpy()),
+                'Datetime': chunk['datetime'].to_numpy(),
+            }))
+
+        errors_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+            columns=['Latitude', 'Longitude', 'Observed_PW', 'Predicted_PW', 'Uncertainty', 'Error', 'Datetime'])
         avg_error = errors_df['Error'].mean()
         print(f"Average error with third-party data: {avg_error:.4f}")
-        
+
         return errors_df
 
-    def create_dashboard_data(self, bounds, resolution=0.1):
-        """Create data for dashboard visualization of interpolated PW"""
+    def validate_archive(self, reference, chunk_size=50_000):
+        """
+        Score a reference archive too large to hold per-row errors for: a
+        DataFrame, an iterable of DataFrames, or file path(s) readable by
+        validation.read_reference. Returns a validation.ValidationReport with
+        overall, per-station and per-month bias / MAE / RMSE.
+        """
+        from validation import validate, read_reference
+
+        if isinstance(reference, str) or (isinstance(reference, list) and reference and isinstance(reference[0], str)):
+            reference = read_reference(reference, chunk_size)
+        predict = self.interpolate_many if self.spatial_model else self.extrapolate_many
+        return validate(predict, reference, chunk_size)
+
+    def create_dashboard_data(self, bounds, resolution=0.1, datetime_val=None):
+        """
+        Create data for dashboard visualization of interpolated PW (one
+        vectorized predict over the whole grid). For a time series of grids
+        see pw_cube.py.
+        """
         if self.station_locations is None:
             raise ValueError("Station locations not available for dashboard")
             
         # Generate grid of points within bounds
         lats = np.arange(bounds['min_lat'], bounds['max_lat'] + resolution, resolution)
         lons = np.arange(bounds['min_lon'], bounds['max_lon'] + resolution, resolution)
-        
-        grid_data = []
-        
-        for lat in lats:
-            for lon in lons:
-                try:
-                    if self.spatial_model:
-                        pred, uncertainty = self.interpolate_pw(lat, lon)
-                        grid_data.append({
-                            'Latitude': lat,
-                            'Longitude': lon,
-                            'Predicted_PW': pred,
-                            'Uncertainty': uncertainty,
-                            'Extrapolated': False
-                        })
-                    else:
-                        # Fallback if no spatial model
-                        pred, uncertainty = self.extrapolate_pw(lat, lon)
-                        grid_data.append({
-                            'Latitude': lat,
-                            'Longitude': lon,
-                            'Predicted_PW': pred,
-                            'Uncertainty': uncertainty,
-                            'Extrapolated': True
-                        })
-                except Exception as e:
-                    print(f"Warning: Failed to interpolate at ({lat}, {lon}): {e}")
-                    # Add default values
-                    grid_data.append({
-                        'Latitude': lat,
-                        'Longitude': lon,
-                        'Predicted_PW': 2.5,
-                        'Uncertainty': 1.0,
-                        'Extrapolated': True,
-                        'Error': str(e)
-                    })
-        
-        return pd.DataFrame(grid_data)
+        lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+        lat_grid, lon_grid = lat_grid.ravel(), lon_grid.ravel()
+        datetimes = None if datetime_val is None else pd.Series(pd.Timestamp(datetime_val), index=range(len(lat_grid)))
+
+        if self.spatial_model:
+            pred, uncertainty = self.interpolate_many(lat_grid, lon_grid, datetimes)
+        else:
+            # Fallback if no spatial model
+            pred, uncertainty = self.extrapolate_many(lat_grid, lon_grid, datetimes)
+
+        return pd.DataFrame({
+            'Latitude': lat_grid,
+            'Longitude': lon_grid,
+            'Predicted_PW': pred,
+            'Uncertainty': uncertainty,
+            'Extrapolated': not self.spatial_model
+        })
 
     def save_model(self, filename="enhanced_gnss_pw_model.pkl"):
         """Save the trained model and preprocessing objects"""
@@ -457,7 +656,8 @@ class EnhancedGNSSPWModel:
             'scaler': self.scaler,
             'station_encoder': self.station_encoder,
             'feature_columns': self.feature_columns,
-            'station_locations': self.station_locations
+            'station_locations': self.station_locations,
+            'imputation_means': self.imputation_means
         }
         joblib.dump(model_data, filename)
         print(f"Model saved as {filename}")
@@ -471,6 +671,7 @@ class EnhancedGNSSPWModel:
         self.station_encoder = model_data['station_encoder']
         self.feature_columns = model_data['feature_columns']
         self.station_locations = model_data.get('station_locations')
+        self.imputation_means = model_data.get('imputation_means')
         print(f"Model loaded from {filename}")
 
 
@@ -505,8 +706,8 @@ def create_interactive_dashboard(grid_data, station_locations):
 
 
 def main():
-    # Initialize the enhanced model
-    pw_model = EnhancedGNSSPWModel()
+    # Initialize the enhanced model (histogram trees, early stopping on the time-based holdout)
+    pw_model = EnhancedGNSSPWModel(backend='hist', early_stopping_rounds=20)
     
     # Get the directory where this script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
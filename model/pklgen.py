@@ -4,6 +4,7 @@
 # LOSO validation + visualisations + 5-station demo
 # =====================================================
 
+import os
 import pickle
 import numpy as np
 import pandas as pd
@@ -12,6 +13,10 @@ from scipy.spatial.distance import cdist
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from xgboost import XGBRegressor
 
+from gnss_store import load_frame
+from physics import pw_from_zwd_linear
+from tm_grid import TM_GRID_FILE, TmGrid
+
 # =====================================================
 # GLOBAL PHYSICS SAFETY
 # =====================================================
@@ -24,47 +29,59 @@ def enforce_physical_pw(pw):
 # 1. LOAD & CLEAN DATA
 # =====================================================
 
-# df = pd.read_csv("dataset.csv")
-df = pd.read_csv("model/dataset.csv")
+# Either the legacy CSV or a partitioned store converted with gnss_store.py;
+# only the columns used below are loaded
+DATASET_PATH = "model/dataset.csv"
+# Tm climatology grid (tm_grid.TM_GRID_FILE, written by the dataset builder);
+# without it PW uses the linear Π(T) fit
+DATASET_COLUMNS = [
+    "Station ID", "Date (ISO Format)", "Station Latitude", "Station Longitude",
+    "ZWD Observation", "Temperature (°C)", "Pressure (hPa)", "Humidity (%)"
+]
+
+def load_clean_data(path=DATASET_PATH):
+    """Load the dataset and keep physically plausible rows"""
+    # df = pd.read_csv("dataset.csv")
+    df = load_frame(path, columns=DATASET_COLUMNS)
 
-df["Date (ISO Format)"] = pd.to_datetime(df["Date (ISO Format)"])
-df["Hour"] = df["Date (ISO Format)"].dt.hour # type: ignore
-df["doy"]  = df["Date (ISO Format)"].dt.dayofyear # type: ignore
+    df["Date (ISO Format)"] = pd.to_datetime(df["Date (ISO Format)"])
+    df["Hour"] = df["Date (ISO Format)"].dt.hour # type: ignore
+    df["doy"]  = df["Date (ISO Format)"].dt.dayofyear # type: ignore
 
-# Physical sanity checks
-df = df[
-    (df["ZWD Observation"] > 0) &
-    (df["Temperature (°C)"].between(-50, 60)) &
-    (df["Pressure (hPa)"].between(800, 1100)) &
-    (df["Humidity (%)"].between(0, 100))
-].dropna()
+    # Physical sanity checks
+    return df[
+        (df["ZWD Observation"] > 0) &
+        (df["Temperature (°C)"].between(-50, 60)) &
+        (df["Pressure (hPa)"].between(800, 1100)) &
+        (df["Humidity (%)"].between(0, 100))
+    ].dropna()
 
 # =====================================================
 # 2. PHYSICS: ZWD → PW (Bevis et al.)
 # IMPORTANT: ZWD IS IN METERS → CONVERT TO mm
 # =====================================================
 
-df["ZWD_mm"] = df["ZWD Observation"] * 1000.0  # meters → millimeters
-
-df["PW_physics_mm"] = (
-    (0.15 + 0.0005 * df["Temperature (°C)"]) *
-    df["ZWD_mm"]
-)
-
-df["PW_physics_mm"] = enforce_physical_pw(df["PW_physics_mm"])
+def add_physics_pw(df, tm_grid_path=TM_GRID_FILE):
+    """Add ZWD_mm and PW_physics_mm columns"""
+    df["ZWD_mm"] = df["ZWD Observation"] * 1000.0  # meters → millimeters
 
-# ---- Sanity check (DO NOT REMOVE) ----
-print("\nPW statistics after physics conversion:")
-print(df["PW_physics_mm"].describe())
+    if tm_grid_path and os.path.exists(tm_grid_path):
+        df["PW_physics_mm"] = TmGrid(tm_grid_path).pw_from_zwd(
+            df["ZWD_mm"].to_numpy(), df["Station Latitude"].to_numpy(),
+            df["Station Longitude"].to_numpy(), df["Date (ISO Format)"].to_numpy()
+        )
+    else:
+        # Linearized Π(T) ≈ 0.15 + 0.0005 * T
+        df["PW_physics_mm"] = pw_from_zwd_linear(df["ZWD_mm"], df["Temperature (°C)"])
 
-assert df["PW_physics_mm"].mean() > 5, \
-    "PW too small → ZWD unit error (meters vs mm)"
+    df["PW_physics_mm"] = enforce_physical_pw(df["PW_physics_mm"])
+    return df
 
 # =====================================================
 # 3. SIMPLE FEATURE SET (LOW COMPLEXITY)
 # =====================================================
 
-features = [
+FEATURES = [
     "Temperature (°C)",
     "Pressure (hPa)",
     "Humidity (%)"
@@ -85,106 +102,106 @@ def idw(train_xy, train_val, test_xy):
 # 5. LOSO VALIDATION
 # =====================================================
 
-stations = df["Station ID"].unique()
-
-rmse_phy, mae_phy, r2_phy = [], [], []
-rmse_idw, mae_idw, r2_idw = [], [], []
-rmse_ml,  mae_ml,  r2_ml  = [], [], []
-
-for st in stations:
-
-    train = df[df["Station ID"] != st]
-    test  = df[df["Station ID"] == st]
-    if len(test) == 0:
-        continue
+def loso_validation(df, features=FEATURES, model_path="physics_informed_xgb.pkl"):
+    """
+    Leave-one-station-out comparison of the physics, IDW and residual-XGBoost
+    models. Returns the mean-metric comparison table; each fold's model is
+    pickled to model_path (None skips saving).
+    """
+    stations = df["Station ID"].unique()
 
-    y_true = test["PW_physics_mm"].values
+    rmse_phy, mae_phy, r2_phy = [], [], []
+    rmse_idw, mae_idw, r2_idw = [], [], []
+    rmse_ml,  mae_ml,  r2_ml  = [], [], []
 
-    # ----- Physics-only baseline -----
-    phy_pred = np.full(len(test), train["PW_physics_mm"].mean())
-    phy_pred = enforce_physical_pw(phy_pred)
+    for st in stations:
 
-    rmse_phy.append(np.sqrt(mean_squared_error(y_true, phy_pred)))
-    mae_phy.append(mean_absolute_error(y_true, phy_pred))
-    r2_phy.append(max(r2_score(y_true, phy_pred), 0))
+        train = df[df["Station ID"] != st]
+        test  = df[df["Station ID"] == st]
+        if len(test) == 0:
+            continue
 
-    # ----- Spatial IDW baseline -----
-    idw_pred = idw(
-        train[["Station Longitude", "Station Latitude"]],
-        train["PW_physics_mm"],
-        test[["Station Longitude", "Station Latitude"]]
-    )
-    idw_pred = enforce_physical_pw(idw_pred)
+        y_true = test["PW_physics_mm"].values
 
-    rmse_idw.append(np.sqrt(mean_squared_error(y_true, idw_pred)))
-    mae_idw.append(mean_absolute_error(y_true, idw_pred))
-    r2_idw.append(max(r2_score(y_true, idw_pred), 0))
+        # ----- Physics-only baseline -----
+        phy_pred = np.full(len(test), train["PW_physics_mm"].mean())
+        phy_pred = enforce_physical_pw(phy_pred)
 
-    # ----- Physics-Informed ML (residual learning) -----
-    baseline = train["PW_physics_mm"].mean()
-    train = train.copy()
-    train["residual"] = train["PW_physics_mm"] - baseline
+        rmse_phy.append(np.sqrt(mean_squared_error(y_true, phy_pred)))
+        mae_phy.append(mean_absolute_error(y_true, phy_pred))
+        r2_phy.append(max(r2_score(y_true, phy_pred), 0))
 
-    model = XGBRegressor(
-        n_estimators=100,
-        max_depth=3,
-        learning_rate=0.1,
-        objective="reg:squarederror",
-        random_state=42
-    )
-
-    model.fit(train[features], train["residual"])
-
-    ml_pred = test["PW_physics_mm"].values + model.predict(test[features])
-    ml_pred = enforce_physical_pw(ml_pred)
-
-    rmse_ml.append(np.sqrt(mean_squared_error(y_true, ml_pred)))
-    mae_ml.append(mean_absolute_error(y_true, ml_pred))
-    r2_ml.append(max(r2_score(y_true, ml_pred), 0))
+        # ----- Spatial IDW baseline -----
+        idw_pred = idw(
+            train[["Station Longitude", "Station Latitude"]],
+            train["PW_physics_mm"],
+            test[["Station Longitude", "Station Latitude"]]
+        )
+        idw_pred = enforce_physical_pw(idw_pred)
+
+        rmse_idw.append(np.sqrt(mean_squared_error(y_true, idw_pred)))
+        mae_idw.append(mean_absolute_error(y_true, idw_pred))
+        r2_idw.append(max(r2_score(y_true, idw_pred), 0))
+
+        # ----- Physics-Informed ML (residual learning) -----
+        baseline = train["PW_physics_mm"].mean()
+        train = train.copy()
+        train["residual"] = train["PW_physics_mm"] - baseline
+
+        model = XGBRegressor(
+            n_estimators=100,
+            max_depth=3,
+            learning_rate=0.1,
+            objective="reg:squarederror",
+            random_state=42
+        )
 
-    with open("physics_informed_xgb.pkl", "wb") as f:
-        pickle.dump(model, f)
+        model.fit(train[features], train["residual"])
+        model.pw_baseline_ = float(baseline)  # PW = baseline + prediction (backend ingest.py)
 
-    
+        ml_pred = test["PW_physics_mm"].values + model.predict(test[features])
+        ml_pred = enforce_physical_pw(ml_pred)
 
-# =====================================================
-# 6. FINAL COMPARISON TABLE
-# =====================================================
+        rmse_ml.append(np.sqrt(mean_squared_error(y_true, ml_pred)))
+        mae_ml.append(mean_absolute_error(y_true, ml_pred))
+        r2_ml.append(max(r2_score(y_true, ml_pred), 0))
 
-comparison = pd.DataFrame({
-    "Model": ["Physics-Only", "Spatial IDW", "Physics-Informed ML"],
-    "RMSE (mm)": [np.mean(rmse_phy), np.mean(rmse_idw), np.mean(rmse_ml)],
-    "MAE (mm)":  [np.mean(mae_phy),  np.mean(mae_idw),  np.mean(mae_ml)],
-    "R²":        [np.mean(r2_phy),   np.mean(r2_idw),   np.mean(r2_ml)]
-})
+        if model_path:
+            with open(model_path, "wb") as f:
+                pickle.dump(model, f)
 
-print("\n=== FINAL MODEL COMPARISON (LOSO) ===")
-print(comparison.to_string(index=False))
+    return pd.DataFrame({
+        "Model": ["Physics-Only", "Spatial IDW", "Physics-Informed ML"],
+        "RMSE (mm)": [np.mean(rmse_phy), np.mean(rmse_idw), np.mean(rmse_ml)],
+        "MAE (mm)":  [np.mean(mae_phy),  np.mean(mae_idw),  np.mean(mae_ml)],
+        "R²":        [np.mean(r2_phy),   np.mean(r2_idw),   np.mean(r2_ml)]
+    })
 
 # =====================================================
-# 7. VISUALISATIONS
+# 6. VISUALISATIONS
 # =====================================================
 
-fig, axes = plt.subplots(1, 3, figsize=(15, 4))
+def plot_comparison(comparison, path="pw_model_comparison.png"):
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4))
 
-axes[0].bar(comparison["Model"], comparison["RMSE (mm)"])
-axes[0].set_title("RMSE Comparison")
-axes[0].set_ylabel("RMSE (mm)")
+    axes[0].bar(comparison["Model"], comparison["RMSE (mm)"])
+    axes[0].set_title("RMSE Comparison")
+    axes[0].set_ylabel("RMSE (mm)")
 
-axes[1].bar(comparison["Model"], comparison["MAE (mm)"])
-axes[1].set_title("MAE Comparison")
-axes[1].set_ylabel("MAE (mm)")
+    axes[1].bar(comparison["Model"], comparison["MAE (mm)"])
+    axes[1].set_title("MAE Comparison")
+    axes[1].set_ylabel("MAE (mm)")
 
-axes[2].bar(comparison["Model"], comparison["R²"])
-axes[2].set_ylim(0, 1)
-axes[2].set_title("R² Comparison")
+    axes[2].bar(comparison["Model"], comparison["R²"])
+    axes[2].set_ylim(0, 1)
+    axes[2].set_title("R² Comparison")
 
-plt.tight_layout()
-plt.savefig("pw_model_comparison.png", dpi=300)
-plt.show()
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.show()
 
 # =====================================================
-# 8. FIVE-STATION INTERPOLATION DEMO (VIVA)
+# 7. FIVE-STATION INTERPOLATION DEMO (VIVA)
 # =====================================================
 
 def five_station_interpolation_demo(df, target_station_id):
@@ -222,32 +239,56 @@ def five_station_interpolation_demo(df, target_station_id):
     print("\nInterpolated PW:", f"{interpolated_pw:.3f} mm")
     print("Absolute Error :", f"{abs(interpolated_pw - target['PW_physics_mm']):.3f} mm")
 
-# Run demo
-example_station = df["Station ID"].iloc[0]
-five_station_interpolation_demo(df, example_station)
+# =====================================================
+# 8. TRAIN FINAL DEPLOYMENT MODEL (ALL DATA)
+# =====================================================
 
+def train_final_model(df, features=FEATURES):
+    """Residual XGBoost on the full dataset"""
+    # Physics baseline
+    baseline_full = df["PW_physics_mm"].mean()
 
+    # Residual learning
+    df["residual"] = df["PW_physics_mm"] - baseline_full
 
-# =====================================================
-# 9. TRAIN FINAL DEPLOYMENT MODEL (ALL DATA)
-# =====================================================
+    final_model = XGBRegressor(
+        n_estimators=150,
+        max_depth=3,
+        learning_rate=0.08,
+        objective="reg:squarederror",
+        random_state=42
+    )
+
+    final_model.fit(df[features], df["residual"])
+    final_model.pw_baseline_ = float(baseline_full)
+    return final_model
+
+
+def main():
+    df = add_physics_pw(load_clean_data(DATASET_PATH))
+
+    # ---- Sanity check (DO NOT REMOVE) ----
+    print("\nPW statistics after physics conversion:")
+    print(df["PW_physics_mm"].describe())
+
+    assert df["PW_physics_mm"].mean() > 5, \
+        "PW too small → ZWD unit error (meters vs mm)"
+
+    comparison = loso_validation(df)
 
-print("\nTraining FINAL deployment model on full dataset...")
+    print("\n=== FINAL MODEL COMPARISON (LOSO) ===")
+    print(comparison.to_string(index=False))
 
-# Physics baseline
-baseline_full = df["PW_physics_mm"].mean()
+    plot_comparison(comparison)
 
-# Residual learning
-df["residual"] = df["PW_physics_mm"] - baseline_full
+    # Run demo
+    example_station = df["Station ID"].iloc[0]
+    five_station_interpolation_demo(df, example_station)
 
-final_model = XGBRegressor(
-    n_estimators=150,
-    max_depth=3,
-    learning_rate=0.08,
-    objective="reg:squarederror",
-    random_state=42
-)
+    print("\nTraining FINAL deployment model on full dataset...")
+    train_final_model(df)
+    print("Final model trained.")
 
-final_model.fit(df[features], df["residual"])
 
-print("Final model trained.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+pw_cube.py - Chunked, compressed PW time-cube for time-slider maps
+
+create_dashboard_data renders one static grid. For a time slider the
+dashboard needs a map per time step, so this renders successive grids once
+and appends them to a Zarr (v2) store that the frontend, xarray or any zarr
+client can read chunk by chunk:
+
+    <root>/time            int64 seconds since 1970-01-01
+    <root>/lat, lon        grid axes
+    <root>/pw              float32 [time, lat, lon], chunks (1, lat, lon)      one map per chunk: scrubbing
+    <root>/uncertainty     float32 [time, lat, lon], chunks (1, lat, lon)
+    <root>/pw_history      float32 [time, lat, lon], chunks (168, 16, 16)     a tile's week: point history
+
+Chunks are zlib-compressed (the standard Zarr "zlib" codec) and written
+directly, so no zarr package is needed to build or serve the cube. Reading a
+frame decompresses one chunk; a point's history reads one tile column.
+
+New steps are appended incrementally (update renders only the steps after
+the last one stored); data chunks are written before the time axis grows,
+so readers never see a time step without its map.
+
+Each step is one vectorized spatial-model call per CHUNK_SIZE grid points;
+a SpaceTimeKriging is evaluated at the step's time, any other model gives the
+same map at every step and is rendered once per update.
+
+Usage:
+    python pw_cube.py create pw_cube.zarr --bounds 5 40 65 100 --resolution 0.2
+    python pw_cube.py update pw_cube.zarr --model enhanced_gnss_pw_model_fixed.pkl --start 2025-09-01 --end 2025-09-08
+    python pw_cube.py frame pw_cube.zarr --time 2025-09-03T12:00
+    python pw_cube.py history pw_cube.zarr --lat 28.6 --lon 77.2
+    python pw_cube.py info pw_cube.zarr
+"""
+
+import argparse
+import itertools
+import json
+import os
+import zlib
+
+import numpy as np
+
+CHUNK_SIZE = 16384            # grid points per predict call
+HISTORY_TIME_CHUNK = 168      # time steps per point-history chunk (a week of hourly maps)
+HISTORY_TILE = 16             # lat/lon cells per point-history chunk
+TIME_CHUNK = 4096             # entries per chunk of the time axis
+COMPRESSION_LEVEL = 5
+QUANTIZE_DIGITS = 4           # maps keep 1e-4 precision (as served), which lets zlib compress them
+APPEND_BATCH = 24             # steps rendered before each write
+TIME_UNITS = 'seconds since 1970-01-01'
+
+
+# ----------------------------------------------------------------------
+# Minimal Zarr v2 array
+# ----------------------------------------------------------------------
+
+def _write_json(path, obj):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+
+class ZarrArray:
+    """A Zarr v2 array directory with zlib-compressed C-order chunks"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, '.zarray')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, '.zattrs')) as f:
+            self.attrs = json.load(f)
+        self.shape = tuple(self.meta['shape'])
+        self.chunks = tuple(self.meta['chunks'])
+        self.dtype = np.dtype(self.meta['dtype'])
+        fill = self.meta['fill_value']
+        self.fill_value = np.nan if fill == 'NaN' else (0 if fill is None else fill)
+
+    @classmethod
+    def create(cls, path, shape, chunks, dtype, dims, attrs=None, quantize=None):
+        dtype = np.dtype(dtype)
+        # numcodecs' Quantize filter: lossy on write, a no-op for readers
+        filters = [{'id': 'quantize', 'digits': quantize, 'dtype': dtype.str, 'astype': dtype.str}] if quantize else None
+        os.makedirs(path, exist_ok=True)
+        _write_json(os.path.join(path, '.zarray'), {
+            'zarr_format': 2,
+            'shape': list(shape),
+            'chunks': list(chunks),
+            'dtype': dtype.str,
+            'compressor': {'id': 'zlib', 'level': COMPRESSION_LEVEL},
+            'fill_value': 'NaN' if dtype.kind == 'f' else 0,
+            'filters': filters,
+            'order': 'C',
+            'dimension_separator': '.',
+        })
+        # _ARRAY_DIMENSIONS names the axes for xarray.open_zarr
+        _write_json(os.path.join(path, '.zattrs'), {'_ARRAY_DIMENSIONS': list(dims), **(attrs or {})})
+        return cls(path)
+
+    def resize(self, shape):
+        self.meta['shape'] = list(shape)
+        self.shape = tuple(shape)
+        _write_json(os.path.join(self.path, '.zarray'), self.meta)
+
+    def _chunk_path(self, index):
+        return os.path.join(self.path, '.'.join(str(i) for i in index))
+
+    def read_chunk(self, index):
+        try:
+            with open(self._chunk_path(index), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return np.full(self.chunks, self.fill_value, dtype=self.dtype)
+        return np.frombuffer(raw, dtype=self.dtype).reshape(self.chunks).copy()
+
+    def write_chunk(self, index, data):
+        path = self._chunk_path(index)
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        for spec in self.meta['filters'] or []:
+            if spec['id'] == 'quantize':
+                # Round to the fewest binary digits giving 10^-digits precision
+                scale = 2.0 ** np.ceil(np.log2(10.0 ** spec['digits']))
+                data = (np.around(data.astype(np.float64) * scale) / scale).astype(self.dtype)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(zlib.compress(data.tobytes(), COMPRESSION_LEVEL))
+        os.replace(path + '.tmp', path)
+
+    def _chunk_ranges(self, start, stop):
+        return [range(a // c, (b - 1) // c + 1) if b > a else range(0)
+                for a, b, c in zip(start, stop, self.chunks)]
+
+    def __getitem__(self, key):
+        """Basic slicing (ints and step-1 slices); only the overlapping chunks are read"""
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (len(self.shape) - len(key))
+        start, stop, squeeze = [], [], []
+        for axis, (k, n) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                a, b, step = k.indices(n)
+                if step != 1:
+                    raise IndexError("Only step-1 slices are supported")
+                start.append(a)
+                stop.append(max(a, b))
+            else:
+                k = int(k) + (n if int(k) < 0 else 0)
+                if not 0 <= k < n:
+                    raise IndexError(f"Index {k} out of range for axis {axis} of size {n}")
+                start.append(k)
+                stop.append(k + 1)
+                squeeze.append(axis)
+
+        out = np.empty([b - a for a, b in zip(start, stop)], dtype=self.dtype)
+        for index in itertools.product(*self._chunk_ranges(start, stop)):
+            lo = [i * c for i, c in zip(index, self.chunks)]
+            src, dst = [], []
+            for a, b, l, c in zip(start, stop, lo, self.chunks):
+                s, e = max(a, l), min(b, l + c)
+                src.append(slice(s - l, e - l))
+                dst.append(slice(s - a, e - a))
+            out[tuple(dst)] = self.read_chunk(index)[tuple(src)]
+        return out.squeeze(axis=tuple(squeeze)) if squeeze else out
+
+    def write_region(self, offset, block):
+        """Write block at offset; chunks only partly covered are read, merged and rewritten"""
+        block = np.asarray(block, dtype=self.dtype)
+        stop = [o + n for o, n in zip(offset, block.shape)]
+        for index in itertools.product(*self._chunk_ranges(offset, stop)):
+            lo = [i * c for i, c in zip(index, self.chunks)]
+            src, dst, full = [], [], True
+            for a, b, l, c, n in zip(offset, stop, lo, self.chunks, self.shape):
+                s, e = max(a, l), min(b, l + c)
+                src.append(slice(s - a, e - a))
+                dst.append(slice(s - l, e - l))
+                full &= s == l and e >= min(l + c, n)
+            chunk = np.full(self.chunks, self.fill_value, dtype=self.dtype) if full else self.read_chunk(index)
+            chunk[tuple(dst)] = block[tuple(src)]
+            self.write_chunk(index, chunk)
+
+
+# ----------------------------------------------------------------------
+# The cube
+# ----------------------------------------------------------------------
+
+def grid_axes(bounds, resolution):
+    """lat / lon axes covering bounds = (min_lat, max_lat, min_lon, max_lon) inclusive"""
+    min_lat, max_lat, min_lon, max_lon = bounds
+    lats = np.round(np.arange(min_lat, max_lat + resolution / 2, resolution), 6)
+    lons = np.round(np.arange(min_lon, max_lon + resolution / 2, resolution), 6)
+    return lats, lons
+
+
+def to_epoch(value):
+    """Epoch seconds for a timestamp / ISO string / number (naive = UTC)"""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    import pandas as pd
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.timestamp())
+
+
+def iso(epoch):
+    return str(np.datetime64(int(epoch), 's')) + 'Z'
+
+
+class PWCube:
+    MAPS = ('pw', 'uncertainty')
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, '.zattrs')) as f:
+            self.attrs = json.load(f)
+        self.time = ZarrArray(os.path.join(root, 'time'))
+        self.lat = ZarrArray(os.path.join(root, 'lat'))[:]
+        self.lon = ZarrArray(os.path.join(root, 'lon'))[:]
+        self.arrays = {name: ZarrArray(os.path.join(root, name)) for name in self.MAPS + ('pw_history',)}
+
+    @classmethod
+    def create(cls, root, bounds, resolution, attrs=None):
+        if os.path.exists(os.path.join(root, '.zgroup')):
+            raise FileExistsError(f"{root} already holds a cube")
+        lats, lons = grid_axes(bounds, resolution)
+        ny, nx = len(lats), len(lons)
+        os.makedirs(root, exist_ok=True)
+        _write_json(os.path.join(root, '.zgroup'), {'zarr_format': 2})
+        _write_json(os.path.join(root, '.zattrs'), {
+            'title': 'Interpolated precipitable water',
+            'bounds': list(bounds),
+            'resolution': resolution,
+            **(attrs or {}),
+        })
+        for name, axis, units in (('lat', lats, 'degrees_north'), ('lon', lons, 'degrees_east')):
+            ZarrArray.create(os.path.join(root, name), axis.shape, axis.shape, '<f8', [name],
+                             {'units': units}).write_chunk((0,), axis)
+        ZarrArray.create(os.path.join(root, 'time'), (0,), (TIME_CHUNK,), '<i8', ['time'],
+                         {'units': TIME_UNITS, 'calendar': 'proleptic_gregorian'})
+        dims = ['time', 'lat', 'lon']
+        ZarrArray.create(os.path.join(root, 'pw'), (0, ny, nx), (1, ny, nx), '<f4', dims,
+                         {'long_name': 'precipitable water'}, QUANTIZE_DIGITS)
+        ZarrArray.create(os.path.join(root, 'uncertainty'), (0, ny, nx), (1, ny, nx), '<f4', dims,
+                         {'long_name': 'precipitable water standard deviation'}, QUANTIZE_DIGITS)
+        ZarrArray.create(os.path.join(root, 'pw_history'), (0, ny, nx),
+                         (HISTORY_TIME_CHUNK, min(HISTORY_TILE, ny), min(HISTORY_TILE, nx)), '<f4', dims,
+                         {'long_name': 'precipitable water (space-major copy for point histories)'}, QUANTIZE_DIGITS)
+        return cls(root)
+
+    def __len__(self):
+        # The time axis grows last, so its length is the number of complete steps
+        return self.time.shape[0]
+
+    @property
+    def times(self):
+        return self.time[:]
+
+    def append(self, times, pw, uncertainty):
+        """Append k steps: times (k,) epoch seconds after the last stored step, maps (k, lat, lon)"""
+        times = np.asarray(times, dtype=np.int64)
+        pw = np.asarray(pw, dtype=np.float32)
+        uncertainty = np.asarray(uncertainty, dtype=np.float32)
+        if not len(times):
+            return 0
+        n = len(self)
+        if np.any(np.diff(times) <= 0) or (n and times[0] <= self.time[n - 1]):
+            raise ValueError("Appended times must be increasing and after the last stored step")
+        shape = (len(self.lat), len(self.lon))
+        if pw.shape != (len(times),) + shape or uncertainty.shape != pw.shape:
+            raise ValueError(f"Maps must have shape ({len(times)}, {shape[0]}, {shape[1]})")
+
+        for name, data in (('pw', pw), ('uncertainty', uncertainty), ('pw_history', pw)):
+            array = self.arrays[name]
+            array.resize((n + len(times),) + shape)
+            array.write_region((n, 0, 0), data)
+        self.time.resize((n + len(times),))
+        self.time.write_region((n,), times)
+        return len(times)
+
+    def nearest(self, t):
+        """Index of the stored step closest to t"""
+        times = self.times
+        if not len(times):
+            raise KeyError("The cube has no time steps yet")
+        t = to_epoch(t)
+        i = int(np.searchsorted(times, t))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(times)]
+        return min(candidates, key=lambda j: abs(int(times[j]) - t))
+
+    def frame(self, t):
+        """(epoch, pw map, uncertainty map) of the step closest to t; reads one chunk per map"""
+        i = self.nearest(t)
+        return int(self.time[i]), self.arrays['pw'][i], self.arrays['uncertainty'][i]
+
+    def history(self, lat, lon, start=None, end=None):
+        """(epochs, pw) at the grid cell nearest (lat, lon) between start and end (inclusive)"""
+        iy = int(np.abs(self.lat - float(lat)).argmin())
+        ix = int(np.abs(self.lon - float(lon)).argmin())
+        times = self.times
+        lo = 0 if start is None else int(np.searchsorted(times, to_epoch(start), side='left'))
+        hi = len(times) if end is None else int(np.searchsorted(times, to_epoch(end), side='right'))
+        return times[lo:hi], self.arrays['pw_history'][lo:hi, iy, ix], (float(self.lat[iy]), float(self.lon[ix]))
+
+
+# ----------------------------------------------------------------------
+# Rendering
+# ----------------------------------------------------------------------
+
+def render(model, lats, lons, times, chunk_size=CHUNK_SIZE):
+    """Yield (epoch, pw map, std map) per step, each step one vectorized predict per chunk"""
+    from spacetime_kriging import SpaceTimeKriging
+
+    lat2d, lon2d = np.meshgrid(lats, lons, indexing='ij')
+    X = np.column_stack([lon2d.ravel(), lat2d.ravel()])
+    timed = isinstance(model, SpaceTimeKriging)
+    static = None
+
+    for t in times:
+        if static is not None:
+            yield int(t), static[0], static[1]
+            continue
+        mean = np.empty(len(X))
+        std = np.empty(len(X))
+        for start in range(0, len(X), chunk_size):
+            part = slice(start, start + chunk_size)
+            if timed:
+                mean[part], std[part] = model.predict(X[part], return_std=True, t=float(t))
+            else:
+                mean[part], std[part] = model.predict(X[part], return_std=True)
+        maps = mean.reshape(lat2d.shape), std.reshape(lat2d.shape)
+        if not timed:
+            static = maps
+        yield int(t), maps[0], maps[1]
+
+
+def update(root, model, end, start=None, step_hours=1.0, chunk_size=CHUNK_SIZE, batch=APPEND_BATCH):
+    """
+    Render and append the steps after the last stored one (or from start)
+    up to end, batch steps per write. Returns the number of steps appended.
+    """
+    cube = PWCube(root)
+    step = int(step_hours * 3600)
+    n = len(cube)
+    first = int(cube.time[n - 1]) + step if n else to_epoch(start if start is not None else end)
+    if start is not None:
+        first = max(first, to_epoch(start))
+    times = np.arange(first, to_epoch(end) + 1, step, dtype=np.int64)
+
+    appended = 0
+    pending = []
+    for t, pw, std in render(model, cube.lat, cube.lon, times, chunk_size):
+        pending.append((t, pw, std))
+        if len(pending) == batch or t == times[-1]:
+            appended += cube.append([p[0] for p in pending], np.stack([p[1] for p in pending]),
+                                    np.stack([p[2] for p in pending]))
+            print(f"Appended {len(pending)} steps up to {iso(t)}")
+            pending = []
+    return appended
+
+
+def _rounded(values, digits=4):
+    return np.where(np.isfinite(values), np.round(values.astype(np.float64), digits), None).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    create = sub.add_parser('create', help="create an empty cube")
+    create.add_argument('root')
+    create.add_argument('--bounds', type=float, nargs=4, required=True, metavar=('MIN_LAT', 'MAX_LAT', 'MIN_LON', 'MAX_LON'))
+    create.add_argument('--resolution', type=float, default=0.2)
+
+    upd = sub.add_parser('update', help="render and append the missing time steps")
+    upd.add_argument('root')
+    upd.add_argument('--model', required=True, help="enhanced model package or pickled spatial model")
+    upd.add_argument('--start', default=None, help="first step when the cube is empty")
+    upd.add_argument('--end', required=True)
+    upd.add_argument('--step-hours', type=float, default=1.0)
+    upd.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    frame = sub.add_parser('frame', help="map closest to a time as JSON")
+    frame.add_argument('root')
+    frame.add_argument('--time', required=True)
+
+    hist = sub.add_parser('history', help="PW history of the grid cell nearest a point as JSON")
+    hist.add_argument('root')
+    hist.add_argument('--lat', type=float, required=True)
+    hist.add_argument('--lon', type=float, required=True)
+    hist.add_argument('--start', default=None)
+    hist.add_argument('--end', default=None)
+
+    info = sub.add_parser('info', help="summarise a cube as JSON")
+    info.add_argument('root')
+
+    args = parser.parse_args()
+    if args.command == 'create':
+        cube = PWCube.create(args.root, args.bounds, args.resolution)
+        print(f"Created {args.root}: {len(cube.lat)} x {len(cube.lon)} grid")
+    elif args.command == 'update':
+        from track_query import load_spatial_model
+        appended = update(args.root, load_spatial_model(args.model), args.end, args.start, args.step_hours,
+                          args.chunk_size)
+        print(f"{args.root}: {appended} steps appended")
+    else:
+        # Read commands print JSON; errors too, with exit code 2 for a missing cube / step
+        try:
+            print(json.dumps(_read_command(args)))
+        except (KeyError, FileNotFoundError) as e:
+            print(json.dumps({'error': str(e.args[0]) if isinstance(e, KeyError) else f"No cube at {args.root}"}))
+            raise SystemExit(2)
+        except ValueError as e:
+            print(json.dumps({'error': str(e)}))
+            raise SystemExit(1)
+
+
+def _read_command(args):
+    cube = PWCube(args.root)
+    if args.command == 'frame':
+        t, pw, std = cube.frame(args.time)
+        return {'time': iso(t), 'pw': _rounded(pw), 'uncertainty': _rounded(std)}
+    if args.command == 'history':
+        times, pw, (lat, lon) = cube.history(args.lat, args.lon, args.start, args.end)
+        return {'latitude': lat, 'longitude': lon, 'time': [iso(t) for t in times], 'pw': _rounded(pw)}
+    times = cube.times
+    return {**cube.attrs, 'lat': [float(cube.lat[0]), float(cube.lat[-1]), len(cube.lat)],
+            'lon': [float(cube.lon[0]), float(cube.lon[-1]), len(cube.lon)], 'steps': len(times),
+            'first': iso(times[0]) if len(times) else None, 'last': iso(times[-1]) if len(times) else None}
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+sat_geometry.py - Satellite azimuth/elevation from RINEX broadcast ephemerides
+
+Reads RINEX 2/3 navigation files (GPS, Galileo and QZSS Keplerian records;
+GLONASS/SBAS state-vector records are skipped) and computes where every
+satellite is as seen from every station, in vectorized numpy:
+
+    NavEphemeris.from_rinex(paths)      parse nav files into ephemeris arrays
+    NavEphemeris.positions(sats, t)     ECEF satellite positions (IS-GPS-200 Kepler)
+    azimuth_elevation(rx_xyz, sat_xyz)  ECEF -> local ENU -> azimuth/elevation (deg)
+    sky_view(nav, rx_xyz, epochs)       every satellite x station x epoch at once
+    annotate(nav, rx_xyz, epochs)       one (satellite, az, el) per observation row
+
+Station coordinates come from the X/Y/Z in backend/data/stations-metadata.json
+(station_xyz), falling back to geodetic lat/lon/height for stations that are
+not in the metadata.
+
+Epochs are Unix (UTC) seconds and are shifted to GPS time internally.
+
+Usage:
+    python sat_geometry.py brdc0010.23n --station ABMF00GLP --epoch 2023-01-01T12:00:00
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+STATIONS_METADATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'backend', 'data', 'stations-metadata.json')
+
+GM = 3.986005e14                # m^3/s^2, WGS-84 value used by GPS
+OMEGA_E = 7.2921151467e-5       # rad/s, Earth rotation rate
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+GPS_EPOCH_UNIX = 315964800      # 1980-01-06T00:00:00Z
+LEAP_SECONDS = 18               # GPS - UTC since 2017-01-01
+SECONDS_PER_WEEK = 604800
+KEPLER_ITERATIONS = 8
+# Broadcast orbits are fitted over ~4 h; ephemerides further than this from toe are not used
+MAX_EPHEMERIS_AGE = 4 * 3600
+
+# Systems with Keplerian broadcast records, and records lines per system (RINEX 3)
+KEPLER_SYSTEMS = ('G', 'E', 'J')
+RECORD_LINES = {'G': 8, 'E': 8, 'J': 8, 'C': 8, 'I': 8, 'R': 4, 'S': 4}
+
+# Broadcast orbit fields in record order (after the epoch line's clock terms)
+ORBIT_FIELDS = [
+    'iode', 'crs', 'delta_n', 'm0',
+    'cuc', 'e', 'cus', 'sqrt_a',
+    'toe', 'cic', 'omega0', 'cis',
+    'i0', 'crc', 'omega', 'omega_dot',
+    'idot', 'codes', 'week', 'l2p',
+    'accuracy', 'health', 'tgd', 'iodc',
+]
+
+
+def unix_to_gps(epoch):
+    """Unix UTC seconds -> continuous GPS seconds since the GPS epoch"""
+    return np.asarray(epoch, dtype=np.float64) - GPS_EPOCH_UNIX + LEAP_SECONDS
+
+
+def _float(field):
+    field = field.strip().replace('D', 'E').replace('d', 'e')
+    return float(field) if field else 0.0
+
+
+def _open_text(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+
+def _parse_rinex_nav(path):
+    """Ephemeris records (dicts) from one RINEX 2 or 3 navigation file"""
+    with _open_text(path) as f:
+        lines = f.read().splitlines()
+
+    version, body_start = 2.0, 0
+    for i, line in enumerate(lines):
+        if 'RINEX VERSION / TYPE' in line:
+            version = float(line[:9])
+        if 'END OF HEADER' in line:
+            body_start = i + 1
+            break
+
+    records = []
+    i = body_start
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+
+        if version >= 3:
+            system = line[0]
+            n_lines = RECORD_LINES.get(system, 8)
+            if system not in KEPLER_SYSTEMS:
+                i += n_lines
+                continue
+            sat = f"{system}{int(line[1:3]):02d}"
+            date = [int(line[4:8])] + [int(line[9 + 3 * k:11 + 3 * k]) for k in range(5)]
+            clock_start, orbit_start = 23, 4
+        else:
+            n_lines = 8
+            sat = f"G{int(line[0:2]):02d}"
+            year = int(line[3:5])
+            date = [year + (2000 if year < 80 else 1900)] + \
+                   [int(float(line[6 + 3 * k:8 + 3 * k])) for k in range(4)] + [int(float(line[17:22]))]
+            clock_start, orbit_start = 22, 3
+
+        record = {'sat': sat, 'toc': pd.Timestamp(*date).value / 1e9 - GPS_EPOCH_UNIX,
+                  'af0': _float(line[clock_start:clock_start + 19]),
+                  'af1': _float(line[clock_start + 19:clock_start + 38]),
+                  'af2': _float(line[clock_start + 38:clock_start + 57])}
+        values = []
+        for orbit_line in lines[i + 1:i + n_lines]:
+            values += [_float(orbit_line[orbit_start + 19 * k:orbit_start + 19 * (k + 1)])
+                       for k in range(4)]
+        record.update(zip(ORBIT_FIELDS, values))
+        records.append(record)
+        i += n_lines
+    return records
+
+
+class NavEphemeris:
+    """Broadcast ephemerides as column arrays, sorted by satellite and time of ephemeris"""
+
+    def __init__(self, table):
+        table = table[table['health'] == 0] if 'health' in table else table
+        table = table.assign(toe_abs=table['week'] * SECONDS_PER_WEEK + table['toe'])
+        table = table.sort_values(['sat', 'toe_abs']).drop_duplicates(['sat', 'toe_abs'])
+        self.table = table.reset_index(drop=True)
+        self.sats = np.array(sorted(self.table['sat'].unique()))
+        self._sat_code = pd.Index(self.sats).get_indexer(self.table['sat']).astype(np.float64)
+        self._key = self._sat_code * 1e10 + self.table['toe_abs'].to_numpy()
+        self._columns = {col: self.table[col].to_numpy(dtype=np.float64)
+                         for col in ORBIT_FIELDS + ['toe_abs']}
+
+    @classmethod
+    def from_rinex(cls, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        records = [r for path in paths for r in _parse_rinex_nav(path)]
+        if not records:
+            raise ValueError(f"No GPS/Galileo/QZSS ephemerides in {paths}")
+        return cls(pd.DataFrame.from_records(records))
+
+    def _select(self, sat_code, t_gps):
+        """Row of the ephemeris with the nearest toe for each (satellite, time), and whether it is usable"""
+        key = sat_code * 1e10 + t_gps
+        hi = np.clip(np.searchsorted(self._key, key), 0, len(self._key) - 1)
+        lo = np.clip(hi - 1, 0, len(self._key) - 1)
+        code = self._sat_code
+        hi_ok = code[hi] == sat_code
+        lo_ok = code[lo] == sat_code
+        use_lo = lo_ok & (~hi_ok | (np.abs(key - self._key[lo]) < np.abs(self._key[hi] - key)))
+        row = np.where(use_lo, lo, hi)
+        fresh = np.abs(key - self._key[row]) <= MAX_EPHEMERIS_AGE
+        return row, (hi_ok | lo_ok) & fresh
+
+    def positions(self, sats, t_gps):
+        """
+        ECEF positions (m) of satellites `sats` (IDs like 'G05', broadcast with
+        t_gps) at GPS seconds t_gps. Returns (xyz [..., 3], valid mask).
+        """
+        sats, t_gps = np.broadcast_arrays(np.asarray(sats), np.asarray(t_gps, dtype=np.float64))
+        shape = sats.shape
+        sat_code = pd.Index(self.sats).get_indexer(sats.ravel()).astype(np.float64)
+        t = t_gps.ravel()
+        row, valid = self._select(sat_code, t)
+        valid &= sat_code >= 0
+        c = {name: col[row] for name, col in self._columns.items()}
+
+        a = c['sqrt_a'] ** 2
+        tk = t - c['toe_abs']
+        n = np.sqrt(GM / a ** 3) + c['delta_n']
+        m = c['m0'] + n * tk
+        e = c['e']
+
+        # Kepler's equation M = E - e sin E, Newton iterations on the whole batch
+        ecc_anomaly = m.copy()
+        for _ in range(KEPLER_ITERATIONS):
+            ecc_anomaly -= (ecc_anomaly - e * np.sin(ecc_anomaly) - m) / (1 - e * np.cos(ecc_anomaly))
+
+        nu = np.arctan2(np.sqrt(1 - e ** 2) * np.sin(ecc_anomaly), np.cos(ecc_anomaly) - e)
+        phi = nu + c['omega']
+        sin2, cos2 = np.sin(2 * phi), np.cos(2 * phi)
+        u = phi + c['cus'] * sin2 + c['cuc'] * cos2
+        r = a * (1 - e * np.cos(ecc_anomaly)) + c['crs'] * sin2 + c['crc'] * cos2
+        inc = c['i0'] + c['cis'] * sin2 + c['cic'] * cos2 + c['idot'] * tk
+
+        x_orb, y_orb = r * np.cos(u), r * np.sin(u)
+        omega = c['omega0'] + (c['omega_dot'] - OMEGA_E) * tk - OMEGA_E * (c['toe_abs'] % SECONDS_PER_WEEK)
+        cos_o, sin_o, cos_i = np.cos(omega), np.sin(omega), np.cos(inc)
+        xyz = np.stack([x_orb * cos_o - y_orb * cos_i * sin_o,
+                        x_orb * sin_o + y_orb * cos_i * cos_o,
+                        y_orb * np.sin(inc)], axis=-1)
+        return xyz.reshape(shape + (3,)), valid.reshape(shape)
+
+
+def ecef_to_geodetic(xyz):
+    """Latitude, longitude (rad) and height (m) from ECEF (Bowring, two iterations)"""
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    lon = np.arctan2(y, x)
+    p = np.hypot(x, y)
+    lat = np.arctan2(z, p * (1 - WGS84_E2))
+    for _ in range(2):
+        n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+        h = p / np.cos(lat) - n
+        lat = np.arctan2(z, p * (1 - WGS84_E2 * n / (n + h)))
+    return lat, lon, h
+
+
+def geodetic_to_ecef(lat_deg, lon_deg, height_m):
+    lat, lon = np.radians(lat_deg), np.radians(lon_deg)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    return np.stack([(n + height_m) * np.cos(lat) * np.cos(lon),
+                     (n + height_m) * np.cos(lat) * np.sin(lon),
+                     (n * (1 - WGS84_E2) + height_m) * np.sin(lat)], axis=-1)
+
+
+def _enu(rx_xyz, sat_xyz):
+    rx_xyz = np.asarray(rx_xyz, dtype=np.float64)
+    lat, lon, _ = ecef_to_geodetic(rx_xyz)
+    d = np.asarray(sat_xyz, dtype=np.float64) - rx_xyz
+    sin_lat, cos_lat, sin_lon, cos_lon = np.sin(lat), np.cos(lat), np.sin(lon), np.cos(lon)
+    east = -sin_lon * d[..., 0] + cos_lon * d[..., 1]
+    north = -sin_lat * cos_lon * d[..., 0] - sin_lat * sin_lon * d[..., 1] + cos_lat * d[..., 2]
+    up = cos_lat * cos_lon * d[..., 0] + cos_lat * sin_lon * d[..., 1] + sin_lat * d[..., 2]
+    return east, north, up
+
+
+def azimuth_elevation(rx_xyz, sat_xyz):
+    """Azimuth [0, 360) and elevation (deg) of sat_xyz seen from rx_xyz (broadcast over [..., 3])"""
+    east, north, up = _enu(rx_xyz, sat_xyz)
+    azimuth = np.degrees(np.arctan2(east, north)) % 360.0
+    elevation = np.degrees(np.arctan2(up, np.hypot(east, north)))
+    return azimuth, elevation
+
+
+def station_xyz(station_ids, fallback=None, max_offset=None, metadata_path=STATIONS_METADATA):
+    """
+    ECEF coordinates [n, 3] for station IDs from stations-metadata.json.
+
+    Full IDs (ABMF00GLP) and 4-character codes (ABMF) both match. Stations
+    missing from the metadata use fallback {id: (lat, lon, height)} if given,
+    otherwise NaN. With max_offset (m), a metadata position further than that
+    from the fallback position is treated as a different site and the
+    fallback is used instead.
+    """
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    by_code = {}
+    for sid, meta in metadata.items():
+        xyz = (float(meta['X']), float(meta['Y']), float(meta['Z']))
+        by_code[sid] = xyz
+        by_code.setdefault(sid[:4], xyz)
+
+    unique = pd.unique(np.asarray(station_ids))
+    table = {}
+    for sid in unique:
+        xyz = by_code.get(sid)
+        if fallback is not None and sid in fallback:
+            approx = tuple(geodetic_to_ecef(*fallback[sid]))
+            if xyz is None or (max_offset is not None and np.hypot.reduce(np.subtract(xyz, approx)) > max_offset):
+                xyz = approx
+        table[sid] = (np.nan, np.nan, np.nan) if xyz is None else xyz
+    lookup = np.array([table[sid] for sid in unique], dtype=np.float64).reshape(-1, 3)
+    return lookup[pd.Index(unique).get_indexer(station_ids)]
+
+
+def sky_view(nav, rx_xyz, epochs):
+    """
+    Azimuth/elevation of every satellite from every station at every epoch.
+
+    rx_xyz [S, 3], epochs [E] (Unix seconds). Returns az, el of shape
+    [S, N, E] for N = len(nav.sats); satellites without a usable ephemeris are NaN.
+    """
+    t_gps = unix_to_gps(epochs)
+    sat_xyz, valid = nav.positions(nav.sats[:, None], t_gps[None, :])      # [N, E, 3]
+    az, el = azimuth_elevation(np.asarray(rx_xyz)[:, None, None, :], sat_xyz[None])
+    az[:, ~valid] = np.nan
+    el[:, ~valid] = np.nan
+    return az, el
+
+
+def annotate(nav, rx_xyz, epochs, sats=None, elevation_mask=10.0, rng=None, chunk_size=100_000):
+    """
+    Satellite, azimuth and elevation for each observation row.
+
+    With sats given, the geometry of that satellite is returned. Otherwise a
+    satellite is drawn uniformly (rng, default np.random) among those above
+    elevation_mask at the row's station and epoch; rows with none visible
+    get NaN angles and an empty satellite ID. Rows are processed in epoch
+    order, chunk_size at a time, and satellite positions are computed once
+    per unique epoch of the chunk, so memory is bounded by chunk_size however
+    many epochs the rows span.
+    """
+    rx_xyz = np.asarray(rx_xyz, dtype=np.float64).reshape(-1, 3)
+    epochs = np.asarray(epochs, dtype=np.float64).ravel()
+    n = len(epochs)
+
+    if sats is not None:
+        sats = np.broadcast_to(np.asarray(sats), (n,))
+        out_az = np.full(n, np.nan)
+        out_el = np.full(n, np.nan)
+        for start in range(0, n, chunk_size):
+            sl = slice(start, start + chunk_size)
+            sat_xyz, valid = nav.positions(sats[sl], unix_to_gps(epochs[sl]))
+            az, el = azimuth_elevation(rx_xyz[sl], sat_xyz)
+            out_az[sl] = np.where(valid, az, np.nan)
+            out_el[sl] = np.where(valid, el, np.nan)
+        return np.array(sats), out_az, out_el
+
+    rng = np.random if rng is None else rng
+    sin_mask = np.sin(np.radians(elevation_mask))
+    out_sat = np.full(n, '', dtype=object)
+    out_az = np.full(n, np.nan)
+    out_el = np.full(n, np.nan)
+    # One draw per row in row order, whatever order the chunks run in
+    draws = rng.random(n)
+
+    unique_epochs, epoch_index = np.unique(epochs, return_inverse=True)
+    epoch_index = epoch_index.ravel()
+    order = np.argsort(epoch_index, kind='stable')
+
+    for start in range(0, n, chunk_size):
+        chunk = order[start:start + chunk_size]
+        chunk_epochs, idx = np.unique(epoch_index[chunk], return_inverse=True)
+        sat_xyz, valid = nav.positions(nav.sats[None, :], unix_to_gps(unique_epochs[chunk_epochs])[:, None])
+        # Visibility from the up component alone; angles only for the chosen satellite
+        rx = rx_xyz[chunk]
+        d = sat_xyz[idx] - rx[:, None, :]                                       # [m, N, 3]
+        lat, lon, _ = ecef_to_geodetic(rx)
+        up_vector = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+        sin_el = np.einsum('mnk,mk->mn', d, up_vector) / np.linalg.norm(d, axis=-1)
+        visible = valid[idx] & (sin_el >= sin_mask)
+
+        # Draw the k-th visible satellite with k uniform in [0, count)
+        count = visible.sum(axis=1)
+        k = np.floor(draws[chunk] * count).astype(np.intp)
+        pick = np.argmax(np.cumsum(visible, axis=1) > k[:, None], axis=1)
+        has = count > 0
+        rows = np.flatnonzero(has)
+        az, el = azimuth_elevation(rx[rows], d[rows, pick[has]] + rx[rows])
+        out_sat[chunk[rows]] = nav.sats[pick[has]]
+        out_az[chunk[rows]] = az
+        out_el[chunk[rows]] = el
+
+    return out_sat, out_az, out_el
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Satellite sky view from RINEX navigation files")
+    parser.add_argument('nav', nargs='+')
+    parser.add_argument('--station', required=True)
+    parser.add_argument('--epoch', required=True, help="UTC time, e.g. 2023-01-01T12:00:00")
+    parser.add_argument('--mask', type=float, default=0.0, help="elevation mask (deg)")
+    args = parser.parse_args()
+
+    nav = NavEphemeris.from_rinex(args.nav)
+    epoch = pd.Timestamp(args.epoch, tz='UTC').timestamp()
+    az, el = sky_view(nav, station_xyz([args.station]), np.array([epoch]))
+    print(f"{'sat':>4} {'azimuth':>8} {'elevation':>9}")
+    for sat, a, e in sorted(zip(nav.sats, az[0, :, 0], el[0, :, 0]), key=lambda r: -np.nan_to_num(r[2], nan=-99)):
+        if e >= args.mask:
+            print(f"{sat:>4} {a:>8.2f} {e:>9.2f}")
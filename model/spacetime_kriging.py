@@ -0,0 +1,243 @@
+"""
+spacetime_kriging.py - Online space-time kriging for live station feeds
+
+SpaceTimeKriging is a Gaussian-process interpolator over (longitude, latitude,
+time) with a separable kernel
+
+    k = variance * exp(-d^2 / (2 * length_scale^2)) * exp(-dt^2 / (2 * time_scale^2))
+        + noise_level * [same observation]
+
+It keeps the lower Cholesky factor of the observation covariance and updates
+it in place: a new observation appends one row (a triangular solve, O(n^2)),
+and observations leaving the sliding time window are removed with a rank-one
+Cholesky update of the trailing block (also O(n^2)). No step refactorizes
+the full matrix, so each new GNSS epoch is absorbed in O(n^2) instead of the
+O(n^3) of refitting GaussianProcessRegressor.
+
+predict(X, return_std=True) follows the GaussianProcessRegressor contract
+used by EnhancedGNSSPWModel.interpolate_pw, with X as [[longitude, latitude]].
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+
+# Added to the Schur complement when appending, guards against round-off
+JITTER = 1e-10
+
+
+def epoch_seconds(values):
+    """Seconds since the Unix epoch for a timestamp or array of timestamps (naive = UTC)"""
+    if np.ndim(values) == 0:
+        ts = pd.Timestamp(values)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize('UTC')
+        return ts.timestamp()
+    dt = pd.to_datetime(pd.Series(values), utc=True)
+    return ((dt - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy()
+
+
+def cholesky_rank_one_update(L, x):
+    """In-place update of lower-triangular L so that L L^T becomes L L^T + x x^T"""
+    x = x.copy()
+    n = len(x)
+    for k in range(n):
+        r = np.hypot(L[k, k], x[k])
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        if k + 1 < n:
+            L[k + 1:, k] = (L[k + 1:, k] + s * x[k + 1:]) / c
+            x[k + 1:] = c * x[k + 1:] - s * L[k + 1:, k]
+    return L
+
+
+class SpaceTimeKriging:
+    def __init__(self, length_scale=1.0, time_scale=6 * 3600.0, variance=1.0, noise_level=0.1,
+                 window=24 * 3600.0, mean=None):
+        # length_scale: spatial correlation length in degrees (same units as the GP's RBF)
+        # time_scale: temporal correlation length in seconds
+        # window: observations older than newest - window are dropped (None keeps all)
+        # mean: constant prior mean; defaults to the mean of the observations passed to fit
+        self.length_scale = float(length_scale)
+        self.time_scale = float(time_scale)
+        self.variance = float(variance)
+        self.noise_level = float(noise_level)
+        self.window = window
+        self.mean = mean
+
+        self.n = 0
+        self._X = np.empty((0, 2))
+        self._t = np.empty(0)
+        self._y = np.empty(0)
+        self._L = np.empty((0, 0))
+        self._alpha = None
+
+    # ------------------------------------------------------------------
+    # Kernel
+    # ------------------------------------------------------------------
+
+    def kernel(self, X1, t1, X2, t2):
+        """Cross-covariance between two sets of (lon, lat, t) points"""
+        d2 = ((X1[:, None, :] - X2[None, :, :]) ** 2).sum(axis=-1)
+        dt2 = (t1[:, None] - t2[None, :]) ** 2
+        return self.variance * np.exp(-0.5 * d2 / self.length_scale ** 2
+                                      - 0.5 * dt2 / self.time_scale ** 2)
+
+    # ------------------------------------------------------------------
+    # Batch initialisation
+    # ------------------------------------------------------------------
+
+    def fit(self, X, y, t=None):
+        """Initialise from a batch of observations (one O(n^3) factorization)"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+        y = np.asarray(y, dtype=np.float64).ravel()
+        t = np.zeros(len(y)) if t is None else np.asarray(t, dtype=np.float64).ravel()
+
+        order = np.argsort(t, kind='stable')
+        X, y, t = X[order], y[order], t[order]
+        if self.window is not None and len(t):
+            keep = t >= t[-1] - self.window
+            X, y, t = X[keep], y[keep], t[keep]
+
+        if self.mean is None:
+            self.mean = float(y.mean()) if len(y) else 0.0
+
+        n = len(y)
+        capacity = max(16, 2 * n)
+        self._X = np.empty((capacity, 2))
+        self._t = np.empty(capacity)
+        self._y = np.empty(capacity)
+        self._L = np.zeros((capacity, capacity))
+        self._X[:n], self._t[:n], self._y[:n] = X, t, y
+
+        K = self.kernel(X, t, X, t)
+        K[np.diag_indices_from(K)] += self.noise_level
+        self._L[:n, :n] = np.linalg.cholesky(K)
+        self.n = n
+        self._alpha = None
+        return self
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._t))
+        n = self.n
+        X, t, y, L = self._X, self._t, self._y, self._L
+        self._X = np.empty((capacity, 2))
+        self._t = np.empty(capacity)
+        self._y = np.empty(capacity)
+        self._L = np.zeros((capacity, capacity))
+        self._X[:n], self._t[:n], self._y[:n] = X[:n], t[:n], y[:n]
+        self._L[:n, :n] = L[:n, :n]
+
+    def add(self, x, y, t):
+        """
+        Absorb one observation at x = (lon, lat), time t (seconds), value y.
+
+        Observations that fall out of the sliding window are removed first.
+        """
+        if self.mean is None:
+            self.mean = float(y)
+        if self.window is not None:
+            self.expire(t - self.window)
+        if self.n == len(self._t):
+            self._grow()
+
+        n = self.n
+        x = np.asarray(x, dtype=np.float64).reshape(1, 2)
+        t_arr = np.array([float(t)])
+
+        k = self.kernel(self._X[:n], self._t[:n], x, t_arr)[:, 0]
+        l = solve_triangular(self._L[:n, :n], k, lower=True, check_finite=False) if n else k
+        d2 = self.variance + self.noise_level - l @ l
+
+        self._L[n, :n] = l
+        self._L[n, n] = np.sqrt(max(d2, JITTER))
+        self._X[n], self._t[n], self._y[n] = x[0], t_arr[0], float(y)
+        self.n = n + 1
+        self._alpha = None
+
+    def add_many(self, X, y, t):
+        """Absorb several observations one at a time, in time order"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+        y = np.asarray(y, dtype=np.float64).ravel()
+        t = np.asarray(t, dtype=np.float64).ravel()
+        for i in np.argsort(t, kind='stable'):
+            self.add(X[i], y[i], t[i])
+
+    def remove(self, index):
+        """Drop observation `index`, downdating the factor in O(n^2)"""
+        n = self.n
+        L = self._L
+        if index < n - 1:
+            # Trailing block absorbs the removed column: L33' L33'^T = L33 L33^T + l32 l32^T
+            cholesky_rank_one_update(L[index + 1:n, index + 1:n], L[index + 1:n, index])
+
+        # Close the gap left by the removed row and column
+        keep = np.r_[0:index, index + 1:n]
+        L[:n - 1, :n - 1] = L[np.ix_(keep, keep)]
+        L[n - 1, :n] = 0.0
+        L[:n, n - 1] = 0.0
+        self._X[:n - 1] = self._X[keep]
+        self._t[:n - 1] = self._t[keep]
+        self._y[:n - 1] = self._y[keep]
+        self.n = n - 1
+        self._alpha = None
+
+    def expire(self, before):
+        """Remove every observation with time < before"""
+        # Observations are kept in arrival order, so the oldest are usually first
+        while self.n:
+            stale = np.flatnonzero(self._t[:self.n] < before)
+            if not len(stale):
+                break
+            self.remove(int(stale[0]))
+
+    # ------------------------------------------------------------------
+    # Prediction
+    # ------------------------------------------------------------------
+
+    @property
+    def latest_time(self):
+        return float(self._t[:self.n].max()) if self.n else 0.0
+
+    @property
+    def y_train_(self):
+        """Current observations (mirrors GaussianProcessRegressor.y_train_)"""
+        return self._y[:self.n].copy()
+
+    def _get_alpha(self):
+        if self._alpha is None:
+            L = self._L[:self.n, :self.n]
+            r = self._y[:self.n] - self.mean
+            v = solve_triangular(L, r, lower=True, check_finite=False)
+            self._alpha = solve_triangular(L.T, v, lower=False, check_finite=False)
+        return self._alpha
+
+    def predict(self, X, return_std=False, t=None):
+        """
+        Predict at X = [[lon, lat], ...] and time t (seconds, scalar or per row).
+
+        t defaults to the newest observation time, i.e. a nowcast.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+        m = len(X)
+        if self.n == 0:
+            mean = np.full(m, self.mean if self.mean is not None else 0.0)
+            std = np.full(m, np.sqrt(self.variance + self.noise_level))
+            return (mean, std) if return_std else mean
+
+        t = self.latest_time if t is None else t
+        t = np.broadcast_to(np.asarray(t, dtype=np.float64), (m,))
+
+        Ks = self.kernel(X, t, self._X[:self.n], self._t[:self.n])
+        mean = self.mean + Ks @ self._get_alpha()
+        if not return_std:
+            return mean
+
+        v = solve_triangular(self._L[:self.n, :self.n], Ks.T, lower=True, check_finite=False)
+        var = self.variance + self.noise_level - np.einsum('ij,ij->j', v, v)
+        return mean, np.sqrt(np.clip(var, 0.0, None))
@@ -2,6 +2,7 @@ import joblib
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from track_query import interpolate_points
 
 def unified_predictor(input_data, model_file="enhanced_gnss_pw_model_fixed.pkl"):
     """
@@ -147,12 +148,11 @@ def interpolate_coordinates(lat, lon, saved_model):
     }
 
 def batch_interpolate_coordinates(coords_list, saved_model):
-    """Batch interpolate multiple coordinates"""
-    results = []
-    for lat, lon in coords_list:
-        result = interpolate_coordinates(lat, lon, saved_model)
-        results.append(result)
-    return pd.DataFrame(results)
+    """Batch interpolate multiple coordinates (chunked vectorized GP calls, see track_query.py)"""
+    coords = np.asarray(coords_list, dtype=np.float64).reshape(-1, 2)
+    results = interpolate_points(saved_model['spatial_model'], coords[:, 0], coords[:, 1])
+    results['method'] = 'spatial_interpolation'
+    return results
 
 # Test the unified predictor with proper handling
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+"""
+tm_grid.py - Weighted-mean-temperature (Tm) climatology grid for ZWD -> PW
+
+Offline, build_tm_grid reduces ERA5 files to a Tm climatology on a
+lat x lon x day-of-year x hour-of-day grid and stores it as a float32 .npy
+(memory-mapped on load) with a small JSON sidecar describing the axes:
+
+    tm_grid.npy   float32 [n_lat, n_lon, n_doy, n_hour], Kelvin
+    tm_grid.json  axis origins/steps, bin counts, source files
+
+Tm per ERA5 time step is
+    - integrated from pressure-level profiles (variables 't' and 'q'):
+      Tm = ∫ e dln(p) / ∫ (e / T) dln(p), which is ∫(e/T)dz / ∫(e/T²)dz
+      under hydrostatic balance;
+    - otherwise derived from 2 m temperature with the Bevis relation
+      Tm = 70.2 + 0.72 * T2m (surface-only files such as the builder's).
+
+At serve time TmGrid.lookup interpolates bilinearly in space and linearly
+(cyclically) in day-of-year and hour for whole batches at once; only the
+16 neighbouring cells per query are read from the memory map.
+
+Usage:
+    python tm_grid.py build ../gnss-data-coll/zenith_dataset/raw_era5/*.nc --out tm_grid.npy
+    python tm_grid.py lookup tm_grid.npy --lat 36.5 --lon 127.3 --time 2025-09-08T12:00:00
+
+Environment:
+    ZVC_TM_GRID    grid the dataset builder writes and pklgen.py / prediction.py read
+                   (default: model/tm_grid.npy)
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from physics import KELVIN, weighted_mean_temperature, pw_from_zwd
+
+# The one default location shared by build_dataset.py, pklgen.py and prediction.py
+TM_GRID_FILE = os.environ.get('ZVC_TM_GRID', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tm_grid.npy'))
+
+DOY_STEP = 8        # days per day-of-year bin (46 bins)
+HOUR_STEP = 3       # hours per hour-of-day bin (8 bins)
+YEAR_DAYS = 365.25
+TIME_CHUNK = 48     # ERA5 time steps reduced per pass
+
+
+def meta_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def _time_dim(ds):
+    return 'valid_time' if 'valid_time' in ds.dims else 'time'
+
+
+def _doy_hour(times):
+    """Fractional day of year (0-based) and hour of day (UTC) for datetime64 values"""
+    import pandas as pd  # not paid by importers that only need TM_GRID_FILE
+
+    times = pd.DatetimeIndex(pd.to_datetime(times, utc=True))
+    hour = times.hour + times.minute / 60.0 + times.second / 3600.0
+    doy = (times.dayofyear - 1) + hour / 24.0
+    return np.asarray(doy, dtype=np.float64), np.asarray(hour, dtype=np.float64)
+
+
+def profile_tm(t_k, q, p_hpa, axis):
+    """Tm from temperature (K) and specific humidity (kg/kg) profiles on pressure levels"""
+    shape = [1] * t_k.ndim
+    shape[axis] = -1
+    p = np.asarray(p_hpa, dtype=np.float64).reshape(shape)
+    e = q * p / (0.622 + 0.378 * q)
+    log_p = np.log(p).ravel()
+    num = np.abs(np.trapezoid(e, log_p, axis=axis))
+    den = np.abs(np.trapezoid(e / t_k, log_p, axis=axis))
+    return num / den
+
+
+def _chunk_tm(chunk):
+    """Tm (K) for one ERA5 time chunk, shape [time, lat, lon]"""
+    if 't' in chunk and 'q' in chunk and 'pressure_level' in chunk.dims:
+        chunk = chunk.transpose(..., 'pressure_level', 'latitude', 'longitude')
+        t = chunk['t'].values.astype(np.float64)
+        q = chunk['q'].values.astype(np.float64)
+        return profile_tm(t, q, chunk['pressure_level'].values, axis=1)
+    return weighted_mean_temperature(chunk['t2m'].values - KELVIN)
+
+
+def _fill_cyclic(values, valid, axis):
+    """Fill bins with no data along a cyclic axis by linear interpolation between filled bins"""
+    filled = np.flatnonzero(valid)
+    n = len(valid)
+    for j in np.flatnonzero(~valid):
+        k = np.searchsorted(filled, j)
+        lo, hi = filled[k - 1], filled[k % len(filled)]
+        gap = (hi - lo) % n or n
+        w = ((j - lo) % n) / gap
+        out = np.take(values, [j], axis=axis)
+        out[...] = ((1 - w) * np.take(values, [lo], axis=axis)
+                    + w * np.take(values, [hi], axis=axis))
+        index = [slice(None)] * values.ndim
+        index[axis] = slice(j, j + 1)
+        values[tuple(index)] = out
+    return values
+
+
+def build_tm_grid(era5_paths, out_path, doy_step=DOY_STEP, hour_step=HOUR_STEP, stride=1):
+    """
+    Reduce ERA5 files to a Tm climatology grid at out_path (.npy + .json).
+
+    stride keeps every stride-th grid point in latitude and longitude.
+    Bins not covered by the input period are filled by cyclic interpolation
+    along day-of-year and hour.
+    """
+    import xarray as xr
+
+    n_doy = int(np.ceil(366 / doy_step))
+    n_hour = int(np.ceil(24 / hour_step))
+    sums = counts = None
+    lats = lons = None
+
+    for path in era5_paths:
+        print(f"Reducing {path}")
+        ds = xr.open_dataset(path)
+        ds = ds.isel(latitude=slice(None, None, stride), longitude=slice(None, None, stride))
+        ds = ds.sortby('latitude').sortby('longitude')
+        time_dim = _time_dim(ds)
+
+        if sums is None:
+            lats, lons = ds['latitude'].values, ds['longitude'].values
+            sums = np.zeros((n_doy * n_hour, len(lats), len(lons)))
+            counts = np.zeros((n_doy * n_hour, len(lats), len(lons)))
+        elif len(ds['latitude']) != len(lats) or len(ds['longitude']) != len(lons):
+            raise ValueError(f"{path} is on a different grid than {era5_paths[0]}")
+
+        for start in range(0, ds.sizes[time_dim], TIME_CHUNK):
+            chunk = ds.isel({time_dim: slice(start, start + TIME_CHUNK)}).transpose(time_dim, ...)
+            tm = _chunk_tm(chunk)
+            doy, hour = _doy_hour(chunk[time_dim].values)
+            doy_bin = np.minimum((doy / YEAR_DAYS * n_doy).astype(int), n_doy - 1)
+            hour_bin = np.minimum((hour / 24.0 * n_hour).astype(int), n_hour - 1)
+            bins = doy_bin * n_hour + hour_bin
+
+            # Sum consecutive runs of equal bins in one pass (much faster than np.add.at)
+            order = np.argsort(bins, kind='stable')
+            uniq, starts = np.unique(bins[order], return_index=True)
+            finite = np.isfinite(tm[order])
+            sums[uniq] += np.add.reduceat(np.where(finite, tm[order], 0.0), starts, axis=0)
+            counts[uniq] += np.add.reduceat(finite, starts, axis=0)
+        ds.close()
+
+    if sums is None:
+        raise ValueError("No ERA5 files given")
+
+    # Cells never observed in a covered bin fall back to their own mean
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tm = sums / counts
+        cell_mean = sums.sum(axis=0) / counts.sum(axis=0)
+    covered = counts.sum(axis=(1, 2)) > 0
+    if not covered.any():
+        raise ValueError("ERA5 input contains no finite temperatures")
+    tm = np.where(np.isnan(tm) & covered[:, None, None], cell_mean, tm)
+
+    tm = tm.reshape(n_doy, n_hour, len(lats), len(lons))
+    covered = covered.reshape(n_doy, n_hour)
+    doy_has_data = covered.any(axis=1)
+    for d in np.flatnonzero(doy_has_data):
+        _fill_cyclic(tm[d], covered[d], axis=0)
+    _fill_cyclic(tm, doy_has_data, axis=0)
+
+    grid = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                     shape=(len(lats), len(lons), n_doy, n_hour))
+    grid[:] = tm.transpose(2, 3, 0, 1)
+    grid.flush()
+    del grid
+
+    dlat = float(lats[1] - lats[0]) if len(lats) > 1 else 1.0
+    dlon = float(lons[1] - lons[0]) if len(lons) > 1 else 1.0
+    meta = {
+        'lat0': float(lats[0]), 'dlat': dlat, 'n_lat': int(len(lats)),
+        'lon0': float(lons[0]), 'dlon': dlon, 'n_lon': int(len(lons)),
+        'lon_cyclic': bool(abs(dlon * len(lons) - 360.0) < 1e-6),
+        'n_doy': n_doy, 'n_hour': n_hour,
+        'covered_bins': int(covered.sum()),
+        'sources': [os.path.basename(p) for p in era5_paths],
+    }
+    with open(meta_path(out_path), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Tm grid {grid_shape_str(meta)} written to {out_path} "
+          f"({covered.sum()}/{n_doy * n_hour} time bins from data)")
+    return out_path
+
+
+def grid_shape_str(meta):
+    return f"{meta['n_lat']}x{meta['n_lon']}x{meta['n_doy']}x{meta['n_hour']}"
+
+
+def _axis_weights(position, size, cyclic):
+    """Lower index, upper index and upper weight for fractional grid positions"""
+    if cyclic:
+        position = np.mod(position, size)
+        i0 = np.floor(position).astype(np.intp)
+        return i0 % size, (i0 + 1) % size, position - i0
+    if size == 1:
+        zeros = np.zeros(position.shape, dtype=np.intp)
+        return zeros, zeros, np.zeros(position.shape)
+    position = np.clip(position, 0, size - 1)
+    i0 = np.minimum(np.floor(position).astype(np.intp), size - 2)
+    return i0, i0 + 1, position - i0
+
+
+class TmGrid:
+    def __init__(self, path):
+        with open(meta_path(path)) as f:
+            self.meta = json.load(f)
+        self.grid = np.load(path, mmap_mode='r')
+        # Flat view and element strides so each corner is a single np.take
+        self._flat = self.grid.reshape(-1)
+        self._strides = [s // self.grid.itemsize for s in self.grid.strides]
+
+    def lookup(self, lat, lon, times):
+        """Tm (K) for arrays of latitude, longitude and timestamps (broadcast together)"""
+        m = self.meta
+        times = np.asarray(times)
+        doy, hour = _doy_hour(times.ravel())
+        lat, lon, doy, hour = np.broadcast_arrays(
+            np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64),
+            doy.reshape(times.shape), hour.reshape(times.shape))
+        shape = lat.shape
+        lat, lon, doy, hour = (a.ravel() for a in (lat, lon, doy, hour))
+
+        lat_pos = (lat - m['lat0']) / m['dlat']
+        if m['lon_cyclic']:
+            lon_pos = np.mod(lon - m['lon0'], 360.0) / m['dlon']
+        else:
+            lon_pos = (np.mod(lon - m['lon0'] + 180.0, 360.0) - 180.0) / m['dlon']
+        doy_pos = doy / YEAR_DAYS * m['n_doy'] - 0.5
+        hour_pos = hour / 24.0 * m['n_hour'] - 0.5
+
+        axes = [
+            _axis_weights(lat_pos, m['n_lat'], False),
+            _axis_weights(lon_pos, m['n_lon'], m['lon_cyclic']),
+            _axis_weights(doy_pos, m['n_doy'], True),
+            _axis_weights(hour_pos, m['n_hour'], True),
+        ]
+
+        # Separable weights: 4 spatial corners x 4 (doy, hour) corners
+        space = self._corners(axes[0], axes[1], self._strides[0], self._strides[1])
+        season = self._corners(axes[2], axes[3], self._strides[2], self._strides[3])
+
+        tm = np.zeros(len(lat))
+        for space_offset, space_weight in space:
+            inner = np.zeros(len(lat))
+            for season_offset, season_weight in season:
+                inner += season_weight * np.take(self._flat, space_offset + season_offset)
+            tm += space_weight * inner
+        return tm.reshape(shape)
+
+    @staticmethod
+    def _corners(axis_a, axis_b, stride_a, stride_b):
+        """Flat offsets and weights of the 4 corners spanned by two axes"""
+        (a0, a1, wa), (b0, b1, wb) = axis_a, axis_b
+        return [(a * stride_a + b * stride_b, u * v)
+                for a, u in ((a0, 1 - wa), (a1, wa))
+                for b, v in ((b0, 1 - wb), (b1, wb))]
+
+    def pw_from_zwd(self, zwd, lat, lon, times):
+        """PW for a batch of ZWD values using the gridded Tm"""
+        return pw_from_zwd(zwd, self.lookup(lat, lon, times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tm climatology grid for ZWD -> PW conversion")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="reduce ERA5 files to a Tm grid")
+    build.add_argument('era5', nargs='+')
+    build.add_argument('--out', required=True)
+    build.add_argument('--doy-step', type=int, default=DOY_STEP)
+    build.add_argument('--hour-step', type=int, default=HOUR_STEP)
+    build.add_argument('--stride', type=int, default=1)
+
+    lookup = sub.add_parser('lookup', help="look up Tm at a point")
+    lookup.add_argument('grid')
+    lookup.add_argument('--lat', type=float, required=True)
+    lookup.add_argument('--lon', type=float, required=True)
+    lookup.add_argument('--time', required=True)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_tm_grid(args.era5, args.out, doy_step=args.doy_step, hour_step=args.hour_step,
+                      stride=args.stride)
+    else:
+        tm = TmGrid(args.grid).lookup(args.lat, args.lon, np.datetime64(args.time))
+        print(f"Tm = {float(tm):.2f} K, Π = {float(pw_from_zwd(1.0, tm)):.4f}")
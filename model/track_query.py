@@ -0,0 +1,283 @@
+"""
+track_query.py - Bulk PW queries along tracks and scattered points
+
+Interpolates PW with the spatial model (the GP in the enhanced model
+package, or a SpaceTimeKriging) at 10^4-10^6 points per request:
+
+    - scattered points are put in Z-order (Morton code of the quantized
+      lon/lat) so each chunk covers a compact area, exact duplicates are
+      evaluated once;
+    - every chunk is one vectorized predict(X, return_std=True), so the
+      kernel matrix against the training stations stays chunk_size x n
+      instead of growing with the query;
+    - GeoJSON LineStrings are densified along great circles to a target
+      spacing (and per-vertex times, if given, interpolated along them);
+    - results are yielded chunk by chunk, so callers can stream them out.
+
+    model = load_spatial_model("enhanced_gnss_pw_model_fixed.pkl")
+    for chunk in query_points(model, lat, lon):
+        ...                                 # DataFrame: index, latitude, longitude, predicted_pw, uncertainty
+
+Usage:
+    python track_query.py --model enhanced_gnss_pw_model_fixed.pkl --geojson flight.geojson --spacing-km 2 --out track.parquet
+    python track_query.py --model enhanced_gnss_pw_model_fixed.pkl --points points.csv --out -      # NDJSON on stdout
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+CHUNK_SIZE = 4096         # query points per predict call
+DEFAULT_SPACING_KM = 5.0
+
+
+def load_spatial_model(path):
+    """The spatial model from an enhanced model package (or a bare pickled model)"""
+    import joblib
+    saved = joblib.load(path)
+    model = saved.get('spatial_model') if isinstance(saved, dict) else saved
+    if model is None:
+        raise ValueError(f"No spatial model in {path}")
+    return model
+
+
+# ----------------------------------------------------------------------
+# Locality ordering
+# ----------------------------------------------------------------------
+
+def _spread_bits(v):
+    """Insert a zero bit between each of the low 16 bits of v (uint64)"""
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+
+def morton_order(lat, lon):
+    """Permutation putting points in Z-order of a 2^16 x 2^16 lon/lat grid"""
+    x = np.clip((np.asarray(lon) + 180.0) / 360.0 * 65535, 0, 65535).astype(np.uint64)
+    y = np.clip((np.asarray(lat) + 90.0) / 180.0 * 65535, 0, 65535).astype(np.uint64)
+    return np.argsort(_spread_bits(x) | (_spread_bits(y) << np.uint64(1)), kind='stable')
+
+
+# ----------------------------------------------------------------------
+# Tracks
+# ----------------------------------------------------------------------
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def densify(lon, lat, spacing_km=DEFAULT_SPACING_KM, times=None):
+    """
+    Points along the great-circle segments between consecutive vertices,
+    no more than spacing_km apart; vertices are kept.
+
+    Returns a DataFrame with latitude, longitude, distance_km (along the
+    track) and, if per-vertex times are given, time (linear in distance).
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    if len(lon) < 2:
+        out = pd.DataFrame({'latitude': lat, 'longitude': lon, 'distance_km': np.zeros(len(lat))})
+        if times is not None:
+            out['time'] = pd.to_datetime(times)
+        return out
+
+    v = _unit_vectors(lat, lon)
+    a, b = v[:-1], v[1:]
+    omega = np.arctan2(np.linalg.norm(np.cross(a, b), axis=1), np.einsum('ij,ij->i', a, b))
+    seg_km = omega * EARTH_RADIUS_KM
+    steps = np.maximum(np.ceil(seg_km / spacing_km).astype(np.int64), 1)
+
+    # Segment i contributes fractions 0, 1/steps_i, ..., (steps_i - 1)/steps_i; the last vertex closes it
+    seg = np.repeat(np.arange(len(steps)), steps)
+    frac = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)
+    frac = frac / steps[seg]
+    seg = np.append(seg, len(steps) - 1)
+    frac = np.append(frac, 1.0)
+
+    w = omega[seg]
+    sin_w = np.sin(w)
+    small = sin_w < 1e-12
+    safe = np.where(small, 1.0, sin_w)
+    ka = np.where(small, 1 - frac, np.sin((1 - frac) * w) / safe)
+    kb = np.where(small, frac, np.sin(frac * w) / safe)
+    p = ka[:, None] * a[seg] + kb[:, None] * b[seg]
+    p /= np.linalg.norm(p, axis=1, keepdims=True)
+
+    distance = np.concatenate([[0.0], np.cumsum(seg_km)])
+    out = pd.DataFrame({
+        'latitude': np.degrees(np.arcsin(np.clip(p[:, 2], -1, 1))),
+        'longitude': np.degrees(np.arctan2(p[:, 1], p[:, 0])),
+        'distance_km': distance[seg] + frac * seg_km[seg],
+    })
+    if times is not None:
+        t = pd.to_datetime(pd.Series(times), utc=True).dt.tz_localize(None).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        out['time'] = pd.to_datetime(np.interp(out['distance_km'], distance, t).astype(np.int64))
+    return out
+
+
+def geojson_tracks(geojson, name='track'):
+    """
+    LineStrings from a GeoJSON object (LineString, MultiLineString, Feature or
+    FeatureCollection) as (name, lon, lat, times) tuples. Names come from
+    properties.name / id; per-vertex times from properties.coordTimes / times
+    (one list per line for MultiLineStrings).
+    """
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    kind = geojson.get('type')
+    if kind == 'FeatureCollection':
+        return [track for i, feature in enumerate(geojson['features'])
+                for track in geojson_tracks(feature, f"{name}{i}")]
+    if kind == 'Feature':
+        props = geojson.get('properties') or {}
+        name = str(props.get('name', props.get('id', name)))
+        times = props.get('coordTimes', props.get('times'))
+        tracks = geojson_tracks(geojson['geometry'], name)
+        if times is not None:
+            per_line = times if geojson['geometry']['type'] == 'MultiLineString' else [times]
+            tracks = [(n, lon, lat, t) for (n, lon, lat, _), t in zip(tracks, per_line)]
+        return tracks
+    if kind == 'LineString':
+        coords = np.asarray(geojson['coordinates'], dtype=np.float64)
+        return [(name, coords[:, 0], coords[:, 1], None)]
+    if kind == 'MultiLineString':
+        lines = [np.asarray(c, dtype=np.float64) for c in geojson['coordinates']]
+        return [(f"{name}.{i}", c[:, 0], c[:, 1], None) for i, c in enumerate(lines)]
+    raise ValueError(f"Unsupported GeoJSON type: {kind}")
+
+
+# ----------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------
+
+def _predict(model, X, t):
+    if t is not None:
+        return model.predict(X, return_std=True, t=t)
+    try:
+        return model.predict(X, return_std=True)
+    except TypeError:
+        return model.predict(X), np.full(len(X), np.nan)
+
+
+def query_points(model, lat, lon, t=None, chunk_size=CHUNK_SIZE, order='locality', dedupe=True):
+    """
+    Yield DataFrames (index, latitude, longitude, predicted_pw, uncertainty)
+    covering every query point once.
+
+    order='locality' evaluates and yields chunks in Z-order (use 'index' to
+    restore the caller's order); order='input' keeps the given order, which
+    is already local for densified tracks. t (epoch seconds per point) is
+    passed through to space-time models.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = len(lat)
+    perm = morton_order(lat, lon) if order == 'locality' else np.arange(n)
+
+    for start in range(0, n, chunk_size):
+        idx = perm[start:start + chunk_size]
+        X = np.column_stack([lon[idx], lat[idx]])
+        tc = None if t is None else np.asarray(t, dtype=np.float64)[idx]
+        if dedupe and tc is None:
+            # Tracks crossing themselves / repeated points: evaluate each location once
+            X_unique, inverse = np.unique(X, axis=0, return_inverse=True)
+            mean, std = _predict(model, X_unique, None)
+            inverse = inverse.ravel()
+            mean, std = np.asarray(mean)[inverse], np.asarray(std)[inverse]
+        else:
+            mean, std = _predict(model, X, tc)
+        yield pd.DataFrame({
+            'index': idx,
+            'latitude': lat[idx],
+            'longitude': lon[idx],
+            'predicted_pw': np.asarray(mean, dtype=np.float64),
+            'uncertainty': np.asarray(std, dtype=np.float64),
+        })
+
+
+def interpolate_points(model, lat, lon, t=None, chunk_size=CHUNK_SIZE):
+    """All of query_points collected into one DataFrame in the caller's order"""
+    chunks = list(query_points(model, lat, lon, t=t, chunk_size=chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=['latitude', 'longitude', 'predicted_pw', 'uncertainty'])
+    out = pd.concat(chunks, ignore_index=True).sort_values('index', kind='stable')
+    return out.drop(columns='index').reset_index(drop=True)
+
+
+def query_tracks(model, geojson, spacing_km=DEFAULT_SPACING_KM, chunk_size=CHUNK_SIZE):
+    """
+    Densify every LineString in geojson and yield per-chunk DataFrames in
+    track order (track, distance_km, time, latitude, longitude,
+    predicted_pw, uncertainty).
+    """
+    from spacetime_kriging import epoch_seconds
+
+    for name, lon, lat, times in geojson_tracks(geojson):
+        points = densify(lon, lat, spacing_km, times)
+        t = epoch_seconds(points['time']) if 'time' in points and hasattr(model, 'time_scale') else None
+        for chunk in query_points(model, points['latitude'], points['longitude'], t=t,
+                                  chunk_size=chunk_size, order='input'):
+            rows = points.iloc[chunk['index'].to_numpy()]
+            out = pd.DataFrame({'track': name, 'distance_km': rows['distance_km'].to_numpy()})
+            # NaT for tracks without times keeps one schema across the stream
+            out['time'] = (rows['time'].to_numpy() if 'time' in rows
+                           else np.full(len(rows), np.datetime64('NaT'), dtype='datetime64[ns]'))
+            for col in ('latitude', 'longitude', 'predicted_pw', 'uncertainty'):
+                out[col] = chunk[col].to_numpy()
+            yield out
+
+
+def write_ndjson(chunks, stream=sys.stdout):
+    """Stream chunks as one JSON object per line; returns the row count"""
+    n = 0
+    for chunk in chunks:
+        if 'time' in chunk:
+            chunk = chunk.assign(time=chunk['time'].dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        text = chunk.to_json(orient='records', lines=True, double_precision=5)
+        stream.write(text if text.endswith('\n') or not text else text + '\n')
+        stream.flush()
+        n += len(chunk)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="enhanced model package or pickled spatial model")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--geojson', help="GeoJSON file with LineStrings")
+    source.add_argument('--points', help="CSV/Parquet with latitude, longitude columns")
+    parser.add_argument('--spacing-km', type=float, default=DEFAULT_SPACING_KM)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--out', default='-', help=".parquet, .csv or - for NDJSON on stdout")
+    args = parser.parse_args()
+
+    model = load_spatial_model(args.model)
+    if args.geojson:
+        with open(args.geojson) as f:
+            chunks = query_tracks(model, json.load(f), args.spacing_km, args.chunk_size)
+    else:
+        points = pd.read_parquet(args.points) if args.points.endswith('.parquet') else pd.read_csv(args.points)
+        chunks = query_points(model, points['latitude'], points['longitude'], chunk_size=args.chunk_size)
+
+    if args.out == '-':
+        write_ndjson(chunks)
+        return
+    from gnss_store import StreamingWriter
+    with StreamingWriter(args.out) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    print(f"Wrote {writer.rows_written} points to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+training_backends.py - Pluggable regressors for EnhancedGNSSPWModel
+
+Backends:
+    gbr       sklearn GradientBoostingRegressor (exact splits, single-threaded)
+    hist      sklearn HistGradientBoostingRegressor (histogram trees, OpenMP)
+    xgboost   XGBRegressor with tree_method='hist'
+    lightgbm  LGBMRegressor
+
+All backends are trained on float32 feature matrices and support early
+stopping against an explicit (time-ordered) validation set.
+"""
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_squared_error
+from threadpoolctl import threadpool_limits
+
+BACKENDS = ('gbr', 'hist', 'xgboost', 'lightgbm')
+
+# Shared tree hyperparameters, kept equivalent to the original GBR setup
+N_ESTIMATORS = 100
+LEARNING_RATE = 0.05
+MAX_DEPTH = 6
+MIN_SAMPLES_LEAF = 2
+SUBSAMPLE = 0.8
+
+# Trees added between validation checks for the warm-start sklearn backends
+WARM_START_STEP = 10
+
+
+def as_float32(X):
+    """Return a C-contiguous float32 copy (or view) of a feature matrix"""
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def make_regressor(backend='gbr', n_estimators=N_ESTIMATORS, random_state=42, n_jobs=None):
+    """Create an unfitted regressor for the given backend"""
+    if backend == 'gbr':
+        return GradientBoostingRegressor(
+            n_estimators=n_estimators,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            min_samples_split=5,
+            min_samples_leaf=MIN_SAMPLES_LEAF,
+            random_state=random_state,
+            subsample=SUBSAMPLE
+        )
+
+    if backend == 'hist':
+        # Early stopping is handled by fit_regressor on the time-based holdout,
+        # so the built-in (random) validation split is disabled
+        return HistGradientBoostingRegressor(
+            max_iter=n_estimators,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            max_leaf_nodes=2 ** MAX_DEPTH,
+            min_samples_leaf=20,
+            early_stopping=False,
+            random_state=random_state
+        )
+
+    if backend == 'xgboost':
+        from xgboost import XGBRegressor
+        return XGBRegressor(
+            n_estimators=n_estimators,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            subsample=SUBSAMPLE,
+            tree_method='hist',
+            objective='reg:squarederror',
+            n_jobs=n_jobs if n_jobs is not None else -1,
+            random_state=random_state
+        )
+
+    if backend == 'lightgbm':
+        from lightgbm import LGBMRegressor
+        return LGBMRegressor(
+            n_estimators=n_estimators,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            num_leaves=2 ** MAX_DEPTH - 1,
+            min_child_samples=MIN_SAMPLES_LEAF,
+            subsample=SUBSAMPLE,
+            subsample_freq=1,
+            n_jobs=n_jobs if n_jobs is not None else -1,
+            random_state=random_state,
+            verbose=-1
+        )
+
+    raise ValueError(f"Unknown training backend '{backend}'. Expected one of {BACKENDS}")
+
+
+def _fit_warm_start(model, backend, X_train, y_train, X_val, y_val, early_stopping_rounds):
+    """
+    Grow a sklearn ensemble in steps until the validation MSE stops improving.
+
+    Like sklearn's built-in n_iter_no_change, the trees added after the best
+    round are kept; the returned value is the size of the final ensemble.
+    """
+    size_param = 'n_estimators' if backend == 'gbr' else 'max_iter'
+    max_size = getattr(model, size_param)
+    model.set_params(warm_start=True)
+
+    best_mse, best_size, size = np.inf, 0, 0
+    while size < max_size:
+        size = min(size + WARM_START_STEP, max_size)
+        model.set_params(**{size_param: size})
+        model.fit(X_train, y_train)
+
+        mse = mean_squared_error(y_val, model.predict(X_val))
+        if mse < best_mse:
+            best_mse, best_size = mse, size
+        elif size - best_size >= early_stopping_rounds:
+            break
+
+    model.set_params(warm_start=False)
+    return size
+
+
+def fit_regressor(model, backend, X_train, y_train, X_val=None, y_val=None,
+                  early_stopping_rounds=None, n_jobs=None):
+    """
+    Fit a regressor produced by make_regressor.
+
+    When a validation set and early_stopping_rounds are given, training stops
+    once the validation MSE has not improved for that many boosting rounds.
+    n_jobs caps the number of native threads used by OpenMP/BLAS backends.
+    Returns the number of boosting rounds kept.
+    """
+    X_train = as_float32(X_train)
+    use_early_stopping = early_stopping_rounds is not None and X_val is not None and len(X_val) > 0
+    if use_early_stopping:
+        X_val = as_float32(X_val)
+
+    with threadpool_limits(limits=n_jobs):
+        if not use_early_stopping:
+            model.fit(X_train, y_train)
+            return model.n_iter_ if backend == 'hist' else model.n_estimators
+
+        if backend in ('gbr', 'hist'):
+            return _fit_warm_start(model, backend, X_train, y_train, X_val, y_val,
+                                   early_stopping_rounds)
+
+        if backend == 'xgboost':
+            model.set_params(early_stopping_rounds=early_stopping_rounds)
+            model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+            return model.best_iteration + 1
+
+        if backend == 'lightgbm':
+            import lightgbm
+            model.fit(X_train, y_train, eval_set=[(X_val, y_val)],
+                      callbacks=[lightgbm.early_stopping(early_stopping_rounds, verbose=False)])
+            return model.best_iteration_
+
+    raise ValueError(f"Unknown training backend '{backend}'. Expected one of {BACKENDS}")
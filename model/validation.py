@@ -0,0 +1,314 @@
+"""
+validation.py - Streaming validation of PW predictions against reference archives
+
+Scores a reference set (radiosonde PW, ERA5 TCWV, third-party GNSS) chunk by
+chunk: each chunk is one vectorized predict over all its points, and the
+residuals are folded into per-group running sums, so memory stays flat
+whatever the archive size.
+
+Per group (overall, station, month) the report gives count, bias, MAE, RMSE,
+residual standard deviation, Pearson r, max |error| and the fraction of
+observations inside the predicted 1σ / 2σ band. Groups merge exactly, so
+reports built on separate shards can be combined with ErrorStats.merge.
+
+    report = validate(predict, read_reference("radiosonde.parquet"))
+    report.print()
+
+predict(lat, lon, times) -> (pw, std) arrays; EnhancedGNSSPWModel.interpolate_many
+or a spatial model via spatial_predictor().
+
+Usage:
+    python validation.py --model enhanced_gnss_pw_model_fixed.pkl --reference igra_pw.parquet --out report.json
+    python validation.py --model enhanced_gnss_pw_model_fixed.pkl --reference era5_2024_*.nc --stride 4
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 50_000
+
+# Running sums kept per group; everything in the report derives from these
+FIELDS = ('n', 'sum_err', 'sum_abs', 'sum_sq', 'sum_obs', 'sum_obs2', 'sum_pred', 'sum_pred2',
+          'sum_obs_pred', 'within_1sigma', 'within_2sigma')
+
+# Accepted spellings for the reference columns
+REFERENCE_ALIASES = {
+    'latitude': 'Latitude', 'lat': 'Latitude',
+    'longitude': 'Longitude', 'lon': 'Longitude',
+    'pw': 'PW', 'tcwv': 'PW',
+    'time': 'datetime', 'Date (ISO Format)': 'datetime',
+    'station': 'Station ID', 'station_id': 'Station ID',
+}
+
+
+class ErrorStats:
+    """Mergeable per-group residual statistics (error = predicted - observed)"""
+
+    def __init__(self):
+        self.keys = []
+        self.index = {}
+        self.sums = np.zeros((0, len(FIELDS)))
+        self.max_abs = np.zeros(0)
+
+    def _rows(self, uniques):
+        rows = np.empty(len(uniques), dtype=np.int64)
+        new = []
+        for i, key in enumerate(uniques):
+            row = self.index.get(key)
+            if row is None:
+                row = self.index[key] = len(self.keys)
+                self.keys.append(key)
+                new.append(key)
+            rows[i] = row
+        if new:
+            self.sums = np.vstack([self.sums, np.zeros((len(new), len(FIELDS)))])
+            self.max_abs = np.append(self.max_abs, np.zeros(len(new)))
+        return rows
+
+    def add(self, keys, observed, predicted, std=None):
+        """Fold one chunk in; keys is a scalar (single group) or one key per row"""
+        observed = np.asarray(observed, dtype=np.float64)
+        predicted = np.asarray(predicted, dtype=np.float64)
+        if np.ndim(keys) == 0:
+            codes, uniques = np.zeros(len(observed), dtype=np.int64), [keys]
+        else:
+            codes, uniques = pd.factorize(np.asarray(keys))
+        rows = self._rows(list(uniques))
+        k = len(uniques)
+
+        err = predicted - observed
+        abs_err = np.abs(err)
+        columns = [np.ones_like(err), err, abs_err, err * err, observed, observed * observed,
+                   predicted, predicted * predicted, observed * predicted]
+        if std is None:
+            columns += [np.zeros_like(err), np.zeros_like(err)]
+        else:
+            std = np.asarray(std, dtype=np.float64)
+            columns += [(abs_err <= std).astype(np.float64), (abs_err <= 2 * std).astype(np.float64)]
+        for j, values in enumerate(columns):
+            self.sums[rows, j] += np.bincount(codes, weights=values, minlength=k)
+        chunk_max = np.zeros(k)
+        np.maximum.at(chunk_max, codes, abs_err)
+        self.max_abs[rows] = np.maximum(self.max_abs[rows], chunk_max)
+
+    def merge(self, other):
+        rows = self._rows(other.keys)
+        self.sums[rows] += other.sums
+        self.max_abs[rows] = np.maximum(self.max_abs[rows], other.max_abs)
+        return self
+
+    def table(self, key_name='group'):
+        s = pd.DataFrame(self.sums, columns=FIELDS)
+        n = s['n'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bias = s['sum_err'] / n
+            var_obs = s['sum_obs2'] / n - (s['sum_obs'] / n) ** 2
+            var_pred = s['sum_pred2'] / n - (s['sum_pred'] / n) ** 2
+            cov = s['sum_obs_pred'] / n - (s['sum_obs'] / n) * (s['sum_pred'] / n)
+            out = pd.DataFrame({
+                key_name: self.keys,
+                'n': n.astype(np.int64),
+                'bias': bias,
+                'mae': s['sum_abs'] / n,
+                'rmse': np.sqrt(s['sum_sq'] / n),
+                'std_error': np.sqrt(np.maximum(s['sum_sq'] / n - bias ** 2, 0)),
+                'r': cov / np.sqrt(var_obs * var_pred),
+                'max_abs_error': self.max_abs,
+                'within_1sigma': s['within_1sigma'] / n,
+                'within_2sigma': s['within_2sigma'] / n,
+            })
+        return out.sort_values(key_name, kind='stable').reset_index(drop=True)
+
+
+class ValidationReport:
+    def __init__(self):
+        self.overall = ErrorStats()
+        self.by_station = ErrorStats()
+        self.by_month = ErrorStats()
+        self.rows_read = 0
+        self.rows_scored = 0
+        self.seconds = 0.0
+
+    def merge(self, other):
+        self.overall.merge(other.overall)
+        self.by_station.merge(other.by_station)
+        self.by_month.merge(other.by_month)
+        self.rows_read += other.rows_read
+        self.rows_scored += other.rows_scored
+        self.seconds += other.seconds
+        return self
+
+    def to_dict(self, top=10):
+        """Compact summary: overall scores, per-month table, best/worst stations by RMSE"""
+        overall = self.overall.table('group').drop(columns='group')
+        stations = self.by_station.table('station').sort_values('rmse', ascending=False)
+        return {
+            'rows_read': self.rows_read,
+            'rows_scored': self.rows_scored,
+            'seconds': round(self.seconds, 3),
+            'overall': overall.to_dict(orient='records')[0] if len(overall) else {},
+            'by_month': self.by_month.table('month').to_dict(orient='records'),
+            'stations': len(stations),
+            'worst_stations': stations.head(top).to_dict(orient='records'),
+            'best_stations': stations.tail(top).iloc[::-1].to_dict(orient='records'),
+        }
+
+    def print(self, top=10):
+        summary = self.to_dict(top)
+        o = summary['overall']
+        print(f"Scored {self.rows_scored:,} of {self.rows_read:,} reference rows in {self.seconds:.1f} s")
+        if o:
+            print(f"  bias {o['bias']:+.4f}  MAE {o['mae']:.4f}  RMSE {o['rmse']:.4f}  r {o['r']:.3f}  "
+                  f"max |err| {o['max_abs_error']:.4f}  within 1σ {o['within_1sigma']:.1%}")
+        months = pd.DataFrame(summary['by_month'])
+        if len(months):
+            print("\nBy month:")
+            print(months[['month', 'n', 'bias', 'mae', 'rmse', 'r']].to_string(index=False, float_format='%.4f'))
+        if summary['stations']:
+            print(f"\nWorst {min(top, summary['stations'])} of {summary['stations']} stations by RMSE:")
+            worst = pd.DataFrame(summary['worst_stations'])
+            print(worst[['station', 'n', 'bias', 'mae', 'rmse']].to_string(index=False, float_format='%.4f'))
+
+
+def normalize_reference(df):
+    """Rename to Latitude / Longitude / PW / datetime (/ Station ID) and parse times"""
+    df = df.rename(columns={k: v for k, v in REFERENCE_ALIASES.items() if k in df.columns and v not in df.columns})
+    missing = {'Latitude', 'Longitude', 'PW'} - set(df.columns)
+    if missing:
+        raise ValueError(f"Reference data lacks columns {sorted(missing)}")
+    if 'datetime' in df.columns:
+        df = df.assign(datetime=pd.to_datetime(df['datetime'], utc=True).dt.tz_localize(None))
+    return df
+
+
+def rechunk(frames, chunk_size=CHUNK_SIZE):
+    """Split an iterable of DataFrames into slices of at most chunk_size rows"""
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for df in frames:
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+
+def validate(predict, reference, chunk_size=CHUNK_SIZE, report=None):
+    """
+    Score every reference row with predict(lat, lon, times) -> (pw, std),
+    chunk_size rows per call, and return the accumulated ValidationReport.
+    Rows with a missing observation or prediction are counted but not scored.
+    """
+    report = report or ValidationReport()
+    start = time.perf_counter()
+    for chunk in rechunk(reference, chunk_size):
+        chunk = normalize_reference(chunk)
+        times = chunk['datetime'] if 'datetime' in chunk.columns else None
+        predicted, std = predict(chunk['Latitude'].to_numpy(np.float64), chunk['Longitude'].to_numpy(np.float64),
+                                 times)
+        observed = chunk['PW'].to_numpy(np.float64)
+        predicted = np.asarray(predicted, dtype=np.float64)
+        std = None if std is None else np.asarray(std, dtype=np.float64)
+        ok = np.isfinite(observed) & np.isfinite(predicted)
+        report.rows_read += len(chunk)
+        report.rows_scored += int(ok.sum())
+        if not ok.any():
+            continue
+
+        observed, predicted = observed[ok], predicted[ok]
+        std = None if std is None else std[ok]
+        report.overall.add('all', observed, predicted, std)
+        if 'Station ID' in chunk.columns:
+            report.by_station.add(chunk['Station ID'].astype(str).to_numpy()[ok], observed, predicted, std)
+        if times is not None:
+            months = times.dt.strftime('%Y-%m').to_numpy()[ok]
+            report.by_month.add(months, observed, predicted, std)
+    report.seconds += time.perf_counter() - start
+    return report
+
+
+def spatial_predictor(model):
+    """predict(lat, lon, times) over a spatial model ([[lon, lat]] convention, optional space-time t)"""
+    from spacetime_kriging import SpaceTimeKriging, epoch_seconds
+
+    def predict(lat, lon, times):
+        X = np.column_stack([lon, lat])
+        if times is not None and isinstance(model, SpaceTimeKriging):
+            return model.predict(X, return_std=True, t=epoch_seconds(times))
+        return model.predict(X, return_std=True)
+    return predict
+
+
+def read_reference(paths, chunk_size=CHUNK_SIZE, stride=1, scale=1.0):
+    """
+    DataFrames from reference files, chunk_size rows at a time:
+    Parquet / CSV tables with latitude, longitude, PW (+ datetime, station), or
+    ERA5 netCDF files, whose tcwv grid cells become points (every stride-th
+    cell per axis) with PW = tcwv * scale.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        elif path.endswith('.csv'):
+            yield from pd.read_csv(path, chunksize=chunk_size)
+        elif path.endswith('.nc'):
+            yield from _era5_points(path, chunk_size, stride, scale)
+        else:
+            raise ValueError(f"Unsupported reference file: {path}")
+
+
+def _era5_points(path, chunk_size, stride, scale):
+    import xarray as xr
+
+    with xr.open_dataset(path) as ds:
+        time_dim = 'valid_time' if 'valid_time' in ds.dims else 'time'
+        tcwv = ds['tcwv'].isel(latitude=slice(None, None, stride), longitude=slice(None, None, stride))
+        lat2d, lon2d = np.meshgrid(tcwv['latitude'].values, tcwv['longitude'].values, indexing='ij')
+        lat, lon = lat2d.ravel(), np.where(lon2d.ravel() > 180, lon2d.ravel() - 360, lon2d.ravel())
+        per_step = max(chunk_size // lat.size, 1)
+        for start in range(0, tcwv.sizes[time_dim], per_step):
+            block = tcwv.isel({time_dim: slice(start, start + per_step)})
+            values = block.values.reshape(block.shape[0], -1)
+            steps = block[time_dim].values
+            yield pd.DataFrame({
+                'Latitude': np.tile(lat, len(steps)),
+                'Longitude': np.tile(lon, len(steps)),
+                'PW': values.ravel() * scale,
+                'datetime': np.repeat(steps, lat.size),
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="enhanced model package (uses its spatial model)")
+    parser.add_argument('--reference', nargs='+', required=True, help="Parquet / CSV / ERA5 netCDF files")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--stride', type=int, default=1, help="ERA5: use every n-th grid cell")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply reference PW by this (unit conversion)")
+    parser.add_argument('--top', type=int, default=10, help="stations listed in the report")
+    parser.add_argument('--out', help="write the JSON report here")
+    args = parser.parse_args()
+
+    import joblib
+    saved = joblib.load(args.model)
+    model = saved.get('spatial_model') if isinstance(saved, dict) else saved
+    if model is None:
+        raise SystemExit(f"No spatial model in {args.model}")
+
+    report = validate(spatial_predictor(model),
+                      read_reference(args.reference, args.chunk_size, args.stride, args.scale),
+                      args.chunk_size)
+    report.print(args.top)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report.to_dict(args.top), f, indent=2, default=float)
+        print(f"\nReport written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()